@@ -0,0 +1,196 @@
+# benchmarks/filters/run.py
+"""
+Browse filter benchmark.
+
+Loads a synthetic catalog (benchmarks.search.catalog) per size and times one browse list page plus its
+total for random filter combinations (1-4 genres, optionally a year and a status) through:
+
+- scan: the browse query (below) against the in-process stand-in, i.e. a Python full scan without indexes
+- mongo: find({"genres": {"$all": [...]}, ...}).sort(name_lower, _id).limit(PAGE_SIZE + 1) + count_documents on a real
+  MongoDB (--mongo-uri): the catalog is loaded into a collection with the production browse indexes
+- postings: intersection of the SearchIndex filter posting sets, then a sort by name_lower
+- bitmaps: FilterBitmaps (AND of int bitsets, next set bits for the page, popcount for the total)
+
+Every engine must return the same first page; mismatches are reported. Usage (from the repository root):
+
+    python -m benchmarks.filters.run
+    python -m benchmarks.filters.run --sizes 10000 100000 --combinations 300 --genres 1 2 3 4
+    python -m benchmarks.filters.run --mongo-uri mongodb://localhost:27017 --mongo-db animerealm_benchmark
+
+The scan engine is a baseline for the in-memory engines, not a measure of MongoDB; only the mongo engine is.
+--mongo-db is dropped and reloaded for every catalog size, so never point it at the bot's database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import List, Dict, Any, Callable, Awaitable, Tuple, Optional
+
+from database.mongo_db import MongoDB, ANIME_BROWSE_INDEXES
+from database.search_index import SearchIndex
+from database.filter_bitmaps import FilterBitmaps
+from database.query_planner import search_within_filters
+
+from benchmarks.search.catalog import generate_catalog
+from benchmarks.search.fake_mongo import FakeDatabase
+from benchmarks.search.run import _percentile
+
+
+PAGE_SIZE = 10 # Same order of magnitude as config.PAGE_SIZE; fixed so runs are comparable
+_LOAD_CHUNK = 10000 # Documents per insert_many when loading a real collection
+
+_real_collection = None # The loaded collection on the --mongo-uri server
+
+
+def _browse_query_filter(filter_data: Dict[str, Any]) -> Dict[str, Any]:
+    # Same filter as handlers.browse_handler.build_browse_db_filter (the handlers package needs pyrogram)
+    query_filter: Dict[str, Any] = {}
+    if filter_data.get("genres"): query_filter["genres"] = {"$all": filter_data["genres"]}
+    if filter_data.get("year") is not None: query_filter["release_year"] = filter_data["year"]
+    if filter_data.get("status"): query_filter["status"] = filter_data["status"]
+    return query_filter
+
+
+async def _browse_page(collection, filter_data: Dict[str, Any]) -> Tuple[List[str], int]:
+    query_filter = _browse_query_filter(filter_data)
+    docs = await collection.find(query_filter, {"name": 1}).sort([("name_lower", 1), ("_id", 1)]).limit(PAGE_SIZE + 1).to_list(PAGE_SIZE + 1)
+    total = await collection.count_documents(query_filter)
+    return [str(doc["_id"]) for doc in docs[:PAGE_SIZE]], total
+
+
+async def _scan_engine(filter_data: Dict[str, Any]) -> Tuple[List[str], int]:
+    return await _browse_page(MongoDB.anime_collection(), filter_data)
+
+
+async def _mongo_engine(filter_data: Dict[str, Any]) -> Tuple[List[str], int]:
+    return await _browse_page(_real_collection, filter_data)
+
+
+async def _load_real_collection(database, catalog: List[Dict[str, Any]]):
+    """Replaces the anime collection of the benchmark database with the catalog and builds the browse indexes."""
+    global _real_collection
+    _real_collection = database["anime"]
+    await _real_collection.drop()
+    started = time.perf_counter()
+    for start in range(0, len(catalog), _LOAD_CHUNK):
+        await _real_collection.insert_many([dict(doc) for doc in catalog[start:start + _LOAD_CHUNK]], ordered=False)
+    for keys in ANIME_BROWSE_INDEXES: await _real_collection.create_index(keys)
+    print(f"MongoDB collection {database.name}.anime loaded and indexed in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+
+async def _postings_engine(filter_data: Dict[str, Any]) -> Tuple[List[str], int]:
+    matching_ids = search_within_filters(None, filter_data)
+    return matching_ids[:PAGE_SIZE], len(matching_ids)
+
+
+async def _bitmaps_engine(filter_data: Dict[str, Any]) -> Tuple[List[str], int]:
+    anime_ids, _, _ = FilterBitmaps.page(filter_data, None, None, None, PAGE_SIZE)
+    return anime_ids, FilterBitmaps.count(filter_data)
+
+
+ENGINES: Dict[str, Callable[[Dict[str, Any]], Awaitable[Tuple[List[str], int]]]] = {
+    "scan": _scan_engine,
+    "mongo": _mongo_engine,
+    "postings": _postings_engine,
+    "bitmaps": _bitmaps_engine,
+}
+
+
+def generate_combinations(catalog: List[Dict[str, Any]], count: int, genre_count: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    Browse filter_data dicts with genre_count genres. Half are seeded from one catalog entry (so they match
+    something), half combine random genres (often empty, like real over-narrowed filters).
+    """
+    rng = random.Random(seed)
+    all_genres = sorted({genre for doc in catalog for genre in doc.get("genres") or []})
+    all_years = sorted({doc["release_year"] for doc in catalog if doc.get("release_year") is not None})
+    all_statuses = sorted({doc["status"] for doc in catalog if doc.get("status")})
+
+    combinations = []
+    for index in range(count):
+        source = rng.choice(catalog)
+        if index % 2 == 0 and len(source.get("genres") or []) >= genre_count:
+            genres = rng.sample(source["genres"], genre_count)
+        else:
+            genres = rng.sample(all_genres, min(genre_count, len(all_genres)))
+        filter_data: Dict[str, Any] = {"genres": genres, "year": None, "status": None}
+        if rng.random() < 0.3: filter_data["year"] = source.get("release_year") if index % 2 == 0 else rng.choice(all_years)
+        if rng.random() < 0.3: filter_data["status"] = source.get("status") if index % 2 == 0 else rng.choice(all_statuses)
+        combinations.append(filter_data)
+    return combinations
+
+
+async def _time_engine(engine, combinations: List[Dict[str, Any]]) -> Tuple[Dict[str, float], List[Tuple[List[str], int]]]:
+    latencies, outputs = [], []
+    for filter_data in combinations:
+        started = time.perf_counter()
+        outputs.append(await engine(filter_data))
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {"p50_ms": round(_percentile(latencies, 50), 3), "p95_ms": round(_percentile(latencies, 95), 3), "p99_ms": round(_percentile(latencies, 99), 3)}, outputs
+
+
+async def run(
+    sizes: List[int], combination_count: int, genre_counts: List[int], engine_names: List[str], seed: int, save_dir: str = None,
+    mongo_uri: Optional[str] = None, mongo_db: str = "animerealm_benchmark"
+) -> Dict[str, Any]:
+    real_database = None
+    if "mongo" in engine_names:
+        if not mongo_uri: raise SystemExit("The mongo engine needs a server: pass --mongo-uri (or leave it out of --engines).")
+        from motor.motor_asyncio import AsyncIOMotorClient
+        real_database = AsyncIOMotorClient(mongo_uri)[mongo_db]
+
+    results: Dict[str, Any] = {}
+    for size in sizes:
+        catalog = generate_catalog(size, seed=seed)
+        database = FakeDatabase()
+        database["anime"].insert_many(catalog)
+        MongoDB._db = database # The in-memory engines and the scan baseline go through MongoDB.get_db()
+        await SearchIndex.build()
+        if real_database is not None: await _load_real_collection(real_database, catalog)
+
+        started = time.perf_counter()
+        FilterBitmaps.count({}) # Builds the bitmaps for this catalog version
+        print(f"\nCatalog {size:,}: filter bitmaps built in {(time.perf_counter() - started) * 1000:.0f} ms.")
+        print(f"{'genres':<8}{'engine':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mismatches':>12}")
+
+        results[str(size)] = {}
+        for genre_count in genre_counts:
+            combinations = generate_combinations(catalog, combination_count, genre_count, seed=seed + genre_count)
+            reference = None
+            results[str(size)][str(genre_count)] = {}
+            for engine_name in engine_names:
+                report, outputs = await _time_engine(ENGINES[engine_name], combinations)
+                if reference is None: reference = outputs
+                report["mismatches"] = sum(1 for output, expected in zip(outputs, reference) if output != expected)
+                results[str(size)][str(genre_count)][engine_name] = report
+                print(f"{genre_count:<8}{engine_name:<10}{report['p50_ms']:>10.3f}{report['p95_ms']:>10.3f}{report['p99_ms']:>10.3f}{report['mismatches']:>12}")
+
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+        output_path = os.path.join(save_dir, f"filter_benchmark_{int(time.time())}.json")
+        with open(output_path, "w") as output_file:
+            json.dump({"seed": seed, "combinations": combination_count, "page_size": PAGE_SIZE, "results": results}, output_file, indent=2)
+        print(f"\nSaved results to {output_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark browse filter pages and totals on a synthetic catalog.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Catalog sizes to generate.")
+    parser.add_argument("--combinations", type=int, default=200, help="Filter combinations per genre count.")
+    parser.add_argument("--genres", type=int, nargs="+", default=[1, 2, 3, 4], help="Numbers of selected genres to test.")
+    parser.add_argument("--engines", nargs="+", default=None, choices=list(ENGINES), help="Engines to benchmark (default: all; mongo only with --mongo-uri).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for catalog and filter generation.")
+    parser.add_argument("--save", default=None, help="Directory to write a JSON report into.")
+    parser.add_argument("--mongo-uri", default=None, help="MongoDB server for the mongo engine.")
+    parser.add_argument("--mongo-db", default="animerealm_benchmark", help="Database the catalog is loaded into (dropped and reloaded per size).")
+    args = parser.parse_args()
+    engine_names = args.engines or [name for name in ENGINES if name != "mongo" or args.mongo_uri]
+    asyncio.run(run(args.sizes, args.combinations, args.genres, engine_names, args.seed, args.save, args.mongo_uri, args.mongo_db))
+
+
+if __name__ == "__main__":
+    main()
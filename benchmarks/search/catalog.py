@@ -0,0 +1,123 @@
+# benchmarks/search/catalog.py
+"""
+Synthetic anime catalog generator.
+
+Titles mimic what the bot actually stores: romaji titles ("Kimetsu no Yaiba"), English titles
+("The Silent Garden"), subtitle forms ("Hero Academy: Final Act"), and franchises with sequels
+("... Season 2", "... Movie", "... OVA"). Popularity (overall_download_count) is Zipf-like, so a few
+titles dominate, as in the real download counters. Some titles carry aliases (English translation,
+acronym) so alias queries can be labelled.
+"""
+import random
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from bson import ObjectId
+
+from database.models import name_sort_key
+
+
+ROMAJI_WORDS = [
+    "shingeki", "kyojin", "kimetsu", "yaiba", "boku", "hero", "jujutsu", "kaisen", "tokyo", "ghoul",
+    "shokugeki", "soma", "yakusoku", "neverland", "kaguya", "sama", "koi", "sensou", "mahou", "shoujo",
+    "kimi", "nawa", "tensei", "shitara", "slime", "datta", "ken", "mushoku", "hagane", "renkinjutsushi",
+    "kaze", "tachinu", "sora", "yoru", "hoshi", "tsuki", "hikari", "kage", "yume", "sekai", "densetsu",
+    "monogatari", "gakuen", "senki", "kishi", "oukoku", "ryuu", "kami", "akuma", "tenshi", "majo",
+    "kokoro", "namida", "haru", "natsu", "fuyu", "aki", "sakura", "hanabi", "umi", "yama", "mori",
+]
+ROMAJI_PARTICLES = ["no", "to", "wa", "ga", "ni"]
+ENGLISH_ADJECTIVES = [
+    "Silent", "Broken", "Crimson", "Eternal", "Hidden", "Last", "Lost", "Forgotten", "Golden", "Iron",
+    "Midnight", "Scarlet", "Shining", "Wandering", "Frozen", "Burning", "Distant", "Endless", "Wild", "Blue",
+]
+ENGLISH_NOUNS = [
+    "Garden", "Blade", "Kingdom", "Academy", "Hunter", "Alchemist", "Witch", "Dragon", "Knight", "Detective",
+    "Chronicle", "Symphony", "Horizon", "Frontier", "Requiem", "Legacy", "Odyssey", "Paradox", "Rebellion", "Summit",
+]
+SUBTITLES = [
+    "Final Act", "The Beginning", "Rebirth", "Second Stage", "Next Generation", "Requiem", "Zero",
+    "Brotherhood", "Origins", "The Movie", "Kai", "Shippuden", "Reloaded", "Encore", "Prologue",
+]
+SEQUEL_SUFFIXES = ["Season 2", "Season 3", "2nd Season", "Movie", "OVA", "Specials", "Part 2", "Final Season"]
+
+# Fallback genres/statuses when config.py can't be imported (it needs pyrogram for ParseMode)
+_FALLBACK_GENRES = ["🔫 Action", "🧭 Adventure", "😂 Comedy", "🎭 Drama", "🧚 Fantasy", "💘 Romance", "🚀 Sci-Fi", "🍰 Slice of Life"]
+_FALLBACK_STATUSES = ["🌀 Ongoing", "✅ Completed", "🎬 Movie", "📀 OVA"]
+
+
+def _catalog_vocabulary():
+    """Genres and statuses exactly as the bot offers them (config.py), so filters see realistic values."""
+    try:
+        import config
+        return list(config.INITIAL_GENRES), [status.strip() for status in config.ANIME_STATUSES]
+    except Exception:
+        return _FALLBACK_GENRES, _FALLBACK_STATUSES
+
+
+def _romaji_title(rng: random.Random) -> str:
+    words = rng.sample(ROMAJI_WORDS, 2)
+    if rng.random() < 0.6: return f"{words[0].capitalize()} {rng.choice(ROMAJI_PARTICLES)} {words[1].capitalize()}"
+    return f"{words[0].capitalize()} {words[1].capitalize()}"
+
+
+def _english_title(rng: random.Random) -> str:
+    title = f"{rng.choice(ENGLISH_ADJECTIVES)} {rng.choice(ENGLISH_NOUNS)}"
+    return f"The {title}" if rng.random() < 0.3 else title
+
+
+def _acronym(title: str) -> Optional[str]:
+    """'Shingeki no Kyojin' -> 'SnK'. Only for titles with 3+ words, like real fandom abbreviations."""
+    words = title.replace(":", " ").split()
+    if len(words) < 3: return None
+    return "".join(word[0].upper() if len(word) > 2 else word[0].lower() for word in words)
+
+
+def generate_catalog(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Returns `size` anime documents shaped like the `anime` collection (seasons left empty to keep
+    memory low; search never reads them). Deterministic for a given (size, seed).
+    """
+    rng = random.Random(seed)
+    genres_pool, statuses_pool = _catalog_vocabulary()
+    documents: List[Dict[str, Any]] = []
+    used_names = set()
+    franchise_roots: List[str] = []
+
+    while len(documents) < size:
+        roll = rng.random()
+        aliases: List[str] = []
+        if franchise_roots and roll < 0.2:
+            # Sequel/spin-off of an existing franchise
+            name = f"{rng.choice(franchise_roots)} {rng.choice(SEQUEL_SUFFIXES)}"
+        elif roll < 0.6:
+            name = _romaji_title(rng)
+            if rng.random() < 0.4: aliases.append(_english_title(rng)) # Official English title
+        else:
+            name = _english_title(rng)
+        if rng.random() < 0.15: name = f"{name}: {rng.choice(SUBTITLES)}"
+
+        if name in used_names:
+            # Real catalogs disambiguate remakes by year; do the same
+            name = f"{name} ({rng.randint(1975, 2025)})"
+            if name in used_names: continue
+        used_names.add(name)
+        if len(franchise_roots) < max(size // 20, 10) and rng.random() < 0.3: franchise_roots.append(name.split(":")[0])
+
+        acronym = _acronym(name)
+        if acronym and rng.random() < 0.5: aliases.append(acronym)
+
+        documents.append({
+            "_id": ObjectId(),
+            "name": name,
+            "name_lower": name_sort_key(name),
+            "aliases": aliases,
+            "genres": rng.sample(genres_pool, rng.randint(1, 4)),
+            # Skewed towards recent years, like a catalog that keeps adding new seasons
+            "release_year": 2025 - min(int(rng.expovariate(1 / 8)), 50),
+            "status": rng.choice(statuses_pool),
+            "overall_download_count": int(rng.paretovariate(1.16) * 10) - 10, # Zipf-like head/tail
+            "total_seasons_declared": rng.randint(0, 5),
+            "seasons": [],
+            "last_updated_at": datetime.now(timezone.utc),
+        })
+    return documents
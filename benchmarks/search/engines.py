@@ -0,0 +1,54 @@
+# benchmarks/search/engines.py
+"""
+Search engines under benchmark. Each engine is an async callable (query) -> ranked list of anime _id
+strings, in the order a user would see them. Register alternatives with register_engine() (or add
+them to ENGINES) and select them with `--engines` on the runner.
+"""
+from typing import Awaitable, Callable, Dict, List
+
+from database.anime_search import find_matching_anime
+from database.search_index import SearchIndex
+
+
+SearchEngine = Callable[[str], Awaitable[List[str]]]
+
+
+async def pipeline_engine(query: str) -> List[str]:
+    """What handle_search_query_text shows: find_matching_anime() results, in display order."""
+    return [str(doc["_id"]) for doc in await find_matching_anime(query)]
+
+
+async def pipeline_without_index_engine(query: str) -> List[str]:
+    """
+    The same pipeline with the in-memory index switched off (no autocomplete, no spell correction):
+    the $text + fuzzywuzzy path exactly as it ran before the index existed. Baseline for comparisons.
+    """
+    was_ready = SearchIndex._ready
+    SearchIndex._ready = False
+    try:
+        return await pipeline_engine(query)
+    finally:
+        SearchIndex._ready = was_ready
+
+
+async def index_search_engine(query: str) -> List[str]:
+    """SearchIndex.search_ids(): token AND-match with prefix last token, exact > prefix > token, then downloads."""
+    return SearchIndex.search_ids(query)
+
+
+async def inline_engine(query: str) -> List[str]:
+    """Inline mode ranking: prefix completions first, then the remaining token matches."""
+    return SearchIndex.completion_first_ids(query, 20)
+
+
+ENGINES: Dict[str, SearchEngine] = {
+    "pipeline": pipeline_engine,
+    "pipeline_no_index": pipeline_without_index_engine,
+    "index_search": index_search_engine,
+    "inline": inline_engine,
+}
+
+
+def register_engine(name: str, engine: SearchEngine):
+    """Adds (or replaces) an engine so the runner can benchmark it by name."""
+    ENGINES[name] = engine
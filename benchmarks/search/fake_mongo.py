@@ -0,0 +1,180 @@
+# benchmarks/search/fake_mongo.py
+"""
+In-process stand-in for the Motor database object held in MongoDB._db.
+
+Implements just the query surface the search code uses: find/find_one with projection, sort, skip,
+limit, batch_size, to_list and async iteration, count_documents, and the filter operators
+equality, $in, $all, $gt/$gte/$lt/$lte, $or, $and and $text (with {"$meta": "textScore"}).
+
+$text mimics MongoDB's text index closely enough for relevance work: case-insensitive, diacritic-
+insensitive token matching with English stop words dropped, OR semantics between terms, and a score
+that grows with the number of matched terms. It does no stemming, and runs as a full collection scan,
+so its latency numbers are not Mongo latencies. Compare engines run against the same stand-in.
+"""
+import re
+import unicodedata
+from typing import List, Dict, Any, Optional, Union, Tuple
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_STOP_WORDS = {"a", "an", "and", "the", "of", "to", "in", "on", "for", "is", "it", "at", "by", "with"}
+
+
+def _text_tokens(text: Optional[str]) -> List[str]:
+    if not text: return []
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return [token for token in _TOKEN_RE.findall("".join(ch for ch in decomposed if not unicodedata.combining(ch))) if token not in _STOP_WORDS]
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    try:
+        if operator == "$gt": return value > operand
+        if operator == "$gte": return value >= operand
+        if operator == "$lt": return value < operand
+        if operator == "$lte": return value <= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Operator {operator} not supported by the benchmark Mongo stand-in.")
+
+
+def _field_matches(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(item in operand for item in values): return False
+            elif operator == "$all":
+                if not isinstance(value, list) or not all(item in value for item in operand): return False
+            elif operator == "$ne":
+                if value == operand: return False
+            else:
+                if not _compare(value, operator, operand): return False
+        return True
+    if isinstance(value, list) and not isinstance(condition, list): return condition in value
+    return value == condition
+
+
+class FakeCursor:
+    def __init__(self, matches: List[Tuple[Dict[str, Any], float]], projection: Optional[Dict[str, Any]] = None):
+        self._matches = matches # (document, text score) pairs, projected only after sorting, like MongoDB
+        self._projection = projection
+        self._sort: List[Tuple[str, Any]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list: Union[str, List[Tuple[str, Any]]], direction: Optional[int] = None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self # Nothing to batch in memory
+
+    def _materialize(self) -> List[Dict[str, Any]]:
+        matches = list(self._matches)
+        # Stable sorts applied last key first give multi-key ordering
+        for key, direction in reversed(self._sort):
+            if isinstance(direction, dict): # ("score", {"$meta": "textScore"}) sorts by score descending
+                matches.sort(key=lambda match: match[1], reverse=True)
+            else:
+                matches.sort(key=lambda match: (match[0].get(key) is None, match[0].get(key)), reverse=direction == -1)
+        matches = matches[self._skip:]
+        if self._limit: matches = matches[:self._limit]
+        return [FakeCollection._project(document, self._projection, score) for document, score in matches]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        documents = self._materialize()
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        async def iterate():
+            for document in self._materialize(): yield document
+        return iterate()
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: List[Dict[str, Any]] = []
+        self._text_tokens: List[set] = [] # Per document, tokens of the text-indexed field (name)
+
+    def insert_many(self, documents: List[Dict[str, Any]]):
+        for document in documents: self.insert_one_sync(document)
+
+    def insert_one_sync(self, document: Dict[str, Any]):
+        self._documents.append(document)
+        self._text_tokens.append(set(_text_tokens(document.get("name"))))
+
+    async def insert_one(self, document: Dict[str, Any]):
+        self.insert_one_sync(document)
+
+    async def create_index(self, *args, **kwargs):
+        return None # Indexes are irrelevant in memory
+
+    def _matching(self, query_filter: Dict[str, Any]) -> List[Tuple[Dict[str, Any], float]]:
+        query_filter = dict(query_filter or {})
+        text_terms: Optional[set] = None
+        if "$text" in query_filter: text_terms = set(_text_tokens(query_filter.pop("$text").get("$search", "")))
+        or_clauses = query_filter.pop("$or", None)
+        and_clauses = query_filter.pop("$and", [])
+
+        matches = []
+        for document, tokens in zip(self._documents, self._text_tokens):
+            score = 0.0
+            if text_terms is not None:
+                matched_terms = text_terms & tokens
+                if not matched_terms: continue
+                score = len(matched_terms) + len(matched_terms) / (len(tokens) or 1) # Mongo favours short, dense matches
+            if not all(_field_matches(document.get(field), condition) for field, condition in query_filter.items()): continue
+            if or_clauses and not any(all(_field_matches(document.get(field), condition) for field, condition in clause.items()) for clause in or_clauses): continue
+            if and_clauses and not all(self._matches_plain(document, clause) for clause in and_clauses): continue
+            matches.append((document, score))
+        return matches
+
+    @staticmethod
+    def _matches_plain(document: Dict[str, Any], clause: Dict[str, Any]) -> bool:
+        """Field conditions plus $or (what $and sub-clauses use; $text is top-level only in MongoDB too)."""
+        clause = dict(clause)
+        or_clauses = clause.pop("$or", None)
+        if not all(_field_matches(document.get(field), condition) for field, condition in clause.items()): return False
+        return not or_clauses or any(FakeCollection._matches_plain(document, sub_clause) for sub_clause in or_clauses)
+
+    @staticmethod
+    def _project(document: Dict[str, Any], projection: Optional[Dict[str, Any]], score: float) -> Dict[str, Any]:
+        if not projection: return dict(document)
+        projected = {"_id": document.get("_id")} if projection.get("_id", 1) else {}
+        for field, spec in projection.items():
+            if field == "_id": continue
+            if isinstance(spec, dict) and spec.get("$meta") == "textScore": projected[field] = score
+            elif spec and field in document: projected[field] = document[field]
+        return projected
+
+    def find(self, query_filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> FakeCursor:
+        return FakeCursor(self._matching(query_filter or {}), projection)
+
+    async def find_one(self, query_filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        matches = self._matching(query_filter or {})
+        return self._project(matches[0][0], projection, matches[0][1]) if matches else None
+
+    async def estimated_document_count(self) -> int:
+        return len(self._documents)
+
+    async def count_documents(self, query_filter: Optional[Dict[str, Any]] = None) -> int:
+        return len(self._matching(query_filter or {}))
+
+
+class FakeDatabase:
+    """Dict-like database: db["anime"] returns (and creates on first use) a FakeCollection."""
+
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections: self._collections[name] = FakeCollection(name)
+        return self._collections[name]
@@ -0,0 +1,75 @@
+# benchmarks/search/queries.py
+"""
+Labelled query set generator.
+
+Every query is derived from one catalog document and labelled with that document's _id as the
+single relevant answer. Query kinds cover what users actually type:
+
+- exact:    the full title, as typed ("Kimetsu no Yaiba")
+- sloppy:   lowercase, punctuation dropped ("hero academy final act")
+- partial:  leading words or a typed-so-far prefix ("kimetsu no", "kime")
+- typo:     one or two keyboard edits in a title word ("kimetsu no yaiab", "bleech")
+- alias:    an alias instead of the title (English title, acronym)
+
+Targets are drawn proportionally to popularity, since popular titles are searched the most.
+"""
+import random
+import string
+from typing import List, Dict, Any, Optional
+
+QUERY_KINDS = ("exact", "sloppy", "partial", "typo", "alias")
+
+
+def _sloppy(name: str) -> str:
+    return " ".join("".join(ch for ch in name.lower() if ch.isalnum() or ch.isspace()).split())
+
+
+def _partial(rng: random.Random, name: str) -> str:
+    words = name.replace(":", "").split()
+    if len(words) > 1 and rng.random() < 0.5:
+        return " ".join(words[:rng.randint(1, len(words) - 1)])
+    # Typed-so-far prefix of the title, at least 4 characters
+    return name[:rng.randint(min(4, len(name)), len(name))].rstrip()
+
+
+def _typo(rng: random.Random, name: str) -> Optional[str]:
+    words = name.split()
+    editable = [index for index, word in enumerate(words) if len(word) >= 5 and word.isalpha()]
+    if not editable: return None
+    index = rng.choice(editable)
+    word = list(words[index].lower())
+    for _ in range(1 if len(word) < 8 else rng.randint(1, 2)):
+        position = rng.randrange(len(word))
+        operation = rng.choice(("substitute", "delete", "insert", "transpose"))
+        if operation == "substitute": word[position] = rng.choice(string.ascii_lowercase)
+        elif operation == "delete" and len(word) > 4: del word[position]
+        elif operation == "insert": word.insert(position, rng.choice(string.ascii_lowercase))
+        elif operation == "transpose" and position < len(word) - 1: word[position], word[position + 1] = word[position + 1], word[position]
+    words[index] = "".join(word)
+    return " ".join(words)
+
+
+def generate_queries(catalog: List[Dict[str, Any]], count: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """
+    Returns `count` labelled queries: {"query", "kind", "expected_id", "expected_name"}.
+    Deterministic for a given (catalog, count, seed).
+    """
+    rng = random.Random(seed)
+    weights = [doc.get("overall_download_count", 0) + 1 for doc in catalog]
+    queries: List[Dict[str, Any]] = []
+    attempts = 0
+    while len(queries) < count and attempts < count * 20:
+        attempts += 1
+        doc = rng.choices(catalog, weights=weights, k=1)[0]
+        kind = QUERY_KINDS[len(queries) % len(QUERY_KINDS)] # Balanced mix of kinds
+        name = doc["name"]
+
+        if kind == "exact": query = name
+        elif kind == "sloppy": query = _sloppy(name)
+        elif kind == "partial": query = _partial(rng, name)
+        elif kind == "typo": query = _typo(rng, name)
+        else: query = rng.choice(doc["aliases"]) if doc.get("aliases") else None
+
+        if not query: continue # Title has no alias / no editable word; draw another target
+        queries.append({"query": query, "kind": kind, "expected_id": str(doc["_id"]), "expected_name": name})
+    return queries
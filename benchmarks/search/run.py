@@ -0,0 +1,124 @@
+# benchmarks/search/run.py
+"""
+Search benchmark runner.
+
+Generates a synthetic catalog per size, loads it into the in-process Mongo stand-in, builds the
+SearchIndex, then runs the labelled query set through every selected engine and reports:
+
+- latency p50/p95/p99 (ms) per query
+- recall@k: share of queries whose expected anime is in the first k results
+- MRR: mean reciprocal rank of the expected anime (0 when missing)
+
+overall and per query kind. Usage (from the repository root):
+
+    python -m benchmarks.search.run
+    python -m benchmarks.search.run --sizes 1000 10000 --queries 300 --engines pipeline index_search
+    python -m benchmarks.search.run --save benchmarks/results
+
+Needs the bot's Python requirements installed (config.py, the database package and fuzzywuzzy are
+imported as-is); no MongoDB server or Telegram credentials are used.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from typing import List, Dict, Any
+
+from database.mongo_db import MongoDB
+from database.search_index import SearchIndex
+
+from benchmarks.search.catalog import generate_catalog
+from benchmarks.search.queries import generate_queries, QUERY_KINDS
+from benchmarks.search.fake_mongo import FakeDatabase
+from benchmarks.search.engines import ENGINES
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return 0.0
+    rank = max(math.ceil(percentile / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def _summarize(samples: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+    latencies = sorted(sample["latency_ms"] for sample in samples)
+    ranks = [sample["rank"] for sample in samples]
+    count = len(samples) or 1
+    return {
+        "queries": len(samples),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        f"recall@{k}": round(sum(1 for rank in ranks if rank and rank <= k) / count, 4),
+        "mrr": round(sum(1 / rank for rank in ranks if rank) / count, 4),
+    }
+
+
+async def _run_engine(engine, queries: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+    samples = []
+    for labelled in queries:
+        started = time.perf_counter()
+        ranked_ids = await engine(labelled["query"])
+        latency_ms = (time.perf_counter() - started) * 1000
+        rank = ranked_ids.index(labelled["expected_id"]) + 1 if labelled["expected_id"] in ranked_ids else 0
+        samples.append({"kind": labelled["kind"], "latency_ms": latency_ms, "rank": rank})
+
+    report = {"overall": _summarize(samples, k)}
+    for kind in QUERY_KINDS:
+        kind_samples = [sample for sample in samples if sample["kind"] == kind]
+        if kind_samples: report[kind] = _summarize(kind_samples, k)
+    return report
+
+
+def _print_report(size: int, engine_name: str, report: Dict[str, Any], k: int):
+    print(f"\n== catalog {size:,} | engine {engine_name} ==")
+    print(f"{'kind':<10}{'queries':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{f'recall@{k}':>11}{'mrr':>8}")
+    for kind, row in report.items():
+        print(f"{kind:<10}{row['queries']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row[f'recall@{k}']:>11.3f}{row['mrr']:>8.3f}")
+
+
+async def run(sizes: List[int], query_count: int, k: int, engine_names: List[str], seed: int, save_dir: str = None) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for size in sizes:
+        catalog = generate_catalog(size, seed=seed)
+        queries = generate_queries(catalog, query_count, seed=seed + 1)
+
+        database = FakeDatabase()
+        database["anime"].insert_many(catalog)
+        MongoDB._db = database # Everything under test goes through MongoDB.get_db()
+
+        started = time.perf_counter()
+        await SearchIndex.build()
+        print(f"\nCatalog {size:,}: {len(queries)} queries, index built in {(time.perf_counter() - started) * 1000:.0f} ms ({SearchIndex.size():,} entries).")
+
+        results[str(size)] = {}
+        for engine_name in engine_names:
+            report = await _run_engine(ENGINES[engine_name], queries, k)
+            results[str(size)][engine_name] = report
+            _print_report(size, engine_name, report, k)
+
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+        output_path = os.path.join(save_dir, f"search_benchmark_{int(time.time())}.json")
+        with open(output_path, "w") as output_file:
+            json.dump({"k": k, "seed": seed, "queries": query_count, "results": results}, output_file, indent=2)
+        print(f"\nSaved results to {output_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search latency and relevance on a synthetic catalog.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Catalog sizes to generate.")
+    parser.add_argument("--queries", type=int, default=500, help="Labelled queries per catalog size.")
+    parser.add_argument("--k", type=int, default=10, help="Cutoff for recall@k.")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES), help="Engines to benchmark.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for catalog and query generation.")
+    parser.add_argument("--save", default=None, help="Directory to write a JSON report into.")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.queries, args.k, args.engines, args.seed, args.save))
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,8 @@ STATE_COLLECTION_NAME = "user_states" # Collection name for state management
 PAGE_SIZE = int(os.getenv("PAGE_SIZE", 15)) # Load from env if available
 # Time limit for certain *admin input* operations (in seconds)
 ADMIN_INPUT_TIMEOUT_SECONDS = 300 # This requires specific handler/state timeout logic, define if implementing.
+# How long list totals that need a count_documents (filtered lists without the search index) are reused
+LIST_COUNT_CACHE_SECONDS = int(os.getenv("LIST_COUNT_CACHE_SECONDS", 300)) # Seconds
 
 
 # --- User & Download Configuration ---
@@ -150,6 +152,22 @@ LATEST_COUNT = int(os.getenv("LATEST_COUNT", 15))
 POPULAR_COUNT = int(os.getenv("POPULAR_COUNT", 10))
 LEADERBOARD_COUNT = int(os.getenv("LEADERBOARD_COUNT", 10))
 
+# --- Episode Grid ---
+# Season episode lists are shown as a COLUMNS x ROWS grid per page, with range jumps ("1–40", "41–80", ...)
+EPISODE_GRID_COLUMNS = int(os.getenv("EPISODE_GRID_COLUMNS", 5)) # Episode buttons per keyboard row
+EPISODE_GRID_ROWS = int(os.getenv("EPISODE_GRID_ROWS", 8)) # Episode rows per page
+EPISODE_RANGE_BUTTONS = int(os.getenv("EPISODE_RANGE_BUTTONS", 6)) # Max range jump buttons; longer seasons get wider ranges
+
+
+# --- Similar Anime Recommendations ---
+# "More like this" buttons on the details menu, from a background-built index (genres + co-watchlist signals)
+SIMILAR_ANIME_BUTTONS = int(os.getenv("SIMILAR_ANIME_BUTTONS", 3)) # Similar anime shown on the details menu
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", 10)) # Neighbours stored per anime
+SIMILARITY_GENRE_WEIGHT = float(os.getenv("SIMILARITY_GENRE_WEIGHT", 0.4)) # Share of the genre signal; the rest is co-watchlist
+SIMILARITY_MIN_CO_WATCHERS = int(os.getenv("SIMILARITY_MIN_CO_WATCHERS", 2)) # Users needed on a pair before it counts as co-watched
+SIMILARITY_MAX_WATCHLIST_ITEMS = int(os.getenv("SIMILARITY_MAX_WATCHLIST_ITEMS", 100)) # Newest watchlist entries used per user (pairs grow quadratically)
+SIMILARITY_REFRESH_SECONDS = int(os.getenv("SIMILARITY_REFRESH_SECONDS", 3600)) # Incremental rebuild interval
+SIMILARITY_FULL_REBUILD_SECONDS = int(os.getenv("SIMILARITY_FULL_REBUILD_SECONDS", 86400)) # Full rebuild at least this often
 
 # --- Welcome Message Configuration ---
 # Telegram file_id of the welcome image after uploading via bot
@@ -165,9 +183,115 @@ WELCOME_IMAGE_TELEGRAPH_LINK = os.getenv("WELCOME_IMAGE_TELEGRAPH_LINK") # Optio
 FILE_CHUNK_SIZE = 10 * 1024 * 1024
 
 
+# --- File Delivery Queue ---
+# Downloads are queued and sent by a worker pool under Telegram's bot limits (about 30 messages/s overall, ~1/s per chat)
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", 8)) # Concurrent sends (one per user at most)
+DELIVERY_QUEUE_MAX = int(os.getenv("DELIVERY_QUEUE_MAX", 1000)) # Waiting files across all users; beyond this downloads are refused
+DELIVERY_MAX_PER_USER = int(os.getenv("DELIVERY_MAX_PER_USER", 30)) # Files one user may have queued or in flight
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", 25)) # Telegram calls per second, whole bot
+DELIVERY_GLOBAL_BURST = int(os.getenv("DELIVERY_GLOBAL_BURST", 25))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", 1)) # Telegram calls per second into one chat
+DELIVERY_CHAT_BURST = int(os.getenv("DELIVERY_CHAT_BURST", 3))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", 3)) # Tries per Telegram call when FloodWait hits
+DELIVERY_STATS_SAMPLES = int(os.getenv("DELIVERY_STATS_SAMPLES", 1000)) # Recent jobs kept for the /delivery_report percentiles
+# Repeated download callbacks (double taps, client resends) for a file already queued are dropped before any DB work
+DOWNLOAD_DEDUP_COOLDOWN_SECONDS = int(os.getenv("DOWNLOAD_DEDUP_COOLDOWN_SECONDS", 10)) # Repeats still dropped this long after delivery
+DOWNLOAD_DEDUP_TTL_SECONDS = int(os.getenv("DOWNLOAD_DEDUP_TTL_SECONDS", 900)) # Longest a download counts as in flight
+# Batch downloads (whole season / episode range): one file per episode, sent as media groups of up to 10
+BATCH_QUALITY_PREFERENCE = [quality.strip() for quality in os.getenv("BATCH_QUALITY_PREFERENCE", "1080p,720p,480p,360p").split(",") if quality.strip()] # Best first
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 100)) # Files per batch; longer ranges are cut after this many
+
+# --- File ID Health Checks ---
+# Background scan of stored file_ids: stale ones are refreshed from their copy in FILE_STORAGE_CHANNEL_ID, dead ones reported
+FILE_HEALTH_ENABLED = os.getenv("FILE_HEALTH_ENABLED", "True").lower() == "true"
+FILE_HEALTH_INTERVAL_SECONDS = int(os.getenv("FILE_HEALTH_INTERVAL_SECONDS", 21600)) # Pause between catalog scans
+FILE_HEALTH_RECHECK_HOURS = int(os.getenv("FILE_HEALTH_RECHECK_HOURS", 72)) # Files checked more recently are skipped
+FILE_HEALTH_BATCH_ANIME = int(os.getenv("FILE_HEALTH_BATCH_ANIME", 50)) # Anime documents per batch (one bulk_write each)
+FILE_HEALTH_RATE = float(os.getenv("FILE_HEALTH_RATE", 2.0)) # Telegram calls per second made by the checks
+
 # --- Search Configuration ---
 # Fuzzywuzzy confidence score threshold for search results (0-100)
 FUZZYWUZZY_THRESHOLD = int(os.getenv("FUZZYWUZZY_THRESHOLD", 70))
+# Queries up to this many characters are answered by prefix autocomplete instead of the $text + fuzzy pipeline
+AUTOCOMPLETE_MAX_QUERY_LENGTH = int(os.getenv("AUTOCOMPLETE_MAX_QUERY_LENGTH", 3))
+# Number of "titles starting with..." suggestions shown on the no results view
+AUTOCOMPLETE_SUGGESTIONS_COUNT = int(os.getenv("AUTOCOMPLETE_SUGGESTIONS_COUNT", 5))
+# Typo correction (symmetric-delete dictionary over title tokens): max edits per token (1 or 2)
+SPELL_MAX_EDIT_DISTANCE = int(os.getenv("SPELL_MAX_EDIT_DISTANCE", 2))
+# Only the first N characters of each token generate deletes. Bounds memory; 7 is the usual SymSpell default.
+SPELL_PREFIX_LENGTH = int(os.getenv("SPELL_PREFIX_LENGTH", 7))
+
+
+# --- Browse Filter Facet Counts ---
+# Filter menus show how many titles each option would leave, e.g. "Romance (42)", and hide options leaving none
+FACET_CACHE_SECONDS = int(os.getenv("FACET_CACHE_SECONDS", 300)) # Max age of cached counts (also invalidated by catalog changes)
+FACET_CACHE_MAX_ENTRIES = int(os.getenv("FACET_CACHE_MAX_ENTRIES", 1024)) # Distinct filter combinations kept
+
+# --- Rendered Menu Cache ---
+# Shared views (browse pages, popular, latest, episode lists, anime details) are rendered once and reused for every user
+MENU_CACHE_SECONDS = int(os.getenv("MENU_CACHE_SECONDS", 120)) # Max age of a rendered menu (bounds staleness of download counts)
+MENU_CACHE_MAX_ENTRIES = int(os.getenv("MENU_CACHE_MAX_ENTRIES", 2048)) # Distinct rendered views kept
+
+# --- Broadcasts ---
+# Broadcasts run as a persisted job: users are read in _id pages, sent by a worker pool under one token bucket,
+# and the job's cursor is checkpointed after every page so a restart resumes where it stopped
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25.0)) # Messages per second (Telegram allows about 30 per second per bot)
+BROADCAST_BURST = int(os.getenv("BROADCAST_BURST", 25))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 16)) # Concurrent sends (hide per-request latency, the bucket sets the pace)
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", 250)) # Users per checkpoint (at most this many resent after a crash)
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", 3)) # Tries per recipient when FloodWait hits
+BROADCAST_PROGRESS_SECONDS = int(os.getenv("BROADCAST_PROGRESS_SECONDS", 30)) # How often the admin's progress message is edited
+
+# --- Reachability ---
+# Users whose chat rejects sends (blocked the bot, deleted account) are marked unreachable and skipped by broadcasts
+# and watchlist notifications until they interact with the bot again
+REACHABILITY_FLUSH_SECONDS = int(os.getenv("REACHABILITY_FLUSH_SECONDS", 10)) # Pending status changes written at least this often
+REACHABILITY_BATCH = int(os.getenv("REACHABILITY_BATCH", 500)) # Pending changes that trigger an early write; bulk_write size
+
+# --- Watchlist Notifications ---
+# Content changes enqueue one job in the notification_outbox collection; background workers lease a job, stream its
+# subscribers in _id pages, send them paced and checkpoint the page cursor, so a restart resumes where it stopped
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", 2)) # Outbox jobs processed at the same time
+NOTIFICATION_SENDERS = int(os.getenv("NOTIFICATION_SENDERS", 8)) # Concurrent sends within a job (the bucket sets the pace)
+NOTIFICATION_RATE = float(os.getenv("NOTIFICATION_RATE", 15.0)) # Messages per second, all jobs together (leave room for broadcasts and downloads)
+NOTIFICATION_BURST = int(os.getenv("NOTIFICATION_BURST", 15))
+NOTIFICATION_PAGE_SIZE = int(os.getenv("NOTIFICATION_PAGE_SIZE", 500)) # Subscribers per checkpoint
+NOTIFICATION_LEASE_SECONDS = int(os.getenv("NOTIFICATION_LEASE_SECONDS", 300)) # A job whose worker stops renewing this is picked up again
+NOTIFICATION_POLL_SECONDS = int(os.getenv("NOTIFICATION_POLL_SECONDS", 30)) # Idle workers look for jobs (expired leases) this often
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 3)) # Tries per recipient on FloodWait, and per job on errors
+NOTIFICATION_OUTBOX_RETENTION_DAYS = int(os.getenv("NOTIFICATION_OUTBOX_RETENTION_DAYS", 14)) # Finished jobs kept this long
+NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_DIGEST_WINDOW_SECONDS", 600)) # Changes of an anime collected into one digest; 0 sends every change instantly to everyone
+
+# --- Download Events ---
+# Every delivered file is recorded in the download_events time-series collection, buffered and written with insert_many
+DOWNLOAD_EVENTS_ENABLED = os.getenv("DOWNLOAD_EVENTS_ENABLED", "True").lower() == "true"
+DOWNLOAD_EVENTS_FLUSH_SECONDS = int(os.getenv("DOWNLOAD_EVENTS_FLUSH_SECONDS", 10)) # Buffer written at least this often
+DOWNLOAD_EVENTS_BATCH = int(os.getenv("DOWNLOAD_EVENTS_BATCH", 500)) # Buffered events that trigger an early flush; insert_many size
+DOWNLOAD_EVENTS_BUFFER_MAX = int(os.getenv("DOWNLOAD_EVENTS_BUFFER_MAX", 50000)) # Oldest events dropped beyond this (MongoDB unreachable)
+DOWNLOAD_EVENTS_RETENTION_DAYS = int(os.getenv("DOWNLOAD_EVENTS_RETENTION_DAYS", 365)) # Collection TTL; 0 keeps events forever
+
+# --- Callback Acknowledgement ---
+# Every button press is answered before any handler work, so Telegram's spinner never waits on MongoDB
+CALLBACK_ACK_ENABLED = os.getenv("CALLBACK_ACK_ENABLED", "True").lower() == "true" # Acknowledge callback queries in the first handler group
+CALLBACK_TOAST_SECONDS = int(os.getenv("CALLBACK_TOAST_SECONDS", 5)) # Lifetime of the message replacing an alert or toast after the ack
+CALLBACK_ACK_SAMPLES = int(os.getenv("CALLBACK_ACK_SAMPLES", 1000)) # Recent ack delays kept for the /query_report percentiles
+
+# --- Query Profiler ---
+# Fingerprints every MongoDB query shape per handler, explains slow ones and advises indexes (/query_report)
+QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "True").lower() == "true" # Installs the command listener at connect
+QUERY_PROFILER_SLOW_MS = int(os.getenv("QUERY_PROFILER_SLOW_MS", 50)) # Shapes at least this slow get an explain()
+QUERY_PROFILER_EXPLAIN_INTERVAL_SECONDS = int(os.getenv("QUERY_PROFILER_EXPLAIN_INTERVAL_SECONDS", 900)) # Re-explain a shape at most this often
+QUERY_PROFILER_MAX_SHAPES = int(os.getenv("QUERY_PROFILER_MAX_SHAPES", 500)) # Distinct shapes tracked
+QUERY_PROFILER_EXAMINED_RATIO = int(os.getenv("QUERY_PROFILER_EXAMINED_RATIO", 10)) # Docs examined per doc returned above which an index is advised
+
+
+# --- Inline Mode Configuration ---
+# Results returned per inline answer page (Telegram allows at most 50). Further pages use next_offset.
+INLINE_RESULTS_PER_PAGE = min(int(os.getenv("INLINE_RESULTS_PER_PAGE", 20)), 50)
+# Seconds Telegram may cache non-personal inline answers (same query -> same results for everyone)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))
+# Seconds Telegram may cache personal inline answers (e.g. the user's own watchlist on an empty query)
+INLINE_PERSONAL_CACHE_TIME = int(os.getenv("INLINE_PERSONAL_CACHE_TIME", 10))
 
 
 # --- Callback Data Separator ---
@@ -180,7 +304,8 @@ CALLBACK_DATA_SEPARATOR = "|"
 DEFAULT_NOTIFICATION_SETTINGS = {
     "new_episode": True, # Notify when a new episode is added for watched anime
     "new_version": True, # Notify when a new quality/language version is added for watched episode/anime
-    "release_date_updated": False # Notify if only the release date is changed
+    "release_date_updated": False, # Notify if only the release date is changed
+    "digest": True # Group the changes of a NOTIFICATION_DIGEST_WINDOW_SECONDS window into one message per anime (off: instant)
 }
 
 # --- Owner/Admin Specific Text/Buttons (Could also be in strings.py) ---
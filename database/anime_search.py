@@ -0,0 +1,79 @@
+# database/anime_search.py
+import logging
+from typing import Union, List, Dict, Any, Tuple
+
+import config
+from database.mongo_db import MongoDB
+from database.search_index import SearchIndex, normalize_text
+
+# Fuzzy search library
+from fuzzywuzzy import process
+
+
+search_logger = logging.getLogger(__name__) # Logger for this module
+
+# The search candidate pipeline behind handlers/search_handler.handle_search_query_text.
+# Kept free of Telegram imports so benchmarks/search can run it against an in-process Mongo stand-in.
+
+
+# --- Candidate Lookup Pipeline ---
+async def find_matching_anime(query_text: str) -> List[Dict[str, Any]]:
+    """
+    Returns projected anime documents matching query_text.
+    Short queries are answered by prefix autocomplete from the in-memory index (ranked by downloads);
+    longer ones use the $text prefilter + fuzzy matching below.
+    """
+    if len(query_text) <= config.AUTOCOMPLETE_MAX_QUERY_LENGTH and SearchIndex.is_ready():
+        # Fuzzy-matching 200 name-sorted docs against 1-3 letters is noise; complete the prefix instead
+        return SearchIndex.autocomplete(query_text, config.PAGE_SIZE * 2)
+
+    # Fix typos before candidate lookup: "shingeki no kyojn" would never survive the $text stage otherwise.
+    # Only swap the query when a token was actually corrected, so normal queries keep their original casing/punctuation.
+    if SearchIndex.is_ready():
+        corrected_query = SearchIndex.correct_query(query_text)
+        if corrected_query and corrected_query != normalize_text(query_text):
+            search_logger.debug(f"Search query '{query_text}' spell-corrected to '{corrected_query}'.")
+            query_text = corrected_query
+
+    # Basic Text Search (if query > min length) as initial filter
+    db_query_filter: Dict[str, Any] = {}
+    if len(query_text) > 3: # Arbitrary length threshold for text index efficiency
+         db_query_filter = {"$text": {"$search": query_text}}
+
+    # Project relevant fields for search results list display (name, status, year, download count, _id)
+    projection = {"name": 1, "_id": 1, "status": 1, "release_year": 1, "overall_download_count": 1}
+
+    # Fetch a reasonable subset of anime docs, sorting by text score (if using text search) or alphabetically otherwise
+    sort_criteria: List[Tuple[str, Union[int, Dict[str, Any]]]] = [("name", 1)] # Default sort
+    if db_query_filter: # If text search filter is used, add text score sort priority
+        projection["score"] = {"$meta": "textScore"} # Project score to sort by it
+        sort_criteria.insert(0, ("score", {"$meta": "textScore"})) # Sort by score first
+
+    # Limit the initial database fetch for fuzzy matching candidates
+    anime_docs_subset = await MongoDB.anime_collection().find(db_query_filter, projection).sort(sort_criteria).limit(200).to_list(200) # Limit candidates
+
+    # Build a dictionary of name (string) -> full document dictionary from the subset for fuzzy matching
+    # This allows retrieving full projected data after fuzzy match.
+    anime_name_to_doc_dict = {doc['name']: doc for doc in anime_docs_subset}
+    anime_names_list = list(anime_name_to_doc_dict.keys())
+
+
+    # Perform fuzzy matching using fuzzywuzzy's process.extract on the subset of names
+    # Extract the top N matches based on score.
+    # Use a slightly higher limit than display PAGE_SIZE initially if needing robust result ordering later.
+    fuzzy_results_raw = process.extract(query_text, anime_names_list, limit=config.PAGE_SIZE * 2)
+
+    # Filter fuzzy results by the confidence score threshold
+    matching_anime_filtered = []
+    for name_match, score in fuzzy_results_raw:
+         if score >= config.FUZZYWUZZY_THRESHOLD:
+             # Retrieve the original projected document from the dictionary
+             original_doc = anime_name_to_doc_dict[name_match]
+             matching_anime_filtered.append((score, original_doc))
+
+
+    # Rank by fuzzy score, then by $text score. $text OR-matches every (corrected) token, so a name sort would put
+    # "Haru Yaiba" ahead of the exact "Yaiba wa Sakura"; the fuzzy score keeps the closest title on top.
+    matching_anime_filtered.sort(key=lambda match: (-match[0], -match[1].get("score", 0), match[1].get("name", "")))
+
+    return [doc for _, doc in matching_anime_filtered]
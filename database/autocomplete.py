@@ -0,0 +1,117 @@
+# database/autocomplete.py
+import bisect
+import heapq
+import logging
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Callable
+
+
+autocomplete_logger = logging.getLogger(__name__) # Logger for this module
+
+# Upper bound appended to a prefix to find the end of its range in a sorted list of strings.
+# Normalized keys only contain [0-9a-z ], so any higher code point works as a sentinel.
+_PREFIX_RANGE_SENTINEL = "\uffff"
+
+# Separators that usually start a subtitle ("Attack on Titan: The Final Season", "Naruto - Shippuden")
+_SUBTITLE_SEPARATORS = (":", " - ", " – ", "|")
+
+
+def prefix_range(sorted_values: List[Any], prefix: str, key_index: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Returns the [lo, hi) slice of a sorted list whose entries start with prefix.
+    sorted_values holds plain strings, or tuples sorted by their key_index-th element (pass key_index=0).
+    """
+    if key_index is None:
+        lo = bisect.bisect_left(sorted_values, prefix);
+        hi = bisect.bisect_left(sorted_values, prefix + _PREFIX_RANGE_SENTINEL, lo);
+    else:
+        lo = bisect.bisect_left(sorted_values, (prefix,));
+        hi = bisect.bisect_left(sorted_values, (prefix + _PREFIX_RANGE_SENTINEL,), lo);
+    return lo, hi;
+
+
+def autocomplete_keys(name: Optional[str], aliases: Optional[List[str]], normalize: Callable[[Optional[str]], str]) -> List[str]:
+    """
+    All normalized strings an anime can be completed from: its full name, every alias, and the
+    name's main title/subtitle parts, so both "attack on" and "the final" complete to
+    "Attack on Titan: The Final Season".
+    """
+    raw_keys: List[str] = [name or ""] + list(aliases or []);
+    if name:
+        for separator in _SUBTITLE_SEPARATORS:
+            if separator in name: raw_keys.extend(part for part in name.split(separator) if part.strip());
+    keys: List[str] = [];
+    for raw_key in raw_keys:
+        key = normalize(raw_key);
+        if key and key not in keys: keys.append(key);
+    return keys;
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index for search-as-you-type.
+    Holds (normalized_key, anime_id) pairs sorted by key; a prefix lookup is two bisects
+    plus a top-k pick over the matching range. Ranges too wide to scan cheaply (one or two
+    letter prefixes) have their top-k memoized until a change touches that prefix.
+    """
+
+    def __init__(self, rank_key: Callable[[str], Any], scan_limit: int = 256):
+        self._rank_key = rank_key # anime_id -> sort key, smaller = better (SearchIndex popularity key)
+        self._scan_limit = scan_limit # Ranges wider than this are memoized per prefix
+        self._pairs: List[Tuple[str, str]] = [] # Sorted (normalized_key, anime_id)
+        self._keys_by_anime: Dict[str, List[str]] = {} # anime_id -> its keys, needed for removal
+        self._memo: Dict[Tuple[str, int], List[str]] = {} # (prefix, k) -> ranked anime ids for wide ranges
+
+    def __len__(self) -> int: return len(self._pairs);
+
+    def build(self, keys_by_anime: Dict[str, List[str]]):
+        """Replaces the whole index (startup / full rebuild)."""
+        self._keys_by_anime = {anime_id: list(keys) for anime_id, keys in keys_by_anime.items()};
+        self._pairs = sorted((key, anime_id) for anime_id, keys in self._keys_by_anime.items() for key in keys);
+        self._memo.clear();
+
+    def _invalidate(self, keys: Iterable[str]):
+        """Drops memoized answers for every prefix of the changed keys (only those can change)."""
+        if not self._memo: return;
+        changed = list(keys);
+        self._memo = {
+            (prefix, k): ids for (prefix, k), ids in self._memo.items()
+            if not any(key.startswith(prefix) for key in changed)
+        };
+
+    def remove(self, anime_id: str):
+        """Removes every key of an anime. O(keys * n) list deletes, fine for admin-rate catalog edits."""
+        keys = self._keys_by_anime.pop(anime_id, None);
+        if not keys: return;
+        for key in keys:
+            position = bisect.bisect_left(self._pairs, (key, anime_id));
+            if position < len(self._pairs) and self._pairs[position] == (key, anime_id): del self._pairs[position];
+        self._invalidate(keys);
+
+    def add(self, anime_id: str, keys: List[str]):
+        """Inserts (or replaces) the keys of one anime, keeping the array sorted."""
+        self.remove(anime_id);
+        if not keys: return;
+        self._keys_by_anime[anime_id] = list(keys);
+        for key in keys: bisect.insort(self._pairs, (key, anime_id));
+        self._invalidate(keys);
+
+    def rank_changed(self, anime_id: str):
+        """The rank key of an anime changed (download count): memoized answers its keys appear in are stale."""
+        self._invalidate(self._keys_by_anime.get(anime_id, []));
+
+    def suggest(self, prefix: str, k: int) -> List[str]:
+        """Top-k anime ids (best rank first) having any key that starts with the normalized prefix."""
+        if not prefix or k <= 0: return [];
+        lo, hi = prefix_range(self._pairs, prefix, key_index=0);
+        if lo >= hi: return [];
+
+        memo_key = (prefix, k);
+        wide_range = hi - lo > self._scan_limit;
+        if wide_range and memo_key in self._memo: return self._memo[memo_key];
+
+        # One anime can match through several keys (name + alias); rank each anime once
+        candidate_ids = {self._pairs[position][1] for position in range(lo, hi)};
+        ranked_ids = heapq.nsmallest(k, candidate_ids, key=self._rank_key);
+
+        if wide_range: self._memo[memo_key] = ranked_ids;
+        return ranked_ids;
@@ -0,0 +1,129 @@
+# database/download_events.py
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Deque
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from config import (
+    DOWNLOAD_EVENTS_ENABLED, DOWNLOAD_EVENTS_FLUSH_SECONDS, DOWNLOAD_EVENTS_BATCH, DOWNLOAD_EVENTS_BUFFER_MAX
+)
+from database.mongo_db import MongoDB
+
+
+events_logger = logging.getLogger(__name__) # Logger for this module
+
+# One document per delivered file in the download_events time-series collection:
+# {"ts", "meta": {"anime_id"}, "user_id", "season_number", "episode_number", "quality", "file_size_bytes", "latency_ms", "batch"}
+# latency_ms runs from the download callback queuing the file to Telegram accepting it.
+# The delivery workers only append to an in-memory buffer; run_forever writes it with insert_many every
+# DOWNLOAD_EVENTS_FLUSH_SECONDS, or as soon as DOWNLOAD_EVENTS_BATCH events are waiting. While MongoDB is unreachable
+# the buffer keeps the newest DOWNLOAD_EVENTS_BUFFER_MAX events; events MongoDB rejects are dropped (and counted).
+
+
+class DownloadEvents:
+    """Buffered download event writer and the time-bucketed aggregations over download_events."""
+    _buffer: Deque[Dict[str, Any]] = deque(maxlen=DOWNLOAD_EVENTS_BUFFER_MAX)
+    _wakeup: Optional[asyncio.Event] = None # Set when a full batch is waiting (created by run_forever)
+    _counters: Dict[str, int] = {"recorded": 0, "written": 0, "dropped": 0, "failed_flushes": 0}
+
+    @classmethod
+    def record(
+        cls, user_id: int, anime_id_str: str, season_number: Optional[int], episode_number: Optional[int],
+        quality: Optional[str], file_size_bytes: Optional[int], latency_ms: float, batch: bool = False
+    ):
+        """Buffers one delivered file. Never waits on MongoDB."""
+        if not DOWNLOAD_EVENTS_ENABLED: return
+        try: anime_id = ObjectId(anime_id_str)
+        except Exception: return
+        if len(cls._buffer) == cls._buffer.maxlen: cls._counters["dropped"] += 1 # deque drops the oldest
+        cls._buffer.append({
+            "ts": datetime.now(timezone.utc), "meta": {"anime_id": anime_id}, "user_id": user_id,
+            "season_number": season_number, "episode_number": episode_number, "quality": quality,
+            "file_size_bytes": file_size_bytes or 0, "latency_ms": round(latency_ms, 1), "batch": batch
+        })
+        cls._counters["recorded"] += 1
+        if len(cls._buffer) >= DOWNLOAD_EVENTS_BATCH and cls._wakeup is not None: cls._wakeup.set()
+
+
+    @classmethod
+    async def flush(cls) -> int:
+        """Writes the buffered events, DOWNLOAD_EVENTS_BATCH per insert_many. Returns the number written."""
+        written = 0
+        while cls._buffer:
+            events = [cls._buffer.popleft() for _ in range(min(len(cls._buffer), DOWNLOAD_EVENTS_BATCH))]
+            try: await MongoDB.download_events_collection().insert_many(events, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: the rest of the batch was inserted. Per-document errors (validation, duplicate key) fail
+                # the same way on every retry, so those events are dropped, not kept.
+                failed = len(e.details.get("writeErrors", []))
+                written += e.details.get("nInserted", len(events) - failed)
+                cls._counters["dropped"] += failed
+                events_logger.error(f"Dropped {failed} download events rejected by MongoDB: {e.details.get('writeErrors', [])[:1]}")
+                continue
+            except ConnectionFailure as e: # Network errors, AutoReconnect, server selection timeouts: worth retrying
+                cls._counters["failed_flushes"] += 1
+                events_logger.error(f"Failed to write {len(events)} download events: {e}. Keeping them for the next flush.")
+                room = cls._buffer.maxlen - len(cls._buffer)
+                cls._counters["dropped"] += max(0, len(events) - room)
+                cls._buffer.extendleft(reversed(events[-room:] if room else [])) # Back in front, newest kept if it overflows
+                break
+            except Exception as e:
+                cls._counters["failed_flushes"] += 1
+                cls._counters["dropped"] += len(events)
+                events_logger.error(f"Dropped {len(events)} download events after a non-transient write error: {e}", exc_info=True)
+                continue
+            written += len(events)
+        cls._counters["written"] += written
+        return written
+
+
+    @classmethod
+    async def run_forever(cls):
+        """Background task: flushes every DOWNLOAD_EVENTS_FLUSH_SECONDS, or early when a batch is full."""
+        cls._wakeup = asyncio.Event()
+        while True:
+            try: await asyncio.wait_for(cls._wakeup.wait(), DOWNLOAD_EVENTS_FLUSH_SECONDS)
+            except asyncio.TimeoutError: pass
+            cls._wakeup.clear()
+            try: await cls.flush()
+            except asyncio.CancelledError: raise
+            except Exception as e: events_logger.error(f"Download events flush failed: {e}", exc_info=True)
+
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        return {**cls._counters, "buffered": len(cls._buffer)}
+
+
+    # --- Aggregations ---
+
+    @staticmethod
+    async def daily_totals(since: datetime) -> List[Dict[str, Any]]:
+        """Per UTC day since `since`: downloads, distinct users, bytes and average latency, oldest day first."""
+        pipeline = [
+            {"$match": {"ts": {"$gte": since}}},
+            {"$group": {
+                "_id": {"$dateTrunc": {"date": "$ts", "unit": "day"}},
+                "downloads": {"$sum": 1}, "users": {"$addToSet": "$user_id"},
+                "bytes": {"$sum": "$file_size_bytes"}, "avg_latency_ms": {"$avg": "$latency_ms"}
+            }},
+            {"$project": {"_id": 0, "day": "$_id", "downloads": 1, "users": {"$size": "$users"}, "bytes": 1, "avg_latency_ms": 1}},
+            {"$sort": {"day": 1}}
+        ]
+        return await MongoDB.download_events_collection().aggregate(pipeline).to_list(None)
+
+
+    @staticmethod
+    async def top_anime(since: datetime, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most downloaded anime since `since`: {"anime_id", "downloads", "bytes"}, most downloads first."""
+        pipeline = [
+            {"$match": {"ts": {"$gte": since}}},
+            {"$group": {"_id": "$meta.anime_id", "downloads": {"$sum": 1}, "bytes": {"$sum": "$file_size_bytes"}}},
+            {"$sort": {"downloads": -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "anime_id": "$_id", "downloads": 1, "bytes": 1}}
+        ]
+        return await MongoDB.download_events_collection().aggregate(pipeline).to_list(limit)
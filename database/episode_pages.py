@@ -0,0 +1,151 @@
+# database/episode_pages.py
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from config import EPISODE_GRID_COLUMNS, EPISODE_GRID_ROWS, BATCH_QUALITY_PREFERENCE, BATCH_MAX_FILES
+from database.mongo_db import MongoDB
+
+
+# Episode lists of long-running series are paginated by episode number windows of EPISODE_PAGE_SIZE:
+# page 0 holds episodes 1..EPISODE_PAGE_SIZE, page 1 the next window, and so on (specials numbered 0 fall on page -1).
+# Each page is one aggregation that returns only the window's episode numbers, release dates and an availability
+# flag; the files arrays (file_id, names, sizes of every version) never leave the server.
+EPISODE_PAGE_SIZE = EPISODE_GRID_COLUMNS * EPISODE_GRID_ROWS
+
+
+class EpisodePage(NamedTuple):
+    """One window of a season's episodes plus what the grid needs to draw its range jumps."""
+    anime_name: str
+    page: int # Window shown (clamped into first_page..last_page)
+    first_page: int
+    last_page: int
+    first_episode: int # Lowest/highest episode number in the season (labels of the outer range jumps)
+    last_episode: int
+    episode_total: int # Episodes in the whole season
+    episodes: List[Dict[str, Any]] # {"episode_number", "release_date", "available"} sorted by episode number
+
+
+def page_of_episode(episode_number: int) -> int:
+    """Window holding this episode number (back buttons return to the page the episode was picked from)."""
+    return (episode_number - 1) // EPISODE_PAGE_SIZE
+
+
+def page_bounds(page: int) -> Tuple[int, int]:
+    """First and last episode number of a window."""
+    return page * EPISODE_PAGE_SIZE + 1, (page + 1) * EPISODE_PAGE_SIZE
+
+
+def _window_of(expression: Any) -> Dict[str, Any]:
+    # (n - 1) // EPISODE_PAGE_SIZE, server side. Null (season without numbered episodes) stays null.
+    return {"$floor": {"$divide": [{"$subtract": [expression, 1]}, EPISODE_PAGE_SIZE]}}
+
+
+def _season_episodes(season_number: int) -> Dict[str, Any]:
+    # Episodes array of one season (empty when the season has none)
+    return {"$let": {
+        "vars": {"season": {"$arrayElemAt": [{"$filter": {"input": "$seasons", "as": "season", "cond": {"$eq": ["$$season.season_number", season_number]}}}, 0]}},
+        "in": {"$ifNull": ["$$season.episodes", []]}
+    }}
+
+
+def _episode_page_pipeline(anime_id: ObjectId, season_number: int, page: Optional[int]) -> List[Dict[str, Any]]:
+    season_episodes = _season_episodes(season_number)
+    in_window = {"$and": [
+        {"$gt": ["$$episode.episode_number", {"$multiply": ["$page", EPISODE_PAGE_SIZE]}]},
+        {"$lte": ["$$episode.episode_number", {"$multiply": [{"$add": ["$page", 1]}, EPISODE_PAGE_SIZE]}]}
+    ]}
+    return [
+        {"$match": {"_id": anime_id, "seasons.season_number": season_number}},
+        # Reduce every episode to its number, date and a flag: the files arrays are dropped here, on the server
+        {"$project": {"name": 1, "episodes": {"$map": {"input": season_episodes, "as": "episode", "in": {
+            "episode_number": "$$episode.episode_number",
+            "release_date": "$$episode.release_date",
+            "available": {"$gt": [{"$size": {"$ifNull": ["$$episode.files", []]}}, 0]}
+        }}}}},
+        {"$addFields": {"first_episode": {"$min": "$episodes.episode_number"}, "last_episode": {"$max": "$episodes.episode_number"}}},
+        {"$addFields": {"first_page": _window_of("$first_episode"), "last_page": _window_of("$last_episode")}},
+        {"$addFields": {"page": {"$min": [{"$max": [page if page is not None else "$first_page", "$first_page"]}, "$last_page"]}}},
+        {"$project": {
+            "name": 1, "first_episode": 1, "last_episode": 1, "first_page": 1, "last_page": 1, "page": 1,
+            "episode_total": {"$size": "$episodes"},
+            # Slice caps the page even if an admin created duplicate episode numbers
+            "episodes": {"$slice": [{"$filter": {"input": "$episodes", "as": "episode", "cond": in_window}}, EPISODE_PAGE_SIZE]}
+        }}
+    ]
+
+
+async def fetch_episode_page(anime_id_str: str, season_number: int, page: Optional[int] = None) -> Optional[EpisodePage]:
+    """
+    One page of a season's episode grid (first page when page is None, nearest page when out of range).
+    None when the anime or season doesn't exist. A season without episodes gives a page with no episodes.
+    """
+    try: anime_id = ObjectId(anime_id_str)
+    except (InvalidId, TypeError): return None
+
+    docs = await MongoDB.anime_collection().aggregate(_episode_page_pipeline(anime_id, season_number, page)).to_list(1)
+    if not docs: return None
+    doc = docs[0]
+
+    if doc.get("first_page") is None: # No numbered episodes yet
+        return EpisodePage(doc.get("name", "Anime Name Unknown"), 0, 0, 0, 0, 0, 0, [])
+
+    episodes = sorted(doc.get("episodes") or [], key=lambda episode: episode.get("episode_number", 0)) # Stored order isn't guaranteed
+    return EpisodePage(
+        doc.get("name", "Anime Name Unknown"), int(doc["page"]), int(doc["first_page"]), int(doc["last_page"]),
+        int(doc["first_episode"]), int(doc["last_episode"]), doc.get("episode_total", len(episodes)), episodes
+    )
+
+
+# --- Batch Downloads ---
+# "Download season / episodes a–b" picks one file version per episode on the server: the version whose quality comes
+# first in BATCH_QUALITY_PREFERENCE (unlisted qualities last, ties keep the stored order).
+
+class BatchSelection(NamedTuple):
+    """File versions chosen for a batch download, one per episode, by episode number."""
+    anime_name: str
+    files: List[Dict[str, Any]] # {"episode_number", "file_id", "file_unique_id", "file_name", "file_size_bytes", "quality_resolution"}
+    missing: List[int] # Episodes in the range without any file yet
+    truncated: bool # More episodes had files than BATCH_MAX_FILES
+
+
+def _batch_files_pipeline(anime_id: ObjectId, season_number: int, first_episode: int, last_episode: int) -> List[Dict[str, Any]]:
+    unlisted_rank = len(BATCH_QUALITY_PREFERENCE)
+    ranked_files = {"$map": {"input": {"$ifNull": ["$$episode.files", []]}, "as": "file", "in": {
+        "file_id": "$$file.file_id", "file_unique_id": "$$file.file_unique_id", "file_name": "$$file.file_name",
+        "file_size_bytes": "$$file.file_size_bytes", "quality_resolution": "$$file.quality_resolution",
+        "rank": {"$let": {
+            "vars": {"position": {"$indexOfArray": [BATCH_QUALITY_PREFERENCE, "$$file.quality_resolution"]}},
+            "in": {"$cond": [{"$lt": ["$$position", 0]}, unlisted_rank, "$$position"]}
+        }}
+    }}}
+    best_file = {"$reduce": {"input": ranked_files, "initialValue": None, "in": {
+        "$cond": [{"$or": [{"$eq": ["$$value", None]}, {"$lt": ["$$this.rank", "$$value.rank"]}]}, "$$this", "$$value"]
+    }}}
+    in_range = {"$and": [{"$gte": ["$$episode.episode_number", first_episode]}, {"$lte": ["$$episode.episode_number", last_episode]}]}
+    return [
+        {"$match": {"_id": anime_id, "seasons.season_number": season_number}},
+        {"$project": {"name": 1, "episodes": {"$map": {
+            "input": {"$filter": {"input": _season_episodes(season_number), "as": "episode", "cond": in_range}},
+            "as": "episode",
+            "in": {"episode_number": "$$episode.episode_number", "file": best_file}
+        }}}}
+    ]
+
+
+async def fetch_batch_selection(anime_id_str: str, season_number: int, first_episode: int, last_episode: int) -> Optional[BatchSelection]:
+    """One aggregation for a whole batch download. None when the anime or season doesn't exist."""
+    try: anime_id = ObjectId(anime_id_str)
+    except (InvalidId, TypeError): return None
+
+    docs = await MongoDB.anime_collection().aggregate(_batch_files_pipeline(anime_id, season_number, first_episode, last_episode)).to_list(1)
+    if not docs: return None
+
+    files: Dict[int, Dict[str, Any]] = {}
+    missing = set()
+    for episode in docs[0].get("episodes") or []:
+        episode_number = episode.get("episode_number")
+        if episode.get("file"): files.setdefault(episode_number, {**episode["file"], "episode_number": episode_number}) # First copy wins on duplicate numbers
+        else: missing.add(episode_number)
+    ordered = [files[episode_number] for episode_number in sorted(files)]
+    return BatchSelection(docs[0].get("name", "Anime Name Unknown"), ordered[:BATCH_MAX_FILES], sorted(missing - set(files)), len(ordered) > BATCH_MAX_FILES)
@@ -0,0 +1,81 @@
+# database/facet_counts.py
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+
+from config import FACET_CACHE_SECONDS, FACET_CACHE_MAX_ENTRIES
+from database.mongo_db import MongoDB
+from database.search_index import SearchIndex
+from database.filter_bitmaps import FilterBitmaps, FACETS
+
+
+facet_logger = logging.getLogger(__name__) # Logger for this module
+
+_FACET_FIELDS = {"genres": "genres", "year": "release_year", "status": "status"} # facet -> anime document field
+
+
+def _mongo_filter(filter_data: Dict[str, Any], facet: str) -> Dict[str, Any]:
+    """
+    $match stage for one facet. Genres are multi-select ($all), so picking one more genre narrows the current
+    selection: counts are conditioned on everything. Year and status are single-select, picking one replaces
+    the current value: counts ignore that facet's own selection.
+    """
+    match: Dict[str, Any] = {}
+    if filter_data.get("genres"): match["genres"] = {"$all": filter_data["genres"]}
+    if facet != "year" and filter_data.get("year") is not None: match["release_year"] = filter_data["year"]
+    if facet != "status" and filter_data.get("status"): match["status"] = filter_data["status"]
+    return match
+
+
+class FacetCounts:
+    """
+    Per-option counts for the browse filter menus ("🔫 Action (42)"), conditioned on the filters already selected.
+    Computed as popcounts over the in-memory filter bitmaps, or with one $facet aggregation while the search index
+    is not ready. Results are cached per filter combination; a catalog change (catalog_version) invalidates them.
+    """
+    _cache: "OrderedDict[Tuple, Tuple[Dict[str, Dict[Any, int]], float]]" = OrderedDict() # key -> (counts, computed at)
+
+    @classmethod
+    def _cache_key(cls, filter_data: Dict[str, Any]) -> Tuple:
+        return (SearchIndex.catalog_version(), tuple(sorted(filter_data.get("genres") or [])), filter_data.get("year"), filter_data.get("status"))
+
+
+    @classmethod
+    async def get(cls, filter_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Dict[Any, int]]]:
+        """
+        Returns {"genres": {genre: count}, "year": {year: count}, "status": {status: count}} for the given
+        browse filter_data. Options with no matching anime are absent. None if counts could not be computed.
+        """
+        filter_data = filter_data or {}
+        cache_key = cls._cache_key(filter_data)
+        cached = cls._cache.get(cache_key)
+        if cached and time.monotonic() - cached[1] < FACET_CACHE_SECONDS:
+            cls._cache.move_to_end(cache_key)
+            return cached[0]
+
+        try:
+            counts = FilterBitmaps.facet_counts(filter_data) if SearchIndex.is_ready() else await cls._from_aggregation(filter_data)
+        except Exception as e:
+            facet_logger.error(f"Failed to compute facet counts for filters {filter_data}: {e}", exc_info=True)
+            return None
+
+        cls._cache[cache_key] = (counts, time.monotonic())
+        if len(cls._cache) > FACET_CACHE_MAX_ENTRIES: cls._cache.popitem(last=False) # Evict least recently used
+        return counts
+
+
+    @classmethod
+    async def _from_aggregation(cls, filter_data: Dict[str, Any]) -> Dict[str, Dict[Any, int]]:
+        """All three facets in a single round trip: one $facet stage with a sub-pipeline per facet."""
+        facet_stage: Dict[str, List[Dict[str, Any]]] = {}
+        for facet in FACETS:
+            field = _FACET_FIELDS[facet]
+            sub_pipeline: List[Dict[str, Any]] = [{"$match": _mongo_filter(filter_data, facet)}]
+            if facet == "genres": sub_pipeline.append({"$unwind": "$genres"})
+            sub_pipeline.append({"$group": {"_id": f"${field}", "count": {"$sum": 1}}})
+            facet_stage[facet] = sub_pipeline
+
+        results = await MongoDB.anime_collection().aggregate([{"$facet": facet_stage}]).to_list(1)
+        facet_results = results[0] if results else {}
+        return {facet: {row["_id"]: row["count"] for row in facet_results.get(facet, []) if row["_id"] is not None} for facet in FACETS}
@@ -0,0 +1,146 @@
+# database/filter_bitmaps.py
+import bisect
+import logging
+from typing import Optional, List, Dict, Any, Tuple
+
+from database.search_index import SearchIndex
+from database.models import name_sort_key
+
+
+bitmap_logger = logging.getLogger(__name__) # Logger for this module
+
+FACETS = ("genres", "year", "status") # Same keys as the browse filter_data in user state
+
+
+def _bitmap_from_ordinals(ordinals: List[int], size: int) -> int:
+    """Packs ordinals into an int bitset (bit i set = ordinal i present) in O(n) via a bytearray."""
+    packed = bytearray((size + 7) // 8)
+    for ordinal in ordinals: packed[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(packed, "little")
+
+
+def _lowest_ordinals(mask: int, limit: int) -> List[int]:
+    """First `limit` set bits of mask, ascending."""
+    ordinals: List[int] = []
+    while mask and len(ordinals) < limit:
+        lowest_bit = mask & -mask
+        ordinals.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+    return ordinals
+
+
+def _highest_ordinals(mask: int, limit: int) -> List[int]:
+    """Last `limit` set bits of mask, ascending."""
+    ordinals: List[int] = []
+    while mask and len(ordinals) < limit:
+        highest = mask.bit_length() - 1
+        ordinals.append(highest)
+        mask ^= 1 << highest
+    ordinals.reverse()
+    return ordinals
+
+
+class FilterBitmaps:
+    """
+    Browse filter engine over the in-memory catalog. Every anime gets a dense ordinal in (name, _id) order,
+    the same order as the browse list, and every genre/year/status value a bitmap over those ordinals
+    (Python ints as arbitrary-length bitsets). A filter combination is a bitwise AND; a page is the next
+    PAGE_SIZE set bits after the anchor's ordinal; a count is a popcount.
+    Derived from SearchIndex and rebuilt lazily whenever its catalog_version moves: catalog writes are rare
+    admin actions, reads are every browse tap.
+    """
+    _version: int = -1 # SearchIndex catalog version the bitmaps were built for
+    _ordinal_ids: List[str] = [] # ordinal -> anime id (str), sorted by (name, _id)
+    _ordinal_names: List[str] = [] # ordinal -> name_sort_key(name), for bisect letter jumps
+    _ordinal_by_id: Dict[str, int] = {} # anime id (str) -> ordinal
+    _bitmaps: Dict[str, Dict[Any, int]] = {} # facet -> value -> bitmap
+    _all_mask: int = 0 # Every ordinal set (no filters)
+
+    @classmethod
+    def _ensure_current(cls):
+        if cls._version == SearchIndex.catalog_version(): return
+        version = SearchIndex.catalog_version()
+        entries = [(name_sort_key(entry.get("name")), anime_id_str, entry) for anime_id_str, entry in ((anime_id_str, SearchIndex.get_entry(anime_id_str)) for anime_id_str in SearchIndex.all_ids()) if entry]
+        entries.sort(key=lambda item: (item[0], item[1])) # Code point order of name_lower == MongoDB's binary order on it
+
+        ordinals_by_value: Dict[str, Dict[Any, List[int]]] = {facet: {} for facet in FACETS}
+        for ordinal, (_, _, entry) in enumerate(entries):
+            for genre in entry.get("genres") or []: ordinals_by_value["genres"].setdefault(genre, []).append(ordinal)
+            if entry.get("release_year") is not None: ordinals_by_value["year"].setdefault(entry["release_year"], []).append(ordinal)
+            if entry.get("status"): ordinals_by_value["status"].setdefault(entry["status"], []).append(ordinal)
+
+        size = len(entries)
+        cls._ordinal_ids = [anime_id_str for _, anime_id_str, _ in entries]
+        cls._ordinal_names = [name for name, _, _ in entries]
+        cls._ordinal_by_id = {anime_id_str: ordinal for ordinal, anime_id_str in enumerate(cls._ordinal_ids)}
+        cls._bitmaps = {facet: {value: _bitmap_from_ordinals(ordinals, size) for value, ordinals in values.items()} for facet, values in ordinals_by_value.items()}
+        cls._all_mask = (1 << size) - 1
+        cls._version = version
+        bitmap_logger.debug(f"Filter bitmaps rebuilt for catalog version {version}: {size} anime, {sum(len(values) for values in cls._bitmaps.values())} bitmaps.")
+
+
+    @classmethod
+    def filter_mask(cls, filter_data: Dict[str, Any], exclude_facet: Optional[str] = None) -> int:
+        """AND of the bitmaps of every active filter (genres/year/status), optionally leaving one facet out."""
+        cls._ensure_current()
+        mask = cls._all_mask
+        if exclude_facet != "genres":
+            for genre in filter_data.get("genres") or []: mask &= cls._bitmaps["genres"].get(genre, 0)
+        if exclude_facet != "year" and filter_data.get("year") is not None: mask &= cls._bitmaps["year"].get(filter_data["year"], 0)
+        if exclude_facet != "status" and filter_data.get("status"): mask &= cls._bitmaps["status"].get(filter_data["status"], 0)
+        return mask
+
+
+    @classmethod
+    def count(cls, filter_data: Dict[str, Any]) -> int:
+        return cls.filter_mask(filter_data).bit_count()
+
+
+    @classmethod
+    def facet_counts(cls, filter_data: Dict[str, Any]) -> Dict[str, Dict[Any, int]]:
+        """
+        Per-value counts of every facet as popcounts of (base AND value bitmap). Genres are counted within the
+        full selection (multi-select narrows), year/status without their own selection (single-select replaces).
+        """
+        counts: Dict[str, Dict[Any, int]] = {}
+        for facet in FACETS:
+            base_mask = cls.filter_mask(filter_data, exclude_facet=None if facet == "genres" else facet)
+            facet_counts: Dict[Any, int] = {}
+            for value, bitmap in cls._bitmaps[facet].items():
+                count = (base_mask & bitmap).bit_count()
+                if count: facet_counts[value] = count
+            counts[facet] = facet_counts
+        return counts
+
+
+    @classmethod
+    def page(cls, filter_data: Dict[str, Any], direction: Optional[str], anchor_id: Optional[str], letter: Optional[str], page_size: int) -> Tuple[List[str], bool, bool]:
+        """
+        One page of the filtered, name-ordered list. direction: "next" (after anchor_id), "previous" (before it),
+        or None (from the first title >= letter, or from the start). Returns (anime ids, has_previous, has_next).
+        An unknown anchor restarts from the first page.
+        """
+        mask = cls.filter_mask(filter_data)
+        anchor = cls._ordinal_by_id.get(anchor_id) if anchor_id else None
+
+        if direction == "previous" and anchor is not None:
+            before = mask & ((1 << anchor) - 1)
+            ordinals = _highest_ordinals(before, page_size + 1)
+            has_previous = len(ordinals) > page_size
+            ordinals = ordinals[-page_size:]
+            if ordinals: return [cls._ordinal_ids[ordinal] for ordinal in ordinals], has_previous, True
+
+        if direction == "next" and anchor is not None:
+            start = anchor + 1
+        elif direction is None and letter:
+            start = bisect.bisect_left(cls._ordinal_names, name_sort_key(letter))
+        else:
+            start = 0
+
+        ordinals = _lowest_ordinals(mask >> start, page_size + 1)
+        if not ordinals and start: # Anchor was the last title, or nothing from that letter on: show the first page
+            return cls.page(filter_data, None, None, None, page_size)
+        has_next = len(ordinals) > page_size
+        ordinals = [start + ordinal for ordinal in ordinals[:page_size]]
+        has_previous = bool(ordinals) and bool(mask & ((1 << ordinals[0]) - 1))
+        return [cls._ordinal_ids[ordinal] for ordinal in ordinals], has_previous, has_next
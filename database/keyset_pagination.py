@@ -0,0 +1,152 @@
+# database/keyset_pagination.py
+import logging
+import time
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from config import LIST_COUNT_CACHE_SECONDS
+from database.mongo_db import MongoDB
+from database.models import name_sort_key
+from database.search_index import SearchIndex
+from database.filter_bitmaps import FilterBitmaps
+
+
+pagination_logger = logging.getLogger(__name__) # Logger for this module
+
+# Keyset (cursor) pagination over anime lists sorted by (name_lower, _id): case-insensitive title order, the same
+# name_sort_key the in-memory filter bitmaps sort by, so both paths produce the same pages.
+# Instead of skip((page - 1) * PAGE_SIZE), every page is a range scan starting right after (or before) an anchor
+# document, so page 500 costs the same as page 1. Cursor tokens fit in callback data (64 bytes):
+#   n<anime_id>  page after this anime
+#   p<anime_id>  page before this anime
+#   l<letter>    page starting at the first title >= letter ("#" = start of the list)
+CURSOR_NEXT = "n"
+CURSOR_PREVIOUS = "p"
+CURSOR_LETTER = "l"
+LETTER_START = "#" # Jump target for titles starting with digits/symbols, i.e. the beginning of the list
+
+_SORT_ASCENDING = [("name_lower", 1), ("_id", 1)]
+_SORT_DESCENDING = [("name_lower", -1), ("_id", -1)]
+
+_count_cache: Dict[str, Tuple[int, float]] = {} # filter key -> (count, monotonic time computed)
+
+
+class KeysetPage(NamedTuple):
+    """One page of a keyset-paginated list, with the tokens for its neighbours (None at either end)."""
+    docs: List[Dict[str, Any]]
+    previous_cursor: Optional[str]
+    next_cursor: Optional[str]
+
+
+def _after(name_lower: str, anime_id: ObjectId) -> Dict[str, Any]:
+    return {"$or": [{"name_lower": {"$gt": name_lower}}, {"name_lower": name_lower, "_id": {"$gt": anime_id}}]}
+
+
+def _before(name_lower: str, anime_id: ObjectId) -> Dict[str, Any]:
+    return {"$or": [{"name_lower": {"$lt": name_lower}}, {"name_lower": name_lower, "_id": {"$lt": anime_id}}]}
+
+
+def _with_range(query_filter: Dict[str, Any], range_filter: Dict[str, Any]) -> Dict[str, Any]:
+    # Browse filters never use $or themselves, but $and keeps this correct if one ever does
+    if not query_filter: return range_filter
+    return {"$and": [query_filter, range_filter]}
+
+
+async def _anchor(cursor_value: str) -> Optional[Tuple[str, ObjectId]]:
+    """(name_lower, _id) of the anime a cursor points at. Served from the search index when possible (no DB hit)."""
+    try: anime_id = ObjectId(cursor_value)
+    except (InvalidId, TypeError): return None
+    entry = SearchIndex.get_entry(cursor_value)
+    if entry is None:
+        entry = await MongoDB.anime_collection().find_one({"_id": anime_id}, {"name": 1})
+    if entry is None or entry.get("name") is None: return None # Anchor deleted meanwhile
+    return name_sort_key(entry["name"]), anime_id
+
+
+async def _has_docs_before(query_filter: Dict[str, Any], first_doc: Dict[str, Any]) -> bool:
+    """Single-document index probe: is there anything before first_doc in the list?"""
+    probe = await MongoDB.anime_collection().find_one(_with_range(query_filter, _before(name_sort_key(first_doc["name"]), first_doc["_id"])), {"_id": 1})
+    return probe is not None
+
+
+def _bitmap_page(filter_data: Dict[str, Any], cursor: Optional[str], page_size: int) -> KeysetPage:
+    """Same page as the MongoDB path, served from the in-memory filter bitmaps (search index entries as documents)."""
+    direction = cursor[:1] if cursor else None
+    cursor_value = cursor[1:] if cursor else None
+    anime_ids, has_previous, has_next = FilterBitmaps.page(
+        filter_data,
+        {CURSOR_NEXT: "next", CURSOR_PREVIOUS: "previous"}.get(direction),
+        cursor_value if direction in (CURSOR_NEXT, CURSOR_PREVIOUS) else None,
+        cursor_value if direction == CURSOR_LETTER and cursor_value != LETTER_START else None,
+        page_size
+    )
+    docs = [SearchIndex.get_entry(anime_id_str) for anime_id_str in anime_ids]
+    if not docs: return KeysetPage([], None, None)
+    return KeysetPage(docs, f"{CURSOR_PREVIOUS}{docs[0]['_id']}" if has_previous else None, f"{CURSOR_NEXT}{docs[-1]['_id']}" if has_next else None)
+
+
+async def fetch_keyset_page(query_filter: Dict[str, Any], projection: Dict[str, Any], cursor: Optional[str], page_size: int, filter_data: Optional[Dict[str, Any]] = None) -> KeysetPage:
+    """
+    Fetches the anime page a cursor token points at (first page when cursor is None or stale).
+    When the browse filter_data behind query_filter is given and the search index is ready, the page comes from
+    the in-memory filter bitmaps (documents then carry the index projection, not `projection`).
+    Otherwise reads page_size + 1 documents: the extra one only tells whether another page exists in that direction.
+    """
+    if filter_data is not None and SearchIndex.is_ready(): return _bitmap_page(filter_data, cursor, page_size)
+
+    collection = MongoDB.anime_collection()
+    projection = {**projection, "name": 1} # The name is the sort key, always needed for the next cursor
+    direction = cursor[:1] if cursor else None
+    cursor_value = cursor[1:] if cursor else ""
+
+    if direction in (CURSOR_NEXT, CURSOR_PREVIOUS):
+        anchor = await _anchor(cursor_value)
+        if anchor is None:
+            pagination_logger.debug(f"Stale pagination cursor '{cursor}'. Restarting from the first page.")
+            return await fetch_keyset_page(query_filter, projection, None, page_size)
+        name, anime_id = anchor
+
+        if direction == CURSOR_PREVIOUS:
+            # Walk backwards from the anchor, then restore ascending order for display
+            docs = await collection.find(_with_range(query_filter, _before(name, anime_id)), projection).sort(_SORT_DESCENDING).limit(page_size + 1).to_list(page_size + 1)
+            has_previous = len(docs) > page_size
+            docs = list(reversed(docs[:page_size]))
+            if not docs: return await fetch_keyset_page(query_filter, projection, None, page_size)
+            return KeysetPage(docs, f"{CURSOR_PREVIOUS}{docs[0]['_id']}" if has_previous else None, f"{CURSOR_NEXT}{docs[-1]['_id']}")
+
+        docs = await collection.find(_with_range(query_filter, _after(name, anime_id)), projection).sort(_SORT_ASCENDING).limit(page_size + 1).to_list(page_size + 1)
+        if not docs: return await fetch_keyset_page(query_filter, projection, None, page_size)
+        has_next = len(docs) > page_size
+        docs = docs[:page_size]
+        return KeysetPage(docs, f"{CURSOR_PREVIOUS}{docs[0]['_id']}", f"{CURSOR_NEXT}{docs[-1]['_id']}" if has_next else None)
+
+    page_filter = query_filter
+    if direction == CURSOR_LETTER and cursor_value and cursor_value != LETTER_START:
+        page_filter = _with_range(query_filter, {"name_lower": {"$gte": name_sort_key(cursor_value)}})
+    docs = await collection.find(page_filter, projection).sort(_SORT_ASCENDING).limit(page_size + 1).to_list(page_size + 1)
+    if not docs and page_filter is not query_filter: return await fetch_keyset_page(query_filter, projection, None, page_size) # Nothing from that letter on
+    has_next = len(docs) > page_size
+    docs = docs[:page_size]
+    has_previous = page_filter is not query_filter and bool(docs) and await _has_docs_before(query_filter, docs[0])
+    return KeysetPage(docs, f"{CURSOR_PREVIOUS}{docs[0]['_id']}" if has_previous else None, f"{CURSOR_NEXT}{docs[-1]['_id']}" if has_next else None)
+
+
+async def estimate_total(query_filter: Dict[str, Any], filter_data: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Total for the list header without a count_documents per page turn:
+    - browse filters answered exactly by a popcount over the in-memory filter bitmaps when the search index is ready
+    - the unfiltered catalog from collection metadata (estimated_document_count)
+    - anything else via count_documents, cached for LIST_COUNT_CACHE_SECONDS
+    """
+    if filter_data is not None and SearchIndex.is_ready(): return FilterBitmaps.count(filter_data)
+
+    collection = MongoDB.anime_collection()
+    if not query_filter: return await collection.estimated_document_count()
+
+    cache_key = repr(sorted(query_filter.items()))
+    cached = _count_cache.get(cache_key)
+    if cached and time.monotonic() - cached[1] < LIST_COUNT_CACHE_SECONDS: return cached[0]
+    count = await collection.count_documents(query_filter)
+    _count_cache[cache_key] = (count, time.monotonic())
+    return count
@@ -38,6 +38,9 @@ class FileVersion(BaseModel):
     audio_languages: List[str] = Field(default_factory=list)
     subtitle_languages: List[str] = Field(default_factory=list)
     added_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc)) # When this version was added
+    storage_message_id: Optional[int] = None # Copy in FILE_STORAGE_CHANNEL_ID, source of fresh file_ids (handlers/file_health.py)
+    file_id_checked_at: Optional[datetime] = None # Last file_id health check
+    file_dead_at: Optional[datetime] = None # Set when neither the file_id nor a storage copy works anymore
 
 
 # Model for Episodes within a season (Nested in Season)
@@ -59,17 +62,28 @@ class Season(BaseModel):
     season_number: int # e.g., 1, 2, 3
     episode_count_declared: Optional[int] = None # Admin-set count of expected episodes
     episodes: List[Episode] = Field(default_factory=list) # Array of Episode objects
+    # Denormalized counters (maintained with the file writes, see MongoDB.add_file_version_to_episode)
+    episode_count: int = 0
+    available_episode_count: int = 0 # Episodes with at least one file version
+    file_count: int = 0
 
 
     class Config:
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str, datetime: lambda dt: dt.replace(tzinfo=timezone.utc).isoformat()}
 
+def name_sort_key(name: Optional[str]) -> str:
+    """Browse list order key (stored as name_lower): case-insensitive, so "lain" sorts with "L", not after "Z"."""
+    return (name or "").lower()
+
+
 # Model for Anime entry (Top Level Collection)
 class Anime(BaseModel):
     # Using PyObjectId for the _id field, aliased to 'id' for easier Python access
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     name: str # Anime name, unique (indexed)
+    name_lower: Optional[str] = None # name_sort_key(name), the browse list sort key; written with every name change
+    aliases: List[str] = Field(default_factory=list) # Alternative titles (romaji/English/abbreviations), used by search autocomplete
     poster_file_id: Optional[str] = None # Telegram file_id of the poster image
     synopsis: Optional[str] = None
     total_seasons_declared: int = 0 # Total number of seasons as declared by admin
@@ -80,6 +94,12 @@ class Anime(BaseModel):
 
     # Stats
     overall_download_count: int = 0 # Total files downloaded across all episodes of this anime series
+    # Denormalized content counters: details menus render from these instead of walking seasons/episodes/files
+    season_count: int = 0
+    episode_count: int = 0
+    available_episode_count: int = 0 # Episodes with at least one file version
+    file_count: int = 0
+    total_bytes: int = 0 # Sum of file_size_bytes over all file versions
     # Track download count per episode for Popular Episodes? Could add `download_count` to Episode model.
 
     last_updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc)) # Timestamp of last update
@@ -108,6 +128,9 @@ class User(BaseModel):
 
     notification_settings: Dict[str, bool] = Field(default_factory=dict) # Dictionary of notification preferences
 
+    reachability: str = "ok" # "ok" or "unreachable" (sends fail: bot blocked, account deleted)
+    reachability_at: Optional[datetime] = None # When reachability last changed
+
 
     class Config:
          validate_by_name = True
@@ -2,20 +2,59 @@
 import asyncio
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient # Asynchronous driver
-from pymongo.errors import ConnectionFailure, OperationFailure, ConfigurationError
+from pymongo.errors import ConnectionFailure, OperationFailure, ConfigurationError, CollectionInvalid
 from pymongo.write_concern import WriteConcern
-from typing import Optional, List, Dict, Any, Union
+from pymongo import ReturnDocument, UpdateOne
+from typing import Optional, List, Dict, Any, Union, Tuple
 from datetime import datetime, timezone
 from bson import ObjectId
 
 # Import constants from config
-from config import DB_NAME, STATE_COLLECTION_NAME
+from config import DB_NAME, STATE_COLLECTION_NAME, QUERY_PROFILER_ENABLED, DOWNLOAD_EVENTS_RETENTION_DAYS, NOTIFICATION_OUTBOX_RETENTION_DAYS
 # Import models for type hinting, validation, and conversion (need model_to_mongo_dict helper)
-from database.models import UserState, User, Anime, Request, GeneratedToken, FileVersion, PyObjectId, model_to_mongo_dict
+from database.models import UserState, User, Anime, Request, GeneratedToken, FileVersion, PyObjectId, model_to_mongo_dict, name_sort_key
+from database.query_profiler import QueryProfiler # Command monitoring: query shapes, explain sampling, index advice
 
 
 db_logger = logging.getLogger(__name__) # Logger for this module
 
+# Indices behind the browse list: (name_lower, _id) keyset range scans plus one per filter field. Shared with
+# benchmarks/filters, which builds them on a real collection when given --mongo-uri.
+ANIME_BROWSE_INDEXES: List[List[Tuple[str, int]]] = [
+    [("name_lower", 1), ("_id", 1)], # Keyset pagination range scans; name_lower makes the binary order case-insensitive
+    [("genres", 1)],
+    [("release_year", 1)],
+    [("status", 1)],
+]
+
+# Details/management menus render from the denormalized counters: everything but the episode/file tree
+ANIME_SUMMARY_PROJECTION = {"seasons.episodes": 0}
+
+# Recomputes the denormalized content counters of an anime from its seasons tree, on the server (update pipeline).
+# File adds/deletes keep them current with $inc; structural writes (season removal, files unset by a release date)
+# and the startup backfill use this.
+CONTENT_COUNTERS_PIPELINE = [
+    {"$set": {"seasons": {"$map": {"input": {"$ifNull": ["$seasons", []]}, "as": "season", "in": {"$mergeObjects": ["$$season", {
+        "episode_count": {"$size": {"$ifNull": ["$$season.episodes", []]}},
+        "available_episode_count": {"$size": {"$filter": {"input": {"$ifNull": ["$$season.episodes", []]}, "as": "episode", "cond": {"$gt": [{"$size": {"$ifNull": ["$$episode.files", []]}}, 0]}}}},
+        "file_count": {"$sum": {"$map": {"input": {"$ifNull": ["$$season.episodes", []]}, "as": "episode", "in": {"$size": {"$ifNull": ["$$episode.files", []]}}}}}
+    }]}}}}},
+    {"$set": {
+        "season_count": {"$size": "$seasons"},
+        "episode_count": {"$sum": "$seasons.episode_count"},
+        "available_episode_count": {"$sum": "$seasons.available_episode_count"},
+        "file_count": {"$sum": "$seasons.file_count"},
+        "total_bytes": {"$sum": {"$map": {"input": "$seasons", "as": "season", "in": {"$sum": {"$map": {
+            "input": {"$ifNull": ["$$season.episodes", []]}, "as": "episode", "in": {"$sum": "$$episode.files.file_size_bytes"}
+        }}}}}}
+    }}
+]
+
+
+def _episode_filter(anime_id_obj: ObjectId, season_number: int, episode_conditions: Dict[str, Any]) -> Dict[str, Any]:
+    # One season/episode pair matched in the same array elements (not just anywhere in the tree)
+    return {"_id": anime_id_obj, "seasons": {"$elemMatch": {"season_number": season_number, "episodes": {"$elemMatch": episode_conditions}}}}
+
 class MongoDB:
     """
     Singleton class to manage MongoDB connection.
@@ -64,7 +103,8 @@ class MongoDB:
                 connectTimeoutMS=5000,          # Timeout for the initial socket connection
                 tz_aware=True,                  # Automatically convert BSON datetimes to timezone-aware Python datetimes
                 uuidRepresentation='standard',  # Consistent handling of UUIDs
-                appname="AnimeRealmBot"         # Identify bot connections in DB logs
+                appname="AnimeRealmBot",        # Identify bot connections in DB logs
+                event_listeners=[QueryProfiler.listener()] if QUERY_PROFILER_ENABLED else [] # Per query shape latency/plan stats
             )
             db_logger.debug("AsyncIOMotorClient instance created.")
 
@@ -73,6 +113,7 @@ class MongoDB:
             # Set a default write concern (majority recommended for safety and for admin operations like deletion)
             cls._db = cls._client.get_database(db_name, write_concern=WriteConcern(w='majority'))
             db_logger.debug(f"Database instance '{db_name}' obtained with write concern '{WriteConcern(w='majority')}'.")
+            QueryProfiler.attach(cls._db)
 
 
             # Force an asynchronous operation that requires server interaction to confirm connection and credentials
@@ -145,6 +186,27 @@ class MongoDB:
     def generated_tokens_collection(cls): return cls.get_db()["generated_tokens"];
     @classmethod
     def states_collection(cls): return cls.get_db()[STATE_COLLECTION_NAME];
+    @classmethod
+    def similarity_collection(cls): return cls.get_db()["anime_similarity"]; # Precomputed similar-anime lists, keyed by anime _id
+    @classmethod
+    def broadcasts_collection(cls): return cls.get_db()["broadcasts"]; # Broadcast jobs with their resume cursor and counters
+    @classmethod
+    def download_events_collection(cls): return cls.get_db()["download_events"]; # Time-series: one document per delivered file
+    @classmethod
+    def notification_outbox_collection(cls): return cls.get_db()["notification_outbox"]; # Watchlist notification jobs with their lease and cursor
+
+
+    @classmethod
+    async def ensure_download_events_collection(cls):
+        """Creates download_events as a time-series collection (MongoDB 5.0+) if it doesn't exist yet."""
+        if "download_events" in await cls.get_db().list_collection_names(): return;
+        options: Dict[str, Any] = {"timeseries": {"timeField": "ts", "metaField": "meta", "granularity": "minutes"}};
+        if DOWNLOAD_EVENTS_RETENTION_DAYS > 0: options["expireAfterSeconds"] = DOWNLOAD_EVENTS_RETENTION_DAYS * 86400;
+        try:
+            await cls.get_db().create_collection("download_events", **options);
+            db_logger.info("Created the download_events time-series collection.");
+        except CollectionInvalid: pass; # Created concurrently
+        except OperationFailure as e: db_logger.warning(f"Could not create download_events as a time-series collection: {e}. Events go to a regular collection.");
 
     # --- State Management Utility Methods ---
     # Using the UserState model and STATE_COLLECTION_NAME
@@ -222,15 +284,18 @@ class MongoDB:
     # --- Common Data Interaction Utility Methods (Detailed Logging Added) ---
 
     @classmethod
-    async def get_anime_by_id(cls, anime_id: Union[str, ObjectId, PyObjectId]) -> Optional[Anime]:
-        """Retrieves a single anime document by its _id, returns as Anime model. Handles errors."""
+    async def get_anime_by_id(cls, anime_id: Union[str, ObjectId, PyObjectId], projection: Optional[Dict[str, Any]] = None) -> Optional[Anime]:
+        """
+        Retrieves a single anime document by its _id, returns as Anime model. Handles errors.
+        Pass ANIME_SUMMARY_PROJECTION when only details and counters are needed (seasons come without episodes).
+        """
         db_logger.debug(f"Attempting to get anime by ID: {anime_id}.");
         try:
             # Ensure input ID is ObjectId type for query
             if not isinstance(anime_id, ObjectId): anime_id_obj = ObjectId(str(anime_id));
             else: anime_id_obj = anime_id;
 
-            anime_doc = await cls.anime_collection().find_one({"_id": anime_id_obj});
+            anime_doc = await cls.anime_collection().find_one({"_id": anime_id_obj}, projection);
             if anime_doc:
                 try:
                     anime_instance = Anime(**anime_doc);
@@ -255,45 +320,55 @@ class MongoDB:
         season_number: int,
         episode_number: int,
         file_version: FileVersion # Pydantic model instance
-    ) -> bool:
-        """Adds a FileVersion subdocument to a specific episode's files array. Handles DB errors."""
+    ) -> int:
+        """
+        Adds a FileVersion subdocument to a specific episode's files array. Handles DB errors.
+        Returns the episode's number of files after the add (1: the episode just became available), 0 if nothing was added.
+        """
         db_logger.debug(f"Attempting to add file version '{file_version.file_unique_id}' to {anime_id}/S{season_number}E{episode_number}.");
         try:
             if not isinstance(anime_id, ObjectId): anime_id_obj = ObjectId(str(anime_id));
             else: anime_id_obj = anime_id;
 
-            # Use $elemMatch in filter for precision, positional operator $ for update path.
-            filter_query = {
-                 "_id": anime_id_obj,
-                 "seasons": { "$elemMatch": {"season_number": season_number,
-                     "episodes": { "$elemMatch": {"episode_number": episode_number} }
-                 }}
-            };
-            # Update operation adds to files array and updates timestamp, removes release_date.
-            update_operation = {
-                 "$push": {"seasons.$.episodes.$.files": model_to_mongo_dict(file_version)}, # Add subdocument dictionary
-                 "$set": {"last_updated_at": datetime.now(timezone.utc)}, # Update parent timestamp
-                 # Remove release_date field from episode subdocument using $unset
-                 "$unset": { "seasons.$.episodes.$.release_date": "" } # Unset requires field path and empty string value
-            };
-
-
-            result = await cls.anime_collection().update_one(
-                filter_query, update_operation
-            );
-
-            if result.matched_count == 0: db_logger.warning(f"Add file version matched 0 documents for {anime_id}/S{season_number}E{episode_number}. Path not found.");
-            elif result.modified_count == 0: db_logger.warning(f"Add file version matched {result.matched_count} but modified 0 for {anime_id}/S{season_number}E{episode_number}. Already existed?"); # Pushing always modifies unless array is huge and needs explicit space check?
-
-
-            db_logger.debug(f"Add file version update result: matched={result.matched_count}, modified={result.modified_count}.");
-
-            return result.matched_count > 0 and result.modified_count > 0; # True if document matched and modified
+            # The file push and the counters are one atomic update. Whether the episode becomes available is decided by the
+            # filter: first try "episode has no files yet" (+1 available), then "episode already has files". A concurrent
+            # add/delete can flip the episode between the two attempts, hence the second round.
+            array_filters = [{"season.season_number": season_number}, {"episode.episode_number": episode_number}]
+            for _ in range(2):
+                for first_file in (True, False):
+                    counters = {"file_count": 1, "total_bytes": file_version.file_size_bytes, "seasons.$[season].file_count": 1}
+                    if first_file: counters.update({"available_episode_count": 1, "seasons.$[season].available_episode_count": 1})
+                    # Adds to files array, updates counters and timestamp, removes release_date.
+                    update_operation = {
+                         "$push": {"seasons.$[season].episodes.$[episode].files": model_to_mongo_dict(file_version)}, # Add subdocument dictionary
+                         "$inc": counters,
+                         "$set": {"last_updated_at": datetime.now(timezone.utc)}, # Update parent timestamp
+                         "$unset": { "seasons.$[season].episodes.$[episode].release_date": "" } # Unset requires field path and empty string value
+                    };
+
+                    # The updated document comes back with only the ids of the tree, to count the episode's files
+                    anime_doc = await cls.anime_collection().find_one_and_update(
+                        _episode_filter(anime_id_obj, season_number, {"episode_number": episode_number, "files.0": {"$exists": not first_file}}),
+                        update_operation, array_filters=array_filters,
+                        projection={"seasons.season_number": 1, "seasons.episodes.episode_number": 1, "seasons.episodes.files.file_unique_id": 1},
+                        return_document=ReturnDocument.AFTER
+                    );
+                    if anime_doc is not None:
+                        file_count = next((
+                             len(episode_doc.get("files") or [])
+                             for season_doc in anime_doc.get("seasons", []) if season_doc.get("season_number") == season_number
+                             for episode_doc in season_doc.get("episodes", []) if episode_doc.get("episode_number") == episode_number
+                        ), 1);
+                        db_logger.debug(f"Add file version updated {anime_id}/S{season_number}E{episode_number}: first file of episode={first_file}, {file_count} files now.");
+                        return file_count;
+
+            db_logger.warning(f"Add file version matched 0 documents for {anime_id}/S{season_number}E{episode_number}. Path not found.");
+            return 0;
 
 
         except Exception as e:
              db_logger.error(f"DATABASE ERROR: Failed to add file version '{file_version.file_unique_id}' to episode {anime_id}/S{season_number}E{episode_number}: {e}", exc_info=True);
-             return False;
+             return 0;
 
     @classmethod
     async def delete_file_version_from_episode(
@@ -309,32 +384,101 @@ class MongoDB:
              if not isinstance(anime_id, ObjectId): anime_id_obj = ObjectId(str(anime_id));
              else: anime_id_obj = anime_id;
 
-             filter_query = {
-                  "_id": anime_id_obj,
-                  "seasons": { "$elemMatch": {"season_number": season_number,
-                      "episodes": { "$elemMatch": {"episode_number": episode_number} }
-                  }}
-             };
-             # $pull operator on the files array, inside the matched episode and season.
-             update_operation = {
-                  "$pull": { "seasons.$.episodes.$.files": {"file_unique_id": file_unique_id} },
-                  "$set": {"last_updated_at": datetime.now(timezone.utc)} # Update parent timestamp
-             };
+             # Size of the version being removed, for total_bytes (only ids and sizes of the tree are transferred)
+             anime_doc = await cls.anime_collection().find_one(
+                  _episode_filter(anime_id_obj, season_number, {"episode_number": episode_number, "files.file_unique_id": file_unique_id}),
+                  {"seasons.season_number": 1, "seasons.episodes.episode_number": 1, "seasons.episodes.files.file_unique_id": 1, "seasons.episodes.files.file_size_bytes": 1}
+             );
+             file_size_bytes = next((
+                  file_doc.get("file_size_bytes", 0)
+                  for season_doc in (anime_doc or {}).get("seasons", []) if season_doc.get("season_number") == season_number
+                  for episode_doc in season_doc.get("episodes", []) if episode_doc.get("episode_number") == episode_number
+                  for file_doc in episode_doc.get("files", []) if file_doc.get("file_unique_id") == file_unique_id
+             ), None);
+             if file_size_bytes is None:
+                  db_logger.warning(f"Delete file version found no version '{file_unique_id}' at {anime_id}/S{season_number}E{episode_number}.");
+                  return False;
+
+             # $pull on the files array of the matched season/episode, with the counters in the same atomic update.
+             # The filter decides whether this removes the episode's last file (-1 available), like the add above.
+             array_filters = [{"season.season_number": season_number}, {"episode.episode_number": episode_number}]
+             for _ in range(2):
+                 for last_file in (True, False):
+                     counters = {"file_count": -1, "total_bytes": -file_size_bytes, "seasons.$[season].file_count": -1}
+                     if last_file: counters.update({"available_episode_count": -1, "seasons.$[season].available_episode_count": -1})
+                     update_operation = {
+                          "$pull": { "seasons.$[season].episodes.$[episode].files": {"file_unique_id": file_unique_id} },
+                          "$inc": counters,
+                          "$set": {"last_updated_at": datetime.now(timezone.utc)} # Update parent timestamp
+                     };
+                     episode_conditions = {"episode_number": episode_number, "files.file_unique_id": file_unique_id}
+                     episode_conditions.update({"files": {"$size": 1}} if last_file else {"files.1": {"$exists": True}})
+
+                     result = await cls.anime_collection().update_one(_episode_filter(anime_id_obj, season_number, episode_conditions), update_operation, array_filters=array_filters);
+                     if result.matched_count > 0:
+                         db_logger.debug(f"Delete file version update result: matched={result.matched_count}, modified={result.modified_count}, last file of episode={last_file}.");
+                         return result.modified_count > 0; # True if document matched and modified
+
+             db_logger.warning(f"Delete file version matched 0 documents for {anime_id}/S{season_number}E{episode_number}. Version '{file_unique_id}' removed meanwhile?");
+             return False;
 
-             result = await cls.anime_collection().update_one( filter_query, update_operation );
 
-             if result.matched_count == 0: db_logger.warning(f"Delete file version matched 0 documents for {anime_id}/S{season_number}E{episode_number}. Path not found?");
-             elif result.modified_count == 0: db_logger.warning(f"Delete file version matched {result.matched_count} but modified 0 for {anime_id}/S{season_number}E{episode_number}. Version '{file_unique_id}' not found?");
+        except Exception as e:
+             db_logger.error(f"DATABASE ERROR: Failed to delete file version '{file_unique_id}' from {anime_id}/S{season_number}E{episode_number}: {e}", exc_info=True);
+             return False;
 
-             db_logger.debug(f"Delete file version update result: matched={result.matched_count}, modified={result.modified_count}.");
 
+    @classmethod
+    async def recount_anime_contents(cls, anime_id: Union[str, ObjectId, PyObjectId]) -> bool:
+        """Recomputes an anime's season/episode/file counters from its tree in one server-side update. Logs errors, doesn't raise."""
+        try:
+            if not isinstance(anime_id, ObjectId): anime_id_obj = ObjectId(str(anime_id));
+            else: anime_id_obj = anime_id;
+            result = await cls.anime_collection().update_one({"_id": anime_id_obj}, CONTENT_COUNTERS_PIPELINE);
+            return result.matched_count > 0;
+        except Exception as e:
+            db_logger.error(f"DATABASE ERROR: Failed to recount contents of anime {anime_id}: {e}", exc_info=True);
+            return False;
 
-             return result.matched_count > 0 and result.modified_count > 0; # True if document matched and modified
 
+    @classmethod
+    async def backfill_content_counters(cls) -> int:
+        """Computes the content counters of every anime that doesn't have them yet (documents from before the counters existed)."""
+        result = await cls.anime_collection().update_many({"file_count": {"$exists": False}}, CONTENT_COUNTERS_PIPELINE);
+        if result.modified_count: db_logger.info(f"Backfilled content counters of {result.modified_count} anime.");
+        return result.modified_count;
 
-        except Exception as e:
-             db_logger.error(f"DATABASE ERROR: Failed to delete file version '{file_unique_id}' from {anime_id}/S{season_number}E{episode_number}: {e}", exc_info=True);
-             return False;
+
+    @classmethod
+    async def backfill_name_lower(cls) -> int:
+        """
+        Sets name_lower (the browse sort key) where it is missing or out of date. Computed in Python, not with $toLower,
+        which only lowercases ASCII: the in-memory browse engines sort by the same name_sort_key.
+        """
+        updates = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"name_lower": name_sort_key(doc.get("name"))}})
+            async for doc in cls.anime_collection().find({}, {"name": 1, "name_lower": 1})
+            if doc.get("name_lower") != name_sort_key(doc.get("name"))
+        ];
+        if updates:
+            await cls.anime_collection().bulk_write(updates, ordered=False);
+            db_logger.info(f"Backfilled name_lower of {len(updates)} anime.");
+        return len(updates);
+
+
+    @classmethod
+    async def backfill_reachability(cls) -> int:
+        """
+        Marks users from before reachability tracking as reachable, so the partial indices over reachable users include
+        them. Also restores users marked unreachable by errors that no longer count (PeerIdInvalid, UserNotParticipant).
+        """
+        result = await cls.users_collection().update_many({"reachability": {"$exists": False}}, {"$set": {"reachability": "ok"}});
+        restored = await cls.users_collection().update_many(
+            {"reachability": "unreachable", "reachability_error": {"$in": ["PeerIdInvalid", "UserNotParticipant"]}},
+            {"$set": {"reachability": "ok", "reachability_at": datetime.now(timezone.utc), "reachability_error": None}}
+        );
+        if result.modified_count or restored.modified_count: db_logger.info(f"Backfilled reachability of {result.modified_count} users, restored {restored.modified_count}.");
+        return result.modified_count + restored.modified_count;
 
 
     @classmethod
@@ -342,17 +486,18 @@ class MongoDB:
         cls,
         user_id: int,
         anime_id: Union[str, ObjectId, PyObjectId],
+        count: int = 1,
     ):
-        """Atomically increments download counts for a user and an anime. Logs errors, doesn't raise."""
+        """Atomically increments download counts for a user and an anime (by `count` files). Logs errors, doesn't raise."""
         db_logger.debug(f"Attempting to increment download counts for user {user_id} and anime {anime_id}.");
         try:
-            user_update_result = await cls.users_collection().update_one({"user_id": user_id}, {"$inc": {"download_count": 1}, "$set": {"last_activity_at": datetime.now(timezone.utc)}});
+            user_update_result = await cls.users_collection().update_one({"user_id": user_id}, {"$inc": {"download_count": count}, "$set": {"last_activity_at": datetime.now(timezone.utc)}});
             if user_update_result.matched_count == 0: db_logger.warning(f"Increment user download count matched 0 users for ID {user_id}. User not found.");
             else: db_logger.debug(f"Incremented user download count for {user_id}. Matched: {user_update_result.matched_count}, Modified: {user_update_result.modified_count}.");
 
             if not isinstance(anime_id, ObjectId): anime_id_obj = ObjectId(str(anime_id)); 
             else: anime_id_obj = anime_id;
-            anime_update_result = await cls.anime_collection().update_one({"_id": anime_id_obj}, {"$inc": {"overall_download_count": 1}, "$set": {"last_activity_at": datetime.now(timezone.utc)}});
+            anime_update_result = await cls.anime_collection().update_one({"_id": anime_id_obj}, {"$inc": {"overall_download_count": count}, "$set": {"last_activity_at": datetime.now(timezone.utc)}});
             if anime_update_result.matched_count == 0: db_logger.warning(f"Increment anime overall download count matched 0 anime for ID {anime_id_obj}. Anime not found.");
             else: db_logger.debug(f"Incremented anime overall download count for {anime_id_obj}. Matched: {anime_update_result.matched_count}, Modified: {anime_update_result.modified_count}.");
 
@@ -415,6 +560,9 @@ async def init_db(uri: str):
         db_logger.info("Getting database instance for indexing.");
         db = MongoDB.get_db(); # This will raise ConnectionFailure if connect failed
 
+        try: await MongoDB.ensure_download_events_collection(); # Before its indices below
+        except Exception as e: db_logger.error(f"Failed to set up the download_events collection: {e}", exc_info=True);
+
         db_logger.info("Creating/Ensuring MongoDB indices for performance and constraints...");
         index_coroutines = [
             # User collection indices - **CORRECTED CALLS HERE**
@@ -425,6 +573,9 @@ async def init_db(uri: str):
             db["users"].create_index([("premium_status", 1)]),
             db["users"].create_index([("watchlist", 1)]),
             db["users"].create_index([("join_date", 1)]),
+            # Broadcast pages and watchlist notifications only read reachable users
+            db["users"].create_index([("_id", 1), ("user_id", 1)], name="reachable_id_user_id", partialFilterExpression={"reachability": "ok"}),
+            db["users"].create_index([("watchlist", 1), ("_id", 1)], name="reachable_watchlist_id", partialFilterExpression={"reachability": "ok"}), # Outbox streams subscribers in _id order
 
             # Anime collection indices - **CORRECTED CALLS HERE**
             db["anime"].create_index(
@@ -433,10 +584,8 @@ async def init_db(uri: str):
                  collation={'locale': 'en', 'strength': 2}
             ),
             db["anime"].create_index([("name", "text")]),
+            *[db["anime"].create_index(keys) for keys in ANIME_BROWSE_INDEXES],
             db["anime"].create_index([("overall_download_count", -1)]),
-            db["anime"].create_index([("genres", 1)]),
-            db["anime"].create_index([("release_year", 1)]),
-            db["anime"].create_index([("status", 1)]),
             db["anime"].create_index([("seasons.season_number", 1)]),
             db["anime"].create_index([("seasons.episodes.episode_number", 1)]),
             db["anime"].create_index([("seasons.episodes.files.file_unique_id", 1)]),
@@ -459,6 +608,14 @@ async def init_db(uri: str):
             db["user_states"].create_index([("user_id", 1)], unique=True),
             db["user_states"].create_index([("handler", 1), ("step", 1)]),
             db["user_states"].create_index([("updated_at", 1)]),
+
+            # Notification outbox: workers claim the oldest pending (or expired lease) job; finished jobs expire
+            db["notification_outbox"].create_index([("status", 1), ("lease_until", 1), ("created_at", 1)]),
+            db["notification_outbox"].create_index([("finished_at", 1)], expireAfterSeconds=NOTIFICATION_OUTBOX_RETENTION_DAYS * 86400),
+            db["notification_outbox"].create_index([("anime_id", 1)], unique=True, partialFilterExpression={"status": "collecting"}), # One open digest per anime
+
+            # Download events (time-series, secondary indices on meta + time)
+            db["download_events"].create_index([("meta.anime_id", 1), ("ts", -1)]),
         ];
 
         db_logger.info(f"Executing {len(index_coroutines)} index creation tasks concurrently...");
@@ -478,6 +635,13 @@ async def init_db(uri: str):
 
 
         db_logger.info("Database indexing process completed.");
+
+        try: await MongoDB.backfill_content_counters();
+        except Exception as e: db_logger.error(f"Content counters backfill failed: {e}. Details menus show 0 counts for anime without counters.", exc_info=True);
+        try: await MongoDB.backfill_name_lower();
+        except Exception as e: db_logger.error(f"name_lower backfill failed: {e}. Browse pages read from MongoDB skip anime without it.", exc_info=True);
+        try: await MongoDB.backfill_reachability();
+        except Exception as e: db_logger.error(f"Reachability backfill failed: {e}. Users without the field are skipped by broadcasts and notifications.", exc_info=True);
         main_logger.info("Database initialization complete.") # Final confirmation log in main_logger
 
 
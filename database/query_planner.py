@@ -0,0 +1,82 @@
+# database/query_planner.py
+import logging
+from typing import Optional, List, Dict, Any, Set, NamedTuple
+
+from database.search_index import SearchIndex
+from database.models import name_sort_key
+
+
+planner_logger = logging.getLogger(__name__) # Logger for this module
+
+# Relative cost of checking one document's name against the query tokens (string splits and prefix tests)
+# versus one set insert/lookup on the text side. Driving from filters pays this per filtered document.
+NAME_CHECK_COST = 4
+
+
+class QueryPlan(NamedTuple):
+    """How a combined text + browse filter query will be executed (see plan_query)."""
+    driver: str # "text", "filters" or "all" (no text, no filters): which side is iterated
+    query_tokens: List[str] # Prepared (normalized, spell-corrected) query tokens, empty for pure filtering
+    filter_sets: Optional[List[Set[str]]] # Filter posting sets, smallest first; None when no filter is active
+    estimated_text_matches: int # Upper bound on text matches (0 when there is no text)
+    estimated_filter_matches: int # Upper bound on filter matches: size of the smallest filter posting set
+
+
+def plan_query(query_text: Optional[str], filter_data: Dict[str, Any]) -> QueryPlan:
+    """
+    Chooses the cheaper side to drive a combined query from, using posting sizes as selectivity estimates.
+    A rare filter ("OVA", 1998) is iterated and its documents' names checked against the text;
+    a rare title word ("kyojin") is looked up in the token postings and its ids probed in the filter sets.
+    """
+    query_tokens = SearchIndex.prepare_query_tokens(query_text) if query_text else []
+    filter_sets = SearchIndex.filter_posting_sets(filter_data or {})
+    estimated_filter_matches = len(filter_sets[0]) if filter_sets else SearchIndex.size()
+
+    if not query_tokens:
+        driver = "filters" if filter_sets else "all"
+        return QueryPlan(driver, [], filter_sets, 0, estimated_filter_matches)
+
+    # Text estimate is only needed up to the point where it loses against the filter side
+    stop_at = estimated_filter_matches * NAME_CHECK_COST if filter_sets else None
+    estimated_text_matches = SearchIndex.estimate_text_matches(query_tokens, stop_at=stop_at)
+    if filter_sets and estimated_filter_matches * NAME_CHECK_COST < estimated_text_matches: driver = "filters"
+    else: driver = "text"
+    return QueryPlan(driver, query_tokens, filter_sets, estimated_text_matches, estimated_filter_matches)
+
+
+def execute_plan(plan: QueryPlan) -> List[str]:
+    """
+    Runs a plan against the in-memory index. Returns ranked anime ids: by match quality then downloads
+    when there is text, otherwise alphabetically like the browse list.
+    """
+    if plan.driver == "text":
+        candidate_ids = SearchIndex.text_candidate_ids(plan.query_tokens)
+        if plan.filter_sets:
+            # Probe the smallest filter set first: it rejects the most candidates
+            candidate_ids = {anime_id_str for anime_id_str in candidate_ids if all(anime_id_str in ids for ids in plan.filter_sets)}
+        return SearchIndex.rank_ids(candidate_ids, plan.query_tokens)
+
+    if plan.driver == "filters":
+        driving_set, other_sets = plan.filter_sets[0], plan.filter_sets[1:]
+        matching_ids = [
+            anime_id_str for anime_id_str in driving_set
+            if all(anime_id_str in ids for ids in other_sets)
+            and (not plan.query_tokens or SearchIndex.name_matches_tokens(anime_id_str, plan.query_tokens))
+        ]
+        if plan.query_tokens: return SearchIndex.rank_ids(matching_ids, plan.query_tokens)
+        return _sorted_by_name(matching_ids)
+
+    return _sorted_by_name(SearchIndex.all_ids())
+
+
+def _sorted_by_name(anime_ids) -> List[str]:
+    # (name_lower, _id) like the keyset-paginated browse list, so equal names keep a stable order
+    return sorted(anime_ids, key=lambda anime_id_str: (name_sort_key((SearchIndex.get_entry(anime_id_str) or {}).get("name")), anime_id_str))
+
+
+def search_within_filters(query_text: Optional[str], filter_data: Dict[str, Any]) -> List[str]:
+    """Plans and runs a text query restricted to the browse filters ({"genres": [...], "year": ..., "status": ...})."""
+    plan = plan_query(query_text, filter_data)
+    ranked_ids = execute_plan(plan)
+    planner_logger.debug(f"Query '{query_text}' with filters {filter_data}: driver={plan.driver}, est. text={plan.estimated_text_matches}, est. filters={plan.estimated_filter_matches}, matches={len(ranked_ids)}.")
+    return ranked_ids
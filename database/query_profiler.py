@@ -0,0 +1,331 @@
+# database/query_profiler.py
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, Tuple
+from pymongo import monitoring
+
+from config import QUERY_PROFILER_SLOW_MS, QUERY_PROFILER_EXPLAIN_INTERVAL_SECONDS, QUERY_PROFILER_MAX_SHAPES, QUERY_PROFILER_EXAMINED_RATIO
+
+
+profiler_logger = logging.getLogger(__name__) # Logger for this module
+
+# Which bot handler issued a query. Set per update by handlers/query_profiling.py; Motor runs pymongo on worker
+# threads with a copy of the caller's context, so the command listener sees the value of the awaiting handler.
+current_handler: ContextVar[str] = ContextVar("query_profiler_handler", default="background")
+
+PROFILER_COMMENT = "query_profiler" # Commands issued by the profiler itself carry this comment and are not recorded
+
+# Commands fingerprinted by their filter shape and sampled with explain()
+_PROFILED_COMMANDS = ("find", "aggregate", "count", "distinct", "update", "delete", "findAndModify")
+_LIST_OPERATORS = ("$in", "$nin", "$all")
+_LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+_RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex", "$exists", "$not")
+_SESSION_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction", "writeConcern", "readConcern") # Not allowed inside explain
+
+
+def query_shape(value: Any) -> Any:
+    """Replaces every literal in a filter with "?" but keeps field names and operators: one shape per query pattern."""
+    if isinstance(value, dict):
+        shape = {}
+        for key, inner in value.items():
+            if key in _LOGICAL_OPERATORS and isinstance(inner, list):
+                shape[key] = sorted({json.dumps(query_shape(clause), sort_keys=True) for clause in inner})
+            elif key in _LIST_OPERATORS:
+                shape[key] = ["?"]
+            else:
+                shape[key] = query_shape(inner)
+        return shape
+    if isinstance(value, list): return ["?"]
+    return "?"
+
+
+def _sort_shape(sort: Any) -> List[List[Any]]:
+    # Pairs, not a dict: key order matters for sorts and fingerprints are dumped with sort_keys
+    return [[field, direction] for field, direction in dict(sort or {}).items()]
+
+
+def _pipeline_shape(pipeline: List[Dict[str, Any]]) -> List[Any]:
+    shape = []
+    for stage in pipeline or []:
+        stage_name, body = next(iter(stage.items())) if stage else ("?", None)
+        if stage_name == "$match": shape.append({"$match": query_shape(body)})
+        elif stage_name == "$sort": shape.append({"$sort": _sort_shape(body)})
+        elif stage_name == "$facet": shape.append({"$facet": {name: _pipeline_shape(sub) for name, sub in body.items()}})
+        elif stage_name in ("$project", "$group"): shape.append({stage_name: sorted(body)})
+        else: shape.append(stage_name)
+    return shape
+
+
+def _update_shape(update: Any) -> Any:
+    if isinstance(update, list): return _pipeline_shape(update) # Pipeline-style update
+    return {operator: sorted(fields) if isinstance(fields, dict) else "?" for operator, fields in (update or {}).items()}
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """Literal-free description of a command: filter, sort and projection/update keys."""
+    if command_name == "find":
+        return {"filter": query_shape(command.get("filter") or {}), "sort": _sort_shape(command.get("sort")), "projection": sorted(command.get("projection") or {})}
+    if command_name == "aggregate": return {"pipeline": _pipeline_shape(command.get("pipeline"))}
+    if command_name == "count": return {"filter": query_shape(command.get("query") or {})}
+    if command_name == "distinct": return {"key": command.get("key"), "filter": query_shape(command.get("query") or {})}
+    if command_name == "update":
+        statement = (command.get("updates") or [{}])[0]
+        return {"filter": query_shape(statement.get("q") or {}), "update": _update_shape(statement.get("u"))}
+    if command_name == "delete": return {"filter": query_shape(((command.get("deletes") or [{}])[0]).get("q") or {})}
+    if command_name == "findAndModify":
+        return {"filter": query_shape(command.get("query") or {}), "sort": _sort_shape(command.get("sort")), "update": _update_shape(command.get("update"))}
+    return {}
+
+
+def _returned_count(command_name: str, reply: Dict[str, Any]) -> int:
+    if command_name in ("find", "aggregate"): return len((reply.get("cursor") or {}).get("firstBatch") or [])
+    if command_name == "distinct": return len(reply.get("values") or [])
+    if command_name == "findAndModify": return 1 if reply.get("value") is not None else 0
+    return int(reply.get("n") or 0) # count, update (matched), delete
+
+
+def _walk_plan(plan: Dict[str, Any], stages: List[str], index_names: List[str]):
+    if not isinstance(plan, dict): return
+    if plan.get("stage"): stages.append(plan["stage"])
+    if plan.get("indexName"): index_names.append(plan["indexName"])
+    for child_key in ("inputStage", "queryPlan", "outerStage", "innerStage"): _walk_plan(plan.get(child_key), stages, index_names)
+    for child in plan.get("inputStages") or []: _walk_plan(child, stages, index_names)
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Winning plan stages, indexes used and docs/keys examined vs returned from an executionStats explain."""
+    planner, execution = explain.get("queryPlanner"), explain.get("executionStats")
+    if planner is None and explain.get("stages"): # Aggregations explain their initial $cursor stage
+        cursor_stage = explain["stages"][0].get("$cursor") or {}
+        planner, execution = cursor_stage.get("queryPlanner"), cursor_stage.get("executionStats")
+    stages: List[str] = []
+    index_names: List[str] = []
+    _walk_plan((planner or {}).get("winningPlan"), stages, index_names)
+    execution = execution or {}
+    return {
+        "stages": stages,
+        "indexes": index_names,
+        "collscan": "COLLSCAN" in stages,
+        "docs_examined": execution.get("totalDocsExamined"),
+        "keys_examined": execution.get("totalKeysExamined"),
+        "returned": execution.get("nReturned"),
+    }
+
+
+def _explainable(command: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in command.items() if not key.startswith("$") and key not in _SESSION_FIELDS}
+
+
+def recommend_index(shape: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """
+    Compound index for a query shape following the Equality, Sort, Range rule. Only top-level AND filters are
+    considered ($or/$text shapes get no recommendation). None when the shape has nothing to index.
+    """
+    query_filter = shape.get("filter")
+    if query_filter is None and shape.get("pipeline"):
+        first_stage = shape["pipeline"][0]
+        query_filter = first_stage.get("$match") if isinstance(first_stage, dict) else None
+    if not isinstance(query_filter, dict) or any(key in query_filter for key in ("$or", "$nor", "$text", "$where", "$expr")): return None
+
+    equality_fields, range_fields = [], []
+    for field, condition in query_filter.items():
+        if field == "$and": return None
+        operators = set(condition) if isinstance(condition, dict) else set()
+        if operators & set(_RANGE_OPERATORS): range_fields.append(field)
+        else: equality_fields.append(field) # Literal, $in, $all, $elemMatch
+    index_keys: Dict[str, int] = {field: 1 for field in equality_fields}
+    for field, direction in shape.get("sort") or []:
+        if field not in index_keys: index_keys[field] = direction if direction in (1, -1) else 1
+    for field in range_fields:
+        if field not in index_keys: index_keys[field] = 1
+    return index_keys or None
+
+
+class QueryProfiler:
+    """
+    Per query shape statistics from MongoDB command monitoring: call count, latency, documents returned and which
+    handlers issue it. Shapes slower than QUERY_PROFILER_SLOW_MS get an explain("executionStats") at most once per
+    QUERY_PROFILER_EXPLAIN_INTERVAL_SECONDS. Index usage comes from $indexStats. Read by the /query_report admin command.
+    """
+    _lock = threading.Lock() # Listener callbacks run on Motor's worker threads
+    _shapes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict() # fingerprint -> stats
+    _pending: Dict[Tuple[int, int], Tuple[str, Dict[str, Any], Dict[str, Any], str]] = {} # (request, operation id) -> (fingerprint, shape, command, handler)
+    _db = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _explain_tasks: set = set()
+    _started_at: float = time.time()
+
+    @classmethod
+    def listener(cls) -> monitoring.CommandListener:
+        """Command listener for AsyncIOMotorClient(event_listeners=[...]). Must be called from the bot's event loop."""
+        cls._loop = asyncio.get_running_loop()
+        return _CommandProfiler()
+
+
+    @classmethod
+    def attach(cls, db):
+        """Database the profiled commands run against; used for explain() and $indexStats."""
+        cls._db = db
+
+
+    @classmethod
+    def set_handler(cls, label: str):
+        current_handler.set(label)
+
+
+    # --- Listener callbacks ---
+
+    @classmethod
+    def _started(cls, event: monitoring.CommandStartedEvent):
+        if event.command_name not in _PROFILED_COMMANDS or cls._db is None or event.database_name != cls._db.name: return
+        if event.command.get("comment") == PROFILER_COMMENT: return
+        collection = event.command.get(event.command_name)
+        shape = command_shape(event.command_name, event.command)
+        fingerprint = f"{collection}.{event.command_name} {json.dumps(shape, sort_keys=True, default=str)}"
+        with cls._lock:
+            cls._pending[(event.request_id, event.operation_id)] = (fingerprint, shape, _explainable(event.command), current_handler.get())
+
+
+    @classmethod
+    def _succeeded(cls, event: monitoring.CommandSucceededEvent):
+        with cls._lock:
+            pending = cls._pending.pop((event.request_id, event.operation_id), None)
+            if pending is None: return
+            fingerprint, shape, command, handler = pending
+            duration_ms = event.duration_micros / 1000
+            stats = cls._shapes.get(fingerprint)
+            if stats is None:
+                stats = {
+                    "collection": command.get(event.command_name), "command": event.command_name, "shape": shape,
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "returned": 0, "handlers": Counter(),
+                    "explain": None, "explained_at": None, "sample": None,
+                }
+                cls._shapes[fingerprint] = stats
+                while len(cls._shapes) > QUERY_PROFILER_MAX_SHAPES: cls._shapes.popitem(last=False) # Forget the oldest shapes
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["returned"] += _returned_count(event.command_name, event.reply)
+            stats["handlers"][handler] += 1
+            needs_explain = duration_ms >= QUERY_PROFILER_SLOW_MS and (stats["explained_at"] is None or time.monotonic() - stats["explained_at"] >= QUERY_PROFILER_EXPLAIN_INTERVAL_SECONDS)
+            if needs_explain:
+                stats["explained_at"] = time.monotonic()
+                stats["sample"] = command
+        if needs_explain and cls._loop is not None:
+            cls._loop.call_soon_threadsafe(cls._schedule_explain, fingerprint)
+
+
+    @classmethod
+    def _failed(cls, event: monitoring.CommandFailedEvent):
+        with cls._lock: cls._pending.pop((event.request_id, event.operation_id), None)
+
+
+    # --- Explain sampling ---
+
+    @classmethod
+    def _schedule_explain(cls, fingerprint: str):
+        task = asyncio.ensure_future(cls._explain(fingerprint))
+        cls._explain_tasks.add(task) # Keep a reference until done
+        task.add_done_callback(cls._explain_tasks.discard)
+
+
+    @classmethod
+    async def _explain(cls, fingerprint: str):
+        stats = cls._shapes.get(fingerprint)
+        if stats is None or stats["sample"] is None or cls._db is None: return
+        try:
+            explain = await cls._db.command({"explain": stats["sample"], "verbosity": "executionStats"})
+            stats["explain"] = summarize_explain(explain)
+            profiler_logger.info(f"Explained slow query shape {fingerprint[:200]}: {stats['explain']}")
+        except Exception as e:
+            profiler_logger.warning(f"Failed to explain query shape {fingerprint[:200]}: {e}")
+
+
+    # --- Reporting ---
+
+    @classmethod
+    def shapes(cls, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Shape statistics ordered by total time spent, most expensive first."""
+        with cls._lock: snapshot = [dict(stats, fingerprint=fingerprint) for fingerprint, stats in cls._shapes.items()]
+        snapshot.sort(key=lambda stats: stats["total_ms"], reverse=True)
+        return snapshot[:limit] if limit else snapshot
+
+
+    @classmethod
+    async def index_usage(cls) -> Dict[str, List[Dict[str, Any]]]:
+        """$indexStats per collection: {collection: [{"name", "key", "ops", "since"}]}."""
+        usage: Dict[str, List[Dict[str, Any]]] = {}
+        if cls._db is None: return usage
+        for collection_name in await cls._db.list_collection_names():
+            try:
+                rows = await cls._db[collection_name].aggregate([{"$indexStats": {}}], comment=PROFILER_COMMENT).to_list(None)
+            except Exception as e:
+                profiler_logger.warning(f"Failed to read $indexStats for collection {collection_name}: {e}")
+                continue
+            usage[collection_name] = [
+                {"name": row.get("name"), "key": dict(row.get("key") or {}), "ops": (row.get("accesses") or {}).get("ops", 0), "since": (row.get("accesses") or {}).get("since")}
+                for row in rows
+            ]
+        return usage
+
+
+    @classmethod
+    async def recommendations(cls) -> Dict[str, Any]:
+        """
+        Index advice from the sampled explains and $indexStats:
+        - "create": compound indexes for shapes that scan the collection or examine far more documents than they return
+        - "unused": indexes with no recorded use since the server started (the _id index is never listed)
+        """
+        usage = await cls.index_usage()
+        existing_keys = {collection: [index["key"] for index in indexes] for collection, indexes in usage.items()}
+        create: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for stats in cls.shapes():
+            explain = stats.get("explain")
+            if not explain: continue
+            returned = max(explain.get("returned") or 0, 1)
+            inefficient = explain["collscan"] or (explain.get("docs_examined") or 0) > QUERY_PROFILER_EXAMINED_RATIO * returned
+            if not inefficient: continue
+            index_keys = recommend_index(stats["shape"])
+            if not index_keys: continue
+            # An existing index with this exact prefix means the planner had a choice: report it, don't duplicate it
+            covered_by = next((keys for keys in existing_keys.get(stats["collection"], []) if list(keys.items())[:len(index_keys)] == list(index_keys.items())), None)
+            advice_key = (stats["collection"], json.dumps(index_keys))
+            advice = create.setdefault(advice_key, {"collection": stats["collection"], "keys": index_keys, "covered_by": covered_by, "shapes": [], "calls": 0})
+            advice["shapes"].append(stats["fingerprint"])
+            advice["calls"] += stats["count"]
+
+        unused = [
+            {"collection": collection, "name": index["name"], "key": index["key"], "since": index["since"]}
+            for collection, indexes in usage.items() for index in indexes
+            if index["ops"] == 0 and index["name"] != "_id_"
+        ]
+        return {"create": sorted(create.values(), key=lambda advice: advice["calls"], reverse=True), "unused": unused, "since": cls._started_at}
+
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._shapes.clear()
+            cls._pending.clear()
+        cls._started_at = time.time()
+
+
+class _CommandProfiler(monitoring.CommandListener):
+    """pymongo listener forwarding to QueryProfiler. Must stay cheap: it runs on every command."""
+
+    def started(self, event):
+        try: QueryProfiler._started(event)
+        except Exception as e: profiler_logger.debug(f"Query profiler failed on command start: {e}")
+
+    def succeeded(self, event):
+        try: QueryProfiler._succeeded(event)
+        except Exception as e: profiler_logger.debug(f"Query profiler failed on command success: {e}")
+
+    def failed(self, event):
+        try: QueryProfiler._failed(event)
+        except Exception as e: profiler_logger.debug(f"Query profiler failed on command failure: {e}")
@@ -0,0 +1,450 @@
+# database/search_index.py
+import asyncio
+import bisect
+import logging
+import re
+import unicodedata
+from typing import Optional, List, Dict, Any, Set, Tuple, Union, Iterable
+from bson import ObjectId
+
+from config import SPELL_MAX_EDIT_DISTANCE, SPELL_PREFIX_LENGTH
+from database.mongo_db import MongoDB
+from database.models import PyObjectId
+from database.autocomplete import PrefixIndex, prefix_range, autocomplete_keys
+from database.spell_index import SymSpellDictionary
+
+
+index_logger = logging.getLogger(__name__) # Logger for this module
+
+# Fields kept in memory for every anime. Only what search results and inline articles display,
+# never seasons/episodes, so the index stays small even for large catalogs.
+INDEX_PROJECTION = {"_id": 1, "name": 1, "aliases": 1, "status": 1, "release_year": 1, "genres": 1, "overall_download_count": 1}
+
+# Regex to split normalized text into alphanumeric tokens
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+
+# --- Text Normalization Helpers ---
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Lowercases, strips accents and punctuation, and collapses whitespace.
+    'Shingeki no Kyojin: The Final Season!' -> 'shingeki no kyojin the final season'
+    """
+    if not text: return "";
+    # NFKD splits accented characters into base char + combining mark, then the marks are dropped
+    decomposed = unicodedata.normalize("NFKD", text);
+    ascii_text = "".join(ch for ch in decomposed if not unicodedata.combining(ch));
+    return _NON_ALNUM_RE.sub(" ", ascii_text.lower()).strip();
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Returns the list of normalized tokens for a piece of text (duplicates preserved, order kept)."""
+    normalized = normalize_text(text);
+    return normalized.split() if normalized else [];
+
+
+# --- Filter Posting Helpers ---
+# Browse filters (genre/year/status) as posting lists: value -> set of anime ids.
+
+def _add_filter_postings(doc: Dict[str, Any], anime_id_str: str, genre_postings: Dict[str, Set[str]], year_postings: Dict[int, Set[str]], status_postings: Dict[str, Set[str]]):
+    for genre in doc.get("genres") or []: genre_postings.setdefault(genre, set()).add(anime_id_str);
+    if doc.get("release_year") is not None: year_postings.setdefault(doc["release_year"], set()).add(anime_id_str);
+    if doc.get("status"): status_postings.setdefault(doc["status"], set()).add(anime_id_str);
+
+
+def _remove_filter_postings(doc: Dict[str, Any], anime_id_str: str, genre_postings: Dict[str, Set[str]], year_postings: Dict[int, Set[str]], status_postings: Dict[str, Set[str]]):
+    keyed_postings = [(genre_postings, genre) for genre in doc.get("genres") or []];
+    keyed_postings += [(year_postings, doc.get("release_year")), (status_postings, doc.get("status"))];
+    for postings, key in keyed_postings:
+        ids = postings.get(key);
+        if ids is None: continue;
+        ids.discard(anime_id_str);
+        if not ids: del postings[key];
+
+
+class SearchIndex:
+    """
+    Process-wide in-memory search index over the anime catalog.
+    Built once at startup from a small projection and kept in sync by the content
+    management write paths (refresh_anime / remove_anime), so read-heavy paths like
+    inline mode never have to hit MongoDB per keystroke.
+    """
+    _entries: Dict[str, Dict[str, Any]] = {} # anime_id (str) -> projected anime document
+    _normalized_names: Dict[str, str] = {} # anime_id (str) -> normalized name
+    _token_postings: Dict[str, Set[str]] = {} # token -> set of anime_id (str) whose name contains the token
+    _vocabulary: List[str] = [] # Sorted distinct tokens of _token_postings, for bisect prefix lookups
+    _genre_postings: Dict[str, Set[str]] = {} # genre -> anime ids tagged with it (browse filter posting lists)
+    _year_postings: Dict[int, Set[str]] = {} # release_year -> anime ids
+    _status_postings: Dict[str, Set[str]] = {} # status -> anime ids
+    _prefix_index: Optional[PrefixIndex] = None # Search-as-you-type over names and aliases
+    _spell: Optional[SymSpellDictionary] = None # Typo correction over name tokens
+    _catalog_version: int = 0 # Incremented on every change, used to invalidate derived caches
+    _ready: bool = False # True once the initial build completed
+    _popular_ids: List[str] = [] # Cached popularity ranking of all anime ids
+    _popular_version: int = -1 # Catalog version _popular_ids was computed for
+    _build_lock: Optional[asyncio.Lock] = None # Created lazily inside the running event loop
+
+    # --- State Accessors ---
+
+    @classmethod
+    def is_ready(cls) -> bool: return cls._ready;
+
+    @classmethod
+    def catalog_version(cls) -> int: return cls._catalog_version;
+
+    @classmethod
+    def size(cls) -> int: return len(cls._entries);
+
+    @classmethod
+    def all_ids(cls) -> List[str]: return list(cls._entries);
+
+    @classmethod
+    def get_entry(cls, anime_id: Union[str, ObjectId, PyObjectId]) -> Optional[Dict[str, Any]]:
+        """Returns the in-memory projected document for an anime, or None if unknown."""
+        return cls._entries.get(str(anime_id));
+
+    # --- Build & Incremental Maintenance ---
+
+    @classmethod
+    async def build(cls):
+        """
+        (Re)builds the whole index from MongoDB. Safe to call again later (e.g. after bulk imports);
+        the new index is swapped in atomically so concurrent searches never see a half-built state.
+        """
+        if cls._build_lock is None: cls._build_lock = asyncio.Lock();
+        async with cls._build_lock:
+            index_logger.info("Building in-memory search index from anime collection...");
+            entries: Dict[str, Dict[str, Any]] = {};
+            try:
+                cursor = MongoDB.anime_collection().find({}, INDEX_PROJECTION).batch_size(1000);
+                async for doc in cursor:
+                    entries[str(doc["_id"])] = doc;
+            except Exception as e:
+                index_logger.error(f"DATABASE ERROR: Failed to load anime documents for search index build: {e}", exc_info=True);
+                raise
+
+            normalized_names: Dict[str, str] = {};
+            token_postings: Dict[str, Set[str]] = {};
+            completion_keys: Dict[str, List[str]] = {};
+            genre_postings: Dict[str, Set[str]] = {};
+            year_postings: Dict[int, Set[str]] = {};
+            status_postings: Dict[str, Set[str]] = {};
+            spell = SymSpellDictionary(max_edit_distance=SPELL_MAX_EDIT_DISTANCE, prefix_length=SPELL_PREFIX_LENGTH);
+            for anime_id_str, doc in entries.items():
+                normalized_names[anime_id_str] = normalize_text(doc.get("name"));
+                for token in set(normalized_names[anime_id_str].split()):
+                    token_postings.setdefault(token, set()).add(anime_id_str);
+                    spell.add_word(token);
+                completion_keys[anime_id_str] = autocomplete_keys(doc.get("name"), doc.get("aliases"), normalize_text);
+                _add_filter_postings(doc, anime_id_str, genre_postings, year_postings, status_postings);
+
+            # Swap in the freshly built structures in one go.
+            # The prefix index ranks through _popularity_key, which reads cls._entries, so entries go in first.
+            cls._entries = entries;
+            cls._normalized_names = normalized_names;
+            cls._token_postings = token_postings;
+            cls._vocabulary = sorted(token_postings);
+            cls._genre_postings = genre_postings;
+            cls._year_postings = year_postings;
+            cls._status_postings = status_postings;
+            prefix_index = PrefixIndex(rank_key=cls._popularity_key);
+            prefix_index.build(completion_keys);
+            cls._prefix_index = prefix_index;
+            cls._spell = spell;
+            cls._catalog_version += 1;
+            cls._ready = True;
+            index_logger.info(f"Search index built: {len(entries)} anime, {len(token_postings)} distinct tokens, {len(prefix_index)} completion keys, {spell.delete_entry_count()} spelling deletes (catalog version {cls._catalog_version}).");
+
+
+    @classmethod
+    def _unindex(cls, anime_id_str: str):
+        """Removes an anime's tokens from the postings (entry itself is handled by the caller)."""
+        old_normalized = cls._normalized_names.pop(anime_id_str, None);
+        if old_normalized is None: return;
+        old_entry = cls._entries.get(anime_id_str);
+        if old_entry is not None: _remove_filter_postings(old_entry, anime_id_str, cls._genre_postings, cls._year_postings, cls._status_postings);
+        for token in set(old_normalized.split()):
+            if cls._spell is not None: cls._spell.remove_word(token);
+            postings = cls._token_postings.get(token);
+            if postings is None: continue;
+            postings.discard(anime_id_str);
+            if not postings:
+                # Drop empty postings to keep vocabulary tight
+                del cls._token_postings[token];
+                position = bisect.bisect_left(cls._vocabulary, token);
+                if position < len(cls._vocabulary) and cls._vocabulary[position] == token: del cls._vocabulary[position];
+        if cls._prefix_index is not None: cls._prefix_index.remove(anime_id_str);
+
+
+    @classmethod
+    def upsert_entry(cls, doc: Dict[str, Any]):
+        """Inserts or replaces a single projected anime document in the index."""
+        anime_id_str = str(doc["_id"]);
+        cls._unindex(anime_id_str);
+        entry = {key: doc.get(key) for key in INDEX_PROJECTION};
+        cls._entries[anime_id_str] = entry;
+        cls._normalized_names[anime_id_str] = normalize_text(entry.get("name"));
+        for token in set(cls._normalized_names[anime_id_str].split()):
+            if token not in cls._token_postings:
+                cls._token_postings[token] = set();
+                bisect.insort(cls._vocabulary, token);
+            cls._token_postings[token].add(anime_id_str);
+            if cls._spell is not None: cls._spell.add_word(token);
+        _add_filter_postings(entry, anime_id_str, cls._genre_postings, cls._year_postings, cls._status_postings);
+        if cls._prefix_index is not None:
+            cls._prefix_index.add(anime_id_str, autocomplete_keys(entry.get("name"), entry.get("aliases"), normalize_text));
+        cls._catalog_version += 1;
+
+
+    @classmethod
+    def remove_anime(cls, anime_id: Union[str, ObjectId, PyObjectId]):
+        """Drops an anime from the index (call after deleting it from the DB)."""
+        anime_id_str = str(anime_id);
+        if anime_id_str not in cls._entries: return;
+        cls._unindex(anime_id_str);
+        del cls._entries[anime_id_str];
+        cls._catalog_version += 1;
+        index_logger.debug(f"Removed anime {anime_id_str} from search index.");
+
+
+    @classmethod
+    async def refresh_anime(cls, anime_id: Union[str, ObjectId, PyObjectId]):
+        """
+        Re-reads one anime's projected fields from the DB and updates the index.
+        Called by content management after inserts and edits. Logs errors, never raises:
+        a stale index entry must not break the admin flow that triggered the refresh.
+        """
+        if not cls._ready: return; # Initial build will pick the change up
+        try:
+            anime_id_obj = anime_id if isinstance(anime_id, ObjectId) else ObjectId(str(anime_id));
+            doc = await MongoDB.anime_collection().find_one({"_id": anime_id_obj}, INDEX_PROJECTION);
+            if doc: cls.upsert_entry(doc); index_logger.debug(f"Refreshed anime {anime_id_obj} in search index.");
+            else: cls.remove_anime(anime_id_obj);
+        except Exception as e:
+            index_logger.error(f"Failed to refresh anime {anime_id} in search index: {e}", exc_info=True);
+
+
+    @classmethod
+    def bump_download_count(cls, anime_id: Union[str, ObjectId, PyObjectId], amount: int = 1):
+        """
+        Mirrors MongoDB.increment_download_counts so popularity ranking stays current without a reload.
+        The cached popular() ranking is patched in place (one bisect out, one in) and the memoized autocomplete
+        answers for this anime's prefixes are dropped; the catalog version is left alone, since the browse caches
+        keyed on it don't depend on download counts.
+        """
+        anime_id_str = str(anime_id);
+        entry = cls._entries.get(anime_id_str);
+        if entry is None: return;
+        ranking_cached = cls._popular_version == cls._catalog_version;
+        if ranking_cached:
+            position = bisect.bisect_left(cls._popular_ids, cls._popularity_key(anime_id_str), key=cls._popularity_key);
+            while position < len(cls._popular_ids) and cls._popular_ids[position] != anime_id_str: position += 1; # Equal keys
+            if position < len(cls._popular_ids): del cls._popular_ids[position];
+            else: ranking_cached, cls._popular_version = False, -1; # Not where expected: recompute on next use
+        entry["overall_download_count"] = (entry.get("overall_download_count") or 0) + amount;
+        if ranking_cached: bisect.insort(cls._popular_ids, anime_id_str, key=cls._popularity_key);
+        if cls._prefix_index is not None: cls._prefix_index.rank_changed(anime_id_str);
+
+
+    # --- Querying ---
+
+    @classmethod
+    def _popularity_key(cls, anime_id_str: str) -> Tuple[int, str]:
+        """Sort key: most downloaded first, then alphabetical by normalized name."""
+        entry = cls._entries.get(anime_id_str, {});
+        return (-(entry.get("overall_download_count") or 0), cls._normalized_names.get(anime_id_str, ""));
+
+
+    @classmethod
+    def _matching_tokens(cls, query_token: str, allow_prefix: bool) -> List[str]:
+        """Returns vocabulary tokens equal to query_token, or starting with it when allow_prefix is set."""
+        if not allow_prefix: return [query_token] if query_token in cls._token_postings else [];
+        lo, hi = prefix_range(cls._vocabulary, query_token);
+        return cls._vocabulary[lo:hi];
+
+
+    @classmethod
+    def search(cls, query: str, limit: int, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Ranked token search over anime names. Every query token must match a name token;
+        the last token also matches as a prefix so results update while the user is still typing.
+        Ranking: exact name > name prefix > token match, ties broken by download count.
+        Returns (documents for [offset, offset + limit), total number of matches).
+        """
+        ranked_ids = cls.search_ids(query);
+        page_ids = ranked_ids[offset:offset + limit];
+        return [cls._entries[anime_id_str] for anime_id_str in page_ids], len(ranked_ids);
+
+
+    @classmethod
+    def search_ids(cls, query: str) -> List[str]:
+        """Full ranked list of matching anime ids for search() (see there for the matching rules)."""
+        query_tokens = cls.prepare_query_tokens(query);
+        if not query_tokens: return [];
+        return cls.rank_ids(cls.text_candidate_ids(query_tokens), query_tokens);
+
+
+    @classmethod
+    def prepare_query_tokens(cls, query: str) -> List[str]:
+        """Normalized query tokens, with tokens that would match nothing spell-corrected."""
+        return cls._correct_unmatched_tokens(tokenize(query));
+
+
+    @classmethod
+    def text_candidate_ids(cls, query_tokens: List[str]) -> Set[str]:
+        """Ids whose name contains every query token (the last one as a prefix)."""
+        candidate_ids: Optional[Set[str]] = None;
+        for position, query_token in enumerate(query_tokens):
+            is_last = position == len(query_tokens) - 1;
+            token_ids: Set[str] = set();
+            for token in cls._matching_tokens(query_token, allow_prefix=is_last):
+                token_ids |= cls._token_postings[token];
+            # Intersect smallest-first is irrelevant here, query token lists are tiny
+            candidate_ids = token_ids if candidate_ids is None else candidate_ids & token_ids;
+            if not candidate_ids: return set();
+        return candidate_ids or set();
+
+
+    @classmethod
+    def estimate_text_matches(cls, query_tokens: List[str], stop_at: Optional[int] = None) -> int:
+        """
+        Upper bound on len(text_candidate_ids(query_tokens)) without building any set: the smallest
+        per-token sum of posting sizes. Summing stops early once a token is known to exceed stop_at.
+        """
+        estimate: Optional[int] = None;
+        for position, query_token in enumerate(query_tokens):
+            is_last = position == len(query_tokens) - 1;
+            token_total = 0;
+            for token in cls._matching_tokens(query_token, allow_prefix=is_last):
+                token_total += len(cls._token_postings[token]);
+                if stop_at is not None and token_total > stop_at: break;
+            estimate = token_total if estimate is None else min(estimate, token_total);
+            if estimate == 0: return 0;
+        return estimate or 0;
+
+
+    @classmethod
+    def name_matches_tokens(cls, anime_id_str: str, query_tokens: List[str]) -> bool:
+        """Per-document form of text_candidate_ids(): checks one anime's name against the query tokens."""
+        name_tokens = cls._normalized_names.get(anime_id_str, "").split();
+        for position, query_token in enumerate(query_tokens):
+            if position == len(query_tokens) - 1:
+                if not any(name_token.startswith(query_token) for name_token in name_tokens): return False;
+            elif query_token not in name_tokens: return False;
+        return True;
+
+
+    @classmethod
+    def rank_ids(cls, anime_ids: Iterable[str], query_tokens: List[str]) -> List[str]:
+        """Orders ids by match quality (exact name > name prefix > token match), then downloads."""
+        normalized_query = " ".join(query_tokens);
+
+        def rank_key(anime_id_str: str):
+            normalized_name = cls._normalized_names.get(anime_id_str, "");
+            if normalized_name == normalized_query: match_rank = 0;
+            elif normalized_name.startswith(normalized_query): match_rank = 1;
+            else: match_rank = 2;
+            return (match_rank,) + cls._popularity_key(anime_id_str);
+
+        return sorted(anime_ids, key=rank_key);
+
+
+    @classmethod
+    def filter_posting_sets(cls, filter_data: Dict[str, Any]) -> Optional[List[Set[str]]]:
+        """
+        Posting sets for the active browse filters (same keys as browse filter_data: genres, year, status),
+        one per constraint, smallest first. None when no filter is active. A value nobody has yields an empty set.
+        Sets are the live postings: callers must not mutate them.
+        """
+        posting_sets: List[Set[str]] = [cls._genre_postings.get(genre, set()) for genre in filter_data.get("genres") or []];
+        if filter_data.get("year") is not None: posting_sets.append(cls._year_postings.get(filter_data["year"], set()));
+        if filter_data.get("status"): posting_sets.append(cls._status_postings.get(filter_data["status"], set()));
+        if not posting_sets: return None;
+        return sorted(posting_sets, key=len);
+
+
+    @classmethod
+    def _correct_unmatched_tokens(cls, query_tokens: List[str]) -> List[str]:
+        """
+        Spell-corrects only the tokens that would match nothing: complete tokens missing from the
+        vocabulary, and a last token that is not even a prefix of a known token (still being typed otherwise).
+        """
+        if cls._spell is None or not query_tokens: return query_tokens;
+        corrected: List[str] = [];
+        for position, query_token in enumerate(query_tokens):
+            is_last = position == len(query_tokens) - 1;
+            if cls._matching_tokens(query_token, allow_prefix=is_last): corrected.append(query_token);
+            else: corrected.extend(cls._spell.correct_tokens([query_token]));
+        return corrected;
+
+
+    @classmethod
+    def correct_query(cls, query: str) -> str:
+        """Normalized query with every unknown token replaced by its closest title token (edit distance ≤ 2)."""
+        query_tokens = tokenize(query);
+        if cls._spell is None: return " ".join(query_tokens);
+        return " ".join(cls._spell.correct_tokens(query_tokens));
+
+
+    @classmethod
+    def did_you_mean(cls, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Best matching anime for the spell-corrected query, or None when correction changes nothing
+        or the corrected query still matches no title.
+        """
+        corrected_query = cls.correct_query(query);
+        if not corrected_query or corrected_query == normalize_text(query): return None;
+        ranked_ids = cls.search_ids(corrected_query);
+        return cls._entries[ranked_ids[0]] if ranked_ids else None;
+
+
+    @classmethod
+    def autocomplete_ids(cls, prefix: str, limit: int) -> List[str]:
+        """Top `limit` anime ids, most downloaded first, whose name or alias starts with the typed prefix."""
+        if cls._prefix_index is None: return [];
+        return cls._prefix_index.suggest(normalize_text(prefix), limit);
+
+
+    @classmethod
+    def completion_first_ids(cls, query: str, completion_count: int) -> List[str]:
+        """
+        Ranking used by inline mode: the top `completion_count` titles/aliases starting with the typed text,
+        then every remaining token match in search_ids() order.
+        """
+        ranked_ids = cls.autocomplete_ids(query, completion_count);
+        completed_ids = set(ranked_ids);
+        return ranked_ids + [anime_id_str for anime_id_str in cls.search_ids(query) if anime_id_str not in completed_ids];
+
+
+    @classmethod
+    def autocomplete(cls, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """Projected documents for autocomplete_ids()."""
+        return [cls._entries[anime_id_str] for anime_id_str in cls.autocomplete_ids(prefix, limit)];
+
+
+    @classmethod
+    def autocomplete_backoff(cls, query: str, limit: int, min_prefix_length: int = 2) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Suggestions for a query that found nothing: tries the whole normalized query, then shorter
+        and shorter prefixes of it ("naruto shipuden" -> "naruto s") until something completes.
+        Returns (prefix that matched, documents), or ("", []) if nothing did.
+        """
+        normalized_query = normalize_text(query);
+        for length in range(len(normalized_query), min_prefix_length - 1, -1):
+            prefix = normalized_query[:length].rstrip();
+            if len(prefix) < min_prefix_length: break;
+            suggestions = cls.autocomplete(prefix, limit);
+            if suggestions: return prefix, suggestions;
+        return "", [];
+
+
+    @classmethod
+    def popular(cls, limit: int, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Most downloaded anime, used when an inline query is empty. Ranking is cached per catalog version."""
+        if cls._popular_version != cls._catalog_version:
+            cls._popular_ids = sorted(cls._entries, key=cls._popularity_key);
+            cls._popular_version = cls._catalog_version;
+        ranked_ids = cls._popular_ids;
+        page_ids = ranked_ids[offset:offset + limit];
+        return [cls._entries[anime_id_str] for anime_id_str in page_ids], len(ranked_ids);
@@ -0,0 +1,353 @@
+# database/similarity_index.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne, DeleteMany
+
+from config import (
+    SIMILARITY_TOP_K, SIMILARITY_GENRE_WEIGHT, SIMILARITY_MIN_CO_WATCHERS, SIMILARITY_MAX_WATCHLIST_ITEMS,
+    SIMILARITY_REFRESH_SECONDS, SIMILARITY_FULL_REBUILD_SECONDS
+)
+from database.mongo_db import MongoDB
+from database.search_index import SearchIndex
+
+
+similarity_logger = logging.getLogger(__name__) # Logger for this module
+
+# "More like this" for the details menu, precomputed in the background. Two signals per anime pair:
+# - genre cosine: rows of a one-hot anime x genre matrix, L2-normalized, so G @ G.T is the cosine of the genre sets
+# - co-watchlist cosine: users having both on their watchlist / sqrt(watchers of one * watchers of the other)
+# score = SIMILARITY_GENRE_WEIGHT * genre + (1 - SIMILARITY_GENRE_WEIGHT) * co-watchlist. Scores are computed in
+# row blocks of the (anime x anime) matrix, the top SIMILARITY_TOP_K of every row are kept and stored in MongoDB.
+_BLOCK_CELLS = 4_000_000 # Score matrix cells per block (16 MB of float32)
+_POPULARITY_TIE_BREAK = 1e-4 # Downloads only order neighbours that are otherwise equally similar
+_WRITE_BATCH = 1000 # Upserts per bulk_write
+
+
+# --- Vectorized Scoring Helpers (run in a worker thread) ---
+
+def _genre_matrix(genre_sets: List[Tuple[str, ...]]) -> np.ndarray:
+    """Row-normalized one-hot genre matrix (anime x genre). Anime without genres get a zero row."""
+    vocabulary = {genre: column for column, genre in enumerate(sorted({genre for genres in genre_sets for genre in genres}))}
+    matrix = np.zeros((len(genre_sets), max(len(vocabulary), 1)), dtype=np.float32)
+    rows = [row for row, genres in enumerate(genre_sets) for _ in genres]
+    columns = [vocabulary[genre] for genres in genre_sets for genre in genres]
+    matrix[rows, columns] = 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _merge_pair_counts(merged: Tuple[np.ndarray, np.ndarray], pending: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Folds a chunk of pair keys into the running (unique keys, counts)."""
+    keys, counts = np.unique(np.concatenate(pending), return_counts=True)
+    all_keys = np.concatenate([merged[0], keys])
+    all_counts = np.concatenate([merged[1], counts])
+    unique_keys, inverse = np.unique(all_keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=all_counts).astype(np.int64)
+
+
+def _co_watchlist(watchlists: List[np.ndarray], size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Co-watchlist cosine as CSR arrays over ordinals (indptr, columns, scores), both directions of every pair.
+    Each watchlist (distinct ordinals) contributes all its pairs at once via triu_indices; pair keys low * size + high
+    are counted with np.unique in chunks of _BLOCK_CELLS so memory stays bounded however many users there are.
+    """
+    watchers = np.zeros(size, dtype=np.int64)
+    merged = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    pending: List[np.ndarray] = []
+    pending_pairs = 0
+    for ordinals in watchlists:
+        watchers[ordinals] += 1
+        first, second = np.triu_indices(len(ordinals), 1)
+        low, high = np.minimum(ordinals[first], ordinals[second]), np.maximum(ordinals[first], ordinals[second])
+        pending.append(low * size + high)
+        pending_pairs += len(low)
+        if pending_pairs >= _BLOCK_CELLS:
+            merged = _merge_pair_counts(merged, pending)
+            pending, pending_pairs = [], 0
+    if pending: merged = _merge_pair_counts(merged, pending)
+
+    keys, counts = merged
+    kept = counts >= SIMILARITY_MIN_CO_WATCHERS # A single shared watchlist is noise, not a signal
+    keys, counts = keys[kept], counts[kept]
+    low, high = keys // size, keys % size
+    scores = (counts / np.sqrt(watchers[low] * watchers[high])).astype(np.float32)
+
+    rows = np.concatenate([low, high])
+    order = np.argsort(rows, kind="stable")
+    columns = np.concatenate([high, low])[order]
+    indptr = np.searchsorted(rows[order], np.arange(size + 1))
+    return indptr, columns, np.concatenate([scores, scores])[order]
+
+
+def _score(rows: np.ndarray, columns: np.ndarray, genres: np.ndarray, co: Tuple[np.ndarray, np.ndarray, np.ndarray], popularity: np.ndarray, alive: np.ndarray) -> np.ndarray:
+    """
+    Combined similarity of `rows` against `columns` (len(rows) x len(columns)).
+    Unrelated pairs (no shared genre, no co-watchers), removed anime and an anime against itself score -inf.
+    """
+    scores = SIMILARITY_GENRE_WEIGHT * (genres[rows] @ genres[columns].T)
+
+    # Scatter the co-watchlist entries of these rows that fall into `columns`
+    indptr, co_columns, co_scores = co
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    if lengths.sum():
+        block_rows = np.repeat(np.arange(len(rows)), lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+        column_position = np.full(len(alive), -1, dtype=np.int64)
+        column_position[columns] = np.arange(len(columns))
+        targets = column_position[co_columns[positions]]
+        kept = targets >= 0
+        scores[block_rows[kept], targets[kept]] += (1 - SIMILARITY_GENRE_WEIGHT) * co_scores[positions[kept]]
+
+    related = scores > 0
+    scores = scores + _POPULARITY_TIE_BREAK * popularity[columns]
+    scores[~related] = -np.inf
+    scores[:, ~alive[columns]] = -np.inf
+    scores[rows[:, None] == columns[None, :]] = -np.inf
+    return scores
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and scores of the k best entries of every row, best first (argpartition, then sort only k)."""
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def _blocks(rows: np.ndarray, columns_count: int):
+    step = max(1, _BLOCK_CELLS // max(columns_count, 1))
+    for start in range(0, len(rows), step): yield rows[start:start + step]
+
+
+class _BuildState:
+    """
+    What an incremental rebuild reuses from the previous run. Ordinals are stable between full rebuilds:
+    new anime are appended, removed ones stay as dead ordinals (alive = False).
+    """
+
+    def __init__(self, anime_ids: List[str], genre_sets: List[Tuple[str, ...]], co: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]], popularity: np.ndarray):
+        self.ordinal_ids = anime_ids
+        self.ordinal_by_id = {anime_id_str: ordinal for ordinal, anime_id_str in enumerate(anime_ids)}
+        self.genre_sets = genre_sets
+        self.alive = np.ones(len(anime_ids), dtype=bool)
+        self.co = co
+        self.popularity = popularity
+
+
+class SimilarityIndex:
+    """
+    Precomputed top-k similar anime per anime. The details menu reads neighbours() - a dict lookup - and never
+    computes anything. run_forever (started from main.py) loads the stored lists and then refreshes them every
+    SIMILARITY_REFRESH_SECONDS:
+    - nothing changed (same catalog version, same watchlists digest): the run is skipped
+    - only the catalog changed: rows of new/re-genred anime (and rows listing them or a removed anime) are scored
+      against everything, every other row only against the changed anime and merged into its current list
+    - watchlists changed, or SIMILARITY_FULL_REBUILD_SECONDS elapsed: full rebuild
+    Only lists that actually changed are written back.
+    """
+    _neighbours: Dict[str, List[str]] = {} # anime id (str) -> similar anime ids (str), most similar first
+    _scores: Dict[str, List[float]] = {} # anime id (str) -> scores matching _neighbours
+    _state: Optional[_BuildState] = None
+    _catalog_version: int = -1 # SearchIndex catalog version of the last run
+    _watchlist_digest: Optional[Tuple[int, int, int]] = None
+    _full_built_at: float = 0.0 # Monotonic time of the last full rebuild
+    _lock: Optional[asyncio.Lock] = None # Created lazily inside the running event loop
+
+    @classmethod
+    def neighbours(cls, anime_id: Any, limit: int) -> List[str]:
+        """Similar anime ids, most similar first, skipping anime deleted since the last run."""
+        similar = cls._neighbours.get(str(anime_id)) or []
+        return [anime_id_str for anime_id_str in similar if SearchIndex.get_entry(anime_id_str) is not None][:limit]
+
+
+    @classmethod
+    async def load(cls):
+        """Fills the lookup table from the stored lists, so recommendations show right after a restart."""
+        neighbours: Dict[str, List[str]] = {}
+        scores: Dict[str, List[float]] = {}
+        async for doc in MongoDB.similarity_collection().find({}, {"neighbours": 1, "scores": 1}).batch_size(1000):
+            neighbours[str(doc["_id"])] = [str(anime_id) for anime_id in doc.get("neighbours") or []]
+            scores[str(doc["_id"])] = list(doc.get("scores") or [])
+        cls._neighbours, cls._scores = neighbours, scores
+        similarity_logger.info(f"Loaded similar-anime lists for {len(neighbours)} anime.")
+
+
+    @classmethod
+    async def _read_watchlist_digest(cls) -> Tuple[int, int, int]:
+        """(users, entries, sum of entry timestamps) over watchlists with at least two anime: cheap change detection."""
+        docs = await MongoDB.users_collection().aggregate([
+            {"$match": {"watchlist.1": {"$exists": True}}},
+            {"$group": {"_id": None, "users": {"$sum": 1}, "entries": {"$sum": {"$size": "$watchlist"}},
+                        "stamp": {"$sum": {"$sum": {"$map": {"input": "$watchlist", "in": {"$toLong": {"$toDate": "$$this"}}}}}}}}
+        ]).to_list(1)
+        if not docs: return (0, 0, 0)
+        return (docs[0]["users"], docs[0]["entries"], docs[0]["stamp"])
+
+
+    @classmethod
+    async def _read_watchlists(cls, ordinal_by_id: Dict[str, int]) -> List[np.ndarray]:
+        """Distinct catalog ordinals of every watchlist with two or more anime (newest SIMILARITY_MAX_WATCHLIST_ITEMS)."""
+        watchlists: List[np.ndarray] = []
+        cursor = MongoDB.users_collection().find({"watchlist.1": {"$exists": True}}, {"_id": 0, "watchlist": {"$slice": -SIMILARITY_MAX_WATCHLIST_ITEMS}}).batch_size(1000)
+        async for doc in cursor:
+            ordinals = {ordinal_by_id[str(anime_id)] for anime_id in doc.get("watchlist") or [] if str(anime_id) in ordinal_by_id}
+            if len(ordinals) >= 2: watchlists.append(np.fromiter(ordinals, dtype=np.int64, count=len(ordinals)))
+        return watchlists
+
+
+    @classmethod
+    def _snapshot(cls) -> Tuple[List[str], List[Tuple[str, ...]], List[int]]:
+        # Copied on the event loop: the search index is mutated by content writes while the worker thread runs
+        anime_ids = SearchIndex.all_ids()
+        entries = [SearchIndex.get_entry(anime_id_str) or {} for anime_id_str in anime_ids]
+        return anime_ids, [tuple(sorted(set(entry.get("genres") or []))) for entry in entries], [entry.get("overall_download_count") or 0 for entry in entries]
+
+
+    @staticmethod
+    def _popularity(download_counts: List[int]) -> np.ndarray:
+        popularity = np.log1p(np.asarray(download_counts, dtype=np.float32))
+        return popularity / popularity.max() if len(popularity) and popularity.max() > 0 else popularity
+
+
+    @classmethod
+    def _full_lists(cls, state: _BuildState) -> Dict[str, Tuple[List[str], List[float]]]:
+        """Top-k of every alive anime against the whole catalog."""
+        genres = _genre_matrix(state.genre_sets)
+        all_ordinals = np.arange(len(state.ordinal_ids))
+        lists: Dict[str, Tuple[List[str], List[float]]] = {}
+        for rows in _blocks(all_ordinals[state.alive], len(all_ordinals)):
+            top, top_scores = _top_k(_score(rows, all_ordinals, genres, state.co, state.popularity, state.alive), SIMILARITY_TOP_K)
+            for row, columns, scores in zip(rows, top, top_scores):
+                finite = np.isfinite(scores)
+                lists[state.ordinal_ids[row]] = ([state.ordinal_ids[column] for column in columns[finite]], scores[finite].tolist())
+        return lists
+
+
+    @classmethod
+    def _incremental_lists(cls, state: _BuildState, changed: np.ndarray, stale_ids: set) -> Dict[str, Tuple[List[str], List[float]]]:
+        """
+        Rows of changed anime, and rows that listed a changed/removed anime, are scored against the whole catalog.
+        Every other row is only scored against the changed anime and merged into its current list.
+        """
+        genres = _genre_matrix(state.genre_sets)
+        all_ordinals = np.arange(len(state.ordinal_ids))
+        alive_ordinals = all_ordinals[state.alive]
+        lists: Dict[str, Tuple[List[str], List[float]]] = {}
+
+        rescored = np.union1d(changed, [ordinal for ordinal in alive_ordinals if any(neighbour in stale_ids for neighbour in cls._neighbours.get(state.ordinal_ids[ordinal], []))]).astype(np.int64)
+        for rows in _blocks(rescored, len(all_ordinals)):
+            top, top_scores = _top_k(_score(rows, all_ordinals, genres, state.co, state.popularity, state.alive), SIMILARITY_TOP_K)
+            for row, columns, scores in zip(rows, top, top_scores):
+                finite = np.isfinite(scores)
+                lists[state.ordinal_ids[row]] = ([state.ordinal_ids[column] for column in columns[finite]], scores[finite].tolist())
+
+        if not len(changed): return lists # Only removals: lists without them are unaffected
+        others = alive_ordinals[~np.isin(alive_ordinals, rescored)]
+        for rows in _blocks(others, len(changed)):
+            top, top_scores = _top_k(_score(rows, changed, genres, state.co, state.popularity, state.alive), SIMILARITY_TOP_K)
+            for row, columns, scores in zip(rows, top, top_scores):
+                anime_id_str = state.ordinal_ids[row]
+                candidates = list(zip(cls._neighbours.get(anime_id_str, []), cls._scores.get(anime_id_str, [])))
+                candidates += [(state.ordinal_ids[changed[column]], float(score)) for column, score in zip(columns, scores) if np.isfinite(score)]
+                candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+                candidates = candidates[:SIMILARITY_TOP_K]
+                lists[anime_id_str] = ([neighbour for neighbour, _ in candidates], [score for _, score in candidates])
+        return lists
+
+
+    @classmethod
+    async def _persist(cls, lists: Dict[str, Tuple[List[str], List[float]]], removed_ids: List[str]) -> int:
+        """Writes the lists that differ from the current ones, deletes removed anime, then swaps the lookup table."""
+        now = datetime.now(timezone.utc)
+        operations = [
+            ReplaceOne({"_id": ObjectId(anime_id_str)}, {"neighbours": [ObjectId(neighbour) for neighbour in neighbours], "scores": scores, "updated_at": now}, upsert=True)
+            for anime_id_str, (neighbours, scores) in lists.items() if cls._neighbours.get(anime_id_str) != neighbours
+        ]
+        if removed_ids: operations.append(DeleteMany({"_id": {"$in": [ObjectId(anime_id_str) for anime_id_str in removed_ids]}}))
+        for start in range(0, len(operations), _WRITE_BATCH):
+            await MongoDB.similarity_collection().bulk_write(operations[start:start + _WRITE_BATCH], ordered=False)
+
+        neighbours_map = {**cls._neighbours, **{anime_id_str: neighbours for anime_id_str, (neighbours, _) in lists.items()}}
+        scores_map = {**cls._scores, **{anime_id_str: scores for anime_id_str, (_, scores) in lists.items()}}
+        for anime_id_str in removed_ids:
+            neighbours_map.pop(anime_id_str, None)
+            scores_map.pop(anime_id_str, None)
+        cls._neighbours, cls._scores = neighbours_map, scores_map
+        return len(operations)
+
+
+    @classmethod
+    async def rebuild(cls, force_full: bool = False) -> Optional[int]:
+        """One scheduled run (see class docstring). Returns the number of writes, None when the run was skipped."""
+        if not SearchIndex.is_ready(): return None
+        if cls._lock is None: cls._lock = asyncio.Lock()
+        async with cls._lock:
+            version = SearchIndex.catalog_version()
+            digest = await cls._read_watchlist_digest()
+            state = cls._state
+            full = force_full or state is None or digest != cls._watchlist_digest or time.monotonic() - cls._full_built_at >= SIMILARITY_FULL_REBUILD_SECONDS
+            if not full and version == cls._catalog_version: return None
+
+            anime_ids, genre_sets, download_counts = cls._snapshot()
+            started = time.monotonic()
+
+            if full:
+                new_state = _BuildState(anime_ids, genre_sets, None, cls._popularity(download_counts))
+                watchlists = await cls._read_watchlists(new_state.ordinal_by_id)
+                new_state.co = await asyncio.to_thread(_co_watchlist, watchlists, len(anime_ids))
+                lists = await asyncio.to_thread(cls._full_lists, new_state)
+                current = set(anime_ids)
+                removed_ids = [anime_id_str for anime_id_str in cls._neighbours if anime_id_str not in current]
+                cls._state, cls._full_built_at = new_state, time.monotonic()
+            else:
+                # Extend the stable ordinals with new anime, mark removed ones dead, note whose genres changed
+                current = dict(zip(anime_ids, genre_sets))
+                changed: List[int] = []
+                for anime_id_str, genres in current.items():
+                    ordinal = state.ordinal_by_id.get(anime_id_str)
+                    if ordinal is None:
+                        ordinal = len(state.ordinal_ids)
+                        state.ordinal_ids.append(anime_id_str)
+                        state.ordinal_by_id[anime_id_str] = ordinal
+                        state.genre_sets.append(genres)
+                        changed.append(ordinal)
+                    elif state.genre_sets[ordinal] != genres:
+                        state.genre_sets[ordinal] = genres
+                        changed.append(ordinal)
+                added = len(state.ordinal_ids) - len(state.alive)
+                if added:
+                    indptr, co_columns, co_scores = state.co
+                    state.co = (np.concatenate([indptr, np.full(added, indptr[-1])]), co_columns, co_scores)
+                    state.popularity = np.concatenate([state.popularity, np.zeros(added, dtype=np.float32)])
+                state.alive = np.array([anime_id_str in current for anime_id_str in state.ordinal_ids], dtype=bool)
+                removed_ids = [anime_id_str for anime_id_str in cls._neighbours if anime_id_str not in current]
+                stale_ids = set(removed_ids) | {state.ordinal_ids[ordinal] for ordinal in changed}
+                if not changed and not removed_ids:
+                    cls._catalog_version = version
+                    return None
+                lists = await asyncio.to_thread(cls._incremental_lists, state, np.asarray(changed, dtype=np.int64), stale_ids)
+
+            writes = await cls._persist(lists, removed_ids)
+            cls._catalog_version, cls._watchlist_digest = version, digest
+            similarity_logger.info(f"Similarity index {'full' if full else 'incremental'} rebuild: {len(lists)} lists computed, {writes} writes in {time.monotonic() - started:.1f}s.")
+            return writes
+
+
+    @classmethod
+    async def run_forever(cls):
+        """Background task: load the stored lists, then rebuild every SIMILARITY_REFRESH_SECONDS."""
+        try: await cls.load()
+        except Exception as e: similarity_logger.error(f"Failed to load similar-anime lists: {e}", exc_info=True)
+        while True:
+            try: await cls.rebuild()
+            except asyncio.CancelledError: raise
+            except Exception as e: similarity_logger.error(f"Similarity index rebuild failed: {e}. Keeping the previous lists.", exc_info=True)
+            await asyncio.sleep(SIMILARITY_REFRESH_SECONDS)
@@ -0,0 +1,136 @@
+# database/spell_index.py
+import logging
+from typing import Optional, List, Dict, Set, Tuple, Iterable
+
+
+spell_logger = logging.getLogger(__name__) # Logger for this module
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein + adjacent transpositions, so "bleahc" ~ "bleach" is 1).
+    Gives up early and returns max_distance + 1 as soon as the distance is known to exceed max_distance.
+    """
+    if a == b: return 0;
+    if abs(len(a) - len(b)) > max_distance: return max_distance + 1;
+    previous_previous: List[int] = [];
+    previous = list(range(len(b) + 1));
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b);
+        row_minimum = current[0];
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1;
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost);
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1);
+            row_minimum = min(row_minimum, current[j]);
+        if row_minimum > max_distance: return max_distance + 1; # Every path already too expensive
+        previous_previous, previous = previous, current;
+    return previous[len(b)] if previous[len(b)] <= max_distance else max_distance + 1;
+
+
+class SymSpellDictionary:
+    """
+    Symmetric-delete spelling dictionary over catalog title tokens (SymSpell).
+    Every word is stored together with all strings obtainable by deleting up to max_edit_distance
+    characters from it. A query word generates its own deletes the same way; any shared delete is
+    a candidate, verified with a real edit distance. Lookups are a handful of dict hits regardless
+    of vocabulary size.
+    Memory stays bounded because deletes are only generated from the first prefix_length characters
+    of a word (long words differ from each other early anyway), as in the reference SymSpell.
+    """
+
+    def __init__(self, max_edit_distance: int = 2, prefix_length: int = 7, min_word_length: int = 3):
+        self.max_edit_distance = max_edit_distance # Upper bound on corrections (≤2 keeps delete sets small)
+        self.prefix_length = max(prefix_length, max_edit_distance + 1) # Deletes generated from this many leading chars
+        self.min_word_length = min_word_length # Shorter tokens ("no", "of", "2") are never corrected or indexed
+        self._word_counts: Dict[str, int] = {} # word -> number of titles containing it (frequency for tie-breaks)
+        self._deletes: Dict[str, Set[str]] = {} # delete variant -> words it was generated from
+
+    def __len__(self) -> int: return len(self._word_counts);
+
+    def __contains__(self, word: str) -> bool: return word in self._word_counts;
+
+    def delete_entry_count(self) -> int:
+        """Number of stored delete variants (the dictionary's memory footprint driver)."""
+        return len(self._deletes);
+
+    def _generate_deletes(self, word: str) -> Set[str]:
+        """All strings reachable from the word's prefix by deleting 0..max_edit_distance characters."""
+        prefix = word[:self.prefix_length];
+        deletes = {prefix};
+        frontier = {prefix};
+        for _ in range(self.max_edit_distance):
+            next_frontier: Set[str] = set();
+            for variant in frontier:
+                if len(variant) <= 1: continue;
+                for position in range(len(variant)):
+                    next_frontier.add(variant[:position] + variant[position + 1:]);
+            next_frontier -= deletes;
+            deletes |= next_frontier;
+            frontier = next_frontier;
+        return deletes;
+
+    def build(self, words: Iterable[str]):
+        """Replaces the dictionary. words may repeat; repetitions count as frequency."""
+        self._word_counts = {};
+        self._deletes = {};
+        for word in words: self.add_word(word);
+
+    def add_word(self, word: str):
+        """Registers one occurrence of word (one more title containing it)."""
+        if len(word) < self.min_word_length: return;
+        if word in self._word_counts:
+            self._word_counts[word] += 1;
+            return;
+        self._word_counts[word] = 1;
+        for variant in self._generate_deletes(word):
+            self._deletes.setdefault(variant, set()).add(word);
+
+    def remove_word(self, word: str):
+        """Drops one occurrence of word; forgets it (and its deletes) when no title uses it anymore."""
+        count = self._word_counts.get(word);
+        if count is None: return;
+        if count > 1:
+            self._word_counts[word] = count - 1;
+            return;
+        del self._word_counts[word];
+        for variant in self._generate_deletes(word):
+            words = self._deletes.get(variant);
+            if words is None: continue;
+            words.discard(word);
+            if not words: del self._deletes[variant];
+
+    def lookup(self, word: str, max_edit_distance: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        Best known word within the edit distance: smallest distance first, then most frequent.
+        Returns (word, distance), or None when nothing is close enough. Known words return themselves.
+        """
+        if word in self._word_counts: return word, 0;
+        if len(word) < self.min_word_length: return None;
+        max_distance = self.max_edit_distance if max_edit_distance is None else min(max_edit_distance, self.max_edit_distance);
+
+        best: Optional[Tuple[int, int, str]] = None; # (distance, -frequency, word), smaller is better
+        checked: Set[str] = set();
+        for variant in self._generate_deletes(word):
+            for candidate in self._deletes.get(variant, ()):
+                if candidate in checked: continue;
+                checked.add(candidate);
+                distance = edit_distance(word, candidate, max_distance);
+                if distance > max_distance: continue;
+                ranking = (distance, -self._word_counts[candidate], candidate);
+                if best is None or ranking < best: best = ranking;
+        return (best[2], best[0]) if best else None;
+
+    def correct_tokens(self, tokens: List[str]) -> List[str]:
+        """
+        Replaces unknown tokens with their best correction; known and uncorrectable tokens are kept.
+        Short tokens only tolerate one edit ("bleech" -> "bleach" is fine, but 4-letter words with two
+        edits are mostly other words).
+        """
+        corrected: List[str] = [];
+        for token in tokens:
+            allowed_distance = 1 if len(token) <= 4 else self.max_edit_distance;
+            match = self.lookup(token, allowed_distance);
+            corrected.append(match[0] if match else token);
+        return corrected;
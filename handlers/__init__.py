@@ -3,9 +3,11 @@ from . import tokens_handler
 from . import content_handler 
 from . import browse_handler
 from . import search_handler
+from . import inline_handler
 from . import download_handler
 from . import request_handler
 from . import watchlist_handler
 from . import premium_handler
 from . import callback_handlers
 from . import admin_handlers  
+from . import query_profiling
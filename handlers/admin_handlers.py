@@ -1,7 +1,10 @@
 # handlers/admin_handlers.py
+import html
+import json
 import logging
 import asyncio # For potential delays
 from typing import Union, List, Dict, Any, Optional
+from datetime import datetime, timezone, timedelta
 from pyrogram import Client, filters # Import Pyrogram core and filters
 from pyrogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton,
@@ -21,14 +24,24 @@ import strings # Import string constants for messages
 # Import database models and utilities
 from database.mongo_db import MongoDB # Access MongoDB
 from database.models import User # Import User model
+from database.search_index import SearchIndex # Rebuilt after wiping the catalog
+from database.query_profiler import QueryProfiler # /query_report
+from database.download_events import DownloadEvents # /download_stats
 
 # Import state management helpers if needed (likely for multi-step admin tasks, less for these)
 from database.mongo_db import get_user_state, set_user_state, clear_user_state
 
 
 # Import helpers
-from handlers.common_handlers import get_user # Needed to fetch users
+from handlers.common_handlers import get_user, edit_or_send_message # Needed to fetch users and edit the admin's menus
 from handlers.common_handlers import get_user_mention # Needed to format user mentions for admins
+from handlers.menu_cache import MenuCache, RenderedMenu # Shared rendering of the popular/latest lists
+from handlers.callback_ack import answer_callback, CallbackAck # Ack delay section of /query_report
+from handlers.delivery_queue import DeliveryQueue # /delivery_report
+from handlers.file_health import FileHealth
+from handlers.broadcast_engine import BroadcastEngine # /broadcast jobs
+from handlers.reachability import Reachability # Unreachable users in /delivery_report
+from handlers.notification_outbox import NotificationOutbox # Watchlist notification jobs in /delivery_report
 
 
 admin_logger = logging.getLogger(__name__)
@@ -36,6 +49,18 @@ admin_logger = logging.getLogger(__name__)
 # --- Admin Command Handlers ---
 # Note: All handlers here should include an admin check (if not handled by filters)
 
+def _broadcast_source_chat_id() -> Optional[int]:
+    """Channel holding the source copies of message broadcasts."""
+    return config.FILE_STORAGE_CHANNEL_ID or config.LOG_CHANNEL_ID
+
+
+def _broadcast_preview(message: Message) -> str:
+    """Confirmation preview of a message broadcast: its kind and text or caption."""
+    kind = message.media.value if message.media else "text"
+    body = message.text or message.caption or ""
+    return f"[{kind}] {body}".strip()
+
+
 # Handler for /broadcast command - Initiates the broadcast workflow
 @Client.on_message(filters.command("broadcast") & filters.private)
 async def broadcast_command_handler(client: Client, message: Message):
@@ -47,20 +72,26 @@ async def broadcast_command_handler(client: Client, message: Message):
         await message.reply_text("🚫 You are not authorized to use this command.", parse_mode=config.PARSE_MODE)
         return
 
-    # Broadcast command expects the message text directly in the command arguments
+    # Broadcast command takes the message text in the command arguments, or is sent as a reply to the message to broadcast
+    # (any kind: photo with caption, video, sticker...), which is copied to every user
     broadcast_text = message.text.split(None, 1)[1] if len(message.text.split(None, 1)) > 1 else None
+    source_message = message.reply_to_message if not broadcast_text else None
 
-    if not broadcast_text:
-        await message.reply_text("ℹ️ Usage: `/broadcast Your message text here.`", parse_mode=config.PARSE_MODE)
+    if not broadcast_text and not source_message:
+        await message.reply_text(strings.BROADCAST_USAGE, parse_mode=config.PARSE_MODE)
         return
 
+    if source_message and _broadcast_source_chat_id() is None:
+        await message.reply_text(strings.BROADCAST_NO_SOURCE_CHANNEL, parse_mode=config.PARSE_MODE)
+        return
 
-    admin_logger.info(f"Admin {user_id} initiated broadcast. Message: '{broadcast_text[:100]}...'")
+    preview = broadcast_text if broadcast_text else _broadcast_preview(source_message)
+    admin_logger.info(f"Admin {user_id} initiated broadcast. Message: '{preview[:100]}...'")
 
     # Need to confirm broadcast with admin before sending to all users
     # First, estimate the number of users to broadcast to
     try:
-        total_users_count = await MongoDB.users_collection().count_documents({})
+        total_users_count = await MongoDB.users_collection().count_documents({"reachability": "ok"})
     except Exception as e:
         admin_logger.error(f"Failed to get total users count for broadcast for admin {user_id}: {e}", exc_info=True)
         total_users_count = "Unknown" # Fallback if DB error
@@ -69,7 +100,7 @@ async def broadcast_command_handler(client: Client, message: Message):
     # Send confirmation message to the admin with preview and count
     confirm_text = strings.BROADCAST_CONFIRMATION.format(
          user_count=total_users_count,
-         message_preview=broadcast_text[:500] + '...' if len(broadcast_text) > 500 else broadcast_text # Limit preview length
+         message_preview=preview[:500] + '...' if len(preview) > 500 else preview # Limit preview length
     )
 
     # Buttons: Confirm, Cancel
@@ -96,7 +127,9 @@ async def broadcast_command_handler(client: Client, message: Message):
         await clear_user_state(user_id)
 
 
-    await set_user_state(user_id, "admin", "confirm_broadcast", data={"broadcast_message": broadcast_text, "total_users_count": total_users_count}) # Store message and user count in state
+    await set_user_state(user_id, "admin", "confirm_broadcast", data={ # Store message (or the id of the message to copy) and user count in state
+        "broadcast_message": broadcast_text, "source_message_id": source_message.id if source_message else None, "total_users_count": total_users_count
+    })
 
 
     # Reply to the command message with the confirmation prompt
@@ -121,12 +154,12 @@ async def broadcast_confirmation_callback(client: Client, callback_query: Callba
 
     # Admin Check - Use filters.chat to be strict or check manually
     if user_id not in config.ADMIN_IDS:
-         await callback_query.answer("🚫 You are not authorized.", show_alert=True)
+         await answer_callback(callback_query, "🚫 You are not authorized.", show_alert=True)
          return # Not admin
 
 
     # Acknowledge callback immediately
-    try: await client.answer_callback_query(message.id)
+    try: await answer_callback(callback_query)
     except Exception: admin_logger.warning(f"Admin {user_id} failed to answer callback query {data} in chat {chat_id}.")
 
     # Check user state - must be in the confirm_broadcast state
@@ -138,11 +171,12 @@ async def broadcast_confirmation_callback(client: Client, callback_query: Callba
 
 
     broadcast_message_text = user_state.data.get("broadcast_message")
+    source_message_id = user_state.data.get("source_message_id") # Admin's message to copy, when broadcasting a message instead of text
     total_users_count = user_state.data.get("total_users_count") # Can be "Unknown"
 
 
     # Ensure broadcast message text is available in state
-    if broadcast_message_text is None:
+    if broadcast_message_text is None and source_message_id is None:
          admin_logger.error(f"Admin {user_id} in confirm_broadcast state but 'broadcast_message' missing in state data: {user_state.data}. Clearing state.")
          await edit_or_send_message(client, chat_id, message_id, "💔 Broadcast message text missing from state. Process cancelled.", disable_web_page_preview=True)
          await clear_user_state(user_id); return # Clear corrupted state
@@ -150,20 +184,38 @@ async def broadcast_confirmation_callback(client: Client, callback_query: Callba
 
     if data == "admin_confirm_broadcast":
          # --- Admin confirmed the broadcast ---
-         admin_logger.info(f"Admin {user_id} CONFIRMED broadcast to {total_users_count} users. Message: '{broadcast_message_text[:100]}...'")
-
-         # Inform admin that broadcast is starting. Edit the confirmation message.
-         await edit_or_send_message(
-              client, chat_id, message_id,
-              strings.BROADCAST_STARTED + f"\n({total_users_count} users estimated)", # Add info
-              reply_markup=None # Remove confirmation buttons
-              # Optionally, add a "Stop Broadcast" button? Requires more state/logic.
-         )
-
-         # --- Start the broadcast process in the background ---
-         # This is the core loop that sends messages to all users.
-         # Do NOT block the handler, use asyncio.create_task
-         asyncio.create_task(execute_broadcast(client, user_id, broadcast_message_text))
+         admin_logger.info(f"Admin {user_id} CONFIRMED broadcast to {total_users_count} users. Message: '{(broadcast_message_text or f'copy of message {source_message_id}')[:100]}...'")
+
+         # A message broadcast is copied from a copy in the storage/log channel: it outlives the admin deleting their
+         # message, and copy_message reuses the stored media instead of uploading it again for every user
+         # Checked before the channel copy, so a refused start doesn't leave a stray copy in the channel
+         active = await BroadcastEngine.active_job()
+         if active is not None:
+              await edit_or_send_message(client, chat_id, message_id, strings.BROADCAST_ALREADY_ACTIVE.format(status=active["status"]), reply_markup=None)
+              await clear_user_state(user_id); return
+
+         source = None
+         if source_message_id is not None:
+              try:
+                   stored = await client.copy_message(_broadcast_source_chat_id(), chat_id, source_message_id, disable_notification=True)
+                   source = (stored.chat.id, stored.id)
+              except Exception as e:
+                   admin_logger.error(f"Failed to copy broadcast message {source_message_id} of admin {user_id} to the source channel: {e}", exc_info=True)
+                   await edit_or_send_message(client, chat_id, message_id, strings.BROADCAST_SOURCE_COPY_FAILED, reply_markup=None)
+                   await clear_user_state(user_id); return
+
+         # --- Start the broadcast job in the background ---
+         # The engine persists the job and checkpoints its progress; the confirmation message becomes the progress message.
+         job = await BroadcastEngine.start(client, user_id, broadcast_message_text, chat_id, message_id, source=source)
+         if job is None:
+              active = await BroadcastEngine.active_job()
+              await edit_or_send_message(client, chat_id, message_id, strings.BROADCAST_ALREADY_ACTIVE.format(status=active["status"] if active else "running"), reply_markup=None)
+         else:
+              await edit_or_send_message(
+                   client, chat_id, message_id,
+                   strings.BROADCAST_STARTED + f"\n({job['total']} users estimated)", # Add info
+                   reply_markup=None # Remove confirmation buttons
+              )
 
          # Clear the broadcast confirmation state now that processing is delegated
          await clear_user_state(user_id) # Broadcast task runs independently
@@ -181,93 +233,32 @@ async def broadcast_confirmation_callback(client: Client, callback_query: Callba
     # If invalid callback data other than confirm/cancel falls through (should be caught by regex)
     # Generic callback handler might catch, or log.
 
-async def execute_broadcast(client: Client, admin_user_id: int, message_text: str):
-     """
-     Sends the broadcast message to all bot users except the sending admin.
-     Runs as an asynchronous background task. Handles errors and FloodWait.
-     """
-     admin_logger.info(f"Starting background broadcast execution for admin {admin_user_id}. Message: '{message_text[:100]}...'")
-     sent_count = 0
-     blocked_count = 0 # Count users who blocked bot
-
-
-     try:
-         # Fetch all user IDs from the database, projecting only user_id
-         # Exclude the sending admin from the list? Yes, usually don't broadcast to self.
-         users_cursor = MongoDB.users_collection().find({}, {"user_id": 1}).batch_size(100) # Use batch_size for efficiency
-
-
-         # Iterate through all users fetched from the database
-         async for user_doc in users_cursor:
-              user_id_to_send = user_doc.get("user_id")
-
-              if user_id_to_send is None: continue # Skip if user ID is missing
-              if user_id_to_send == admin_user_id:
-                   admin_logger.debug(f"Skipping broadcast to initiating admin {user_id_to_send}.")
-                   continue # Skip the admin who initiated it
-
-
-              try:
-                   # Send the message to the user's private chat
-                   # Use client.send_message - this is the operation that can trigger FloodWait/UserNotParticipant
-                   await client.send_message(
-                        chat_id=user_id_to_send, # Send to user ID (private chat)
-                        text=message_text,
-                        parse_mode=config.PARSE_MODE,
-                        disable_web_page_preview=True
-                   )
-                   sent_count += 1 # Increment success count
-                   # Log every successful send? Too verbose. Log progress.
-
-
-              except UserNotParticipant:
-                   # User has blocked the bot or somehow is not reachable via private chat.
-                   blocked_count += 1 # Increment blocked count
-                   # Consider marking user as inactive or removing them from DB if persistent (advanced).
-                   admin_logger.debug(f"User {user_id_to_send} blocked bot or not participant. Cannot send broadcast.")
-              except FloodWait as e:
-                   # Rate limit hit for sending messages. Wait and continue broadcast.
-                   admin_logger.warning(f"FloodWait during broadcast execution. Waiting {e.value}s before continuing...")
-                   await asyncio.sleep(e.value)
-                   # Try to send again to the SAME user after the wait. Or skip and continue?
-                   # Retrying this specific user after wait is better. Put send logic in a retry loop.
-                   # Simplified: Just wait and let the async for loop continue to the next user.
-                   # Some messages might be missed in this simplified approach if FloodWait is hit between users.
-
-                   # More robust retry logic for a single send attempt within the loop:
-                   # try: await client.send_message(...) ... success=True ... except FloodWait as e: await asyncio.sleep(e.value); try again; finally success=False/Error.
-                   # If successful after retry, continue loop. If still error, increment failed count or blocked count.
-                   # For this example, simple FloodWait catch on send is acceptable. The loop just moves to next user.
-                   continue # Skip current user on FloodWait and proceed after delay (simplified)
-
-
-              except Exception as e:
-                   # Any other error sending to a specific user
-                   admin_logger.error(f"Failed to send broadcast message to user {user_id_to_send}: {e}", exc_info=True)
-                   # Don't increment sent count. Increment a failed count if needed.
-                   continue # Continue the loop to the next user
-
-              # Add a small delay between sending messages to avoid hitting API limits too fast
-              # Telegram API has limits per user and global. Default client handling helps, but extra delay is safer for broadcasts.
-              await asyncio.sleep(0.05) # Example small delay
-
-
-     except Exception as e:
-          # Error during the database query or iteration
-          admin_logger.critical(f"FATAL error during broadcast execution for admin {admin_user_id}: {e}", exc_info=True)
-          # Notify the initiating admin that the broadcast failed.
-          try: await client.send_message(admin_user_id, f"💔 Error occurred during broadcast execution: {e}", parse_mode=config.PARSE_MODE)
-          except Exception: pass # If informing admin fails, just log
+# /broadcast_status, /broadcast_pause, /broadcast_resume, /broadcast_cancel: control the active broadcast job
+@Client.on_message(filters.command(["broadcast_status", "broadcast_pause", "broadcast_resume", "broadcast_cancel"]) & filters.private)
+async def broadcast_control_command_handler(client: Client, message: Message):
+    user_id = message.from_user.id
 
+    # --- Admin Check ---
+    if user_id not in config.ADMIN_IDS:
+        await message.reply_text("🚫 You are not authorized to use this command.", parse_mode=config.PARSE_MODE)
+        return
 
-     finally:
-         # Broadcast process finished (or failed)
-         completion_message = f"📢 Broadcast process finished!\nSent to: {sent_count} users.\nBlocked/Unreachable: {blocked_count} users."
-         admin_logger.info(completion_message)
+    command = message.command[0].lower()
+    try:
+        if command == "broadcast_pause": job, reply = await BroadcastEngine.pause(), strings.BROADCAST_PAUSED
+        elif command == "broadcast_resume": job, reply = await BroadcastEngine.resume(client), strings.BROADCAST_RESUMED
+        elif command == "broadcast_cancel": job, reply = await BroadcastEngine.cancel(), strings.BROADCAST_CANCEL_REQUESTED
+        else:
+            job = await BroadcastEngine.active_job()
+            reply = BroadcastEngine.progress_text(job) if job else None
+    except Exception as e:
+        admin_logger.error(f"Failed to handle /{command} for admin {user_id}: {e}", exc_info=True)
+        await message.reply_text(strings.DB_ERROR, parse_mode=config.PARSE_MODE)
+        return
 
-         # Notify the initiating admin about the broadcast completion summary
-         try: await client.send_message(admin_user_id, completion_message, parse_mode=config.PARSE_MODE)
-         except Exception: pass # If informing admin fails, just log
+    if job is None: reply = strings.BROADCAST_NONE_ACTIVE if command in ("broadcast_status", "broadcast_cancel") else strings.BROADCAST_NOTHING_TO_CHANGE.format(action=command.split("_")[1])
+    else: admin_logger.info(f"Admin {user_id} used /{command} on broadcast {job['_id']}.")
+    await message.reply_text(reply, parse_mode=config.PARSE_MODE)
 
 
 # --- Admin User Token Management Handlers ---
@@ -455,6 +446,9 @@ async def delete_all_data_command_handler(client: Client, message: Message):
     # --- Execute Database Deletion ---
     try:
         success = await MongoDB.delete_all_data() # Call the method in MongoDB class
+        # Drop whatever the in-memory index still holds for the deleted catalog (rebuilds empty)
+        try: await SearchIndex.build()
+        except Exception as e: admin_logger.error(f"Failed to rebuild search index after delete_all_data: {e}", exc_info=True)
 
         # Inform owner about the outcome
         if success:
@@ -481,6 +475,174 @@ async def delete_all_data_command_handler(client: Client, message: Message):
     # os._exit(1) # Forced exit, potentially more abrupt shutdown
 
 
+# --- Admin Query Profile Command ---
+# /query_report: most expensive MongoDB query shapes, sampled plans and index advice. "/query_report reset" clears the stats.
+QUERY_REPORT_SHAPES = 10 # Shapes listed, by total time spent
+MESSAGE_CHUNK_LENGTH = 4000 # Telegram messages are capped at 4096 characters
+
+
+def _chunk_lines(lines: List[str], limit: int = MESSAGE_CHUNK_LENGTH) -> List[str]:
+    chunks, current = [], ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            chunks.append(current)
+            current = ""
+        current += line + "\n"
+    if current: chunks.append(current)
+    return chunks
+
+
+@Client.on_message(filters.command("query_report") & filters.private)
+async def query_report_command_handler(client: Client, message: Message):
+    user_id = message.from_user.id
+
+    # --- Admin Check ---
+    if user_id not in config.ADMIN_IDS:
+        await message.reply_text("🚫 You are not authorized to use this command.", parse_mode=config.PARSE_MODE)
+        return
+
+    if not config.QUERY_PROFILER_ENABLED:
+        await message.reply_text("ℹ️ The query profiler is disabled (QUERY_PROFILER_ENABLED).", parse_mode=config.PARSE_MODE)
+        return
+
+    if len(message.command) > 1 and message.command[1].lower() == "reset":
+        QueryProfiler.reset()
+        CallbackAck.reset()
+        admin_logger.info(f"Admin {user_id} reset the query profiler statistics.")
+        await message.reply_text("✅ Query profiler statistics cleared.", parse_mode=config.PARSE_MODE)
+        return
+
+    try:
+        shapes = QueryProfiler.shapes(limit=QUERY_REPORT_SHAPES)
+        advice = await QueryProfiler.recommendations()
+    except Exception as e:
+        admin_logger.error(f"Failed to build query report for admin {user_id}: {e}", exc_info=True)
+        await message.reply_text(strings.ERROR_OCCURRED, parse_mode=config.PARSE_MODE)
+        return
+
+    since = datetime.fromtimestamp(advice["since"], tz=timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+    lines = [f"📊 <b><u>Query Profile</u></b> (since {since})", ""]
+    if not shapes: lines.append("No queries recorded yet.")
+    for position, stats in enumerate(shapes, start=1):
+        shape_text = html.escape(json.dumps(stats["shape"], default=str)[:300])
+        lines.append(f"<b>{position}. {html.escape(str(stats['collection']))}.{stats['command']}</b> — {stats['count']}× avg {stats['total_ms'] / stats['count']:.1f} ms, max {stats['max_ms']:.0f} ms, {stats['returned'] / stats['count']:.1f} docs")
+        lines.append(f"<code>{shape_text}</code>")
+        lines.append("Handlers: " + html.escape(", ".join(f"{handler} ({count})" for handler, count in stats["handlers"].most_common(3))))
+        explain = stats.get("explain")
+        if explain:
+            plan = "⚠️ COLLSCAN" if explain["collscan"] else " → ".join(explain["stages"]) or "?"
+            indexes = f" [{html.escape(', '.join(explain['indexes']))}]" if explain["indexes"] else ""
+            lines.append(f"Plan: {plan}{indexes} • examined {explain['docs_examined']} docs / {explain['keys_examined']} keys → {explain['returned']} returned")
+        lines.append("")
+
+    lines.append("💡 <b>Recommended indexes</b>")
+    if not advice["create"]: lines.append("None: no sampled slow shape scans more than it returns.")
+    for index_advice in advice["create"]:
+        keys_text = html.escape(json.dumps(index_advice["keys"]))
+        if index_advice["covered_by"]:
+            lines.append(f"• {html.escape(index_advice['collection'])} {keys_text} exists as {html.escape(json.dumps(index_advice['covered_by']))} but was not chosen ({index_advice['calls']} calls): check the query/sort shape")
+        else:
+            lines.append(f"• <code>db.{html.escape(index_advice['collection'])}.createIndex({keys_text})</code> ({index_advice['calls']} calls)")
+
+    lines.append("")
+    lines.append("🗑 <b>Unused indexes</b> (no use since server start)")
+    if not advice["unused"]: lines.append("None.")
+    for index in advice["unused"]:
+        lines.append(f"• {html.escape(index['collection'])}.{html.escape(str(index['name']))}")
+
+    ack = CallbackAck.stats()
+    lines.append("")
+    lines.append("⏱ <b>Callback acknowledgement</b> (button press → spinner stopped)")
+    if not config.CALLBACK_ACK_ENABLED: lines.append("Disabled (CALLBACK_ACK_ENABLED): handlers answer callbacks themselves.")
+    else: lines.append(f"{ack['count']} acks, p50 {ack['p50_ms']:.0f} ms, p95 {ack['p95_ms']:.0f} ms, max {ack['max_ms']:.0f} ms, {ack['failures']} failed")
+
+    for chunk in _chunk_lines(lines):
+        await message.reply_text(chunk, parse_mode=config.PARSE_MODE, disable_web_page_preview=True)
+
+
+# /delivery_report: file delivery queue depth, waits and send latency
+@Client.on_message(filters.command("delivery_report") & filters.private)
+async def delivery_report_command_handler(client: Client, message: Message):
+    user_id = message.from_user.id
+
+    # --- Admin Check ---
+    if user_id not in config.ADMIN_IDS:
+        await message.reply_text("🚫 You are not authorized to use this command.", parse_mode=config.PARSE_MODE)
+        return
+
+    stats = DeliveryQueue.stats()
+    lines = [
+        "📦 <b><u>File Delivery Queue</u></b>",
+        f"Waiting: {stats['depth']} files from {stats['users_waiting']} users • in flight: {stats['in_flight']}",
+        f"Queue wait: p50 {stats['wait_p50_ms']:.0f} ms, p95 {stats['wait_p95_ms']:.0f} ms",
+        f"Send latency: p50 {stats['send_p50_ms']:.0f} ms, p95 {stats['send_p95_ms']:.0f} ms",
+        f"Sent {stats['sent']} • failed {stats['failed']} • refused (queue full) {stats['rejected']} • FloodWaits {stats['flood_waits']}",
+        f"Repeated taps dropped: {stats['duplicates_dropped']}",
+    ]
+    if stats["paused_for"] > 0: lines.append(f"⏸ Paused by FloodWait for another {stats['paused_for']:.0f}s")
+    health = FileHealth.stats()
+    last_scan = health["last_scan_at"].strftime("%Y-%m-%d %H:%M UTC") if health["last_scan_at"] else "not yet"
+    lines += [
+        "",
+        f"🩺 <b>File health</b> (last scan: {last_scan})",
+        f"Checked {health['checked']} • refreshed {health['refreshed']} • storage copies added {health['backfilled']} • dead {health['dead']} • repaired on send {health['repaired']}",
+    ]
+    reachability = Reachability.stats()
+    lines += [
+        "",
+        f"📵 <b>Unreachable users</b>: {reachability['unreachable']} (skipped by broadcasts and notifications)",
+        f"Marked unreachable {reachability['marked_unreachable']} • reachable again {reachability['marked_reachable']} • pending writes {reachability['pending']}",
+    ]
+    try:
+        outbox = await NotificationOutbox.stats()
+        lines += [
+            "",
+            f"🔔 <b>Watchlist notifications</b>: {outbox['waiting']} jobs waiting or running",
+            f"Jobs enqueued {outbox['enqueued']} • done {outbox['jobs_done']} • failed {outbox['jobs_failed']}",
+            f"Sent {outbox['sent']} • unreachable {outbox['blocked']} • failed {outbox['failed']} • FloodWaits {outbox['flood_waits']}",
+        ]
+    except Exception as e: admin_logger.warning(f"Failed to read notification outbox stats: {e}")
+    await message.reply_text("\n".join(lines), parse_mode=config.PARSE_MODE)
+
+
+# /download_stats [days]: downloads per day and most downloaded anime, from the download_events time series
+@Client.on_message(filters.command("download_stats") & filters.private)
+async def download_stats_command_handler(client: Client, message: Message):
+    user_id = message.from_user.id
+
+    # --- Admin Check ---
+    if user_id not in config.ADMIN_IDS:
+        await message.reply_text("🚫 You are not authorized to use this command.", parse_mode=config.PARSE_MODE)
+        return
+
+    args = message.text.split()[1:]
+    days = int(args[0]) if args and args[0].isdigit() and int(args[0]) > 0 else 7
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    try:
+        daily = await DownloadEvents.daily_totals(since)
+        top = await DownloadEvents.top_anime(since, 10)
+    except Exception as e:
+        admin_logger.error(f"Failed to aggregate download events for admin {user_id}: {e}", exc_info=True)
+        await message.reply_text(strings.DB_ERROR, parse_mode=config.PARSE_MODE)
+        return
+
+    lines = [f"📈 <b><u>Downloads, last {days} day(s)</u></b>", ""]
+    if not daily: lines.append("No downloads recorded in this period.")
+    for day in daily:
+        lines.append(f"{day['day'].strftime('%Y-%m-%d')}: {day['downloads']} files • {day['users']} users • {day['bytes'] / 1024 ** 3:.1f} GB • avg {day['avg_latency_ms'] / 1000:.1f}s to deliver")
+    if top:
+        lines += ["", "🔥 <b>Most downloaded</b>"]
+        for rank, row in enumerate(top, 1):
+            entry = SearchIndex.get_entry(row["anime_id"])
+            name = entry.get("name") if entry else str(row["anime_id"])
+            lines.append(f"{rank}. {html.escape(name)}: {row['downloads']} files")
+    events = DownloadEvents.stats()
+    lines += ["", f"Events recorded {events['recorded']} • written {events['written']} • buffered {events['buffered']} • dropped {events['dropped']}"]
+
+    for chunk in _chunk_lines(lines):
+        await message.reply_text(chunk, parse_mode=config.PARSE_MODE, disable_web_page_preview=True)
+
+
 # --- Discovery Lists Handlers (Leaderboard, Latest, Popular) ---
 # Note: Display logic is already in browse_handler for simplicity of display helper reuse.
 # We just need command handlers to trigger that display, and potential specific list fetching.
@@ -491,7 +653,7 @@ async def leaderboard_callback(client: Client, callback_query: CallbackQuery):
      # Chat/Message ID from callback_query.message
      message = callback_query.message
 
-     try: await client.answer_callback_query(message.id, "Loading leaderboard...")
+     try: await answer_callback(callback_query, "Loading leaderboard...")
      except Exception: admin_logger.warning(f"Failed to answer callback query menu_leaderboard from user {user_id}")
 
      # Clear any prior state, as these lists are standalone display features.
@@ -567,13 +729,97 @@ async def leaderboard_callback(client: Client, callback_query: CallbackQuery):
           await edit_or_send_message(client, message.chat.id, message.id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
 
 
+async def _render_latest_menu() -> RenderedMenu:
+    """Latest additions list, shared by all users. Depends on every anime's episodes: invalidated by any content write."""
+    menu_text = strings.LATEST_TITLE + "\n\n"
+    buttons = []
+
+    # Fetch recent ANIME updates sorted by last_updated_at
+    # Need to get episodes information efficiently
+    # More advanced: Query for anime, then sort episodes by creation time (if timestamp added to Episode model)
+    # Simplified: Query Anime sorted by overall_download_count as proxy for popularity. (Oops, that's Popular).
+    # Query Anime sorted by last_updated_at and project episode/season info to list recent updates.
+    # Better approach: Aggregate documents to get list of recent file additions across ALL anime.
+    # Needs complex aggregation query. Let's simplify for first pass.
+    # Fetch top N most recently *updated* anime, then list details like "Anime Name (Latest Episodes: S#E#...)"
+    # Or just fetch documents sorted by last_updated_at and show them, relying on update time as 'latest'.
+
+    recent_anime_docs = await MongoDB.anime_collection().find(
+        {}, {"name": 1, "_id": 1, "seasons": 1} # Project needed fields: name, id, full seasons/episodes
+    ).sort("last_updated_at", -1).limit(config.LATEST_COUNT).to_list(config.LATEST_COUNT) # Sort by anime update time
+
+
+    if not recent_anime_docs:
+         menu_text += strings.NO_CONTENT_YET # "No latest additions yet."
+    else:
+        # Iterate through recent anime and identify *their* latest episodes
+        for anime_doc in recent_anime_docs:
+            anime_name = anime_doc.get("name", "Unnamed Anime")
+            anime_id = str(anime_doc["_id"])
+
+            # Find the latest episode added to this anime *by its own timestamp* (if available) or highest episode number
+            latest_episode_info = None
+            latest_timestamp = datetime.min.replace(tzinfo=timezone.utc) # Use a very old time for comparison
+
+            seasons = sorted(anime_doc.get("seasons", []), key=lambda s: s.get("season_number", 0))
+            for season_doc in seasons:
+                episodes = sorted(season_doc.get("episodes", []), key=lambda e: e.get("episode_number", 0))
+                season_number = season_doc.get("season_number", 0)
+                for episode_doc in episodes:
+                     episode_number = episode_doc.get("episode_number", 0)
+                     files = episode_doc.get("files", [])
+
+                     # Determine the 'latest' timestamp for this episode
+                     episode_latest_time = episode_doc.get("release_date") # Use release date if available
+
+                     # Use latest added file version timestamp if files exist and it's more recent
+                     latest_file_added_at = datetime.min.replace(tzinfo=timezone.utc)
+                     if files:
+                        for file_ver in files:
+                             added_at = file_ver.get("added_at", datetime.min.replace(tzinfo=timezone.utc))
+                             if isinstance(added_at, datetime) and added_at > latest_file_added_at:
+                                  latest_file_added_at = added_at
+                        if latest_file_added_at > episode_latest_time: # Use file added time if more recent
+                            episode_latest_time = latest_file_added_at
+
+
+                     if isinstance(episode_latest_time, datetime) and episode_latest_time > latest_timestamp:
+                         latest_timestamp = episode_latest_time
+                         latest_episode_info = {"anime_name": anime_name, "anime_id": anime_id, "season_number": season_number, "episode_number": episode_number}
+
+            if latest_episode_info:
+                # Add entry for this anime's latest identified episode
+                entry_text = strings.LATEST_ENTRY_FORMAT.format(
+                    anime_title=latest_episode_info["anime_name"],
+                    season_number=latest_episode_info["season_number"],
+                    episode_number=latest_episode_info["episode_number"]
+                )
+                menu_text += entry_text + "\n"
+
+                # Add button to link to the episode's version list directly
+                # Callback: download_select_episode|<anime_id>|<season>|<ep>
+                button_callback_direct_episode = f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{latest_episode_info['anime_id']}{config.CALLBACK_DATA_SEPARATOR}{latest_episode_info['season_number']}{config.CALLBACK_DATA_SEPARATOR}{latest_episode_info['episode_number']}"
+                buttons.append([InlineKeyboardButton(f"🎬 View S{latest_episode_info['season_number']}E{latest_episode_info['episode_number']:02d}", callback_data=button_callback_direct_episode)])
+
+        if not latest_episode_info and anime_doc.get("seasons"):
+            # No timestamped episodes found in this recently updated anime? Link to details instead.
+             menu_text += f" - (Episodes un-timestamped?)\n" # Add note for debugging
+             buttons.append([InlineKeyboardButton(f"📚 View {anime_name}", callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id}")]) # Link to anime details
+
+
+    # Add Back to Main Menu button after list or entries
+    buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
+
+    return RenderedMenu(menu_text, buttons)
+
+
 @Client.on_callback_query(filters.regex("^menu_latest$") & filters.private)
 async def latest_additions_callback(client: Client, callback_query: CallbackQuery):
      user_id = callback_query.from_user.id
      # Chat/Message ID from callback_query.message
      message = callback_query.message
 
-     try: await client.answer_callback_query(message.id, "Loading latest additions...")
+     try: await answer_callback(callback_query, "Loading latest additions...")
      except Exception: admin_logger.warning(f"Failed to answer callback query menu_latest from user {user_id}")
 
      user_state = await get_user_state(user_id)
@@ -583,88 +829,11 @@ async def latest_additions_callback(client: Client, callback_query: CallbackQuer
 
 
      try:
-         menu_text = strings.LATEST_TITLE + "\n\n"
-         buttons = []
-
-         # Fetch recent ANIME updates sorted by last_updated_at
-         # Need to get episodes information efficiently
-         # More advanced: Query for anime, then sort episodes by creation time (if timestamp added to Episode model)
-         # Simplified: Query Anime sorted by overall_download_count as proxy for popularity. (Oops, that's Popular).
-         # Query Anime sorted by last_updated_at and project episode/season info to list recent updates.
-         # Better approach: Aggregate documents to get list of recent file additions across ALL anime.
-         # Needs complex aggregation query. Let's simplify for first pass.
-         # Fetch top N most recently *updated* anime, then list details like "Anime Name (Latest Episodes: S#E#...)"
-         # Or just fetch documents sorted by last_updated_at and show them, relying on update time as 'latest'.
-
-         recent_anime_docs = await MongoDB.anime_collection().find(
-             {}, {"name": 1, "_id": 1, "seasons": 1} # Project needed fields: name, id, full seasons/episodes
-         ).sort("last_updated_at", -1).limit(config.LATEST_COUNT).to_list(config.LATEST_COUNT) # Sort by anime update time
-
-
-         if not recent_anime_docs:
-              menu_text += strings.NO_CONTENT_YET # "No latest additions yet."
-         else:
-             # Iterate through recent anime and identify *their* latest episodes
-             for anime_doc in recent_anime_docs:
-                 anime_name = anime_doc.get("name", "Unnamed Anime")
-                 anime_id = str(anime_doc["_id"])
-
-                 # Find the latest episode added to this anime *by its own timestamp* (if available) or highest episode number
-                 latest_episode_info = None
-                 latest_timestamp = datetime.min.replace(tzinfo=timezone.utc) # Use a very old time for comparison
-
-                 seasons = sorted(anime_doc.get("seasons", []), key=lambda s: s.get("season_number", 0))
-                 for season_doc in seasons:
-                     episodes = sorted(season_doc.get("episodes", []), key=lambda e: e.get("episode_number", 0))
-                     season_number = season_doc.get("season_number", 0)
-                     for episode_doc in episodes:
-                          episode_number = episode_doc.get("episode_number", 0)
-                          files = episode_doc.get("files", [])
-
-                          # Determine the 'latest' timestamp for this episode
-                          episode_latest_time = episode_doc.get("release_date") # Use release date if available
-
-                          # Use latest added file version timestamp if files exist and it's more recent
-                          latest_file_added_at = datetime.min.replace(tzinfo=timezone.utc)
-                          if files:
-                             for file_ver in files:
-                                  added_at = file_ver.get("added_at", datetime.min.replace(tzinfo=timezone.utc))
-                                  if isinstance(added_at, datetime) and added_at > latest_file_added_at:
-                                       latest_file_added_at = added_at
-                             if latest_file_added_at > episode_latest_time: # Use file added time if more recent
-                                 episode_latest_time = latest_file_added_at
-
-
-                          if isinstance(episode_latest_time, datetime) and episode_latest_time > latest_timestamp:
-                              latest_timestamp = episode_latest_time
-                              latest_episode_info = {"anime_name": anime_name, "anime_id": anime_id, "season_number": season_number, "episode_number": episode_number}
-
-                 if latest_episode_info:
-                     # Add entry for this anime's latest identified episode
-                     entry_text = strings.LATEST_ENTRY_FORMAT.format(
-                         anime_title=latest_episode_info["anime_name"],
-                         season_number=latest_episode_info["season_number"],
-                         episode_number=latest_episode_info["episode_number"]
-                     )
-                     menu_text += entry_text + "\n"
-
-                     # Add button to link to the episode's version list directly
-                     # Callback: download_select_episode|<anime_id>|<season>|<ep>
-                     button_callback_direct_episode = f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{latest_episode_info['anime_id']}{config.CALLBACK_DATA_SEPARATOR}{latest_episode_info['season_number']}{config.CALLBACK_DATA_SEPARATOR}{latest_episode_info['episode_number']}"
-                     buttons.append([InlineKeyboardButton(f"🎬 View S{latest_episode_info['season_number']}E{latest_episode_info['episode_number']:02d}", callback_data=button_callback_direct_episode)])
-
-             if not latest_episode_info and anime_doc.get("seasons"):
-                 # No timestamped episodes found in this recently updated anime? Link to details instead.
-                  menu_text += f" - (Episodes un-timestamped?)\n" # Add note for debugging
-                  buttons.append([InlineKeyboardButton(f"📚 View {anime_name}", callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id}")]) # Link to anime details
-
-
-         # Add Back to Main Menu button after list or entries
-         buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-         reply_markup = InlineKeyboardMarkup(buttons)
+         # Same list for every user: rendered once, dropped by MenuCache.invalidate_anime on any episode/file change
+         rendered_menu = await MenuCache.get_or_render("latest", (), _render_latest_menu, anime_ids=None)
 
          # Edit message to display list
-         await edit_or_send_message(client, message.chat.id, message.id, menu_text, reply_markup, disable_web_page_preview=True)
+         await edit_or_send_message(client, message.chat.id, message.id, rendered_menu.text, rendered_menu.markup(), disable_web_page_preview=True)
 
 
      except Exception as e:
@@ -673,13 +842,47 @@ async def latest_additions_callback(client: Client, callback_query: CallbackQuer
           await edit_or_send_message(client, message.chat.id, message.id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
 
 
+async def _render_popular_menu() -> RenderedMenu:
+    """Popular anime list, shared by all users. Download counts in it are at most MENU_CACHE_SECONDS old."""
+    menu_text = strings.POPULAR_TITLE + "\n\n"
+    buttons = []
+
+    # Fetch popular anime documents sorted by overall_download_count descending.
+    # Use config.POPULAR_COUNT limit.
+    popular_anime_docs = await MongoDB.anime_collection().find(
+         {}, {"name": 1, "_id": 1, "overall_download_count": 1, "status":1, "release_year": 1}
+     ).sort("overall_download_count", -1).limit(config.POPULAR_COUNT).to_list(config.POPULAR_COUNT) # Sort by total downloads
+
+
+    if not popular_anime_docs:
+         menu_text += strings.NO_CONTENT_YET # "No popular anime yet."
+    else:
+        # Create buttons for each popular anime, linking to its details/management menu
+        for anime_doc in popular_anime_docs:
+             anime_name = anime_doc.get("name", "Unnamed Anime")
+             anime_id = str(anime_doc["_id"])
+             downloads = anime_doc.get("overall_download_count", 0)
+
+             # Button label includes downloads count as indicator
+             button_label = f"🔥 {anime_name} ({downloads} ↓)"
+
+             # Callback: browse_select_anime|<anime_id> (Reuse details display logic)
+             buttons.append([InlineKeyboardButton(button_label, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id}")])
+
+
+    # Add Back to Main Menu button after list or entries
+    buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
+
+    return RenderedMenu(menu_text, buttons)
+
+
 @Client.on_callback_query(filters.regex("^menu_popular$") & filters.private)
 async def popular_anime_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     # Chat/Message ID from callback_query.message
     message = callback_query.message
 
-    try: await client.answer_callback_query(message.id, "Loading popular anime...")
+    try: await answer_callback(callback_query, "Loading popular anime...")
     except Exception: admin_logger.warning(f"Failed to answer callback query menu_popular from user {user_id}")
 
     user_state = await get_user_state(user_id)
@@ -689,38 +892,11 @@ async def popular_anime_callback(client: Client, callback_query: CallbackQuery):
 
 
     try:
-        menu_text = strings.POPULAR_TITLE + "\n\n"
-        buttons = []
-
-        # Fetch popular anime documents sorted by overall_download_count descending.
-        # Use config.POPULAR_COUNT limit.
-        popular_anime_docs = await MongoDB.anime_collection().find(
-             {}, {"name": 1, "_id": 1, "overall_download_count": 1, "status":1, "release_year": 1}
-         ).sort("overall_download_count", -1).limit(config.POPULAR_COUNT).to_list(config.POPULAR_COUNT) # Sort by total downloads
-
-
-        if not popular_anime_docs:
-             menu_text += strings.NO_CONTENT_YET # "No popular anime yet."
-        else:
-            # Create buttons for each popular anime, linking to its details/management menu
-            for anime_doc in popular_anime_docs:
-                 anime_name = anime_doc.get("name", "Unnamed Anime")
-                 anime_id = str(anime_doc["_id"])
-                 downloads = anime_doc.get("overall_download_count", 0)
-
-                 # Button label includes downloads count as indicator
-                 button_label = f"🔥 {anime_name} ({downloads} ↓)"
-
-                 # Callback: browse_select_anime|<anime_id> (Reuse details display logic)
-                 buttons.append([InlineKeyboardButton(button_label, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id}")])
-
-
-        # Add Back to Main Menu button after list or entries
-        buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-        reply_markup = InlineKeyboardMarkup(buttons)
+        # Same list for every user: rendered once per MENU_CACHE_SECONDS / catalog version
+        rendered_menu = await MenuCache.get_or_render("popular", (), _render_popular_menu)
 
         # Edit message to display list
-        await edit_or_send_message(client, message.chat.id, message.id, menu_text, reply_markup, disable_web_page_preview=True)
+        await edit_or_send_message(client, message.chat.id, message.id, rendered_menu.text, rendered_menu.markup(), disable_web_page_preview=True)
 
 
     except Exception as e:
@@ -0,0 +1,237 @@
+# handlers/broadcast_engine.py
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Tuple
+from pyrogram import Client
+from pyrogram.errors import FloodWait, MessageNotModified
+
+import config
+import strings
+
+from database.mongo_db import MongoDB
+
+from .delivery_queue import TokenBucket
+from .reachability import Reachability, UNREACHABLE_ERRORS
+
+
+broadcast_logger = logging.getLogger(__name__) # Logger for this module
+
+# A broadcast is a document in the broadcasts collection: text, status, counters and `cursor`, the _id of the last
+# user of the last fully processed page. The runner reads users in _id order, BROADCAST_PAGE_SIZE at a time, sends a
+# page with BROADCAST_WORKERS concurrent workers sharing one token bucket (BROADCAST_RATE), then checkpoints cursor and
+# counters in a single update. After a restart a running job resumes from its cursor: at most one page is sent twice.
+# A FloodWait pauses the shared bucket, so every worker waits it out, and the same recipient is retried.
+# Pause takes effect at the next checkpoint; cancel stops the workers before their next send.
+# A job carries either text (send_message) or a source message (source_chat_id/source_message_id, a copy of the admin's
+# message in the storage or log channel) fanned out with copy_message, so Telegram reuses the stored media.
+# Only reachable users are paged (see reachability.py); the ones a broadcast finds unreachable are marked for next time.
+_RECIPIENTS_QUERY = {"reachability": "ok"}
+_ACTIVE_STATUSES = ["running", "paused"]
+_STATUS_LABELS = {"running": "in progress", "paused": "paused", "cancelled": "cancelled", "done": "finished"}
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600: return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60: return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class BroadcastEngine:
+    """The active broadcast job (one at a time): start, pause/resume/cancel, progress and resume after a restart."""
+    _client: Optional[Client] = None
+    _job: Optional[Dict[str, Any]] = None # In-memory copy of the active job document
+    _task: Optional[asyncio.Task] = None
+    _loop_exited: bool = True # The runner left its page loop (it may still be sending the final report)
+    _bucket = TokenBucket(config.BROADCAST_RATE, config.BROADCAST_BURST)
+    _last_progress: float = 0.0
+    _run_clock: Optional[Tuple[float, int]] = None # (monotonic start, processed count then) of the current run, for rate/ETA
+
+    @classmethod
+    async def active_job(cls) -> Optional[Dict[str, Any]]:
+        """The running or paused job, if any."""
+        if cls._job is None or cls._job["status"] not in _ACTIVE_STATUSES:
+            cls._job = await MongoDB.broadcasts_collection().find_one({"status": {"$in": _ACTIVE_STATUSES}})
+        return cls._job
+
+
+    @classmethod
+    async def start(
+        cls, client: Client, admin_id: int, text: Optional[str], status_chat_id: int, status_message_id: int,
+        source: Optional[Tuple[int, int]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Creates and launches a broadcast job of `text`, or of the message `source` = (chat_id, message_id) copied to
+        every user. None when another one is still running or paused.
+        """
+        if await cls.active_job(): return None
+        now = datetime.now(timezone.utc)
+        source_chat_id, source_message_id = source or (None, None)
+        job = {
+            "admin_id": admin_id, "text": text, "source_chat_id": source_chat_id, "source_message_id": source_message_id,
+            "status": "running", "cursor": None,
+            "total": await MongoDB.users_collection().count_documents(_RECIPIENTS_QUERY),
+            "processed": 0, "sent": 0, "blocked": 0, "failed": 0, "flood_waits": 0,
+            "status_chat_id": status_chat_id, "status_message_id": status_message_id, "created_at": now, "updated_at": now
+        }
+        job["_id"] = (await MongoDB.broadcasts_collection().insert_one(job)).inserted_id
+        cls._launch(client, job)
+        return job
+
+
+    @classmethod
+    def _launch(cls, client: Client, job: Dict[str, Any]):
+        cls._client, cls._job = client, job
+        cls._task = asyncio.create_task(cls._run(job))
+
+
+    @classmethod
+    async def resume_after_restart(cls, client: Client):
+        """main.py: continues a broadcast that was running when the bot stopped (paused ones stay paused)."""
+        cls._client = client
+        job = await MongoDB.broadcasts_collection().find_one({"status": "running"})
+        if job is None: return
+        broadcast_logger.info(f"Resuming broadcast {job['_id']} after restart: {job['processed']}/{job['total']} users processed.")
+        cls._launch(client, job)
+
+
+    @classmethod
+    async def _set_status(cls, job: Dict[str, Any], status: str):
+        job["status"] = status
+        await MongoDB.broadcasts_collection().update_one({"_id": job["_id"]}, {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}})
+
+
+    @classmethod
+    async def pause(cls) -> Optional[Dict[str, Any]]:
+        job = await cls.active_job()
+        if job is None or job["status"] != "running": return None
+        await cls._set_status(job, "paused")
+        return job
+
+
+    @classmethod
+    async def resume(cls, client: Client) -> Optional[Dict[str, Any]]:
+        job = await cls.active_job()
+        if job is None or job["status"] != "paused": return None
+        await cls._set_status(job, "running")
+        # A runner still inside its loop (finishing a page) sees "running" again and carries on; one that already left
+        # it, even if still awaiting its final report, is replaced
+        if cls._task is None or cls._task.done() or cls._loop_exited: cls._launch(client, job)
+        return job
+
+
+    @classmethod
+    async def cancel(cls) -> Optional[Dict[str, Any]]:
+        job = await cls.active_job()
+        if job is None: return None
+        await cls._set_status(job, "cancelled")
+        if cls._task is None or cls._task.done(): await cls._report(job, force=True, notify=True) # Paused job: no runner to report
+        return job
+
+
+    @classmethod
+    async def _run(cls, job: Dict[str, Any]):
+        broadcast_logger.info(f"Broadcast {job['_id']} by admin {job['admin_id']} running from cursor {job['cursor']}.")
+        cls._run_clock = (time.monotonic(), job["processed"])
+        cls._loop_exited = False
+        try:
+            while job["status"] == "running":
+                query = {**_RECIPIENTS_QUERY, "_id": {"$gt": job["cursor"]}} if job["cursor"] else _RECIPIENTS_QUERY
+                page = await MongoDB.users_collection().find(query, {"user_id": 1}).sort("_id", 1).limit(config.BROADCAST_PAGE_SIZE).to_list(config.BROADCAST_PAGE_SIZE)
+                if not page:
+                    await cls._set_status(job, "done")
+                    break
+                recipients = [doc["user_id"] for doc in page if doc.get("user_id") is not None and doc["user_id"] != job["admin_id"]]
+                outcome = await cls._send_page(job, recipients)
+                outcome["processed"] = len(page)
+                job["cursor"] = page[-1]["_id"]
+                for key, value in outcome.items(): job[key] += value
+                # Checkpoint: the cursor and the page's counters move together
+                await MongoDB.broadcasts_collection().update_one({"_id": job["_id"]}, {"$set": {"cursor": job["cursor"], "updated_at": datetime.now(timezone.utc)}, "$inc": outcome})
+                await cls._report(job)
+            cls._loop_exited = True
+        except asyncio.CancelledError: raise
+        except Exception as e:
+            cls._loop_exited = True
+            broadcast_logger.error(f"Broadcast {job['_id']} stopped by an error: {e}. Pausing it at cursor {job['cursor']}.", exc_info=True)
+            try: await cls._set_status(job, "paused")
+            except Exception: job["status"] = "paused" # DB down: stays "running" in the DB and resumes after a restart
+        status = job["status"] # resume() may set the job running again (and relaunch it) during the report below
+        broadcast_logger.info(f"Broadcast {job['_id']} {_STATUS_LABELS.get(status, status)}: {job['sent']} sent, {job['blocked']} unreachable, {job['failed']} failed, {job['flood_waits']} FloodWaits.")
+        await cls._report(job, force=True, notify=status != "paused")
+
+
+    @classmethod
+    async def _send_page(cls, job: Dict[str, Any], recipients: List[int]) -> Dict[str, int]:
+        outcome = {"sent": 0, "blocked": 0, "failed": 0, "flood_waits": 0}
+        pending = deque(recipients)
+
+        async def worker():
+            while pending and job["status"] != "cancelled":
+                result = await cls._send_one(job, pending.popleft(), outcome)
+                if result: outcome[result] += 1
+
+        await asyncio.gather(*(worker() for _ in range(min(config.BROADCAST_WORKERS, len(recipients)))))
+        return outcome
+
+
+    @classmethod
+    async def _send_one(cls, job: Dict[str, Any], user_id: int, outcome: Dict[str, int]) -> Optional[str]:
+        """Outcome key for one recipient, or None when the broadcast was cancelled before the send."""
+        for attempt in range(1, config.BROADCAST_MAX_ATTEMPTS + 1):
+            await cls._bucket.acquire()
+            if job["status"] == "cancelled": return None
+            try:
+                if job.get("source_message_id"): await cls._client.copy_message(user_id, job["source_chat_id"], job["source_message_id"])
+                else: await cls._client.send_message(user_id, job["text"], parse_mode=config.PARSE_MODE, disable_web_page_preview=True)
+                return "sent"
+            except FloodWait as e:
+                outcome["flood_waits"] += 1
+                cls._bucket.pause(e.value)
+                broadcast_logger.warning(f"FloodWait of {e.value}s broadcasting to user {user_id} (attempt {attempt}/{config.BROADCAST_MAX_ATTEMPTS}). Pausing all sends.")
+            except UNREACHABLE_ERRORS as e:
+                Reachability.mark_unreachable(user_id, e)
+                return "blocked"
+            except Exception as e:
+                broadcast_logger.warning(f"Failed to send broadcast to user {user_id}: {e}")
+                return "failed"
+        return "failed"
+
+
+    @classmethod
+    async def _report(cls, job: Dict[str, Any], force: bool = False, notify: bool = False):
+        """Edits the progress message (at most every BROADCAST_PROGRESS_SECONDS unless forced); notify also messages the admin."""
+        if not force and time.monotonic() - cls._last_progress < config.BROADCAST_PROGRESS_SECONDS: return
+        cls._last_progress = time.monotonic()
+        text = cls.progress_text(job)
+        try: await cls._client.edit_message_text(job["status_chat_id"], job["status_message_id"], text, parse_mode=config.PARSE_MODE)
+        except MessageNotModified: pass
+        except Exception as e: broadcast_logger.warning(f"Failed to update broadcast progress message: {e}")
+        if notify:
+            try: await cls._client.send_message(job["admin_id"], text, parse_mode=config.PARSE_MODE)
+            except Exception as e: broadcast_logger.warning(f"Failed to notify admin {job['admin_id']} about broadcast {job['_id']}: {e}")
+
+
+    @classmethod
+    def _throughput(cls, job: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
+        """Users per second since this run started and the seconds left at that pace (None when not measurable)."""
+        if job["status"] != "running" or cls._run_clock is None or cls._job is None or cls._job["_id"] != job["_id"]: return None, None
+        started_at, processed_before = cls._run_clock
+        elapsed = time.monotonic() - started_at
+        processed = job["processed"] - processed_before
+        if elapsed <= 0 or processed <= 0: return None, None
+        rate = processed / elapsed
+        return rate, max(0, job["total"] - job["processed"]) / rate
+
+
+    @classmethod
+    def progress_text(cls, job: Dict[str, Any]) -> str:
+        rate, eta = cls._throughput(job)
+        return strings.BROADCAST_PROGRESS.format(
+            status=_STATUS_LABELS.get(job["status"], job["status"]), processed=min(job["processed"], job["total"]), total=job["total"],
+            sent=job["sent"], blocked=job["blocked"], failed=job["failed"],
+            rate=f"{rate:.1f}/s" if rate is not None else "—", eta=_format_duration(eta) if eta is not None else "—"
+        )
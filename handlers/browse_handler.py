@@ -1,7 +1,8 @@
 # handlers/browse_handler.py
+import html
 import logging
 import asyncio
-from typing import Union, List, Dict, Any, Tuple
+from typing import Union, List, Dict, Any, Tuple, Optional
 from datetime import datetime, timezone
 from pyrogram import Client, filters
 from pyrogram.types import (
@@ -15,9 +16,18 @@ from pyrogram.errors import (
 import config
 import strings
 
-from database.mongo_db import MongoDB
+from database.mongo_db import MongoDB, ANIME_SUMMARY_PROJECTION
 from database.mongo_db import get_user_state, set_user_state, clear_user_state
 from database.models import User, Anime # Import models for browsing
+from database.search_index import SearchIndex
+from database.query_planner import search_within_filters
+from database.keyset_pagination import fetch_keyset_page, estimate_total
+from database.facet_counts import FacetCounts
+from database.similarity_index import SimilarityIndex
+
+from .list_navigation import build_keyset_pagination_row, build_letter_jump_buttons
+from .menu_cache import MenuCache, RenderedMenu
+from .callback_ack import answer_callback
 
 
 async def get_user(client: Client, user_id: int) -> Optional[User]: pass
@@ -46,7 +56,7 @@ async def browse_main_menu_callback(client: Client, callback_query: CallbackQuer
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id
 
-    try: await client.answer_callback_query(message.id)
+    try: await answer_callback(callback_query)
     except Exception: browse_logger.warning(f"Failed to answer callback menu_browse from user {user_id}")
 
 
@@ -83,6 +93,39 @@ async def browse_main_menu_callback(client: Client, callback_query: CallbackQuer
 # --- Handle Filtering Options Prompts ---
 # Callbacks: browse_filter_genre_prompt, browse_filter_year_prompt, browse_filter_status_prompt
 
+def _with_count(label: str, counts: Optional[Dict[Any, int]], value: Any) -> str:
+    """Appends the facet count to an option label ("🔫 Action (42)") when counts are available."""
+    if counts is None: return label
+    return f"{label} ({counts.get(value, 0)})"
+
+
+def _visible_options(options: List[Any], counts: Optional[Dict[Any, int]], selected: List[Any]) -> List[Any]:
+    """Hides options that would leave no anime, except currently selected ones. Without counts, everything is shown."""
+    if counts is None: return list(options)
+    return [option for option in options if counts.get(option) or option in selected]
+
+
+def _build_genre_filter_keyboard(current_selection: List[str], genre_counts: Optional[Dict[Any, int]]) -> InlineKeyboardMarkup:
+    """Multi-select genre keyboard (toggle buttons + Apply/Clear/Back). Used by the prompt and after each toggle."""
+    buttons = []
+    for option in _visible_options(config.INITIAL_GENRES, genre_counts, current_selection):
+         is_selected = option in current_selection
+         # Button text shows selection status (✅/⬜), option value and how many anime it leaves
+         button_text = _with_count(f"✅ {option}" if is_selected else f"⬜ {option}", genre_counts, option)
+         # Callback data to toggle selection: browse_toggle_filter|<filter_type>|<value>
+         buttons.append(InlineKeyboardButton(button_text, callback_data=f"browse_toggle_filter{config.CALLBACK_DATA_SEPARATOR}genre{config.CALLBACK_DATA_SEPARATOR}{option}"))
+
+    # Arrange buttons, add Apply and Cancel
+    keyboard_rows = [buttons[i:i + config.MAX_BUTTONS_PER_ROW] for i in range(0, len(buttons), config.MAX_BUTTONS_PER_ROW)]
+    keyboard_rows.append([
+         # Apply filter button: browse_apply_filter|<filter_type> (pass type to handler)
+         InlineKeyboardButton(strings.BUTTON_APPLY_FILTER, callback_data=f"browse_apply_filter{config.CALLBACK_DATA_SEPARATOR}genre"),
+         InlineKeyboardButton(strings.BUTTON_CLEAR_FILTERS, callback_data=f"browse_clear_filter{config.CALLBACK_DATA_SEPARATOR}genre") # Clear selection for this filter type
+    ])
+    keyboard_rows.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data="browse_main_menu")]) # Back to browse main menu
+    return InlineKeyboardMarkup(keyboard_rows)
+
+
 @Client.on_callback_query(filters.regex("^browse_filter_(genre|year|status)_prompt$") & filters.private)
 async def browse_filter_prompt_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
@@ -90,7 +133,7 @@ async def browse_filter_prompt_callback(client: Client, callback_query: Callback
     message_id = callback_query.message.id
     data = callback_query.data # browse_filter_genre_prompt etc.
 
-    try: await client.answer_callback_query(message.id)
+    try: await answer_callback(callback_query)
     except Exception: browse_logger.warning(f"Failed to answer callback {data} from user {user_id}")
 
     user_state = await get_user_state(user_id)
@@ -112,41 +155,27 @@ async def browse_filter_prompt_callback(client: Client, callback_query: Callback
     await set_user_state(user_id, "browse", BrowseState.FILTER_SELECTION, data={**user_state.data, "filter_type": filter_type})
 
 
+    # Counts per option, conditioned on the filters already selected (cached; None -> plain buttons)
+    facet_counts = await FacetCounts.get(user_state.data["filter_data"])
+
     # Send the specific prompt and buttons based on filter type
     if filter_type == 'genre':
         prompt_text = strings.GENRE_SELECTION_TITLE
-        options = config.INITIAL_GENRES # Use configured presets
 
-        # Multi-select setup for Genres
+        # Multi-select setup for Genres (configured presets)
         current_selection = user_state.data.get("filter_data", {}).get("genres", [])
-        buttons = []
-        for option in options:
-             is_selected = option in current_selection
-             # Button text shows selection status (✅/⬜) and option value
-             button_text = f"✅ {option}" if is_selected else f"⬜ {option}"
-             # Callback data to toggle selection: browse_toggle_filter|<filter_type>|<value>
-             buttons.append(InlineKeyboardButton(button_text, callback_data=f"browse_toggle_filter{config.CALLBACK_DATA_SEPARATOR}{filter_type}{config.CALLBACK_DATA_SEPARATOR}{option}"))
-
-        # Arrange buttons, add Apply and Cancel
-        keyboard_rows = [buttons[i:i + config.MAX_BUTTONS_PER_ROW] for i in range(0, len(buttons), config.MAX_BUTTONS_PER_ROW)]
-        keyboard_rows.append([
-             # Apply filter button: browse_apply_filter|<filter_type> (pass type to handler)
-             InlineKeyboardButton(strings.BUTTON_APPLY_FILTER, callback_data=f"browse_apply_filter{config.CALLBACK_DATA_SEPARATOR}{filter_type}"),
-             InlineKeyboardButton(strings.BUTTON_CLEAR_FILTERS, callback_data=f"browse_clear_filter{config.CALLBACK_DATA_SEPARATOR}{filter_type}") # Clear selection for this filter type
-        ])
-        keyboard_rows.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data="browse_main_menu")]) # Back to browse main menu
-        reply_markup = InlineKeyboardMarkup(keyboard_rows)
+        reply_markup = _build_genre_filter_keyboard(current_selection, facet_counts["genres"] if facet_counts else None)
 
 
     elif filter_type == 'year':
         prompt_text = strings.YEAR_SELECTION_TITLE
-        # Get unique release years from database dynamically or use a range
-        # Let's get distinct years from existing anime
+        # Years come from the facet counts (only years that still have anime under the other filters),
+        # or from distinct years in the database when counts are unavailable
         try:
-             distinct_years_cursor = MongoDB.anime_collection().distinct("release_year", {"release_year": {"$ne": None}}) # Exclude null years
-             # Motor distinct is synchronous in current pymongo versions
-             # Use asyncio executor if it takes time, or run in background task
-             options = sorted([year for year in distinct_years_cursor if isinstance(year, int)], reverse=True) # Get years, filter non-ints, sort descending
+             year_counts = facet_counts["year"] if facet_counts else None
+             if year_counts is not None: distinct_years = list(year_counts)
+             else: distinct_years = await MongoDB.anime_collection().distinct("release_year", {"release_year": {"$ne": None}}) # Exclude null years
+             options = sorted([year for year in distinct_years if isinstance(year, int)], reverse=True) # Get years, filter non-ints, sort descending
 
 
              if not options:
@@ -159,7 +188,7 @@ async def browse_filter_prompt_callback(client: Client, callback_query: Callback
                  buttons = []
                  for option in options:
                       # Callback to select a year: browse_select_filter|<filter_type>|<value>
-                      button_text = str(option)
+                      button_text = _with_count(str(option), year_counts, option)
                       if current_selection and option == current_selection:
                           button_text = f"✅ {button_text}" # Highlight if currently selected
 
@@ -184,15 +213,15 @@ async def browse_filter_prompt_callback(client: Client, callback_query: Callback
 
     elif filter_type == 'status':
         prompt_text = strings.STATUS_SELECTION_TITLE
-        options = config.ANIME_STATUSES # Use configured presets
-
         # Single-select for Status - Similar to Year
         current_selection = user_state.data.get("filter_data", {}).get("status") # Get current status selection
+        status_counts = facet_counts["status"] if facet_counts else None
+        options = _visible_options(config.ANIME_STATUSES, status_counts, [current_selection]) # Configured presets that still have anime
 
         buttons = []
         for option in options:
              # Callback to select a status: browse_select_filter|<filter_type>|<value>
-             button_text = option
+             button_text = _with_count(option, status_counts, option)
              if current_selection and option == current_selection:
                  button_text = f"✅ {button_text}" # Highlight if currently selected
 
@@ -235,7 +264,7 @@ async def browse_select_or_toggle_filter_callback(client: Client, callback_query
     message_id = callback_query.message.id # Message with filter buttons
     data = callback_query.data # browse_toggle_filter|genre|value OR browse_select_filter|year|value
 
-    try: await client.answer_callback_query(message.id) # Answer immediately
+    try: await answer_callback(callback_query) # Answer immediately
     except Exception: browse_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
 
@@ -275,9 +304,9 @@ async def browse_select_or_toggle_filter_callback(client: Client, callback_query
             # Ensure value is a valid preset? Optional sanity check.
             if filter_value not in config.INITIAL_GENRES:
                  browse_logger.warning(f"User {user_id} selected non-preset genre: {filter_value} in filter selection.")
-                 await callback_query.answer("🚫 Invalid genre option.", show_alert=False)
+                 await answer_callback(callback_query, "🚫 Invalid genre option.", show_alert=True)
                  # Don't update state, just re-render the current keyboard
-                 await handle_toggle_filter_display(client, chat_id, message_id, filter_type, current_genre_selection)
+                 await handle_toggle_filter_display(client, chat_id, message_id, filter_type, current_genre_selection, user_state.data.get("filter_data"))
                  return
 
             if filter_action != 'toggle': raise ValueError("Invalid action for genre filter") # Should be toggle
@@ -297,7 +326,7 @@ async def browse_select_or_toggle_filter_callback(client: Client, callback_query
             user_state.data["filter_data"]["genres"] = current_genre_selection
 
             # Re-display the filter selection keyboard with updated button states
-            await handle_toggle_filter_display(client, chat_id, message_id, filter_type, current_genre_selection) # Helper
+            await handle_toggle_filter_display(client, chat_id, message_id, filter_type, current_genre_selection, user_state.data.get("filter_data")) # Helper
 
 
         elif filter_type == 'year' or filter_type == 'status':
@@ -327,7 +356,7 @@ async def browse_select_or_toggle_filter_callback(client: Client, callback_query
 
     except ValueError as e:
         browse_logger.warning(f"User {user_id} invalid filter selection data format/value for {data}: {e}")
-        await client.answer_callback_query(message.id, f"🚫 Invalid selection data: {e}.", show_alert=False) # Toast with specific error
+        await answer_callback(callback_query, f"🚫 Invalid selection data: {e}.", show_alert=True) # Alert with specific error
         # State remains the same, user can retry valid buttons.
     except Exception as e:
          browse_logger.error(f"FATAL error handling browse select/toggle filter callback {data} for user {user_id}: {e}", exc_info=True)
@@ -337,25 +366,12 @@ async def browse_select_or_toggle_filter_callback(client: Client, callback_query
 
 
 # Helper to re-display toggle-filter keyboard (e.g., Genres) with updated states
-async def handle_toggle_filter_display(client: Client, chat_id: int, message_id: int, filter_type: str, current_selection: List[str]):
-     """Re-edits the message with the filter selection keyboard, updating button states."""
+async def handle_toggle_filter_display(client: Client, chat_id: int, message_id: int, filter_type: str, current_selection: List[str], filter_data: Optional[Dict] = None):
+     """Re-edits the message with the filter selection keyboard, updating button states and counts."""
      if filter_type == 'genre':
-          options = config.INITIAL_GENRES
-          prompt_text = strings.GENRE_SELECTION_TITLE # Original prompt text
-
-          buttons = []
-          for option in options:
-               is_selected = option in current_selection
-               button_text = f"✅ {option}" if is_selected else f"⬜ {option}"
-               buttons.append(InlineKeyboardButton(button_text, callback_data=f"browse_toggle_filter{config.CALLBACK_DATA_SEPARATOR}{filter_type}{config.CALLBACK_DATA_SEPARATOR}{option}"))
-
-          keyboard_rows = [buttons[i:i + config.MAX_BUTTONS_PER_ROW] for i in range(0, len(buttons), config.MAX_BUTTONS_PER_ROW)]
-          keyboard_rows.append([
-               InlineKeyboardButton(strings.BUTTON_APPLY_FILTER, callback_data=f"browse_apply_filter{config.CALLBACK_DATA_SEPARATOR}{filter_type}"), # Still apply only genre filter with this type
-               InlineKeyboardButton(strings.BUTTON_CLEAR_FILTERS, callback_data=f"browse_clear_filter{config.CALLBACK_DATA_SEPARATOR}{filter_type}")
-          ])
-          keyboard_rows.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data="browse_main_menu")])
-          reply_markup = InlineKeyboardMarkup(keyboard_rows)
+          # Counts change with every toggle: each genre is conditioned on the (new) selection
+          facet_counts = await FacetCounts.get({**(filter_data or {}), "genres": current_selection})
+          reply_markup = _build_genre_filter_keyboard(current_selection, facet_counts["genres"] if facet_counts else None)
 
      # Add elifs for other multi-select filter types if implemented
 
@@ -404,7 +420,7 @@ async def handle_apply_filter_callback(client: Client, callback_query: CallbackQ
 
 
     # Answer immediately with action message
-    try: await client.answer_callback_query(message.id, apply_msg)
+    try: await answer_callback(callback_query, apply_msg)
     except Exception: browse_logger.warning(f"Failed to answer callback query {data} from user {user_id}")
 
 
@@ -425,7 +441,7 @@ async def handle_apply_filter_callback(client: Client, callback_query: CallbackQ
     if is_apply_filter:
          # Coming from FILTER_SELECTION. Transition to BROWSING_LIST state.
          # Keep filter_data, set page to 1
-         await set_user_state(user_id, "browse", BrowseState.BROWSING_LIST, data={**user_state.data, "filter_data": filter_data, "page": page_number})
+         await set_user_state(user_id, "browse", BrowseState.BROWSING_LIST, data={**user_state.data, "filter_data": filter_data, "page": page_number, "cursor": None})
 
     elif is_view_all:
          # Coming from MAIN_MENU. Transition to BROWSING_LIST state.
@@ -467,90 +483,123 @@ async def handle_apply_filter_callback(client: Client, callback_query: CallbackQ
 
 # --- Helper to display paginated browsed anime list ---
 # Called by handle_apply_filter_callback and the pagination callback (browse_list_page)
-async def display_browsed_anime_list(client: Client, message: Message, query_filter: Dict, page: int, active_filter_data: Dict):
+# The alphabetical list is keyset-paginated: `cursor` is a token from database.keyset_pagination (None = first page).
+# `page` only applies to search within filters, whose relevance-ranked results are paged from memory.
+async def display_browsed_anime_list(client: Client, message: Message, query_filter: Dict, page: int, active_filter_data: Dict, edit_existing: bool = True, cursor: Optional[str] = None):
      user_id = message.from_user.id
      chat_id = message.chat.id
-     message_id = message.id
+     message_id = message.id if edit_existing else None # Text input (search within filters) answers with a new message
 
 
-     browse_logger.debug(f"Displaying browse list page {page} for user {user_id} with filter: {query_filter}")
+     browse_logger.debug(f"Displaying browse list page {page} (cursor {cursor}) for user {user_id} with filter: {query_filter}")
+
+     search_query = active_filter_data.get("query") if active_filter_data else None
 
      try:
-        # Count total matching documents first for pagination info
-        total_anime_count = await MongoDB.anime_collection().count_documents(query_filter)
+        # Identical for every user with the same filters and position: rendered once per catalog version
+        view_params = (
+            tuple((active_filter_data or {}).get("genres") or []), (active_filter_data or {}).get("year"), (active_filter_data or {}).get("status"),
+            search_query, page if search_query else None, cursor
+        )
+        rendered_menu = await MenuCache.get_or_render(
+            "browse_list", view_params,
+            lambda: _render_browsed_anime_list(query_filter, page, active_filter_data, cursor)
+        )
+
+        # Edit the message (apply filter message or previous list page) to display this page.
+        await edit_or_send_message(client, chat_id, message_id, rendered_menu.text, rendered_menu.markup(), disable_web_page_preview=True)
+
+
+     except Exception as e:
+         browse_logger.error(f"FATAL error displaying browsed anime list page {page} for user {user_id}: {e}", exc_info=True)
+         # Decide whether to clear state or try returning to browse main menu
+         await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
+         await clear_user_state(user_id); # Clear state on fatal error
+         await browse_main_menu_callback(client, callback_query) # Re-display browse main menu (uses original callback)
+
+
+async def _render_browsed_anime_list(query_filter: Dict, page: int, active_filter_data: Dict, cursor: Optional[str]) -> RenderedMenu:
+    """Text and keyboard of one browse list page. Nothing user specific: the result is shared through MenuCache."""
+    search_query = active_filter_data.get("query") if active_filter_data else None
+    pagination_buttons = []
+    page_info_text = ""
+    if search_query and SearchIndex.is_ready():
+        # Search within filters: the query planner intersects text matches with the filter postings in memory,
+        # results are ranked by relevance instead of name. Pages are slices of the ranked id list.
+        ranked_ids = search_within_filters(search_query, active_filter_data)
+        total_anime_count = len(ranked_ids)
         total_pages = (total_anime_count + config.PAGE_SIZE - 1) // config.PAGE_SIZE
         if page < 1: page = 1
         if page > total_pages and total_pages > 0: page = total_pages
-
-        # Fetch anime documents for the current page, projecting needed fields for display
-        skip_count = (page - 1) * config.PAGE_SIZE
+        page_ids = ranked_ids[(page - 1) * config.PAGE_SIZE:page * config.PAGE_SIZE]
+        anime_docs_on_page = [SearchIndex.get_entry(anime_id_str) for anime_id_str in page_ids]
+        page_info_text = f"Page <b>{page}</b> / <b>{total_pages}</b>\n\n"
+        if page > 1:
+            pagination_buttons.append(InlineKeyboardButton(strings.BUTTON_PREVIOUS_PAGE, callback_data=f"browse_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{page - 1}"))
+        if page < total_pages:
+            pagination_buttons.append(InlineKeyboardButton(strings.BUTTON_NEXT_PAGE, callback_data=f"browse_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{page + 1}"))
+    else:
+        # Alphabetical list: one bounded range scan on (name, _id) per page instead of count_documents + skip
         # Project relevant fields for the user list view (name, synopsis snippet, maybe poster?)
         # Displaying posters in a text/button list is complex. Let's stick to text list.
-        # Name, maybe year, status, snippet of synopsis for info?
-        projection = {"name": 1, "synopsis": 1, "status": 1, "release_year": 1, "overall_download_count": 1} # Add other needed fields
-        # Sort by name for consistency
-        anime_docs_on_page = await MongoDB.anime_collection().find(query_filter, projection).sort("name", 1).skip(skip_count).limit(config.PAGE_SIZE).to_list(config.PAGE_SIZE)
+        projection = {"name": 1, "status": 1, "release_year": 1, "overall_download_count": 1} # Add other needed fields
+        keyset_page = await fetch_keyset_page(query_filter, projection, cursor, config.PAGE_SIZE, active_filter_data or {}) # In-memory bitmaps when the index is ready
+        anime_docs_on_page = keyset_page.docs
+        if anime_docs_on_page:
+            total_anime_count = await estimate_total(query_filter, active_filter_data)
+            page_info_text = strings.LIST_PAGE_RANGE.format(total=total_anime_count, first=html.escape(anime_docs_on_page[0]["name"][:25]), last=html.escape(anime_docs_on_page[-1]["name"][:25])) + "\n\n"
+            pagination_buttons = build_keyset_pagination_row("browse_admin_anime_list_page", keyset_page, "browse_list_letters")
 
 
-        # Build the message text with the list of anime
-        filter_info_text = ""
-        if active_filter_data: # Show applied filters if any
-             filter_info_parts = []
-             if active_filter_data.get("genres"): filter_info_parts.append(f"Genres: {', '.join(active_filter_data['genres'])}")
-             if active_filter_data.get("year") is not None: filter_info_parts.append(f"Year: {active_filter_data['year']}")
-             if active_filter_data.get("status"): filter_info_parts.append(f"Status: {active_filter_data['status']}")
-             if filter_info_parts: filter_info_text = "Active Filters: " + "; ".join(filter_info_parts) + "\n\n"
+    # Build the message text with the list of anime
+    filter_info_text = ""
+    if active_filter_data: # Show applied filters if any
+         filter_info_parts = []
+         if active_filter_data.get("genres"): filter_info_parts.append(f"Genres: {', '.join(active_filter_data['genres'])}")
+         if active_filter_data.get("year") is not None: filter_info_parts.append(f"Year: {active_filter_data['year']}")
+         if active_filter_data.get("status"): filter_info_parts.append(f"Status: {active_filter_data['status']}")
+         if search_query: filter_info_parts.append(strings.BROWSE_LIST_SEARCH_INFO.format(query=html.escape(search_query)))
+         if filter_info_parts: filter_info_text = "Active Filters: " + "; ".join(filter_info_parts) + "\n\n"
 
 
-        menu_text = strings.BROWSE_LIST_TITLE + filter_info_text
+    menu_text = strings.BROWSE_LIST_TITLE + filter_info_text
 
-        buttons = []
-        if not anime_docs_on_page:
-            menu_text += "😔 No anime found matching these criteria."
-        else:
-             menu_text += f"Page <b>{page}</b> / <b>{total_pages}</b>\n\n"
-             # Create buttons for each anime on the page to select for details/download
-             for anime_doc in anime_docs_on_page:
-                 # Display name and maybe a little extra info in button or just above it.
-                 anime_name = anime_doc.get("name", "Unnamed Anime")
-                 anime_id_str = str(anime_doc["_id"]) # Get the ID for the callback data
-
-                 # Format button label: "Anime Name" - clicking goes to details/download menu
-                 # Callback: browse_select_anime|<anime_id>
-                 buttons.append([InlineKeyboardButton(anime_name, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")])
-
-        # Add pagination buttons
-        pagination_buttons = []
-        if page > 1:
-            pagination_buttons.append(InlineKeyboardButton(strings.BUTTON_PREVIOUS_PAGE, callback_data=f"browse_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{page - 1}"))
-        if page < total_pages:
-             pagination_buttons.append(InlineKeyboardButton(strings.BUTTON_NEXT_PAGE, callback_data=f"browse_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{page + 1}"))
-        if pagination_buttons: # Only add if there are pagination buttons
-             buttons.append(pagination_buttons)
+    buttons = []
+    if not anime_docs_on_page:
+        menu_text += "😔 No anime found matching these criteria."
+    else:
+         menu_text += page_info_text
+         menu_text += strings.BROWSE_LIST_SEARCH_HINT + "\n"
+         # Create buttons for each anime on the page to select for details/download
+         for anime_doc in anime_docs_on_page:
+             # Display name and maybe a little extra info in button or just above it.
+             anime_name = anime_doc.get("name", "Unnamed Anime")
+             anime_id_str = str(anime_doc["_id"]) # Get the ID for the callback data
 
+             # Format button label: "Anime Name" - clicking goes to details/download menu
+             # Callback: browse_select_anime|<anime_id>
+             buttons.append([InlineKeyboardButton(anime_name, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")])
 
-        # Add navigation buttons: Back to Browse main menu, Back to main bot menu
-        # Back button should go back to the filter selection if filters were applied, or main browse menu if just view_all.
-        # Simplify: Back always goes to Browse main menu
-        buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data="browse_main_menu")]) # Back to browse options
-        buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]) # Back to main bot menu
+    # Add pagination buttons
+    if pagination_buttons: # Only add if there are pagination buttons
+         buttons.append(pagination_buttons)
 
+    if search_query:
+         buttons.append([InlineKeyboardButton(strings.BUTTON_CLEAR_BROWSE_SEARCH, callback_data="browse_clear_search")])
 
-        reply_markup = InlineKeyboardMarkup(buttons)
 
-        # Edit the message (apply filter message or previous list page) to display this page.
-        await edit_or_send_message(client, chat_id, message_id, menu_text, reply_markup, disable_web_page_preview=True)
+    # Add navigation buttons: Back to Browse main menu, Back to main bot menu
+    # Back button should go back to the filter selection if filters were applied, or main browse menu if just view_all.
+    # Simplify: Back always goes to Browse main menu
+    buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data="browse_main_menu")]) # Back to browse options
+    buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]) # Back to main bot menu
 
+    return RenderedMenu(menu_text, buttons)
 
-     except Exception as e:
-         browse_logger.error(f"FATAL error displaying browsed anime list page {page} for user {user_id}: {e}", exc_info=True)
-         # Decide whether to clear state or try returning to browse main menu
-         await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
-         await clear_user_state(user_id); # Clear state on fatal error
-         await browse_main_menu_callback(client, callback_query) # Re-display browse main menu (uses original callback)
 
 # --- Handle Pagination Clicks ---
-# Catches callbacks browse_admin_anime_list_page|<page_number>
+# Catches callbacks browse_admin_anime_list_page|<page_number> (search within filters)
+# and browse_admin_anime_list_page|<cursor token> (alphabetical keyset list, incl. letter jumps)
 @Client.on_callback_query(filters.regex(f"^browse_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}.*") & filters.private)
 async def browse_list_page_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
@@ -559,18 +608,19 @@ async def browse_list_page_callback(client: Client, callback_query: CallbackQuer
     data = callback_query.data
 
     try:
-         # Parse target page number
+         # Parse target page number or cursor token
          parts = data.split(config.CALLBACK_DATA_SEPARATOR)
-         if len(parts) != 2: raise ValueError("Invalid pagination callback data format.")
-         target_page = int(parts[1])
+         if len(parts) != 2 or not parts[1]: raise ValueError("Invalid pagination callback data format.")
+         target_cursor = None if parts[1].isdigit() else parts[1]
+         target_page = int(parts[1]) if target_cursor is None else 1
 
     except ValueError:
          browse_logger.warning(f"User {user_id} invalid page number in browse list pagination callback: {data}")
-         await client.answer_callback_query(message.id, "🚫 Invalid page number.", show_alert=False) # Toast error
+         await answer_callback(callback_query, "🚫 Invalid page number.", show_alert=True) # Alert error
          return # Stop processing invalid callback
 
 
-    try: await client.answer_callback_query(message.id, f"Loading page {target_page}...")
+    try: await answer_callback(callback_query, "Loading page...")
     except Exception: browse_logger.warning(f"Failed to answer callback {data} from user {user_id}")
 
     user_state = await get_user_state(user_id)
@@ -596,16 +646,17 @@ async def browse_list_page_callback(client: Client, callback_query: CallbackQuer
     if selected_status: db_query_filter["status"] = selected_status
 
 
-    browse_logger.info(f"User {user_id} browsing list page {target_page} with filters: {db_query_filter}.")
+    browse_logger.info(f"User {user_id} browsing list page {target_page} (cursor {target_cursor}) with filters: {db_query_filter}.")
 
-    # Store the new page number in the state data
+    # Store the new page number / cursor in the state data
     user_state.data["page"] = target_page
+    user_state.data["cursor"] = target_cursor
     # Save the updated state with the new page number
     await set_user_state(user_id, "browse", BrowseState.BROWSING_LIST, data=user_state.data)
 
 
     # Display the browsed anime list for the target page with the current filters
-    await display_browsed_anime_list(client, message, db_query_filter, target_page, active_filter_data) # Pass original message to edit
+    await display_browsed_anime_list(client, message, db_query_filter, target_page, active_filter_data, cursor=target_cursor) # Pass original message to edit
 
 
     # Note: The display_browsed_anime_list function handles checking page bounds.
@@ -618,6 +669,65 @@ async def browse_list_page_callback(client: Client, callback_query: CallbackQuer
          await browse_main_menu_callback(client, callback_query) # Offer to restart browse
 
 
+# Catches callback browse_list_letters: shows the A-Z grid, each letter is a pagination cursor (browse_admin_anime_list_page|l<letter>)
+@Client.on_callback_query(filters.regex("^browse_list_letters$") & filters.private)
+async def browse_list_letters_callback(client: Client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    message = callback_query.message
+
+    try: await answer_callback(callback_query)
+    except Exception: browse_logger.warning(f"Failed to answer callback browse_list_letters from user {user_id}")
+
+    user_state = await get_user_state(user_id)
+    if not (user_state and user_state.handler == "browse" and user_state.step == BrowseState.BROWSING_LIST):
+        await edit_or_send_message(client, message.chat.id, message.id, "🔄 Invalid state. Please return to the Browse Menu.", disable_web_page_preview=True)
+        return
+
+    # Back re-opens the page the user came from
+    back_cursor = user_state.data.get("cursor") or str(user_state.data.get("page", 1))
+    reply_markup = InlineKeyboardMarkup(build_letter_jump_buttons("browse_admin_anime_list_page", f"browse_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{back_cursor}"))
+    await edit_or_send_message(client, message.chat.id, message.id, strings.JUMP_TO_LETTER_PROMPT, reply_markup, disable_web_page_preview=True)
+
+
+def build_browse_db_filter(filter_data: Dict) -> Dict:
+    """MongoDB filter for the browse filter selections in state (genres $all, year, status)."""
+    db_query_filter = {}
+    if filter_data.get("genres"): db_query_filter["genres"] = {"$all": filter_data["genres"]}
+    if filter_data.get("year") is not None: db_query_filter["release_year"] = filter_data["year"]
+    if filter_data.get("status"): db_query_filter["status"] = filter_data["status"]
+    return db_query_filter
+
+
+# --- Search Within Filters ---
+# Text sent while a browse list is displayed searches inside the active filters (routed from common_handlers.handle_plain_text_input).
+async def handle_browse_search_input(client: Client, message: Message, user_state: Any, text: str):
+    user_id = message.from_user.id
+    active_filter_data = {**user_state.data.get("filter_data", {}), "query": text}
+
+    browse_logger.info(f"User {user_id} searching '{text}' within browse filters {active_filter_data}.")
+    await set_user_state(user_id, "browse", BrowseState.BROWSING_LIST, data={**user_state.data, "filter_data": active_filter_data, "page": 1, "cursor": None})
+    await display_browsed_anime_list(client, message, build_browse_db_filter(active_filter_data), 1, active_filter_data, edit_existing=False)
+
+
+# Catches callback browse_clear_search: drops the text query, keeps the filters
+@Client.on_callback_query(filters.regex("^browse_clear_search$") & filters.private)
+async def browse_clear_search_callback(client: Client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    message = callback_query.message
+
+    try: await answer_callback(callback_query, "Clearing search...")
+    except Exception: browse_logger.warning(f"Failed to answer callback browse_clear_search from user {user_id}")
+
+    user_state = await get_user_state(user_id)
+    if not (user_state and user_state.handler == "browse" and user_state.step == BrowseState.BROWSING_LIST):
+        await edit_or_send_message(client, message.chat.id, message.id, "🔄 Invalid state. Please return to the Browse Menu.", disable_web_page_preview=True)
+        return
+
+    active_filter_data = {key: value for key, value in user_state.data.get("filter_data", {}).items() if key != "query"}
+    await set_user_state(user_id, "browse", BrowseState.BROWSING_LIST, data={**user_state.data, "filter_data": active_filter_data, "page": 1, "cursor": None})
+    await display_browsed_anime_list(client, message, build_browse_db_filter(active_filter_data), 1, active_filter_data)
+
+
 # --- Handle Clear Filters ---
 # Catches callbacks browse_clear_filter|<filter_type>
 @Client.on_callback_query(filters.regex(f"^browse_clear_filter{config.CALLBACK_DATA_SEPARATOR}(genre|year|status)$") & filters.private)
@@ -627,7 +737,7 @@ async def browse_clear_filter_callback(client: Client, callback_query: CallbackQ
     message_id = callback_query.message.id # Message with filter buttons
     data = callback_query.data
 
-    try: await client.answer_callback_query(message.id, "Clearing filter...")
+    try: await answer_callback(callback_query, "Clearing filter...")
     except Exception: browse_logger.warning(f"Failed to answer callback {data} from user {user_id}")
 
 
@@ -672,7 +782,7 @@ async def browse_clear_filter_callback(client: Client, callback_query: CallbackQ
 
     except ValueError as e:
         browse_logger.warning(f"User {user_id} invalid filter type in clear filter callback: {data}: {e}")
-        await client.answer_callback_query(message.id, "🚫 Invalid filter type to clear.", show_alert=False)
+        await answer_callback(callback_query, "🚫 Invalid filter type to clear.", show_alert=True)
 
     except Exception as e:
          browse_logger.error(f"FATAL error handling browse clear filter callback {data} for user {user_id}: {e}", exc_info=True)
@@ -690,7 +800,7 @@ async def browse_select_anime_callback(client: Client, callback_query: CallbackQ
     message_id = callback_query.message.id
     data = callback_query.data
 
-    try: await client.answer_callback_query(message.id, "Loading anime details...")
+    try: await answer_callback(callback_query, "Loading anime details...")
     except Exception: browse_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
     user_state = await get_user_state(user_id)
@@ -711,8 +821,8 @@ async def browse_select_anime_callback(client: Client, callback_query: CallbackQ
 
         browse_logger.info(f"User {user_id} selected anime {anime_id_str} from {user_state.handler} list.")
 
-        # Retrieve the full anime document from the database
-        anime = await MongoDB.get_anime_by_id(anime_id_str) # Use the database helper
+        # Retrieve the anime details and content counters (no episode/file tree) from the database
+        anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION) # Use the database helper
 
         if not anime:
             browse_logger.error(f"Selected anime {anime_id_str} not found in DB for user {user_id} browsing/searching.")
@@ -773,23 +883,19 @@ async def browse_select_anime_callback(client: Client, callback_query: CallbackQ
 
 # Helper to display anime details menu to the user
 # This is also used by the search handler after a direct search result selection.
-async def display_user_anime_details_menu(client: Client, message: Message, anime: Anime):
+# edit_existing=False sends a new message instead (e.g. when opened from a /start deep link).
+async def display_user_anime_details_menu(client: Client, message: Message, anime: Anime, edit_existing: bool = True):
     user_id = message.from_user.id
     chat_id = message.chat.id
-    message_id = message.id
+    message_id = message.id if edit_existing else None
 
 
-    # Build anime details text
-    details_text = strings.ANIME_DETAILS_TITLE + "\n\n"
-    details_text += strings.ANIME_DETAILS_FORMAT.format(
-         title=anime.name,
-         synopsis=anime.synopsis if anime.synopsis else 'Not available.', # Provide default
-         genres=', '.join(anime.genres) if anime.genres else 'Not specified',
-         release_year=anime.release_year if anime.release_year else 'Unknown Year',
-         status=anime.status if anime.status else 'Unknown Status',
-         total_seasons_declared=anime.total_seasons_declared,
-         poster_link="https://placeholder.com" # Placeholder for poster link if needed, or omit tag
-     )
+    # Details text and season buttons are the same for every user (cached); the nav row below is per user
+    details_menu = MenuCache.get("anime_details", (str(anime.id),))
+    if details_menu is None:
+        details_menu = _render_anime_details(anime)
+        MenuCache.put("anime_details", (str(anime.id),), details_menu, anime_ids=[anime.id])
+
 
     # Determine Watchlist button state (Add or Remove)
     user = await get_user(client, user_id) # Get user to check watchlist
@@ -808,29 +914,6 @@ async def display_user_anime_details_menu(client: Client, message: Message, anim
              watchlist_button = InlineKeyboardButton(strings.BUTTON_ADD_TO_WATCHLIST, callback_data=f"watchlist_add{config.CALLBACK_DATA_SEPARATOR}{anime.id}")
 
 
-    # Build season selection buttons. Only show if anime has seasons.
-    buttons = []
-    if anime.seasons:
-        # Display header
-        details_text += f"\n{strings.SEASON_LIST_TITLE_USER.format(anime_title=anime.name)}\n"
-
-        # Sort seasons numerically before creating buttons
-        seasons = sorted(anime.seasons, key=lambda s: s.season_number)
-
-        # Add buttons for each season
-        for season in seasons:
-             season_number = season.season_number
-             episodes_list = season.episodes # Access list of episodes for this season
-             # Show count of episodes with files if any? Or just season number.
-             ep_count = len(episodes_list)
-
-             button_label = f"📺 Season {season_number}"
-             if ep_count > 0: button_label += f" ({ep_count} Episodes)" # Indicate episode count
-
-             # Callback to select a season: download_select_season|<anime_id>|<season_number>
-             # Route to the download handler as this is the start of the download path.
-             buttons.append([InlineKeyboardButton(button_label, callback_data=f"download_select_season{config.CALLBACK_DATA_SEPARATOR}{anime.id}{config.CALLBACK_DATA_SEPARATOR}{season_number}")])
-
     # Add navigation buttons: Back to list (browse/search), Watchlist (if available), Home.
     nav_buttons_row = []
     # Determine the BACK button callback based on previous state (search or browse)
@@ -872,11 +955,59 @@ async def display_user_anime_details_menu(client: Client, message: Message, anim
     nav_buttons_row.append(InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")) # Home is universal
 
 
-    if nav_buttons_row: buttons.append(nav_buttons_row) # Add the row of nav/action buttons if not empty
+    # Send or edit the message to display anime details and season buttons.
+    # Similar anime are an overlay, not part of the cached menu: the index refreshes on its own schedule.
+    await edit_or_send_message(client, chat_id, message_id, details_menu.text, details_menu.markup(_similar_anime_rows(anime.id) + [nav_buttons_row]), disable_web_page_preview=True)
+
+
+def _similar_anime_rows(anime_id: Any) -> List[List[InlineKeyboardButton]]:
+    """One button per precomputed similar anime (a dict lookup, names from the search index)."""
+    rows = []
+    for similar_id in SimilarityIndex.neighbours(anime_id, config.SIMILAR_ANIME_BUTTONS):
+        entry = SearchIndex.get_entry(similar_id)
+        if entry is None: continue # Deleted between the two lookups
+        # Callback: browse_select_anime|<anime_id> (opens the similar anime's details)
+        rows.append([InlineKeyboardButton(strings.SIMILAR_ANIME_BUTTON.format(anime_name=entry.get("name", "Anime Name Unknown")), callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{similar_id}")])
+    return rows
+
+
+def _render_anime_details(anime: Anime) -> RenderedMenu:
+    """Details text and season buttons of an anime, without the per-user navigation/watchlist row."""
+    details_text = strings.ANIME_DETAILS_TITLE + "\n\n"
+    details_text += strings.ANIME_DETAILS_FORMAT.format(
+         title=anime.name,
+         synopsis=anime.synopsis if anime.synopsis else 'Not available.', # Provide default
+         genres=', '.join(anime.genres) if anime.genres else 'Not specified',
+         release_year=anime.release_year if anime.release_year else 'Unknown Year',
+         status=anime.status if anime.status else 'Unknown Status',
+         total_seasons_declared=anime.total_seasons_declared,
+         poster_link="https://placeholder.com" # Placeholder for poster link if needed, or omit tag
+     )
+
+    # Build season selection buttons. Only show if anime has seasons.
+    buttons = []
+    if anime.seasons:
+        # Display header
+        details_text += f"\n{strings.SEASON_LIST_TITLE_USER.format(anime_title=anime.name)}\n"
+
+        # Sort seasons numerically before creating buttons
+        seasons = sorted(anime.seasons, key=lambda s: s.season_number)
+
+        # Add buttons for each season
+        for season in seasons:
+             season_number = season.season_number
+             # Denormalized season counters: the episodes themselves aren't loaded
+             ep_count = season.episode_count
+
+             button_label = f"📺 Season {season_number}"
+             if ep_count > 0: button_label += f" ({season.available_episode_count}/{ep_count} Episodes)" # Indicate available/total episodes
+
+             # Callback to select a season: download_select_season|<anime_id>|<season_number>
+             # Route to the download handler as this is the start of the download path.
+             buttons.append([InlineKeyboardButton(button_label, callback_data=f"download_select_season{config.CALLBACK_DATA_SEPARATOR}{anime.id}{config.CALLBACK_DATA_SEPARATOR}{season_number}")])
 
+    return RenderedMenu(details_text, buttons)
 
-    # Send or edit the message to display anime details and season buttons
-    await edit_or_send_message(client, chat_id, message_id, details_text, InlineKeyboardMarkup(buttons), disable_web_page_preview=True)
 
 # Watchlist Callbacks (Implemented in watchlist_handler.py but needed here for button calls)
 # watchlist_add|<anime_id>
@@ -0,0 +1,117 @@
+# handlers/callback_ack.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Union, Dict, Any, Deque, Set
+from pyrogram import Client
+from pyrogram.types import Message, CallbackQuery
+
+from config import CALLBACK_ACK_ENABLED, CALLBACK_TOAST_SECONDS, CALLBACK_ACK_SAMPLES
+
+
+ack_logger = logging.getLogger(__name__) # Logger for this module
+
+# Every callback query is acknowledged here, in the first handler group, before any handler reads user state or
+# touches MongoDB: the client's spinner stops after one Telegram round trip however slow the handler is.
+# The empty answer is sent from a background task, so the real handlers start right away.
+# Telegram accepts a single answer per query, so handlers answer through answer_callback:
+# - query not acknowledged yet (middleware disabled): answered directly, as before
+# - already acknowledged: alerts and plain toasts ("Added to watchlist", error texts) become a deferred toast, a chat
+#   message deleted after CALLBACK_TOAST_SECONDS. Progress notes ("Loading...", any text ending in "...") are
+#   dropped: the early ack already stopped the spinner and the handler's edit follows right away.
+_ACKNOWLEDGED_MAX = 10000 # Query ids remembered; handlers answer within seconds, so this is plenty
+
+
+class CallbackAck:
+    """Immediate callback acknowledgement, deferred toasts and the ack delay metric (shown in /query_report)."""
+    _acknowledged: "OrderedDict[str, None]" = OrderedDict() # Query ids answered by the middleware, oldest first
+    _delays_ms: Deque[float] = deque(maxlen=CALLBACK_ACK_SAMPLES) # Recent ack delays, for percentiles
+    _count: int = 0
+    _failures: int = 0
+    _max_ms: float = 0.0
+    _since: float = time.time()
+    _tasks: Set[asyncio.Task] = set() # Keeps fire-and-forget tasks referenced until they finish
+
+    @classmethod
+    def is_acknowledged(cls, query_id: str) -> bool: return query_id in cls._acknowledged
+
+
+    @classmethod
+    def _spawn(cls, coroutine):
+        task = asyncio.create_task(coroutine)
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+
+
+    @classmethod
+    def acknowledge(cls, callback_query: CallbackQuery):
+        """Marks the query answered right away (handlers see it) and sends the empty answer in the background."""
+        cls._acknowledged[callback_query.id] = None
+        while len(cls._acknowledged) > _ACKNOWLEDGED_MAX: cls._acknowledged.popitem(last=False)
+        cls._spawn(cls._send_ack(callback_query, time.monotonic()))
+
+
+    @classmethod
+    async def _send_ack(cls, callback_query: CallbackQuery, received: float):
+        try: await callback_query.answer()
+        except Exception as e:
+            cls._failures += 1
+            ack_logger.warning(f"Failed to acknowledge callback query '{callback_query.data}' from user {callback_query.from_user.id}: {e}")
+            return
+        delay_ms = (time.monotonic() - received) * 1000
+        cls._count += 1
+        cls._delays_ms.append(delay_ms)
+        cls._max_ms = max(cls._max_ms, delay_ms)
+
+
+    @classmethod
+    def defer_toast(cls, client: Client, chat_id: int, text: str):
+        cls._spawn(cls._show_toast(client, chat_id, text))
+
+
+    @classmethod
+    async def _show_toast(cls, client: Client, chat_id: int, text: str):
+        try:
+            toast = await client.send_message(chat_id, text)
+            await asyncio.sleep(CALLBACK_TOAST_SECONDS)
+            await toast.delete()
+        except Exception as e:
+            ack_logger.warning(f"Failed to show deferred toast in chat {chat_id}: {e}")
+
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Ack count, failures and delay percentiles over the last CALLBACK_ACK_SAMPLES acks."""
+        delays = sorted(cls._delays_ms)
+        percentile = lambda fraction: delays[int(round(fraction * (len(delays) - 1)))] if delays else 0.0
+        return {"count": cls._count, "failures": cls._failures, "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "max_ms": cls._max_ms, "since": cls._since}
+
+
+    @classmethod
+    def reset(cls):
+        cls._delays_ms.clear()
+        cls._count, cls._failures, cls._max_ms, cls._since = 0, 0, 0.0, time.time()
+
+
+async def answer_callback(source: Union[CallbackQuery, Message], text: Optional[str] = None, show_alert: bool = False):
+    """
+    Answers a callback query from a handler. `source` is the CallbackQuery, or the callback's message for helpers
+    that only receive the message (the middleware already acknowledged it then).
+    """
+    if isinstance(source, CallbackQuery) and not CallbackAck.is_acknowledged(source.id):
+        await source.answer(text, show_alert=show_alert)
+        return
+    if not text: return
+    if not show_alert and text.endswith("..."):
+        ack_logger.debug(f"Dropped progress toast '{text}': callback already acknowledged.")
+        return
+    message = source.message if isinstance(source, CallbackQuery) else source
+    if message is None: return # Callback from an inline message: no chat to show it in
+    CallbackAck.defer_toast(message._client, message.chat.id, text)
+
+
+@Client.on_callback_query(group=-3)
+async def acknowledge_callback_query(client: Client, callback_query: CallbackQuery):
+    # Group -3 runs after the profiler labels (-5) and before every real handler (0); returning lets the update continue
+    if CALLBACK_ACK_ENABLED: CallbackAck.acknowledge(callback_query)
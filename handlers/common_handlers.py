@@ -28,7 +28,7 @@ from strings import (
 )
 
 # Import database models and utilities
-from database.mongo_db import MongoDB # Access the MongoDB class instance methods
+from database.mongo_db import MongoDB, ANIME_SUMMARY_PROJECTION # Access the MongoDB class instance methods
 # Import specific DB state management helper functions
 #from database.mongo_db import get_user_state, set_user_state,clear_user_state
 
@@ -45,9 +45,11 @@ from . import download_handler # This file might handle file sending AFTER token
 from . import request_handler
 from . import watchlist_handler
 from . import premium_handler
+from . import inline_handler # Deep-link payload constants for inline results
 # Note: admin_handlers are command-based, don't route plain text/files to them
 # Import specific constants/states from handlers that are needed for routing
 from .content_handler import ContentState # Import ContentState for routing media/text
+from .callback_ack import answer_callback
 
 
 # Configure logger for common handlers
@@ -227,6 +229,32 @@ async def edit_or_send_message(client: Client, chat_id: int, message_id: Optiona
         # Rely on the logging and potential admin alerts.
 
 
+# Opens an anime's details view from a /start view_anime_<id> deep link
+async def handle_view_anime_payload(client: Client, message: Message, anime_id_str: str):
+    """Shows the details menu for the anime referenced by a deep link, as a new message."""
+    user_id = message.from_user.id
+    common_logger.info(f"User {user_id} opened deep link to anime {anime_id_str}.")
+
+    # Make sure the user exists (deep links are often the first contact with the bot)
+    user = await get_user(client, user_id)
+    if user is None:
+        await message.reply_text(DB_ERROR, parse_mode=config.PARSE_MODE)
+        return
+
+    anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION) # Handles invalid id strings, returns None
+    if anime is None:
+        common_logger.warning(f"User {user_id} deep link references unknown anime '{anime_id_str}'.")
+        await message.reply_text(strings.INLINE_NO_RESULTS, parse_mode=config.PARSE_MODE)
+        return
+
+    # Same state the browse/search lists set before showing details, so season/download buttons validate
+    await MongoDB.clear_user_state(user_id)
+    await MongoDB.set_user_state(user_id, "browse", "viewing_anime_details", data={"viewing_anime_id": str(anime.id), "source_handler": "deep_link"})
+
+    # The /start message belongs to the user and cannot be edited, so send the details as a new message
+    await browse_handler.display_user_anime_details_menu(client, message, anime, edit_existing=False)
+
+
 # --- Handler Functions ---
 
 @Client.on_message(filters.command("start") & filters.private)
@@ -252,6 +280,16 @@ async def start_command_or_home_callback(client: Client, update: Union[Message,
         # except Exception:
         #      common_logger.debug(f"Failed to delete /start command message for user {user_id}.")
 
+    # --- Handle Deep-Link Payloads (Inline Results / Notifications) ---
+    # view_anime_<id> opens the anime details view directly; these are not token strings.
+    if payload and payload.startswith(inline_handler.VIEW_ANIME_PAYLOAD_PREFIX):
+        await handle_view_anime_payload(client, update, payload[len(inline_handler.VIEW_ANIME_PAYLOAD_PREFIX):])
+        return
+    # "Open bot" button above inline results: go straight to the search prompt
+    if payload == inline_handler.INLINE_SEARCH_PAYLOAD:
+        await search_handler.search_command_or_callback(client, update)
+        return
+
     # --- Handle Token Redemption Payload (High Priority) ---
     # If a payload is present with the /start command, process it first.
     if payload:
@@ -380,7 +418,7 @@ async def start_command_or_home_callback(client: Client, update: Union[Message,
 
     # If it was a callback, ensure it's answered to prevent the 'Loading...' state
     if is_callback:
-        try: await update.answer() # Answer the callback query
+        try: await answer_callback(update) # Answer the callback query
         except Exception: common_logger.warning(f"Failed to answer menu_home callback query for user {user_id}.")
 
 
@@ -421,7 +459,7 @@ async def help_command_or_callback(client: Client, update: Union[Message, Callba
 
     # If it was a callback, answer it
     if is_callback:
-        try: await update.answer() # Answer the callback query
+        try: await answer_callback(update) # Answer the callback query
         except Exception: common_logger.warning(f"Failed to answer menu_help callback query for user {user_id}.")
 
 
@@ -442,7 +480,7 @@ async def profile_command_or_callback(client: Client, update: Union[Message, Cal
         common_logger.error(f"Failed to retrieve or create user {user_id} while processing Profile command/callback.", exc_info=True)
         await edit_or_send_message(client, chat_id, target_message_id, DB_ERROR, disable_web_page_preview=True)
         if is_callback:
-            try: await update.answer(DB_ERROR, show_alert=True)
+            try: await answer_callback(update, DB_ERROR, show_alert=True)
             except Exception: pass # Ignore failure to answer
         return
 
@@ -508,7 +546,7 @@ async def profile_command_or_callback(client: Client, update: Union[Message, Cal
 
     # Answer callback if applicable
     if is_callback:
-        try: await update.answer()
+        try: await answer_callback(update)
         except Exception: common_logger.warning(f"Failed to answer menu_profile callback for user {user_id}.")
 
 
@@ -565,6 +603,10 @@ async def handle_plain_text_input(client: Client, message: Message):
                  # Route text input to the user request handler function (expects anime name)
                  await request_handler.handle_request_input(client, message, user_state, text)
 
+            elif user_state.handler == "browse" and user_state.step == browse_handler.BrowseState.BROWSING_LIST:
+                 # Text while a browse list is shown searches within the active filters
+                 await browse_handler.handle_browse_search_input(client, message, user_state, text)
+
             # Add more elif blocks here for other handlers that expect text input when in a state
             # elif user_state.handler == "user_settings":
             #    await user_settings_handler.handle_settings_input(client, message, user_state, text)
@@ -1,7 +1,8 @@
 # handlers/content_handler.py
+import html
 import logging
 import asyncio
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Optional
 from datetime import datetime, timezone
 from pyrogram import Client, filters
 from pyrogram.types import (
@@ -17,14 +18,21 @@ from pyrogram.errors import (
 import config
 import strings
 
-from database.mongo_db import MongoDB
+from database.mongo_db import MongoDB, ANIME_SUMMARY_PROJECTION # Management menu renders from the content counters
 from database.mongo_db import get_user_state, set_user_state, clear_user_state
+from database.search_index import SearchIndex # Keep in-memory search index in sync with catalog writes
+from database.keyset_pagination import fetch_keyset_page, estimate_total
 from database.models import (
-    UserState, Anime, Season, Episode, FileVersion, PyObjectId, model_to_mongo_dict
+    UserState, Anime, Season, Episode, FileVersion, PyObjectId, model_to_mongo_dict, name_sort_key
 )
 
 from fuzzywuzzy import process
 
+from .list_navigation import build_keyset_pagination_row, build_letter_jump_buttons
+from .menu_cache import MenuCache # Drop cached episode lists / details / latest additions after season, episode and file writes
+from .callback_ack import answer_callback
+from .notification_outbox import NotificationOutbox # Watchlist notifications are enqueued, never sent inside the admin's flow
+
 
 async def get_user(client: Client, user_id: int) -> Optional[User]: pass # Assume accessible
 async def edit_or_send_message(client: Client, chat_id: int, message_id: Optional[int], text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, disable_web_page_preview: bool = True): pass # Assume accessible
@@ -190,12 +198,12 @@ async def content_main_menu_callbacks(client: Client, callback_query: CallbackQu
     data = callback_query.data
 
     if user_id not in config.ADMIN_IDS:
-        await callback_query.answer("🚫 You are not authorized.", show_alert=True)
+        await answer_callback(callback_query, "🚫 You are not authorized.", show_alert=True)
         return
 
     content_logger.info(f"Admin {user_id} clicked CM callback: {data}")
 
-    try: await callback_query.answer()
+    try: await answer_callback(callback_query)
     except Exception: content_logger.warning(f"Failed to answer callback query: {data} from admin {user_id}")
 
 
@@ -224,7 +232,10 @@ async def content_main_menu_callbacks(client: Client, callback_query: CallbackQu
              )
 
         elif data == "content_view_all_anime_list":
-             await handle_admin_view_all_anime_list(client, callback_query.message, user_state, 1) # Start on page 1
+             await handle_admin_view_all_anime_list(client, callback_query, user_state) # Start on the first page
+
+        elif data == "content_admin_list_letters":
+             await handle_admin_list_letters(client, callback_query, user_state)
 
 
         elif data == "content_management_main_menu":
@@ -301,12 +312,12 @@ async def content_main_menu_callbacks(client: Client, callback_query: CallbackQu
 
 
         # Pagination for Admin View All list
-        elif data.startswith("content_admin_anime_list_page|"): await handle_admin_view_all_anime_list(client, callback_query.message, user_state, int(data.split(config.CALLBACK_DATA_SEPARATOR)[1]))
+        elif data.startswith("content_admin_anime_list_page|"): await handle_admin_view_all_anime_list(client, callback_query, user_state) # Cursor token parsed from data
 
 
         else:
             content_logger.warning(f"Admin {user_id} clicked unhandled content_ callback: {data} in state {user_state.step}. State data: {user_state.data}")
-            await callback_query.answer("⚠️ This action is not implemented yet or invalid.", show_alert=False)
+            await answer_callback(callback_query, "⚠️ This action is not implemented yet or invalid.", show_alert=True)
 
 
     except ValueError as e:
@@ -440,7 +451,7 @@ async def handle_edit_existing_anime_selection(client: Client, message: Message,
 
      try:
          # Retrieve the anime document
-         anime = await MongoDB.get_anime_by_id(anime_id_str)
+         anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
          if not anime:
              content_logger.error(f"Admin {user_id} tried to edit non-existent anime ID: {anime_id_str} after selection.")
              await edit_or_send_message(client, chat_id, message_id, "💔 Error: Selected anime not found in database.", disable_web_page_preview=True)
@@ -473,7 +484,8 @@ async def display_anime_management_menu(client: Client, message: Message, anime:
      menu_text += f"🗓️ <b><u>Release Year</u></b>: {anime.release_year if anime.release_year else 'Not set'}\n"
      menu_text += f"🚦 <b><u>Status</u></b>: {anime.status if anime.status else 'Not set'}\n"
      menu_text += f"🌟 <b><u>Total Seasons Declared</u></b>: {anime.total_seasons_declared}\n"
-     menu_text += f"📁 Files Uploaded: {sum(len(s.episodes[e_idx].files) for s in anime.seasons for e_idx in range(len(s.episodes)) if s.episodes) if anime.seasons else 0} Versions Total\n"
+     menu_text += f"📺 <b><u>Seasons</u></b>: {anime.season_count} • <b><u>Episodes</u></b>: {anime.available_episode_count}/{anime.episode_count} available\n"
+     menu_text += f"📁 Files Uploaded: {anime.file_count} Versions Total ({anime.total_bytes / (1024 * 1024 * 1024):.2f} GB)\n"
 
      menu_text += f"\n👇 Select an option to edit details or manage content structure:"
 
@@ -542,9 +554,10 @@ async def handle_awaiting_poster(client: Client, message: Message, user_state: U
 
              if update_result.matched_count > 0 and update_result.modified_count > 0:
                   content_logger.info(f"Admin {user_id} successfully updated poster for anime {anime_id_str}.")
+                  MenuCache.invalidate_anime(anime_id_str)
                   await message.reply_text("✅ Poster updated!", parse_mode=config.PARSE_MODE)
 
-                  updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                  updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                   if updated_anime:
                        await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                        await asyncio.sleep(1)
@@ -557,7 +570,7 @@ async def handle_awaiting_poster(client: Client, message: Message, user_state: U
              elif update_result.matched_count > 0:
                  content_logger.info(f"Admin {user_id} sent poster for {anime_id_str} but it was unchanged (modified_count=0).")
                  await message.reply_text("✅ Poster appears unchanged. No update needed.", parse_mode=config.PARSE_MODE)
-                 current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if current_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                      await asyncio.sleep(1)
@@ -623,9 +636,10 @@ async def handle_awaiting_synopsis_input(client: Client, message: Message, user_
 
             if update_result.matched_count > 0 and update_result.modified_count > 0:
                 content_logger.info(f"Admin {user_id} successfully updated synopsis for anime {anime_id_str}.")
+                MenuCache.invalidate_anime(anime_id_str)
                 await message.reply_text("✅ Synopsis updated!", parse_mode=config.PARSE_MODE)
 
-                updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                 if updated_anime:
                     await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                     await asyncio.sleep(1)
@@ -640,7 +654,7 @@ async def handle_awaiting_synopsis_input(client: Client, message: Message, user_
             elif update_result.matched_count > 0:
                  content_logger.info(f"Admin {user_id} sent synopsis for {anime_id_str} but it was unchanged (modified_count=0).")
                  await message.reply_text("✅ Synopsis appears unchanged. No update needed.", parse_mode=config.PARSE_MODE)
-                 current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if current_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                      await asyncio.sleep(1)
@@ -716,9 +730,10 @@ async def handle_awaiting_total_seasons_count_input(client: Client, message: Mes
 
             if update_result.matched_count > 0 and update_result.modified_count > 0:
                  content_logger.info(f"Admin {user_id} successfully updated total_seasons_declared for anime {anime_id_str} to {seasons_count}.")
+                 MenuCache.invalidate_anime(anime_id_str)
                  await message.reply_text(f"✅ Total seasons updated to **<u>{seasons_count}</u>**!", parse_mode=config.PARSE_MODE)
 
-                 updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if updated_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                      await asyncio.sleep(1)
@@ -732,7 +747,7 @@ async def handle_awaiting_total_seasons_count_input(client: Client, message: Mes
             elif update_result.matched_count > 0:
                  content_logger.info(f"Admin {user_id} sent total seasons count for {anime_id_str} but it was unchanged (modified_count=0).")
                  await message.reply_text(f"✅ Total seasons count is already <b>{seasons_count}</b>. No update needed.", parse_mode=config.PARSE_MODE)
-                 current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if current_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                      await asyncio.sleep(1)
@@ -786,8 +801,8 @@ async def handle_toggle_genre_callback(client: Client, callback_query: CallbackQ
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: content_logger.warning(f"Failed to answer callback query {data} from admin {user_id}.")
 
 
@@ -808,7 +823,7 @@ async def handle_toggle_genre_callback(client: Client, callback_query: CallbackQ
 
         if genre_to_toggle not in config.INITIAL_GENRES:
              content_logger.warning(f"Admin {user_id} attempted to toggle non-preset genre: {genre_to_toggle}.")
-             await callback_query.answer("🚫 Invalid genre option.", show_alert=False)
+             await answer_callback(callback_query, "🚫 Invalid genre option.", show_alert=True)
              return
 
         if genre_to_toggle in selected_genres: selected_genres.remove(genre_to_toggle)
@@ -847,7 +862,7 @@ async def handle_toggle_genre_callback(client: Client, callback_query: CallbackQ
     except Exception as e:
          content_logger.error(f"FATAL error handling content_toggle_genre callback {data} for admin {user_id}: {e}", exc_info=True)
          await clear_user_state(user_id)
-         try: await callback_query.answer(strings.ERROR_OCCURRED, show_alert=True); except Exception: pass
+         try: await answer_callback(callback_query, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED) # Reply error as new message?
 
 @Client.on_callback_query(filters.regex("^content_genres_done$") & filters.private)
@@ -856,8 +871,8 @@ async def handle_genres_done_callback(client: Client, callback_query: CallbackQu
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Genres selected. Proceeding...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Genres selected. Proceeding...")
     except Exception: common_logger.warning(f"Failed to answer callback query content_genres_done from admin {user_id}.")
 
 
@@ -906,9 +921,10 @@ async def handle_genres_done_callback(client: Client, callback_query: CallbackQu
 
             if update_result.matched_count > 0 and update_result.modified_count > 0:
                  content_logger.info(f"Admin {user_id} successfully updated genres for anime {anime_id_str}.")
+                 await SearchIndex.refresh_anime(anime_id_str)
                  await callback_query.message.edit_text(f"✅ Genres updated to: <b>{', '.join(selected_genres) if selected_genres else 'None'}</b>!", parse_mode=config.PARSE_MODE)
 
-                 updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if updated_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                      await asyncio.sleep(1)
@@ -922,7 +938,7 @@ async def handle_genres_done_callback(client: Client, callback_query: CallbackQu
             elif update_result.matched_count > 0:
                  content_logger.info(f"Admin {user_id} sent genres for {anime_id_str} but it was unchanged (modified_count=0).")
                  await callback_query.message.edit_text(f"✅ Genres appear unchanged. No update needed.", parse_mode=config.PARSE_MODE)
-                 current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if current_anime:
                       await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                       await asyncio.sleep(1)
@@ -995,9 +1011,10 @@ async def handle_awaiting_release_year_input(client: Client, message: Message, u
 
             if update_result.matched_count > 0 and update_result.modified_count > 0:
                  content_logger.info(f"Admin {user_id} successfully updated release year for anime {anime_id_str} to {release_year}.")
+                 await SearchIndex.refresh_anime(anime_id_str)
                  await message.reply_text(f"✅ Release year updated to **__{release_year}__**!", parse_mode=config.PARSE_MODE)
 
-                 updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if updated_anime:
                       await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                       await asyncio.sleep(1)
@@ -1011,7 +1028,7 @@ async def handle_awaiting_release_year_input(client: Client, message: Message, u
             elif update_result.matched_count > 0:
                  content_logger.info(f"Admin {user_id} sent release year for {anime_id_str} but it was unchanged (modified_count=0).")
                  await message.reply_text(f"✅ Release year is already <b>{release_year}</b>. No update needed.", parse_mode=config.PARSE_MODE)
-                 current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if current_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                      await asyncio.sleep(1)
@@ -1060,8 +1077,8 @@ async def handle_select_status_callback(client: Client, callback_query: Callback
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: content_logger.warning(f"Failed to answer callback query {data} from admin {user_id}.")
 
 
@@ -1079,7 +1096,7 @@ async def handle_select_status_callback(client: Client, callback_query: Callback
 
         if selected_status not in config.ANIME_STATUSES:
              content_logger.warning(f"Admin {user_id} attempted to select non-preset status: {selected_status}.")
-             await callback_query.answer("🚫 Invalid status option.", show_alert=False)
+             await answer_callback(callback_query, "🚫 Invalid status option.", show_alert=True)
              await edit_or_send_message(client, chat_id, message_id, f"🚫 Invalid status option selected: {selected_status}.", disable_web_page_preview=True);
              return
 
@@ -1119,9 +1136,10 @@ async def handle_select_status_callback(client: Client, callback_query: Callback
                 await clear_user_state(user_id); return
 
             try:
-                insert_result = await MongoDB.anime_collection().insert_one(new_anime.dict(by_alias=True, exclude_none=True))
+                insert_result = await MongoDB.anime_collection().insert_one({**new_anime.dict(by_alias=True, exclude_none=True), "name_lower": name_sort_key(new_anime.name)})
                 new_anime_id = insert_result.inserted_id
                 content_logger.info(f"Successfully added new anime '{new_anime.name}' (ID: {new_anime_id}) by admin {user_id}.")
+                await SearchIndex.refresh_anime(new_anime_id)
 
                 await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(new_anime_id), "anime_name": new_anime.name})
 
@@ -1160,9 +1178,10 @@ async def handle_select_status_callback(client: Client, callback_query: Callback
 
                 if update_result.matched_count > 0 and update_result.modified_count > 0:
                      content_logger.info(f"Admin {user_id} successfully updated status for anime {anime_id_str} to '{selected_status}'.")
+                     await SearchIndex.refresh_anime(anime_id_str)
                      await callback_query.message.edit_text(f"✅ Status updated to: **<u>{selected_status}</u>**!", parse_mode=config.PARSE_MODE)
 
-                     updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                     updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                      if updated_anime:
                          await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                          await asyncio.sleep(1)
@@ -1177,7 +1196,7 @@ async def handle_select_status_callback(client: Client, callback_query: Callback
                 elif update_result.matched_count > 0:
                      content_logger.info(f"Admin {user_id} selected status for {anime_id_str} but it was unchanged (modified_count=0).")
                      await callback_query.message.edit_text(f"✅ Status is already <b>{selected_status}</b>. No update needed.", parse_mode=config.PARSE_MODE)
-                     current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                     current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                      if current_anime:
                          await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                          await asyncio.sleep(1)
@@ -1209,7 +1228,7 @@ async def handle_select_status_callback(client: Client, callback_query: Callback
 @Client.on_callback_query(filters.regex("^content_edit_name\|.*") & filters.private)
 async def handle_edit_name_callback(client: Client, message: Message, user_state: UserState, data: str):
      user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-     if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+     if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
      if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit name. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing name.", disable_web_page_preview=True)
@@ -1227,12 +1246,12 @@ async def handle_edit_name_callback(client: Client, message: Message, user_state
          reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(strings.BUTTON_CANCEL, callback_data="content_cancel")]])
 
          await edit_or_send_message(client, chat_id, message_id, prompt_text, reply_markup, disable_web_page_preview=True)
-         try: await client.answer_callback_query(message.id)
+         try: await answer_callback(message)
          except Exception: common_logger.warning(f"Failed to answer callback {data} after message edit for {user_id}")
 
      except Exception as e:
          content_logger.error(f"Error handling content_edit_name callback for admin {user_id}: {e}", exc_info=True);
-         try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+         try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 
@@ -1251,15 +1270,16 @@ async def handle_editing_name_input(client: Client, message: Message, user_state
     try:
          update_result = await MongoDB.anime_collection().update_one(
              {"_id": ObjectId(anime_id_str)},
-             {"$set": {"name": new_name, "last_updated_at": datetime.now(timezone.utc)}}
+             {"$set": {"name": new_name, "name_lower": name_sort_key(new_name), "last_updated_at": datetime.now(timezone.utc)}}
          )
 
          if update_result.matched_count > 0:
              if update_result.modified_count > 0:
                   content_logger.info(f"Admin {user_id} successfully updated name of anime {anime_id_str} to '{new_name}'.")
+                  await SearchIndex.refresh_anime(anime_id_str)
                   await message.reply_text(f"✅ Name updated to **<u>{new_name}</u>**!", parse_mode=config.PARSE_MODE)
 
-                  updated_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                  updated_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                   if updated_anime:
                        await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(updated_anime.id), "anime_name": updated_anime.name})
                        await asyncio.sleep(1)
@@ -1273,7 +1293,7 @@ async def handle_editing_name_input(client: Client, message: Message, user_state
              else:
                  content_logger.info(f"Admin {user_id} sent name for {anime_id_str} but it was unchanged ('{new_name}').")
                  await message.reply_text(f"✅ Name is already **<u>{new_name}</u>**. No update needed.", parse_mode=config.PARSE_MODE)
-                 current_anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 current_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if current_anime:
                      await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": str(current_anime.id), "anime_name": current_anime.name})
                      await asyncio.sleep(1)
@@ -1296,7 +1316,7 @@ async def handle_editing_name_input(client: Client, message: Message, user_state
 @Client.on_callback_query(filters.regex("^content_edit_synopsis\|.*") & filters.private)
 async def handle_edit_synopsis_callback(client: Client, message: Message, user_state: UserState, data: str):
      user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-     if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+     if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
      if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit synopsis. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing synopsis.", disable_web_page_preview=True)
@@ -1309,18 +1329,18 @@ async def handle_edit_synopsis_callback(client: Client, message: Message, user_s
          prompt_text = "📝 Send the **<u>New Synopsis</u>** for this anime:"
          reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(strings.BUTTON_CANCEL, callback_data="content_cancel")]])
          await edit_or_send_message(client, chat_id, message_id, prompt_text, reply_markup, disable_web_page_preview=True)
-         try: await client.answer_callback_query(message.id)
+         try: await answer_callback(message)
          except Exception: pass
      except Exception as e:
          content_logger.error(f"Error handling edit synopsis callback {user_id}: {e}", exc_info=True);
-         try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+         try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 
 @Client.on_callback_query(filters.regex("^content_edit_poster\|.*") & filters.private)
 async def handle_edit_poster_callback(client: Client, message: Message, user_state: UserState, data: str):
      user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-     if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+     if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
      if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit poster. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing poster.", disable_web_page_preview=True)
@@ -1333,17 +1353,17 @@ async def handle_edit_poster_callback(client: Client, message: Message, user_sta
          prompt_text = "🖼️ Send the **<u>New Poster Image</u>** for this anime:"
          reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(strings.BUTTON_CANCEL, callback_data="content_cancel")]])
          await edit_or_send_message(client, chat_id, message_id, prompt_text, reply_markup, disable_web_page_preview=True)
-         try: await client.answer_callback_query(message.id)
+         try: await answer_callback(message)
          except Exception: pass
      except Exception as e:
          content_logger.error(f"Error handling edit poster callback {user_id}: {e}", exc_info=True);
-         try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+         try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 @Client.on_callback_query(filters.regex("^content_edit_genres\|.*") & filters.private)
 async def handle_edit_genres_callback(client: Client, message: Message, user_state: UserState, data: str):
      user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-     if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+     if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
      if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit genres. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing genres.", disable_web_page_preview=True)
@@ -1355,7 +1375,7 @@ async def handle_edit_genres_callback(client: Client, message: Message, user_sta
          anime = await MongoDB.get_anime_by_id(anime_id_str)
          if not anime:
              content_logger.error(f"Anime not found {anime_id_str} for genre edit after state check.")
-             await client.answer_callback_query(message.id, "💔 Anime not found for genre edit.");
+             await answer_callback(message, "💔 Anime not found for genre edit.", show_alert=True);
              return
 
 
@@ -1363,16 +1383,16 @@ async def handle_edit_genres_callback(client: Client, message: Message, user_sta
          prompt_text = strings.ADD_ANIME_GENRES_PROMPT.format(anime_name=anime.name)
          await client.send_message(chat_id, prompt_text, parse_mode=config.PARSE_MODE)
          await prompt_for_genres(client, chat_id, anime.name, anime.genres)
-         try: await client.answer_callback_query(message.id, "Select genres to toggle.");
+         try: await answer_callback(message, "Select genres to toggle.");
          except Exception: pass
 
-     except Exception as e: content_logger.error(f"Error handling edit genres callback {user_id}: {e}", exc_info=True); try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass; await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
+     except Exception as e: content_logger.error(f"Error handling edit genres callback {user_id}: {e}", exc_info=True); try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass; await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 
 @Client.on_callback_query(filters.regex("^content_edit_year\|.*") & filters.private)
 async def handle_edit_year_callback(client: Client, message: Message, user_state: UserState, data: str):
     user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+    if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
     if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit year. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing year.", disable_web_page_preview=True)
@@ -1384,17 +1404,17 @@ async def handle_edit_year_callback(client: Client, message: Message, user_state
         prompt_text = "🗓️ Send the **<u>New Release Year</u>** for this anime:"
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(strings.BUTTON_CANCEL, callback_data="content_cancel")]])
         await edit_or_send_message(client, chat_id, message_id, prompt_text, reply_markup, disable_web_page_preview=True)
-        try: await client.answer_callback_query(message.id)
+        try: await answer_callback(message)
         except Exception: pass
     except Exception as e:
          content_logger.error(f"Error handling edit year callback {user_id}: {e}", exc_info=True);
-         try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+         try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 @Client.on_callback_query(filters.regex("^content_edit_status\|.*") & filters.private)
 async def handle_edit_status_callback(client: Client, message: Message, user_state: UserState, data: str):
     user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+    if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
     if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit status. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing status.", disable_web_page_preview=True)
@@ -1405,7 +1425,7 @@ async def handle_edit_status_callback(client: Client, message: Message, user_sta
         anime = await MongoDB.get_anime_by_id(anime_id_str)
         if not anime:
             content_logger.error(f"Anime not found {anime_id_str} for status edit after state check.")
-            await client.answer_callback_query(message.id, "💔 Anime not found for status edit.");
+            await answer_callback(message, "💔 Anime not found for status edit.", show_alert=True);
             return
 
         await set_user_state(user_id, "content_management", ContentState.SELECTING_STATUS, data={**user_state.data, "purpose": "edit", "status": anime.status})
@@ -1416,20 +1436,20 @@ async def handle_edit_status_callback(client: Client, message: Message, user_sta
             client, chat_id, message_id, f"🚦 Sent status selection menu for {anime.name}...",
              disable_web_page_preview=True
          )
-        try: await client.answer_callback_query(message.id, "Select status.");
+        try: await answer_callback(message, "Select status.");
         except Exception: pass
 
 
     except Exception as e:
          content_logger.error(f"Error handling edit status callback {user_id}: {e}", exc_info=True);
-         try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+         try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 
 @Client.on_callback_query(filters.regex("^content_edit_total_seasons_count\|.*") & filters.private)
 async def handle_edit_total_seasons_count_callback(client: Client, message: Message, user_state: UserState, data: str):
     user_id = message.from_user.id; chat_id = message.chat.id; message_id = message.id
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+    if user_id not in config.ADMIN_IDS: await answer_callback(message, "🚫 Unauthorized.", show_alert=True); return
     if not (user_state.handler == "content_management" and user_state.step == ContentState.MANAGING_ANIME_MENU):
          content_logger.warning(f"Admin {user_id} in unexpected state {user_state.handler}:{user_state.step} clicking edit total seasons count. Data: {data}. State data: {user_state.data}")
          await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state for editing total seasons.", disable_web_page_preview=True)
@@ -1442,10 +1462,10 @@ async def handle_edit_total_seasons_count_callback(client: Client, message: Mess
         prompt_text = "🔢 Send the **<u>New Total Number of Seasons</u>** for this anime:"
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(strings.BUTTON_CANCEL, callback_data="content_cancel")]])
         await edit_or_send_message(client, chat_id, message_id, prompt_text, reply_markup, disable_web_page_preview=True)
-        try: await client.answer_callback_query(message.id)
+        try: await answer_callback(message)
         except Exception: pass
 
-    except Exception as e: content_logger.error(f"Error handling edit total seasons count callback {user_id}: {e}", exc_info=True); try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass; await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
+    except Exception as e: content_logger.error(f"Error handling edit total seasons count callback {user_id}: {e}", exc_info=True); try: await answer_callback(message, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass; await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 async def display_seasons_management_menu(client: Client, message: Message, anime: Anime):
      user_id = message.from_user.id
@@ -1508,8 +1528,8 @@ async def handle_manage_seasons_callback(client: Client, callback_query: Callbac
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Loading seasons...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Loading seasons...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -1555,8 +1575,8 @@ async def handle_add_new_season_callback(client: Client, callback_query: Callbac
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -1576,11 +1596,12 @@ async def handle_add_new_season_callback(client: Client, callback_query: Callbac
 
         update_result = await MongoDB.anime_collection().update_one(
             {"_id": ObjectId(anime_id_str)},
-            {"$push": {"seasons": new_season_dict}}
+            {"$push": {"seasons": new_season_dict}, "$inc": {"season_count": 1}} # New season has no episodes: only the season count changes
         )
 
         if update_result.matched_count > 0 and update_result.modified_count > 0:
             content_logger.info(f"Admin {user_id} added Season {season_to_add} to anime {anime_id_str}.")
+            MenuCache.invalidate_anime(anime_id_str)
             await callback_query.message.edit_text(f"✅ Added Season **<u>{season_to_add}</u>** to this anime!\n\n🔢 Now send the **<u>Total Number of Episodes</u>** for Season **__{season_to_add}__**.", parse_mode=config.PARSE_MODE)
 
 
@@ -1611,8 +1632,8 @@ async def handle_remove_season_select_callback(client: Client, callback_query: C
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Select season to remove...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Select season to remove...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -1675,8 +1696,8 @@ async def handle_confirm_remove_season_callback(client: Client, callback_query:
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Removing season permanently...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Removing season permanently...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -1706,11 +1727,13 @@ async def handle_confirm_remove_season_callback(client: Client, callback_query:
             {"$pull": {"seasons": {"season_number": season_number_to_remove}}}
         )
         await MongoDB.anime_collection().update_one({"_id": ObjectId(anime_id_str)}, {"$set": {"last_updated_at": datetime.now(timezone.utc)}})
+        if update_result.modified_count > 0: await MongoDB.recount_anime_contents(anime_id_str) # The removed season's episodes/files leave the counters
 
 
         if update_result.matched_count > 0:
              if update_result.modified_count > 0:
                   content_logger.info(f"Admin {user_id} successfully removed Season {season_number_to_remove} from anime {anime_id_str}.")
+                  MenuCache.invalidate_anime(anime_id_str)
                   await edit_or_send_message(client, chat_id, message_id, f"✅ Permanently removed Season **<u>{season_number_to_remove}</u>** from this anime.", disable_web_page_preview=True)
 
 
@@ -1806,8 +1829,8 @@ async def handle_select_episode_callback(client: Client, callback_query: Callbac
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Loading episode management menu...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Loading episode management menu...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -1968,8 +1991,8 @@ async def handle_add_release_date_callback(client: Client, callback_query: Callb
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -2030,25 +2053,30 @@ async def handle_awaiting_release_date_input(client: Client, message: Message, u
     try:
         release_date_obj = datetime.strptime(date_text, '%d/%m/%Y').replace(tzinfo=timezone.utc)
 
-        filter_query = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number, "seasons.0.episodes.episode_number": episode_number}
+        # The season/episode pair must match in the same array elements; arrayFilters then address that episode
+        filter_query = {"_id": ObjectId(anime_id_str), "seasons": {"$elemMatch": {"season_number": season_number, "episodes.episode_number": episode_number}}}
         update_operation = {
              "$set": {
-                  "seasons.$.episodes.$.release_date": release_date_obj,
+                  "seasons.$[season].episodes.$[episode].release_date": release_date_obj,
                   "last_updated_at": datetime.now(timezone.utc)
              },
-             "$unset": {"seasons.$.episodes.$.files": ""}
+             "$unset": {"seasons.$[season].episodes.$[episode].files": ""}
         }
+        array_filters = [{"season.season_number": season_number}, {"episode.episode_number": episode_number}]
 
         update_result = await MongoDB.anime_collection().update_one(
-            filter_query, update_operation
+            filter_query, update_operation, array_filters=array_filters
         )
 
         if update_result.matched_count > 0:
              if update_result.modified_count > 0:
                   content_logger.info(f"Admin {user_id} set release date for {anime_id_str}/S{season_number}E{episode_number}. Removed files if any.")
+                  await MongoDB.recount_anime_contents(anime_id_str) # Unsetting files changes the file/availability counters
+                  MenuCache.invalidate_anime(anime_id_str)
                   await message.reply_text(strings.RELEASE_DATE_SET_SUCCESS.format(episode_number=episode_number, release_date=date_text), parse_mode=config.PARSE_MODE)
+                  await NotificationOutbox.enqueue(ObjectId(anime_id_str), season_number, episode_number, "release_date_updated", {"release_date": date_text})
 
-                  filter_query_episode = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number, "seasons.0.episodes.episode_number": episode_number}
+                  filter_query_episode = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number}
                   projection_episode = {"name": 1, "seasons.$": 1} # Project matched season
 
                   anime_doc = await MongoDB.anime_collection().find_one(filter_query_episode, projection_episode)
@@ -2101,8 +2129,8 @@ async def handle_go_next_episode_callback(client: Client, callback_query: Callba
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Going to next episode...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Going to next episode...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -2185,8 +2213,8 @@ async def handle_add_file_version_callback(client: Client, callback_query: Callb
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -2246,6 +2274,11 @@ async def handle_episode_file_upload(client: Client, message: Message, user_stat
 
     content_logger.info(f"Admin {user_id} uploaded episode file ({file_obj.file_id}, {file_obj.file_size} bytes) for {anime_name} S{season_number}E{episode_number} in UPLOADING_FILE.")
 
+    # Keep a copy in the storage channel: stale file_ids are refreshed from it (handlers/file_health.py)
+    storage_message_id = None
+    try: storage_message_id = (await message.copy(config.FILE_STORAGE_CHANNEL_ID)).id
+    except Exception as e: content_logger.warning(f"Failed to copy episode file {file_obj.file_unique_id} to the storage channel: {e}. The file health scan will backfill it.")
+
     temp_upload_data = {
         "file_id": file_obj.file_id,
         "file_unique_id": file_obj.file_unique_id,
@@ -2256,6 +2289,7 @@ async def handle_episode_file_upload(client: Client, message: Message, user_stat
         "width": getattr(file_obj, 'width', None),
         "height": getattr(file_obj, 'height', None),
         "added_at": datetime.now(timezone.utc),
+        "storage_message_id": storage_message_id,
     }
 
     user_state.data["temp_upload"] = temp_upload_data
@@ -2301,8 +2335,8 @@ async def handle_select_quality_callback(client: Client, callback_query: Callbac
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: common_logger.warning(f"Failed to answer callback query {data} from admin {user_id}.")
 
     user_state = await get_user_state(user_id)
@@ -2319,7 +2353,7 @@ async def handle_select_quality_callback(client: Client, callback_query: Callbac
 
         if selected_quality not in config.QUALITY_PRESETS:
              content_logger.warning(f"Admin {user_id} selected non-preset quality: {selected_quality}. Saving anyway.")
-             await callback_query.answer("⚠️ Non-preset quality selected. Saving anyway.", show_alert=False)
+             await answer_callback(callback_query, "⚠️ Non-preset quality selected. Saving anyway.", show_alert=True)
 
 
         user_state.data["temp_metadata"] = user_state.data.get("temp_metadata", {})
@@ -2377,8 +2411,8 @@ async def handle_toggle_audio_callback(client: Client, callback_query: CallbackQ
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: content_logger.warning(f"Failed to answer callback query {data} from admin {user_id}.")
 
     user_state = await get_user_state(user_id)
@@ -2398,7 +2432,7 @@ async def handle_toggle_audio_callback(client: Client, callback_query: CallbackQ
 
         if language_to_toggle not in config.AUDIO_LANGUAGES_PRESETS:
              content_logger.warning(f"Admin {user_id} attempted to toggle non-preset audio: {language_to_toggle}.")
-             await callback_query.answer("🚫 Invalid audio option.", show_alert=False)
+             await answer_callback(callback_query, "🚫 Invalid audio option.", show_alert=True)
              return
 
         if language_to_toggle in selected_audio_languages: selected_audio_languages.remove(language_to_toggle)
@@ -2436,7 +2470,7 @@ async def handle_toggle_audio_callback(client: Client, callback_query: CallbackQ
     except Exception as e:
         content_logger.error(f"FATAL error handling content_toggle_audio callback {data} for admin {user_id}: {e}", exc_info=True)
         await clear_user_state(user_id)
-        try: await callback_query.answer(strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+        try: await answer_callback(callback_query, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
         await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 
@@ -2446,8 +2480,8 @@ async def handle_audio_done_callback(client: Client, callback_query: CallbackQue
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Audio languages selected. Proceeding to subtitles...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Audio languages selected. Proceeding to subtitles...")
     except Exception: common_logger.warning(f"Failed to answer callback query content_audio_done from admin {user_id}.")
 
 
@@ -2514,8 +2548,8 @@ async def handle_toggle_subtitle_callback(client: Client, callback_query: Callba
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id)
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query)
     except Exception: common_logger.warning(f"Failed to answer callback query {data} from admin {user_id}.")
 
     user_state = await get_user_state(user_id)
@@ -2536,7 +2570,7 @@ async def handle_toggle_subtitle_callback(client: Client, callback_query: Callba
 
         if language_to_toggle not in config.SUBTITLE_LANGUAGES_PRESETS:
              content_logger.warning(f"Admin {user_id} attempted to toggle non-preset subtitle: {language_to_toggle}.")
-             await callback_query.answer("🚫 Invalid subtitle option.", show_alert=False)
+             await answer_callback(callback_query, "🚫 Invalid subtitle option.", show_alert=True)
              return
 
         if language_to_toggle in selected_subtitle_languages: selected_subtitle_languages.remove(language_to_toggle)
@@ -2577,7 +2611,7 @@ async def handle_toggle_subtitle_callback(client: Client, callback_query: Callba
     except Exception as e:
         content_logger.error(f"FATAL error handling content_toggle_subtitle callback {data} for admin {user_id}: {e}", exc_info=True)
         await clear_user_state(user_id)
-        try: await callback_query.answer(strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
+        try: await answer_callback(callback_query, strings.ERROR_OCCURRED, show_alert=True); except Exception: pass;
         await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True);
 
 @Client.on_callback_query(filters.regex("^content_subtitles_done$") & filters.private)
@@ -2586,8 +2620,8 @@ async def handle_subtitles_done_callback(client: Client, callback_query: Callbac
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Subtitle languages selected. Saving file version...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Subtitle languages selected. Saving file version...")
     except Exception: common_logger.warning(f"Failed to answer callback query content_subtitles_done from admin {user_id}.")
 
 
@@ -2630,6 +2664,7 @@ async def handle_subtitles_done_callback(client: Client, callback_query: Callbac
          "audio_languages": selected_audio_languages,
          "subtitle_languages": selected_subtitle_languages,
          "added_at": datetime.now(timezone.utc),
+         "storage_message_id": temp_upload_data.get("storage_message_id"),
      }
 
     try:
@@ -2642,12 +2677,20 @@ async def handle_subtitles_done_callback(client: Client, callback_query: Callbac
 
 
     try:
-        success = await MongoDB.add_file_version_to_episode(
+        episode_file_count = await MongoDB.add_file_version_to_episode(
             anime_id=anime_id_str, season_number=season_number, episode_number=episode_number, file_version=new_file_version
         )
 
-        if success:
+        if episode_file_count:
             content_logger.info(f"Admin {user_id} successfully added file version ({new_file_version.quality_resolution}, {new_file_version.file_unique_id}) to {anime_id_str}/S{season_number}E{episode_number}.")
+            MenuCache.invalidate_anime(anime_id_str)
+            # First file of the episode: it is now available; otherwise another version of it
+            update_type = "new_episode" if episode_file_count == 1 else "new_version"
+            await NotificationOutbox.enqueue(ObjectId(anime_id_str), season_number, episode_number, update_type, {
+                "file_unique_id": new_file_version.file_unique_id, "quality": new_file_version.quality_resolution,
+                "audio": ', '.join(new_file_version.audio_languages) if new_file_version.audio_languages else 'N/A',
+                "subs": ', '.join(new_file_version.subtitle_languages) if new_file_version.subtitle_languages else 'None'
+            })
             await edit_or_send_message(
                  client, chat_id, message_id,
                  strings.FILE_ADDED_SUCCESS.format(
@@ -2659,7 +2702,8 @@ async def handle_subtitles_done_callback(client: Client, callback_query: Callbac
             )
 
 
-            filter_query = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number, "seasons.0.episodes.episode_number": episode_number}
+            # "seasons.$" returns the season matched by season_number; the episode is picked from it below
+            filter_query = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number}
             projection = {"name": 1, "seasons.$": 1}
 
             anime_doc = await MongoDB.anime_collection().find_one(filter_query, projection)
@@ -2710,8 +2754,8 @@ async def handle_delete_file_version_select_callback(client: Client, callback_qu
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Select file version to remove...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Select file version to remove...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -2847,8 +2891,8 @@ async def handle_confirm_remove_file_version_callback(client: Client, callback_q
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Removing file version permanently...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Removing file version permanently...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -2885,6 +2929,7 @@ async def handle_confirm_remove_file_version_callback(client: Client, callback_q
 
         if success:
              content_logger.info(f"Admin {user_id} successfully removed file version {file_unique_id_to_remove} from {anime_id_str}/S{season_number}E{episode_number}.")
+             MenuCache.invalidate_anime(anime_id_str)
              await edit_or_send_message(client, chat_id, message_id, strings.FILE_DELETED_SUCCESS, disable_web_page_preview=True)
 
              updated_state_data = {k: v for k, v in user_state.data.items() if k != "file_versions"}
@@ -2938,46 +2983,41 @@ async def handle_confirm_remove_file_version_callback(client: Client, callback_q
 # --- Implement Admin View All Anime List ---
 
 # Callback from main CM menu: content_view_all_anime_list or pagination
+# Pagination is keyset-based: content_admin_anime_list_page|<cursor token> (see database.keyset_pagination)
 @Client.on_callback_query(filters.regex("^content_view_all_anime_list") & filters.private)
 @Client.on_callback_query(filters.regex(f"^content_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}.*") & filters.private)
-async def handle_admin_view_all_anime_list(client: Client, callback_query: CallbackQuery, user_state: UserState, page: int = 1):
+async def handle_admin_view_all_anime_list(client: Client, callback_query: CallbackQuery, user_state: UserState, cursor: Optional[str] = None):
     user_id = callback_query.from_user.id
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
 
     is_pagination_callback = data.startswith("content_admin_anime_list_page|")
     if is_pagination_callback:
-         try: page = int(data.split(config.CALLBACK_DATA_SEPARATOR)[1])
-         except ValueError: page = 1 # Default to page 1 if invalid
+         cursor = data.split(config.CALLBACK_DATA_SEPARATOR, 1)[1] or None # Stale/invalid tokens fall back to the first page
 
-    content_logger.info(f"Admin {user_id} viewing all anime list, page {page}.")
-    try: await client.answer_callback_query(message.id, f"Loading page {page}...")
+    content_logger.info(f"Admin {user_id} viewing all anime list, cursor {cursor}.")
+    try: await answer_callback(callback_query, "Loading page...")
     except Exception: content_logger.warning(f"Failed to answer callback query: {data} from admin {user_id}")
 
 
     # Ensure state is correct - could be from main CM menu or pagination
-    await set_user_state(user_id, "content_management", ContentState.ADMIN_ANIME_LIST_VIEW, data={**user_state.data, "page": page})
+    await set_user_state(user_id, "content_management", ContentState.ADMIN_ANIME_LIST_VIEW, data={**user_state.data, "cursor": cursor})
 
 
     try:
-        # Fetch all anime documents (or count for pagination)
-        total_anime_count = await MongoDB.anime_collection().count_documents({})
-        total_pages = (total_anime_count + config.PAGE_SIZE - 1) // config.PAGE_SIZE # Calculate total pages
-        if page < 1: page = 1 # Ensure page is not less than 1
-        if page > total_pages and total_pages > 0: page = total_pages # Ensure page is not more than total pages
-
-        # Fetch anime documents for the current page, projecting needed fields
-        skip_count = (page - 1) * config.PAGE_SIZE
+        # One bounded range scan on (name, _id) per page turn, no count_documents + skip
         # Project only relevant fields for the list display (name, maybe counts, status, year?)
-        anime_docs_on_page = await MongoDB.anime_collection().find({}, {"name": 1, "status": 1, "release_year": 1, "overall_download_count": 1}).sort("name", 1).skip(skip_count).limit(config.PAGE_SIZE).to_list(config.PAGE_SIZE) # Sort by name A-Z
+        keyset_page = await fetch_keyset_page({}, {"name": 1, "status": 1, "release_year": 1, "overall_download_count": 1}, cursor, config.PAGE_SIZE, {}) # Sorted by name A-Z
+        anime_docs_on_page = keyset_page.docs
+        total_anime_count = await estimate_total({}, {}) # Popcount of the in-memory catalog, or collection metadata
 
 
-        menu_text = f"📚 <b><u>Admin View All Anime</u></b> ({total_anime_count} total) 📚\n"
-        if total_anime_count > 0:
-             menu_text += f"Page <b>{page}</b> / <b>{total_pages}</b>\n\n"
+        menu_text = f"📚 <b><u>Admin View All Anime</u></b> (~{total_anime_count} total) 📚\n"
+        if anime_docs_on_page:
+             menu_text += strings.LIST_PAGE_RANGE.format(total=total_anime_count, first=html.escape(anime_docs_on_page[0]["name"][:25]), last=html.escape(anime_docs_on_page[-1]["name"][:25])) + "\n\n"
 
         buttons = []
         if not anime_docs_on_page:
@@ -2998,14 +3038,9 @@ async def handle_admin_view_all_anime_list(client: Client, callback_query: Callb
              buttons.append([InlineKeyboardButton(button_label, callback_data=f"content_edit_existing{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")])
 
 
-        # Add pagination buttons
-        pagination_buttons = []
-        if page > 1:
-            pagination_buttons.append(InlineKeyboardButton(strings.BUTTON_PREVIOUS_PAGE, callback_data=f"content_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{page - 1}"))
-        if page < total_pages:
-             pagination_buttons.append(InlineKeyboardButton(strings.BUTTON_NEXT_PAGE, callback_data=f"content_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{page + 1}"))
-        if pagination_buttons: # Only add if there are pagination buttons
-             buttons.append(pagination_buttons)
+        # Add pagination buttons: Previous / A-Z / Next
+        if anime_docs_on_page:
+             buttons.append(build_keyset_pagination_row("content_admin_anime_list_page", keyset_page, "content_admin_list_letters"))
 
         # Add Navigation buttons: Back to main CM menu, Home Bot Menu
         buttons.append([InlineKeyboardButton(strings.BUTTON_HOME_ADMIN_MENU, callback_data="content_management_main_menu")])
@@ -3019,12 +3054,24 @@ async def handle_admin_view_all_anime_list(client: Client, callback_query: Callb
 
 
     except Exception as e:
-         content_logger.error(f"FATAL error handling content_view_all_anime_list (page {page}) for admin {user_id}: {e}", exc_info=True)
+         content_logger.error(f"FATAL error handling content_view_all_anime_list (cursor {cursor}) for admin {user_id}: {e}", exc_info=True)
          await clear_user_state(user_id) # Clear state on error
          await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
          await manage_content_command(client, callback_query.message); # Offer to restart CM
 
 
+# Callback: content_admin_list_letters (from the admin view all list). Letters are pagination cursors (content_admin_anime_list_page|l<letter>).
+async def handle_admin_list_letters(client: Client, callback_query: CallbackQuery, user_state: UserState):
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.id
+
+    # Back re-opens the page the admin came from
+    back_cursor = user_state.data.get("cursor")
+    back_callback = f"content_admin_anime_list_page{config.CALLBACK_DATA_SEPARATOR}{back_cursor}" if back_cursor else "content_view_all_anime_list"
+    reply_markup = InlineKeyboardMarkup(build_letter_jump_buttons("content_admin_anime_list_page", back_callback))
+    await edit_or_send_message(client, chat_id, message_id, strings.JUMP_TO_LETTER_PROMPT, reply_markup, disable_web_page_preview=True)
+
+
 # --- Implement Delete Anime (Confirmation and Final Deletion) ---
 
 # Callback: content_delete_anime_prompt|<anime_id> (from display_anime_management_menu)
@@ -3036,8 +3083,8 @@ async def handle_delete_anime_prompt(client: Client, callback_query: CallbackQue
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Initiating deletion confirmation...")
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Initiating deletion confirmation...")
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -3062,7 +3109,7 @@ async def handle_delete_anime_prompt(client: Client, callback_query: CallbackQue
 
 
         # Fetch anime name for confirmation message
-        anime = await MongoDB.get_anime_by_id(anime_id_str)
+        anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
         if not anime:
             content_logger.error(f"Anime {anime_id_str} not found for deletion prompt for admin {user_id}.")
             await edit_or_send_message(client, chat_id, message_id, "💔 Error: Anime not found for deletion.", disable_web_page_preview=True)
@@ -3105,8 +3152,8 @@ async def handle_confirm_delete_anime_callback(client: Client, callback_query: C
     message_id = callback_query.message.id
     data = callback_query.data
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, "Deleting anime permanently...") # Indicate ongoing process
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, "Deleting anime permanently...") # Indicate ongoing process
     except Exception: pass
 
 
@@ -3138,6 +3185,7 @@ async def handle_confirm_delete_anime_callback(client: Client, callback_query: C
 
         if delete_result.deleted_count > 0:
             content_logger.info(f"Admin {user_id} successfully deleted anime {anime_id_str}.")
+            SearchIndex.remove_anime(anime_id_str)
             await edit_or_send_message(client, chat_id, message_id, f"✅ Permanently deleted anime: <b>{user_state.data.get('anime_name', 'Unnamed Anime')}</b>.", disable_web_page_preview=True)
 
             # --- Return to the main Content Management Menu ---
@@ -3172,8 +3220,8 @@ async def handle_cancel_delete_anime_callback(client: Client, callback_query: Ca
     message_id = callback_query.message.id
     data = callback_query.data # content_cancel_delete_anime|<anime_id>
 
-    if user_id not in config.ADMIN_IDS: await client.answer_callback_query(message.id, "🚫 Unauthorized."); return
-    try: await client.answer_callback_query(message.id, strings.ACTION_CANCELLED) # Toast
+    if user_id not in config.ADMIN_IDS: await answer_callback(callback_query, "🚫 Unauthorized.", show_alert=True); return
+    try: await answer_callback(callback_query, strings.ACTION_CANCELLED) # Toast
     except Exception: pass
 
     user_state = await get_user_state(user_id)
@@ -3200,7 +3248,7 @@ async def handle_cancel_delete_anime_callback(client: Client, callback_query: Ca
         await set_user_state(user_id, "content_management", ContentState.MANAGING_ANIME_MENU, data={"anime_id": anime_id_str, "anime_name": anime_name})
 
         # Fetch the current anime data to redisplay the management menu.
-        anime = await MongoDB.get_anime_by_id(anime_id_str)
+        anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
 
         if anime:
              await edit_or_send_message(client, chat_id, message_id, strings.ACTION_CANCELLED, parse_mode=config.PARSE_MODE) # Edit previous message to confirm cancel
@@ -0,0 +1,428 @@
+# handlers/delivery_queue.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional, List, Dict, Any, Deque, Set, NamedTuple, Callable, Awaitable, Union, Tuple
+from pyrogram import Client
+from pyrogram.types import InputMediaDocument, InputMediaVideo
+from pyrogram.errors import FloodWait, FileIdInvalid, FileReferenceExpired, MessageNotModified
+
+import config
+import strings
+
+from database.mongo_db import MongoDB
+from database.search_index import SearchIndex
+from database.download_events import DownloadEvents
+
+from .file_health import FileHealth
+from .reachability import Reachability, UNREACHABLE_ERRORS
+
+
+delivery_logger = logging.getLogger(__name__) # Logger for this module
+
+# File downloads are delivered by a worker pool instead of inside the callback:
+# - download callbacks validate, reserve tokens and enqueue; the answer no longer waits on Telegram uploads
+# - jobs wait per user (at most one send in flight per user); users with work queue up FIFO in _ready
+# - every Telegram call takes a token from the global bucket (bot-wide limit) and from the chat's bucket
+# - a FloodWait pauses the global bucket for its duration, so all workers back off together, then the call is retried
+# - a send failing on a stale file_id is retried once with the id FileHealth.repair() refreshes from the storage channel
+# - a job that finally fails refunds the tokens reserved for it
+# Batch downloads (DeliveryBatch) are one job: media groups of up to MEDIA_GROUP_SIZE files, one live progress message.
+# InFlightDownloads drops repeats of a download (same user, same file or batch) from its callback until the worker is
+# done with it, plus DOWNLOAD_DEDUP_COOLDOWN_SECONDS for client resends arriving after the delivery.
+_CHAT_BUCKETS_MAX = 2048 # Idle per-chat buckets are dropped beyond this many
+_DEDUP_PRUNE_AT = 4096 # Registry size that triggers dropping expired keys
+MEDIA_GROUP_SIZE = 10 # Telegram's maximum items per media group
+_VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.webm')
+_STALE_FILE_ERRORS = (FileIdInvalid, FileReferenceExpired)
+
+
+def is_video_file(file_name: Optional[str], mime_type: Optional[str] = None) -> bool:
+    """Videos go out with send_video (streamable in the client), everything else as documents."""
+    return (mime_type or "").startswith('video/') or bool(file_name and file_name.lower().endswith(_VIDEO_EXTENSIONS))
+
+
+class DeliveryJob(NamedTuple):
+    """One file to send. charged_tokens were reserved at enqueue time and are refunded if delivery fails."""
+    user_id: int
+    chat_id: int
+    file_id: str
+    file_name: Optional[str]
+    is_video: bool
+    anime_id_str: str
+    file_unique_id: str
+    season_number: int
+    episode_number: int
+    quality: Optional[str]
+    file_size_bytes: int
+    charged_tokens: int
+    enqueued_at: float
+
+
+class BatchFile(NamedTuple):
+    episode_number: int
+    file_id: str
+    file_unique_id: str
+    is_video: bool
+    quality: Optional[str]
+    file_size_bytes: int
+
+
+class DeliveryBatch(NamedTuple):
+    """Several files for one user (a season or episode range), sent in order with a live-edited progress message."""
+    user_id: int
+    chat_id: int
+    anime_id_str: str
+    season_number: int
+    title: str # Shown in the progress message, e.g. "Naruto - Season 1"
+    files: List[BatchFile]
+    tokens_per_file: int # Reserved for every file at enqueue time; refunded per file that fails
+    progress_message_id: int
+    enqueued_at: float
+    dedup_key: str # InFlightDownloads key of the batch callback ("<anime_id>|<season>|<first>|<last>")
+
+
+def dedup_key_of(job: Union[DeliveryJob, DeliveryBatch]) -> str:
+    return job.dedup_key if isinstance(job, DeliveryBatch) else job.file_unique_id
+
+
+class InFlightDownloads:
+    """(user_id, file) keys of downloads being queued, waiting or sent, with expiry times (monotonic)."""
+    _expires: Dict[Tuple[int, str], float] = {}
+    _queued: Set[Tuple[int, str]] = set() # Claims handed over to the delivery queue; the worker releases them
+    _handed_off: Set[Tuple[int, str]] = set() # Claims queued by a callback that hasn't returned yet (may be released already)
+    dropped: int = 0 # Repeats dropped, for /delivery_report
+
+    @classmethod
+    def claim(cls, user_id: int, key: str) -> bool:
+        """True if the caller now owns this download; False for a repeat of one in flight or just delivered."""
+        now = time.monotonic()
+        if cls._expires.get((user_id, key), 0.0) > now:
+            cls.dropped += 1
+            return False
+        if len(cls._expires) >= _DEDUP_PRUNE_AT:
+            for expired in [entry for entry, expires in cls._expires.items() if expires <= now and entry not in cls._queued]: del cls._expires[expired]
+        cls._expires[(user_id, key)] = now + config.DOWNLOAD_DEDUP_TTL_SECONDS # Bound in case a claim is never released
+        return True
+
+
+    @classmethod
+    def mark_queued(cls, user_id: int, key: str):
+        cls._queued.add((user_id, key))
+        cls._handed_off.add((user_id, key))
+
+
+    @classmethod
+    def abandon(cls, user_id: int, key: str):
+        """
+        End of the download callback: a claim that wasn't queued (refusal, error) is freed at once. A queued one is left
+        to the worker, even when it was already delivered and released while the callback was still running.
+        """
+        if (user_id, key) in cls._handed_off: cls._handed_off.discard((user_id, key))
+        else: cls._expires.pop((user_id, key), None)
+
+
+    @classmethod
+    def release(cls, user_id: int, key: str):
+        """Delivery finished: repeats stay blocked for DOWNLOAD_DEDUP_COOLDOWN_SECONDS more."""
+        cls._queued.discard((user_id, key))
+        cls._expires[(user_id, key)] = time.monotonic() + config.DOWNLOAD_DEDUP_COOLDOWN_SECONDS
+
+
+class TokenBucket:
+    """Async token bucket: `rate` calls per second, bursts up to `capacity`. pause() blocks every caller for a while."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None # Created lazily inside the running event loop; waiters queue FIFO
+
+    async def acquire(self, cost: int = 1):
+        needed = min(cost, self.capacity) # A call costing more than the burst waits for a full bucket
+        if self._lock is None: self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= needed
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until # Refilling starts when the pause ends, not with a burst credited for the pause
+
+    def is_idle(self) -> bool:
+        return (self._lock is None or not self._lock.locked()) and self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+def _percentile(samples: Deque[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(round(fraction * (len(ordered) - 1)))] if ordered else 0.0
+
+
+class DeliveryQueue:
+    """Bounded delivery queue with a worker pool, global and per-chat rate limits, and delivery metrics."""
+    _client: Optional[Client] = None
+    _pending: Dict[int, Deque[DeliveryJob]] = {} # user_id -> jobs waiting, oldest first
+    _ready: Optional[asyncio.Queue] = None # user ids with pending jobs and nothing in flight
+    _in_flight: Set[int] = set() # user ids a worker is sending to
+    _depth: int = 0 # Jobs waiting (not in flight) across all users
+    _global_bucket = TokenBucket(config.DELIVERY_GLOBAL_RATE, config.DELIVERY_GLOBAL_BURST)
+    _chat_buckets: Dict[int, TokenBucket] = {}
+    _workers: List[asyncio.Task] = []
+    _wait_ms: Deque[float] = deque(maxlen=config.DELIVERY_STATS_SAMPLES) # Enqueue -> worker picked the job
+    _send_ms: Deque[float] = deque(maxlen=config.DELIVERY_STATS_SAMPLES) # Worker picked the job -> file delivered
+    _counters: Dict[str, int] = {"sent": 0, "failed": 0, "rejected": 0, "flood_waits": 0}
+
+    @classmethod
+    def start(cls, client: Client):
+        """Starts the worker pool (main.py, once the bot is connected)."""
+        if cls._workers: return
+        cls._client = client
+        cls._ready = asyncio.Queue()
+        cls._workers = [asyncio.create_task(cls._worker(number)) for number in range(config.DELIVERY_WORKERS)]
+        delivery_logger.info(f"Delivery queue started with {config.DELIVERY_WORKERS} workers.")
+
+
+    @classmethod
+    def is_running(cls) -> bool: return bool(cls._workers)
+
+
+    @classmethod
+    def pending_for_user(cls, user_id: int) -> int:
+        return len(cls._pending.get(user_id) or ()) + (1 if user_id in cls._in_flight else 0)
+
+
+    @classmethod
+    def enqueue(cls, job: Union[DeliveryJob, DeliveryBatch]) -> Optional[int]:
+        """Queues a job. Returns its position in the queue, or None when the queue (or the user's share) is full."""
+        if cls._ready is None: return None # Workers not started
+        user_jobs = cls._pending.get(job.user_id)
+        if cls._depth >= config.DELIVERY_QUEUE_MAX or cls.pending_for_user(job.user_id) >= config.DELIVERY_MAX_PER_USER:
+            cls._counters["rejected"] += 1
+            return None
+        if user_jobs is None: user_jobs = cls._pending[job.user_id] = deque()
+        user_jobs.append(job)
+        cls._depth += 1
+        # A user already waiting in _ready or in flight is re-queued by the worker when their current send ends
+        if len(user_jobs) == 1 and job.user_id not in cls._in_flight: cls._ready.put_nowait(job.user_id)
+        InFlightDownloads.mark_queued(job.user_id, dedup_key_of(job))
+        return cls._depth
+
+
+    @classmethod
+    def _chat_bucket(cls, chat_id: int) -> TokenBucket:
+        bucket = cls._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(cls._chat_buckets) >= _CHAT_BUCKETS_MAX:
+                for idle_chat_id in [key for key, value in cls._chat_buckets.items() if value.is_idle()]: del cls._chat_buckets[idle_chat_id]
+            bucket = cls._chat_buckets[chat_id] = TokenBucket(config.DELIVERY_CHAT_RATE, config.DELIVERY_CHAT_BURST)
+        return bucket
+
+
+    @classmethod
+    async def call(cls, chat_id: int, send: Callable[[], Awaitable[Any]], cost: int = 1) -> Any:
+        """
+        One rate-limited Telegram call: the chat's tokens first (so a busy chat doesn't burn global tokens),
+        then global ones. `cost` is the number of messages the call produces (media groups).
+        FloodWait pauses the global bucket and retries, up to DELIVERY_MAX_ATTEMPTS.
+        """
+        for attempt in range(1, config.DELIVERY_MAX_ATTEMPTS + 1):
+            await cls._chat_bucket(chat_id).acquire(cost)
+            await cls._global_bucket.acquire(cost)
+            try: return await send()
+            except FloodWait as e:
+                cls._counters["flood_waits"] += 1
+                cls._global_bucket.pause(e.value)
+                delivery_logger.warning(f"FloodWait of {e.value}s sending to chat {chat_id} (attempt {attempt}/{config.DELIVERY_MAX_ATTEMPTS}). Pausing all deliveries.")
+                if attempt == config.DELIVERY_MAX_ATTEMPTS: raise
+
+
+    @classmethod
+    async def _worker(cls, number: int):
+        while True:
+            user_id = await cls._ready.get()
+            user_jobs = cls._pending.get(user_id)
+            if not user_jobs:
+                cls._pending.pop(user_id, None)
+                continue
+            job = user_jobs.popleft()
+            cls._depth -= 1
+            cls._in_flight.add(user_id)
+            picked_at = time.monotonic()
+            cls._wait_ms.append((picked_at - job.enqueued_at) * 1000)
+            try:
+                if isinstance(job, DeliveryBatch): await cls._deliver_batch(job)
+                else: await cls._deliver(job)
+            except asyncio.CancelledError: raise
+            except Exception as e: delivery_logger.error(f"Delivery worker {number} failed on a job for anime {job.anime_id_str} for user {user_id}: {e}", exc_info=True)
+            finally:
+                cls._send_ms.append((time.monotonic() - picked_at) * 1000)
+                cls._in_flight.discard(user_id)
+                InFlightDownloads.release(user_id, dedup_key_of(job))
+                if user_jobs: cls._ready.put_nowait(user_id) # Next job of this user goes to the back of the line
+                else: cls._pending.pop(user_id, None)
+
+
+    @classmethod
+    async def _send_file(cls, chat_id: int, file_id: str, is_video: bool, file_name: Optional[str] = None):
+        client = cls._client
+        if is_video: await cls.call(chat_id, lambda: client.send_video(chat_id=chat_id, video=file_id, parse_mode=config.PARSE_MODE))
+        else: await cls.call(chat_id, lambda: client.send_document(chat_id=chat_id, document=file_id, file_name=file_name, parse_mode=config.PARSE_MODE))
+
+
+    @classmethod
+    async def _send_or_repair(cls, chat_id: int, anime_id_str: str, file_unique_id: str, file_id: str, is_video: bool, file_name: Optional[str] = None):
+        """Sends a file; on a stale file_id, once more with the id refreshed from the storage channel."""
+        try: await cls._send_file(chat_id, file_id, is_video, file_name)
+        except _STALE_FILE_ERRORS:
+            fresh_file_id = await FileHealth.repair(anime_id_str, file_unique_id)
+            if not fresh_file_id: raise
+            await cls._send_file(chat_id, fresh_file_id, is_video, file_name)
+
+
+    @classmethod
+    async def _deliver(cls, job: DeliveryJob):
+        client = cls._client
+        try:
+            await cls._send_or_repair(job.chat_id, job.anime_id_str, job.file_unique_id, job.file_id, job.is_video, job.file_name)
+        except _STALE_FILE_ERRORS:
+            delivery_logger.error(f"Invalid File ID stored in DB for unique ID {job.file_unique_id} of anime {job.anime_id_str} requested by {job.user_id}. DB File ID: {job.file_id}.")
+            await cls._fail(job, "💔 Error sending file: The file ID appears invalid or expired.")
+            return
+        except UNREACHABLE_ERRORS as e:
+            delivery_logger.info(f"User {job.user_id} can't be reached ({type(e).__name__}); refunding their download.")
+            Reachability.mark_unreachable(job.user_id, e)
+            cls._counters["failed"] += 1
+            await cls.refund(job.user_id, job.charged_tokens)
+            return
+        except Exception as e:
+            delivery_logger.error(f"Failed to send file version {job.file_unique_id} of anime {job.anime_id_str} to user {job.user_id}: {e}", exc_info=True)
+            await cls._fail(job, strings.FILE_SEND_ERROR)
+            return
+
+        cls._counters["sent"] += 1
+        delivery_logger.info(f"User {job.user_id} successfully sent file version {job.file_unique_id} ({job.file_id}).")
+        DownloadEvents.record(job.user_id, job.anime_id_str, job.season_number, job.episode_number, job.quality, job.file_size_bytes, (time.monotonic() - job.enqueued_at) * 1000)
+        await MongoDB.increment_download_counts(user_id=job.user_id, anime_id=job.anime_id_str)
+        SearchIndex.bump_download_count(job.anime_id_str)
+        try: await cls.call(job.chat_id, lambda: client.send_message(job.chat_id, strings.FILE_SENT_SUCCESS, parse_mode=config.PARSE_MODE))
+        except Exception as e: delivery_logger.warning(f"Failed to send delivery confirmation to user {job.user_id}: {e}")
+
+
+    @classmethod
+    async def _send_batch_group(cls, job: DeliveryBatch, group: List[BatchFile]) -> List[BatchFile]:
+        """Sends files as one media group (or a single send). Returns the files that could not be delivered."""
+        client = cls._client
+        try:
+            if len(group) == 1: await cls._send_or_repair(job.chat_id, job.anime_id_str, group[0].file_unique_id, group[0].file_id, group[0].is_video)
+            else:
+                media = [InputMediaVideo(batch_file.file_id) if batch_file.is_video else InputMediaDocument(batch_file.file_id) for batch_file in group]
+                await cls.call(job.chat_id, lambda: client.send_media_group(job.chat_id, media), cost=len(group))
+            return []
+        except UNREACHABLE_ERRORS as e:
+            delivery_logger.info(f"User {job.user_id} can't be reached ({type(e).__name__}); stopping their batch.")
+            Reachability.mark_unreachable(job.user_id, e)
+            return list(group)
+        except Exception as e:
+            if len(group) == 1:
+                delivery_logger.error(f"Failed to send batch file {group[0].file_unique_id} (E{group[0].episode_number}) of anime {job.anime_id_str} to user {job.user_id}: {e}")
+                return list(group)
+            # One bad file_id fails the whole group: retry the files one by one to isolate it
+            delivery_logger.warning(f"Media group of {len(group)} files failed for user {job.user_id}: {e}. Retrying individually.")
+            failed: List[BatchFile] = []
+            for batch_file in group: failed += await cls._send_batch_group(job, [batch_file])
+            return failed
+
+
+    @classmethod
+    async def _edit_progress(cls, job: DeliveryBatch, text: str):
+        try: await cls.call(job.chat_id, lambda: cls._client.edit_message_text(job.chat_id, job.progress_message_id, text, parse_mode=config.PARSE_MODE))
+        except MessageNotModified: pass
+        except Exception as e: delivery_logger.warning(f"Failed to update batch progress message for user {job.user_id}: {e}")
+
+
+    @classmethod
+    async def _deliver_batch(cls, job: DeliveryBatch):
+        # Consecutive files of the same kind form a media group (Telegram doesn't mix documents with videos)
+        groups: List[List[BatchFile]] = []
+        for batch_file in job.files:
+            if groups and len(groups[-1]) < MEDIA_GROUP_SIZE and groups[-1][0].is_video == batch_file.is_video: groups[-1].append(batch_file)
+            else: groups.append([batch_file])
+
+        done = 0
+        failed: List[BatchFile] = []
+        for group in groups:
+            if Reachability.is_unreachable(job.user_id): # Blocked the bot mid-batch: the rest can't be delivered either
+                failed += group
+                continue
+            await cls._edit_progress(job, strings.BATCH_PROGRESS.format(title=job.title, done=done, total=len(job.files)))
+            group_failed = await cls._send_batch_group(job, group)
+            latency_ms = (time.monotonic() - job.enqueued_at) * 1000
+            for batch_file in group:
+                if batch_file not in group_failed: DownloadEvents.record(job.user_id, job.anime_id_str, job.season_number, batch_file.episode_number, batch_file.quality, batch_file.file_size_bytes, latency_ms, batch=True)
+            failed += group_failed
+            done += len(group)
+
+        delivered = len(job.files) - len(failed)
+        cls._counters["sent"] += delivered
+        cls._counters["failed"] += len(failed)
+        delivery_logger.info(f"Batch for user {job.user_id} ({job.title}): {delivered}/{len(job.files)} files delivered.")
+        if delivered:
+            await MongoDB.increment_download_counts(user_id=job.user_id, anime_id=job.anime_id_str, count=delivered)
+            SearchIndex.bump_download_count(job.anime_id_str, delivered)
+        await cls.refund(job.user_id, len(failed) * job.tokens_per_file)
+
+        if failed: text = strings.BATCH_DONE_WITH_FAILURES.format(title=job.title, delivered=delivered, total=len(job.files), failed_episodes=", ".join(str(batch_file.episode_number) for batch_file in failed))
+        else: text = strings.BATCH_DONE.format(title=job.title, total=len(job.files))
+        await cls._edit_progress(job, text)
+
+
+    @classmethod
+    async def _fail(cls, job: DeliveryJob, text: str):
+        cls._counters["failed"] += 1
+        await cls.refund(job.user_id, job.charged_tokens)
+        try: await cls.call(job.chat_id, lambda: cls._client.send_message(job.chat_id, text, parse_mode=config.PARSE_MODE))
+        except Exception as e: delivery_logger.warning(f"Failed to tell user {job.user_id} about a failed delivery: {e}")
+
+
+    @staticmethod
+    async def reserve_tokens(user_id: int, amount: int) -> bool:
+        """Atomically takes `amount` tokens if the balance allows it (no double spend across queued downloads)."""
+        if amount <= 0: return True
+        result = await MongoDB.users_collection().update_one({"user_id": user_id, "tokens": {"$gte": amount}}, {"$inc": {"tokens": -amount}})
+        return result.modified_count == 1
+
+
+    @staticmethod
+    async def refund(user_id: int, amount: int):
+        if amount <= 0: return
+        try:
+            await MongoDB.users_collection().update_one({"user_id": user_id}, {"$inc": {"tokens": amount}})
+            delivery_logger.info(f"Refunded {amount} tokens to user {user_id} for an undelivered file.")
+        except Exception as e:
+            delivery_logger.error(f"Failed to refund {amount} tokens to user {user_id}: {e}", exc_info=True)
+
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Queue depth, in-flight sends, wait and send latency percentiles (last DELIVERY_STATS_SAMPLES jobs), counters."""
+        return {
+            "depth": cls._depth, "in_flight": len(cls._in_flight), "users_waiting": len(cls._pending),
+            "wait_p50_ms": _percentile(cls._wait_ms, 0.5), "wait_p95_ms": _percentile(cls._wait_ms, 0.95),
+            "send_p50_ms": _percentile(cls._send_ms, 0.5), "send_p95_ms": _percentile(cls._send_ms, 0.95),
+            "paused_for": max(0.0, cls._global_bucket.paused_until - time.monotonic()),
+            "duplicates_dropped": InFlightDownloads.dropped,
+            **cls._counters
+        }
@@ -1,7 +1,8 @@
 # handlers/download_handler.py
 import logging
 import asyncio
-from typing import Union, List, Dict, Any
+import time
+from typing import Union, List, Dict, Any, Tuple
 from pyrogram import Client, filters
 from pyrogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton,
@@ -16,10 +17,18 @@ from pyrogram.errors import (
 import config
 import strings
 
-from database.mongo_db import MongoDB
+from database.mongo_db import MongoDB, ANIME_SUMMARY_PROJECTION
 from database.mongo_db import get_user_state, set_user_state, clear_user_state # State management
 from database.mongo_db import increment_download_counts # Helper to update counters
 from database.models import User, Anime, Season, Episode, FileVersion # Import models
+from database.search_index import SearchIndex # Mirror download counts into the in-memory ranking
+
+from database.episode_pages import EpisodePage, fetch_episode_page, page_of_episode, page_bounds # Paginated episode grid
+from database.episode_pages import fetch_batch_selection # Whole-season / episode-range downloads
+
+from .menu_cache import MenuCache, RenderedMenu
+from .callback_ack import answer_callback
+from .delivery_queue import DeliveryQueue, DeliveryJob, DeliveryBatch, BatchFile, InFlightDownloads, is_video_file
 
 
 async def get_user(client: Client, user_id: int) -> Optional[User]: pass # Assume accessible
@@ -54,7 +63,7 @@ async def download_select_season_callback(client: Client, callback_query: Callba
     message_id = callback_query.message.id # Message containing the season buttons
     data = callback_query.data # download_select_season|<anime_id>|<season_number>
 
-    try: await client.answer_callback_query(message.id, "Loading episodes for season...")
+    try: await answer_callback(callback_query, "Loading episodes for season...")
     except Exception: download_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
     user_state = await MongoDB.get_user_state(user_id)
@@ -86,32 +95,23 @@ async def download_select_season_callback(client: Client, callback_query: Callba
 
         download_logger.info(f"User {user_id} selecting season {season_number} for anime {anime_id_str} for download.")
 
-        # Fetch the specific anime document, projecting only the needed season and its episodes.
-        filter_query = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number}
-        projection = {"name": 1, "seasons.$": 1} # Project name and the matched season
-
-        anime_doc = await MongoDB.anime_collection().find_one(filter_query, projection)
+        # Fetch the first page of the season's episode grid only (numbers and availability flags, never the files arrays).
+        episode_page = await fetch_episode_page(anime_id_str, season_number)
 
-        # Validate if anime/season found and episodes list exists
-        if not anime_doc or not anime_doc.get("seasons") or not anime_doc["seasons"][0] or not anime_doc["seasons"][0].get("episodes"):
-            download_logger.error(f"Anime/Season {anime_id_str}/S{season_number} not found or has no episodes for download for user {user_id}. Doc: {anime_doc}")
+        # Validate if anime/season found and has episodes
+        if not episode_page or not episode_page.episode_total:
+            download_logger.error(f"Anime/Season {anime_id_str}/S{season_number} not found or has no episodes for download for user {user_id}. Page: {episode_page}")
             await edit_or_send_message(client, chat_id, message_id, "💔 Error: Anime or season not found, or no episodes available.", disable_web_page_preview=True)
              # State is 'viewing_anime_details'. Keep it? Or go back to details menu.
              # Go back to anime details menu for safety. Fetch the full anime doc.
-            full_anime = await MongoDB.get_anime_by_id(anime_id_str)
+            full_anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
             if full_anime: await search_handler.display_user_anime_details_menu(client, callback_query.message, full_anime)
             else: await MongoDB.clear_user_state(user_id); return
 
 
             return # Stop
 
-        anime_name = anime_doc.get("name", "Anime Name Unknown")
-        season_data = anime_doc["seasons"][0] # The matched season data
-        episodes = season_data.get("episodes", []) # The episodes list from the season
-
-
-        # Sort episodes numerically
-        episodes.sort(key=lambda e: e.get("episode_number", 0))
+        anime_name = episode_page.anime_name
 
         # --- Transition to Selecting Episode State ---
         # State indicates we are viewing episode list for a season, preserve context (anime_id, season_number, name).
@@ -123,8 +123,8 @@ async def download_select_season_callback(client: Client, callback_query: Callba
          )
 
 
-        # Display the list of episodes for the selected season to the user.
-        await display_user_episode_list(client, callback_query.message, anime_name, season_number, episodes) # Pass message to edit
+        # Display the first page of episodes for the selected season to the user.
+        await display_user_episode_list(client, callback_query.message, season_number, episode_page=episode_page) # Pass message to edit
 
 
     except ValueError:
@@ -138,92 +138,322 @@ async def download_select_season_callback(client: Client, callback_query: Callba
         await MongoDB.clear_user_state(user_id);
 
 
-# Helper to display list of episodes for a season (User View)
-# Called from download_select_season_callback and after action in episode view that returns here (e.g., deleting file? Not applicable for user. Back button from version select)
-async def display_user_episode_list(client: Client, message: Message, anime_name: str, season_number: int, episodes: List[Dict]):
+# Callback triggered by the episode grid's Previous/Next and range jump buttons, and by Back from the versions list.
+# Catches callbacks: download_episode_page|<anime_id>|<season_number>|<page>
+@Client.on_callback_query(filters.regex(f"^download_episode_page{config.CALLBACK_DATA_SEPARATOR}.*{config.CALLBACK_DATA_SEPARATOR}.*{config.CALLBACK_DATA_SEPARATOR}.*") & filters.private)
+async def download_episode_page_callback(client: Client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.id
+    data = callback_query.data # download_episode_page|<anime_id>|<season>|<page>
+
+    try: await answer_callback(callback_query)
+    except Exception: download_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
+
+    user_state = await MongoDB.get_user_state(user_id)
+
+    # Page turns happen on the episode list; Back from the versions list also lands here
+    if not (user_state and user_state.handler == "download" and user_state.step in (DownloadState.SELECTING_EPISODE, DownloadState.SELECTING_VERSION)):
+        download_logger.warning(f"User {user_id} in unexpected state {user_state.handler if user_state else 'None'}:{user_state.step if user_state else 'None'} clicking episode page {data}. Clearing state.")
+        await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state. Please return to the Anime Details menu or main menu.", disable_web_page_preview=True)
+        await MongoDB.clear_user_state(user_id); return
+
+    try:
+        parts = data.split(config.CALLBACK_DATA_SEPARATOR)
+        if len(parts) != 4: raise ValueError("Invalid callback data format for episode page.")
+        anime_id_str = parts[1]
+        season_number = int(parts[2])
+        page = int(parts[3])
+
+        if user_state.data.get("anime_id") != anime_id_str or user_state.data.get("season_number") != season_number:
+            download_logger.warning(f"User {user_id} state anime/season mismatch for episode page: {user_state.data.get('anime_id')}/S{user_state.data.get('season_number')} vs callback {anime_id_str}/S{season_number}. Clearing state.")
+            await edit_or_send_message(client, chat_id, message_id, "💔 Error: Anime data mismatch in state. Process cancelled.", disable_web_page_preview=True)
+            await MongoDB.clear_user_state(user_id); return
+
+        if user_state.step != DownloadState.SELECTING_EPISODE:
+            # Back from the versions list: drop the episode context, keep anime/season
+            await MongoDB.set_user_state(
+                 user_id,
+                 "download",
+                 DownloadState.SELECTING_EPISODE,
+                 data={"anime_id": anime_id_str, "season_number": season_number, "anime_name": user_state.data.get("anime_name")}
+             )
+
+        await display_user_episode_list(client, callback_query.message, season_number, page)
+
+    except ValueError:
+        download_logger.warning(f"User {user_id} invalid episode page data in callback: {data}")
+        await edit_or_send_message(client, chat_id, message_id, "🚫 Invalid page data in callback.", disable_web_page_preview=True)
+
+    except Exception as e:
+        download_logger.error(f"FATAL error handling download_episode_page callback {data} for user {user_id}: {e}", exc_info=True)
+        await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
+        await MongoDB.clear_user_state(user_id);
+
+
+# Helper to display one page of the episode grid for a season (User View)
+# Called from download_select_season_callback, episode page turns/range jumps, and error paths returning to the list.
+# page None shows the first page; episode_page is passed when the caller already fetched that page.
+async def display_user_episode_list(client: Client, message: Message, season_number: int, page: Optional[int] = None, episode_page: Optional[EpisodePage] = None):
     user_id = message.from_user.id
     chat_id = message.chat.id
     message_id = message.id # Message containing the episode list
 
+    # Callback data needs anime_id from state context, as message.message only has message_id not originating button data always
+    user_state = await MongoDB.get_user_state(user_id)
+    anime_id_str = user_state.data.get("anime_id") if user_state else None # Anime ID must be in state
+    if not anime_id_str:
+        download_logger.error(f"Missing anime_id in state data while displaying user episode list for user {user_id}. State: {user_state.data if user_state else None}")
+        await edit_or_send_message(client, chat_id, message_id, "💔 Error loading episode list context. Please try again.", disable_web_page_preview=True)
+        await MongoDB.clear_user_state(user_id); return # Critical error
+
+    # Each grid page is the same for every user: rendered once per anime/season/page until its episodes or files change
+    rendered_menu = MenuCache.get("episodes", (anime_id_str, season_number, page))
+    if rendered_menu is None:
+        if episode_page is None: episode_page = await fetch_episode_page(anime_id_str, season_number, page)
+        if episode_page is None:
+            download_logger.error(f"Anime/Season {anime_id_str}/S{season_number} not found while displaying episode page {page} for user {user_id}.")
+            await edit_or_send_message(client, chat_id, message_id, "💔 Error loading episode list.", disable_web_page_preview=True)
+            await MongoDB.clear_user_state(user_id); return
+        rendered_menu = _render_user_episode_list(anime_id_str, season_number, episode_page)
+        if episode_page.episode_total: MenuCache.put("episodes", (anime_id_str, season_number, page), rendered_menu, anime_ids=[anime_id_str]) # Never cache an empty season
+
+    # Edit the current message to display this episode page.
+    await edit_or_send_message(client, chat_id, message_id, rendered_menu.text, rendered_menu.markup(), disable_web_page_preview=True)
+
+    # State is DownloadState.SELECTING_EPISODE, stays until user selects episode or navigates back/home.
+
 
-    menu_text = strings.EPISODE_LIST_TITLE_USER.format(anime_name=anime_name, season_number=season_number) + "\n\n"
+def _episode_page_callback(anime_id_str: str, season_number: int, page: int) -> str:
+    return f"download_episode_page{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{page}"
+
+
+def _render_user_episode_list(anime_id_str: str, season_number: int, episode_page: EpisodePage) -> RenderedMenu:
+    """
+    One page of the episode grid: EPISODE_GRID_COLUMNS buttons per row, Previous/Next, then range jumps.
+    With more pages than EPISODE_RANGE_BUTTONS, each range jump covers several pages so the keyboard stays bounded.
+    """
+    menu_text = strings.EPISODE_LIST_TITLE_USER.format(anime_title=episode_page.anime_name, season_number=season_number) + "\n\n"
 
     buttons = []
-    if not episodes:
+    if not episode_page.episode_total:
          # Should not happen if logic above checks for episodes, but safety.
          menu_text += "No episodes found for this season."
-         # Add Back button
-         # Get anime_id from state data to return to anime details menu
-         user_state = await MongoDB.get_user_state(user_id) # Get state for context
-         anime_id_str = user_state.data.get("anime_id")
-
-         buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=f"download_select_season{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}{config.CALLBACK_DATA_SEPARATOR}{season_number}")]) # Go back to seasons list for THIS anime
+         buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")]) # Go back to seasons list for THIS anime
          buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-         reply_markup = InlineKeyboardMarkup(buttons)
-         await edit_or_send_message(client, chat_id, message_id, menu_text, reply_markup, disable_web_page_preview=True)
-         return
+         return RenderedMenu(menu_text, buttons)
 
+    if episode_page.episodes:
+         menu_text += strings.EPISODE_GRID_PAGE_INFO.format(first=episode_page.episodes[0]["episode_number"], last=episode_page.episodes[-1]["episode_number"], total=episode_page.episode_total)
+    else: # Gap in the episode numbering
+         menu_text += "No episodes in this range."
 
-    # Create buttons for each episode
-    for episode_doc in episodes: # Episode data as dicts from DB/Pydantic
+    # Episode grid: status shown by a compact prefix (Available, Release Date set, Not Announced)
+    row = []
+    for episode_doc in episode_page.episodes:
          ep_number = episode_doc.get("episode_number")
-         # Skip invalid entries
-         if ep_number is None:
-              download_logger.warning(f"User {user_id} found episode document with no episode_number for anime {anime_name} S{season_number}. Skipping display.")
-              continue
+         if episode_doc.get("available"): ep_label = strings.EPISODE_GRID_AVAILABLE_USER.format(episode_number=ep_number)
+         elif isinstance(episode_doc.get("release_date"), datetime): ep_label = strings.EPISODE_GRID_RELEASE_DATE_USER.format(episode_number=ep_number)
+         else: ep_label = strings.EPISODE_GRID_NOT_ANNOUNCED_USER.format(episode_number=ep_number)
 
-         # Determine episode status for button label (Available, Release Date, Not Announced)
-         files = episode_doc.get("files", []) # Files list of dicts
-         release_date = episode_doc.get("release_date") # Datetime or None/missing
+         # Callback data to select this episode for version/date view: download_select_episode|<anime_id>|<season>|<ep>
+         row.append(InlineKeyboardButton(ep_label, callback_data=f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{ep_number}"))
+         if len(row) == config.EPISODE_GRID_COLUMNS:
+              buttons.append(row); row = []
+    if row: buttons.append(row)
+
+    # Previous/Next page
+    navigation_row = []
+    if episode_page.page > episode_page.first_page:
+         navigation_row.append(InlineKeyboardButton(strings.BUTTON_PREVIOUS_PAGE, callback_data=_episode_page_callback(anime_id_str, season_number, episode_page.page - 1)))
+    if episode_page.page < episode_page.last_page:
+         navigation_row.append(InlineKeyboardButton(strings.BUTTON_NEXT_PAGE, callback_data=_episode_page_callback(anime_id_str, season_number, episode_page.page + 1)))
+    if navigation_row: buttons.append(navigation_row)
+
+    # Range jumps ("1–40", "41–80", ...), each jumping to the first page of its range
+    page_count = episode_page.last_page - episode_page.first_page + 1
+    if page_count > 1:
+         pages_per_range = -(-page_count // max(config.EPISODE_RANGE_BUTTONS, 1)) # Ceiling division
+         range_buttons = []
+         for range_first_page in range(episode_page.first_page, episode_page.last_page + 1, pages_per_range):
+              range_last_page = min(range_first_page + pages_per_range - 1, episode_page.last_page)
+              if range_first_page <= episode_page.page <= range_last_page and pages_per_range == 1: continue # Current page, nothing to jump to
+              range_label = strings.EPISODE_RANGE_BUTTON.format(
+                   first=max(page_bounds(range_first_page)[0], episode_page.first_episode),
+                   last=min(page_bounds(range_last_page)[1], episode_page.last_episode)
+              )
+              range_buttons.append(InlineKeyboardButton(range_label, callback_data=_episode_page_callback(anime_id_str, season_number, range_first_page)))
+         buttons.extend(range_buttons[index:index + 3] for index in range(0, len(range_buttons), 3))
+
+    # Batch downloads: the whole season, and this page's range when the season spans several pages
+    if episode_page.episodes:
+         batch_row = [InlineKeyboardButton(strings.BUTTON_BATCH_SEASON, callback_data=_batch_callback("download_batch", anime_id_str, season_number, episode_page.first_episode, episode_page.last_episode))]
+         if page_count > 1:
+              page_first, page_last = episode_page.episodes[0]["episode_number"], episode_page.episodes[-1]["episode_number"]
+              batch_row.append(InlineKeyboardButton(strings.BUTTON_BATCH_RANGE.format(first=page_first, last=page_last), callback_data=_batch_callback("download_batch", anime_id_str, season_number, page_first, page_last)))
+         buttons.append(batch_row)
 
-         ep_label = strings.EPISODE_FORMAT_AVAILABLE_USER.format(episode_number=ep_number) # Base label "🎬 EPXX"
+    # Add navigation buttons: Back to Seasons List, Back to Main Menu.
+    # Back button returns to seasons list display: browse_select_anime|<anime_id> re-displays details with season options
+    buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")]) # Pass anime ID back to browse handler
+    buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]) # Main menu
 
-         if files:
-              ep_label += f" ✅" # Indicator if files exist
-         elif isinstance(release_date, datetime): # Check if it's a datetime object
-              formatted_date = release_date.astimezone(timezone.utc).strftime('%Y-%m-%d') # Format date
-              ep_label = strings.EPISODE_FORMAT_RELEASE_DATE_USER.format(episode_number=ep_number, release_date=formatted_date) # Full date label
-         else: # Neither files nor release date
-              ep_label = strings.EPISODE_FORMAT_NOT_ANNOUNCED_USER.format(episode_number=ep_number) # Full 'Not Announced' label
+    return RenderedMenu(menu_text, buttons)
 
 
-         # Callback data to select this episode for version/date view: download_select_episode|<anime_id>|<season>|<ep>
-         # Needs anime_id from state context, as message.message only has message_id not originating button data always
-         user_state = await MongoDB.get_user_state(user_id) # Get state for anime_id context
-         anime_id_str = user_state.data.get("anime_id") # Anime ID must be in state
+# --- Batch Downloads (Whole Season / Episode Range) ---
+# download_batch|<anime_id>|<season>|<first_ep>|<last_ep>     -> confirmation with file count, size and token cost
+# download_batch_go|<anime_id>|<season>|<first_ep>|<last_ep>  -> reserve tokens for every file, queue one DeliveryBatch
+# Both resolve the files with one aggregation (best quality per episode); the delivery queue sends them as media groups
+# and live-edits the confirmation message with the progress.
 
-         if not anime_id_str:
-              download_logger.error(f"Missing anime_id in state data while displaying user episode list for user {user_id}. State: {user_state.data}")
-              await edit_or_send_message(client, chat_id, message_id, "💔 Error loading episode list context. Please try again.", disable_web_page_preview=True)
-              await MongoDB.clear_user_state(user_id); return # Critical error
+def _batch_callback(prefix: str, anime_id_str: str, season_number: int, first_episode: int, last_episode: int) -> str:
+    return config.CALLBACK_DATA_SEPARATOR.join([prefix, anime_id_str, str(season_number), str(first_episode), str(last_episode)])
 
 
-         buttons.append([InlineKeyboardButton(ep_label, callback_data=f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{ep_number}")])
+def _format_size(size_bytes: int) -> str:
+    if size_bytes >= 1024 * 1024 * 1024: return strings.FILE_SIZE_FORMAT_GB.format(size=size_bytes / (1024 * 1024 * 1024))
+    return strings.FILE_SIZE_FORMAT_MB.format(size=size_bytes / (1024 * 1024))
 
 
-    # Add navigation buttons: Back to Seasons List, Back to Main Menu.
-    user_state = await MongoDB.get_user_state(user_id) # Get state for context
-    anime_id_str = user_state.data.get("anime_id") # Ensure anime_id is in state
-    if not anime_id_str:
-        download_logger.error(f"Missing anime_id in state data while building buttons for user episode list for user {user_id}. State: {user_state.data}")
-        # Add only basic back to menu buttons if context is broken
-        buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-    else:
-        # Back button returns to seasons list display (needs original anime_id)
-        # Need to trigger the handler browse_select_anime|<anime_id> to re-display details with season options
-        # The browse_select_anime handler needs anime_id in the callback.
-        # It requires passing the original anime_id from the state data.
-        buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")]) # Pass anime ID back to browse handler
+async def _batch_context(client: Client, callback_query: CallbackQuery) -> Optional[Tuple[str, int, int, int]]:
+    """(anime_id, season, first, last) of a batch callback once the user's state matches it; handles errors itself."""
+    user_id = callback_query.from_user.id
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.id
+    data = callback_query.data
 
+    user_state = await MongoDB.get_user_state(user_id)
+    # Batch buttons live on the episode grid; the confirmation screen keeps the same state
+    if not (user_state and user_state.handler == "download" and user_state.step in (DownloadState.SELECTING_EPISODE, DownloadState.SELECTING_VERSION)):
+        download_logger.warning(f"User {user_id} in unexpected state {user_state.handler if user_state else 'None'}:{user_state.step if user_state else 'None'} clicking batch download {data}. Clearing state.")
+        await edit_or_send_message(client, chat_id, message_id, "🔄 Invalid state. Please return to the Anime Details menu or main menu.", disable_web_page_preview=True)
+        await MongoDB.clear_user_state(user_id); return None
 
-        buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]) # Main menu
+    try:
+        parts = data.split(config.CALLBACK_DATA_SEPARATOR)
+        if len(parts) != 5: raise ValueError("Invalid callback data format for batch download.")
+        anime_id_str, season_number, first_episode, last_episode = parts[1], int(parts[2]), int(parts[3]), int(parts[4])
+    except ValueError:
+        download_logger.warning(f"User {user_id} invalid batch download data in callback: {data}")
+        await edit_or_send_message(client, chat_id, message_id, "🚫 Invalid download data.", disable_web_page_preview=True)
+        return None
 
-    reply_markup = InlineKeyboardMarkup(buttons)
+    if user_state.data.get("anime_id") != anime_id_str or user_state.data.get("season_number") != season_number:
+        download_logger.warning(f"User {user_id} state anime/season mismatch for batch download: {user_state.data.get('anime_id')}/S{user_state.data.get('season_number')} vs callback {anime_id_str}/S{season_number}. Clearing state.")
+        await edit_or_send_message(client, chat_id, message_id, "💔 Error: Anime data mismatch in state. Process cancelled.", disable_web_page_preview=True)
+        await MongoDB.clear_user_state(user_id); return None
 
-    # Edit the season selection message to display this episode list.
-    await edit_or_send_message(client, chat_id, message_id, menu_text, reply_markup, disable_web_page_preview=True)
+    return anime_id_str, season_number, first_episode, last_episode
+
+
+@Client.on_callback_query(filters.regex(f"^download_batch{config.CALLBACK_DATA_SEPARATOR}.*") & filters.private)
+async def download_batch_callback(client: Client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.id
+
+    try:
+        context = await _batch_context(client, callback_query)
+        if context is None: return
+        anime_id_str, season_number, first_episode, last_episode = context
+
+        selection = await fetch_batch_selection(anime_id_str, season_number, first_episode, last_episode)
+        back_row = [InlineKeyboardButton(strings.BUTTON_BACK, callback_data=_episode_page_callback(anime_id_str, season_number, page_of_episode(first_episode)))]
+        if selection is None or not selection.files:
+            await edit_or_send_message(client, chat_id, message_id, strings.BATCH_NOTHING_AVAILABLE, InlineKeyboardMarkup([back_row]), disable_web_page_preview=True)
+            return
+
+        user = await get_user(client, user_id)
+        if user is None:
+            await edit_or_send_message(client, chat_id, message_id, strings.DB_ERROR, disable_web_page_preview=True)
+            return
+        tokens_per_file = config.TOKENS_PER_REDEEM if user.premium_status == "free" else 0 # Same per-file cost as single downloads
+
+        files = selection.files
+        menu_text = strings.BATCH_CONFIRM.format(
+            anime_title=selection.anime_name, season_number=season_number, first=files[0]["episode_number"], last=files[-1]["episode_number"],
+            count=len(files), total_size=_format_size(sum(file_doc.get("file_size_bytes") or 0 for file_doc in files)),
+            preference=", ".join(config.BATCH_QUALITY_PREFERENCE), cost=len(files) * tokens_per_file
+        )
+        if selection.missing: menu_text += strings.BATCH_MISSING_EPISODES.format(episodes=", ".join(str(episode_number) for episode_number in selection.missing))
+        if selection.truncated: menu_text += strings.BATCH_TRUNCATED.format(count=len(files))
+
+        # Confirm sends exactly the range shown (a truncated selection ends at its last file)
+        confirm_data = _batch_callback("download_batch_go", anime_id_str, season_number, first_episode, files[-1]["episode_number"])
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(strings.BUTTON_BATCH_CONFIRM.format(count=len(files)), callback_data=confirm_data)], back_row])
+        await edit_or_send_message(client, chat_id, message_id, menu_text, reply_markup, disable_web_page_preview=True)
+
+    except Exception as e:
+        download_logger.error(f"FATAL error handling download_batch callback {callback_query.data} for user {user_id}: {e}", exc_info=True)
+        await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
+
+
+@Client.on_callback_query(filters.regex(f"^download_batch_go{config.CALLBACK_DATA_SEPARATOR}.*") & filters.private)
+async def download_batch_go_callback(client: Client, callback_query: CallbackQuery):
+    # Same repeat protection as single files, keyed by the batch's anime/season/range
+    user_id = callback_query.from_user.id
+    batch_key = callback_query.data.split(config.CALLBACK_DATA_SEPARATOR, 1)[-1]
+    if not InFlightDownloads.claim(user_id, batch_key):
+        download_logger.debug(f"User {user_id} repeated batch download {callback_query.data} while it is in flight. Dropped.")
+        await answer_callback(callback_query, strings.DOWNLOAD_ALREADY_QUEUED)
+        return
+    try: await _queue_batch_download(client, callback_query, batch_key)
+    finally: InFlightDownloads.abandon(user_id, batch_key)
 
-    # State is DownloadState.SELECTING_EPISODE, stays until user selects episode or navigates back/home.
+
+async def _queue_batch_download(client: Client, callback_query: CallbackQuery, batch_key: str):
+    user_id = callback_query.from_user.id
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.id
+
+    try:
+        context = await _batch_context(client, callback_query)
+        if context is None: return
+        anime_id_str, season_number, first_episode, last_episode = context
+
+        # Resolved again rather than trusted from the confirmation: files may have changed in between
+        selection = await fetch_batch_selection(anime_id_str, season_number, first_episode, last_episode)
+        if selection is None or not selection.files:
+            await edit_or_send_message(client, chat_id, message_id, strings.BATCH_NOTHING_AVAILABLE, disable_web_page_preview=True)
+            return
+
+        user = await get_user(client, user_id)
+        if user is None:
+            await edit_or_send_message(client, chat_id, message_id, strings.DB_ERROR, disable_web_page_preview=True)
+            return
+        tokens_per_file = config.TOKENS_PER_REDEEM if user.premium_status == "free" else 0
+        total_cost = len(selection.files) * tokens_per_file
+
+        # All-or-nothing reservation for the batch: one conditional $inc
+        if not await DeliveryQueue.reserve_tokens(user_id, total_cost):
+            download_logger.info(f"User {user_id} has {user.tokens} tokens, batch of {len(selection.files)} files needs {total_cost}.")
+            await edit_or_send_message(client, chat_id, message_id, strings.NOT_ENOUGH_TOKENS.format(required_tokens=total_cost, user_tokens=user.tokens), disable_web_page_preview=True)
+            return
+
+        batch = DeliveryBatch(
+            user_id=user_id, chat_id=chat_id, anime_id_str=anime_id_str, season_number=season_number,
+            title=strings.BATCH_TITLE.format(anime_title=selection.anime_name, season_number=season_number),
+            files=[
+                BatchFile(file_doc["episode_number"], file_doc["file_id"], file_doc["file_unique_id"], is_video_file(file_doc.get("file_name")), file_doc.get("quality_resolution"), file_doc.get("file_size_bytes") or 0)
+                for file_doc in selection.files
+            ],
+            tokens_per_file=tokens_per_file, progress_message_id=message_id, enqueued_at=time.monotonic(), dedup_key=batch_key
+        )
+        position = DeliveryQueue.enqueue(batch)
+        if position is None:
+            download_logger.warning(f"Delivery queue full, rejected a batch of {len(batch.files)} files for user {user_id}.")
+            await DeliveryQueue.refund(user_id, total_cost)
+            await edit_or_send_message(client, chat_id, message_id, strings.DELIVERY_QUEUE_FULL, disable_web_page_preview=True)
+            return
+
+        download_logger.info(f"Queued batch of {len(batch.files)} files ({anime_id_str}/S{season_number} E{first_episode}-{last_episode}) for user {user_id} at position {position}.")
+        # This message becomes the live progress message (the worker edits it)
+        await edit_or_send_message(client, chat_id, message_id, strings.BATCH_QUEUED.format(title=batch.title, count=len(batch.files), position=position), disable_web_page_preview=True)
+
+    except Exception as e:
+        download_logger.error(f"FATAL error handling download_batch_go callback {callback_query.data} for user {user_id}: {e}", exc_info=True)
+        await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
 
 
 # Callback triggered when user selects an Episode button from the Episodes list.
@@ -236,7 +466,7 @@ async def download_select_episode_callback(client: Client, callback_query: Callb
     message_id = callback_query.message.id # Message containing the episode buttons
     data = callback_query.data # download_select_episode|<anime_id>|<season>|<ep>
 
-    try: await client.answer_callback_query(message.id, "Loading download options...")
+    try: await answer_callback(callback_query, "Loading download options...")
     except Exception: download_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
     user_state = await MongoDB.get_user_state(user_id)
@@ -294,22 +524,8 @@ async def download_select_episode_callback(client: Client, callback_query: Callb
              download_logger.error(f"Anime/Season/Episode {anime_id_str}/S{season_number}E{episode_number} not found for download options for user {user_id}. Doc: {anime_doc}")
              await edit_or_send_message(client, chat_id, message_id, "💔 Error: Episode not found or data missing.", disable_web_page_preview=True)
              # State is SELECTING_EPISODE. Go back to episode list display.
-             # Needs to re-fetch episodes list for the season.
-             filter_query_season = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number}
-             projection_season_episodes = {"name": 1, "seasons.$": 1}
-             anime_doc_season = await MongoDB.anime_collection().find_one(filter_query_season, projection_season_episodes)
-             if anime_doc_season and anime_doc_season.get("seasons") and anime_doc_season["seasons"][0]:
-                  anime_name_for_list = anime_doc_season.get("name", "Anime Name Unknown")
-                  episodes_list = anime_doc_season["seasons"][0].get("episodes", [])
-                  episodes_list.sort(key=lambda e: e.get("episode_number", 0)) # Sort
-                  # State remains SELECTING_EPISODE
-                  await display_user_episode_list(client, callback_query.message, anime_name_for_list, season_number, episodes_list)
-
-             else:
-                 download_logger.error(f"Failed to fetch anime/season to re-display list after episode not found for user {user_id}. Cannot re-display list.")
-                 await edit_or_send_message(client, chat_id, message_id, "💔 Error loading episode list.", disable_web_page_preview=True)
-                 await MongoDB.clear_user_state(user_id); # Clear state
-                 return
+             # State remains SELECTING_EPISODE. Re-display the grid page the episode was picked from.
+             await display_user_episode_list(client, callback_query.message, season_number, page_of_episode(episode_number))
 
 
             return # Stop execution
@@ -324,21 +540,8 @@ async def download_select_episode_callback(client: Client, callback_query: Callb
             download_logger.error(f"Error accessing deeply nested episode data in projected document for {anime_id_str}/S{season_number}E{episode_number} for user {user_id}: {e}. Doc: {anime_doc}", exc_info=True)
             await edit_or_send_message(client, chat_id, message_id, "💔 Error accessing episode data. Cannot display download options.", disable_web_page_preview=True)
             # Go back to episode list view.
-            filter_query_season = {"_id": ObjectId(anime_id_str), "seasons.season_number": season_number}
-            projection_season_episodes = {"name": 1, "seasons.$": 1}
-            anime_doc_season = await MongoDB.anime_collection().find_one(filter_query_season, projection_season_episodes)
-            if anime_doc_season and anime_doc_season.get("seasons") and anime_doc_season["seasons"][0]:
-                 anime_name_for_list = anime_doc_season.get("name", "Anime Name Unknown")
-                 episodes_list = anime_doc_season["seasons"][0].get("episodes", [])
-                 episodes_list.sort(key=lambda e: e.get("episode_number", 0)) # Sort
-                 # State remains SELECTING_EPISODE
-                 await display_user_episode_list(client, callback_query.message, anime_name_for_list, season_number, episodes_list)
-
-            else:
-                 download_logger.error(f"Failed to fetch anime/season after episode data access error for user {user_id}. Cannot re-display list.")
-                 await edit_or_send_message(client, chat_id, message_id, "💔 Error loading episode list.", disable_web_page_preview=True)
-                 await MongoDB.clear_user_state(user_id);
-                 return
+            # State remains SELECTING_EPISODE. Re-display the grid page the episode was picked from.
+            await display_user_episode_list(client, callback_query.message, season_number, page_of_episode(episode_number))
 
 
             return # Stop execution
@@ -447,7 +650,7 @@ async def display_user_version_list(client: Client, message: Message, anime_name
          season_number_state = user_state.data.get("season_number")
 
          if anime_id_str and season_number_state is not None:
-             buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=f"download_select_season{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}{config.CALLBACK_DATA_SEPARATOR}{season_number_state}")]) # Go back to episode list
+             buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=_episode_page_callback(anime_id_str, season_number_state, page_of_episode(episode_number)))]) # Go back to this episode's grid page
          else:
               # Context missing in state for going back to episode list. Safety fallback.
               download_logger.error(f"Missing anime/season context in state data while building version list back button for user {user_id}. State: {user_state.data}")
@@ -472,18 +675,28 @@ async def display_user_version_list(client: Client, message: Message, anime_name
 
 # --- Handle Download Confirmation / File Sending ---
 # Callback triggered when user clicks a Download button on a specific version.
-# This handler performs permission checks (premium/tokens) and sends the file.
+# This handler performs permission checks (premium/tokens) and queues the file for the delivery workers.
 # Catches callbacks: download_confirm_send|<file_unique_id>
 @Client.on_callback_query(filters.regex(f"^download_confirm_send{config.CALLBACK_DATA_SEPARATOR}.*") & filters.private)
 async def download_confirm_send_callback(client: Client, callback_query: CallbackQuery):
+    # Double taps and client resends of a file still in flight are dropped before any DB or API work
+    user_id = callback_query.from_user.id
+    file_key = callback_query.data.split(config.CALLBACK_DATA_SEPARATOR, 1)[-1]
+    if not InFlightDownloads.claim(user_id, file_key):
+        download_logger.debug(f"User {user_id} repeated download {callback_query.data} while it is in flight. Dropped.")
+        await answer_callback(callback_query, strings.DOWNLOAD_ALREADY_QUEUED)
+        return
+    try: await _queue_file_download(client, callback_query)
+    finally: InFlightDownloads.abandon(user_id, file_key) # No-op once the file is queued (the worker releases it)
+
+
+async def _queue_file_download(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id # Message containing the download buttons
     data = callback_query.data # download_confirm_send|<file_unique_id>
 
-    # Answer immediately to prevent loading, indicate checking permissions.
-    try: await client.answer_callback_query(message.id, "Checking permissions...")
-    except Exception: download_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
+    # Already acknowledged by the callback middleware; the file itself is sent by the delivery queue.
 
 
     user_state = await MongoDB.get_user_state(user_id)
@@ -514,7 +727,7 @@ async def download_confirm_send_callback(client: Client, callback_query: Callbac
              # State is SELECTING_VERSION, could leave it, but redirect to episode list is better.
              # Needs season_number from state, but validate its presence.
              if anime_id_str and season_number is not None: # Need minimum context to go back to episode list
-                  await display_user_episode_list(client, callback_query.message, anime_name or "Anime", season_number, []) # Display empty list? No, fetch current episode list.
+                  await display_user_episode_list(client, callback_query.message, season_number) # First page of the season's episode grid
              else: await MongoDB.clear_user_state(user_id); return # Cannot go back, clear state
 
 
@@ -564,8 +777,7 @@ async def download_confirm_send_callback(client: Client, callback_query: Callbac
                  if episode_doc: await display_user_version_list(client, callback_query.message, anime_doc_episode.get("name", "Anime Name"), season_number, episode_number, episode_doc.get("files", []), episode_doc.get("release_date")) # Redisplay version list
 
                  else: # Episode gone? Go back to episodes list.
-                     episodes_list.sort(key=lambda e: e.get("episode_number", 0))
-                     await display_user_episode_list(client, callback_query.message, anime_doc_episode.get("name", "Anime Name"), season_number, episodes_list)
+                     await display_user_episode_list(client, callback_query.message, season_number, page_of_episode(episode_number))
 
              else:
                   download_logger.error(f"Failed to fetch anime/season after file version not found for user {user_id}. Cannot re-display.")
@@ -594,8 +806,7 @@ async def download_confirm_send_callback(client: Client, callback_query: Callbac
                   episode_doc = next((ep for ep in episodes_list if ep.get("episode_number") == episode_number), None)
                   if episode_doc: await display_user_version_list(client, callback_query.message, anime_name_for_list, season_number, episode_number, episode_doc.get("files", []), episode_doc.get("release_date"))
                   else: # Episode gone? Go back to episodes list.
-                     episodes_list.sort(key=lambda e: e.get("episode_number", 0))
-                     await display_user_episode_list(client, callback_query.message, anime_name_for_list, season_number, episodes_list)
+                     await display_user_episode_list(client, callback_query.message, season_number, page_of_episode(episode_number))
              else:
                  download_logger.error(f"Failed to fetch anime/season after file data access error for user {user_id}. Cannot re-display.")
                  await edit_or_send_message(client, chat_id, message_id, "💔 Error loading download options.", disable_web_page_preview=True)
@@ -615,130 +826,39 @@ async def download_confirm_send_callback(client: Client, callback_query: Callbac
 
 
         # --- Permission Check (Premium vs Tokens) ---
-        has_permission = False
-        required_tokens = 1 # Default tokens needed per file download (based on string format, can make configurable)
-
-        if user.premium_status != "free": # User is Premium
-            has_permission = True
-            download_logger.debug(f"User {user_id} is Premium. Allowing download for {file_unique_id}.")
-            # No token deduction for premium users
-
-        else: # Free User - Check Token Balance
-             # Required tokens per file is hardcoded to 1 for string formatting, use config if variable cost per file is needed
+        # Free users pay when the file is queued: the reservation is a conditional $inc, so several queued downloads
+        # can't spend the same tokens. The delivery queue refunds them if the file can't be delivered.
+        required_tokens = 0
+        if user.premium_status == "free":
             required_tokens = config.TOKENS_PER_REDEEM # Reusing this config for download cost? Or separate? Strings suggest 1 token = 1 file download. Let's stick to 1 fixed for now.
-            if user.tokens >= required_tokens:
-                 has_permission = True
-                 download_logger.debug(f"User {user_id} is Free, has {user.tokens} tokens. Allowing download for {file_unique_id}. Cost: {required_tokens} tokens.")
-
-            else:
-                 has_permission = False
-                 download_logger.info(f"User {user_id} is Free, has {user.tokens} tokens. Insufficient tokens ({required_tokens}) for download of {file_unique_id}.")
-                 # Display insufficient tokens message
-                 await edit_or_send_message(client, chat_id, message_id, strings.NOT_ENOUGH_TOKENS.format(required_tokens=required_tokens, user_tokens=user.tokens), disable_web_page_preview=True)
-                 # State is SELECTING_VERSION, user can earn tokens and come back.
-
-        # --- If User Has Permission, Send File ---
-        if has_permission:
-             # Send file loading message to the user. Edit the previous version list message.
-             try: await callback_query.message.edit_text(strings.FILE_BEING_SENT, parse_mode=config.PARSE_MODE)
-             except (MessageIdInvalid, MessageNotModified) as e:
-                  download_logger.warning(f"Failed to edit message {message_id} with FILE_BEING_SENT for user {user_id}: {e}. Sending as new.")
-                  await client.send_message(chat_id, strings.FILE_BEING_SENT, parse_mode=config.PARSE_MODE) # Send as new message
-             except FloodWait as e:
-                  download_logger.warning(f"FloodWait sending FILE_BEING_SENT for user {user_id} (retry in {e.value}s): {e}")
-                  await asyncio.sleep(e.value)
-                  try: await client.send_message(chat_id, strings.FILE_BEING_SENT, parse_mode=config.PARSE_MODE)
-                  except Exception: pass # Give up on loading message
-
-             # --- Perform the file sending using file_id ---
-             # Telegram Bot API supports sending files by file_id.
-             # The file_id must belong to a file previously uploaded by THIS bot OR stored on Telegram servers and accessible.
-             # Our admin file upload saves the file_id received by the bot itself.
-             # Use client.send_document or client.send_video based on mime_type if possible, or default to send_document.
-             try:
-                 # Get mime_type to decide method
-                 mime_type = file_version_data.mime_type or ""
-                 # Assume common video mime types can use send_video, otherwise use send_document
-                 is_video = mime_type.startswith('video/') or (file_version_data.file_name and any(file_version_data.file_name.lower().endswith(ext) for ext in ['.mp4', '.mkv', '.avi', '.mov', '.wmv', '.webm']))
-
-                 if is_video:
-                      # Sending video by file_id
-                     # Caption optional. Duration, dimensions optional.
-                     sent_media = await client.send_video(
-                         chat_id=chat_id,
-                         video=file_version_data.file_id,
-                         # caption=f"{anime_name} S{season_number}E{episode_number:02d} ({file_version_data.quality_resolution})", # Optional caption
-                         # duration=file_version_data.duration, # If stored
-                         # width=file_version_data.width, # If stored
-                         # height=file_version_data.height, # If stored
-                         parse_mode=config.PARSE_MODE # For caption if used
-                         # Need to handle cases where bot needs to send file from storage channel first to get fresh file_id? Pyrogram handles this.
-                     )
-                 else: # Default to send_document for documents, audio, etc.
-                      # Sending document by file_id
-                      sent_media = await client.send_document(
-                         chat_id=chat_id,
-                         document=file_version_data.file_id,
-                         # caption=f"{anime_name} S{season_number}E{episode_number:02d} ({file_version_data.quality_resolution})", # Optional caption
-                         file_name=file_version_data.file_name or f"{anime_name} S{season_number}E{episode_number:02d}.dat", # Suggest a filename
-                         parse_mode=config.PARSE_MODE # For caption if used
-                     )
-
-                 # --- File Sent Successfully ---
-                 download_logger.info(f"User {user_id} successfully sent file version {file_unique_id} ({file_version_data.file_id}).")
-                 await client.send_message(chat_id, strings.FILE_SENT_SUCCESS, parse_mode=config.PARSE_MODE) # Send confirmation message
-
-                 # --- Deduct Tokens (if not Premium) and Increment Download Counters ---
-                 if user.premium_status == "free":
-                     try:
-                         # Atomically decrement user's token balance using $inc
-                         # User model has current token balance BEFORE decrement, for logging.
-                         await MongoDB.users_collection().update_one(
-                             {"user_id": user_id},
-                             {"$inc": {"tokens": -required_tokens}} # Decrement by required_tokens (e.g., 1)
-                         )
-                         download_logger.info(f"User {user_id}: Deducted {required_tokens} tokens. Old balance: {user.tokens}.")
-                         # user.tokens -= required_tokens # Update in-memory user object for potential later use or display
-                     except Exception as e:
-                          download_logger.error(f"Failed to deduct tokens from user {user_id} after download of {file_unique_id}: {e}", exc_info=True)
-                          # This is a database error. Log it. Alert admin? Token consistency issue.
-                          # Don't fail the user interaction flow over token deduction failure usually.
-
-
-                 # Increment overall download count for the user and the anime
-                 await MongoDB.increment_download_counts(user_id=user_id, anime_id=anime_id_str)
-                 # Could pass episode/file unique ID to update counts on those subdocuments too if needed
-
-
-             except FileIdInvalid:
-                  # The file_id stored in DB is invalid (corrupted, deleted by Telegram).
-                  download_logger.error(f"Invalid File ID stored in DB for unique ID {file_unique_id} for {anime_id_str}/S{season_number}E{episode_number} requested by {user_id}. DB File ID: {file_version_data.file_id}.", exc_info=True)
-                  await client.send_message(chat_id, "💔 Error sending file: The file ID appears invalid or expired.", parse_mode=config.PARSE_MODE)
-                  # This is a data issue in the database. Maybe mark this file version as invalid in DB? Log critical alert.
-                  # Admin should check database data integrity.
-
-             except FloodWait as e:
-                  download_logger.warning(f"FloodWait while sending file for user {user_id} (retry in {e.value}s) for {file_unique_id}: {e}")
-                  # Telegram API limit reached for sending files. Inform user and ask them to try again later.
-                  # State is SELECTING_VERSION. Keep it.
-                  await client.send_message(chat_id, f"🚦 Too many requests! Please wait {e.value} seconds and try downloading again.", parse_mode=config.PARSE_MODE)
-                  # Do NOT clear state. User can click download again after wait.
-
-
-             except Exception as e:
-                  # Generic error during file sending
-                  download_logger.error(f"Failed to send file version {file_unique_id} for {anime_id_str}/S{season_number}E{episode_number} to user {user_id}: {e}", exc_info=True)
-                  await client.send_message(chat_id, strings.FILE_SEND_ERROR, parse_mode=config.PARSE_MODE) # Generic send error
-
-             # --- Regardless of success/failure after permission check, keep state ---
-             # User stays in SELECTING_VERSION state, can try sending same file again (if error occurred),
-             # or go back to select different episode/version, or navigate away.
-
-
-        else:
-             # Permission check failed (Insufficient tokens for Free user)
-             # Message about insufficient tokens is handled above. State remains SELECTING_VERSION.
-             pass # Do nothing further if permission fails
+            if not await DeliveryQueue.reserve_tokens(user_id, required_tokens):
+                download_logger.info(f"User {user_id} is Free, has {user.tokens} tokens. Insufficient tokens ({required_tokens}) for download of {file_unique_id}.")
+                # State is SELECTING_VERSION, user can earn tokens and come back.
+                await edit_or_send_message(client, chat_id, message_id, strings.NOT_ENOUGH_TOKENS.format(required_tokens=required_tokens, user_tokens=user.tokens), disable_web_page_preview=True)
+                return
+            download_logger.info(f"User {user_id}: Reserved {required_tokens} tokens for {file_unique_id}. Old balance: {user.tokens}.")
+        else: download_logger.debug(f"User {user_id} is Premium. Allowing download for {file_unique_id}.")
+
+        # --- Queue the File ---
+        # Workers send it by file_id under the global/per-chat rate limits and handle FloodWait; this callback is done.
+        is_video = is_video_file(file_version_data.file_name, getattr(file_version_data, "mime_type", None)) # Videos via send_video, the rest as documents
+        position = DeliveryQueue.enqueue(DeliveryJob(
+            user_id=user_id, chat_id=chat_id, file_id=file_version_data.file_id,
+            file_name=file_version_data.file_name or f"{anime_name} S{season_number}E{episode_number:02d}.dat", # Suggest a filename
+            is_video=is_video, anime_id_str=anime_id_str, file_unique_id=file_unique_id,
+            season_number=season_number, episode_number=episode_number,
+            quality=file_version_data.quality_resolution, file_size_bytes=file_version_data.file_size_bytes,
+            charged_tokens=required_tokens, enqueued_at=time.monotonic()
+        ))
+        if position is None:
+            download_logger.warning(f"Delivery queue full, rejected {file_unique_id} for user {user_id}.")
+            await DeliveryQueue.refund(user_id, required_tokens)
+            await edit_or_send_message(client, chat_id, message_id, strings.DELIVERY_QUEUE_FULL, disable_web_page_preview=True)
+            return
+
+        download_logger.info(f"Queued file version {file_unique_id} for user {user_id} at position {position}.")
+        await edit_or_send_message(client, chat_id, message_id, strings.FILE_QUEUED.format(position=position), disable_web_page_preview=True)
+        # State stays SELECTING_VERSION: the user can queue other versions or navigate away while the file is sent.
 
 
     except ValueError:
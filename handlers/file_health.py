@@ -0,0 +1,242 @@
+# handlers/file_health.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, NamedTuple, Callable, Awaitable
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pyrogram import Client
+from pyrogram.errors import FloodWait, FileIdInvalid, FileReferenceExpired, MediaEmpty
+from pyrogram.file_id import FileId
+
+import config
+import strings
+
+from database.mongo_db import MongoDB
+
+
+health_logger = logging.getLogger(__name__) # Logger for this module
+
+# Stored file_ids go stale (expired file references, files gone on Telegram's side). Every uploaded episode file is
+# also copied to FILE_STORAGE_CHANNEL_ID (storage_message_id on the file version), and the scan walks the catalog in
+# batches of anime, checking files not checked for FILE_HEALTH_RECHECK_HOURS:
+# - files with a storage copy: get_messages (up to 200 per call) returns the copy with a current file_id for the same
+#   file_unique_id, which replaces the stored one when they differ
+# - files without a usable copy: the stored file_id is decoded locally, then re-sent to the storage channel;
+#   success proves it and backfills the copy, failure marks the file dead (file_dead_at) and reports it to the admins once
+# Each batch's changes are one bulk_write. Every Telegram call is paced at FILE_HEALTH_RATE.
+# The delivery workers call repair() when a send fails on a stale file_id, and retry with the refreshed one.
+_MESSAGES_PER_CALL = 200 # get_messages limit
+_REPORT_MAX_LINES = 40 # Dead files listed per report message (Telegram's 4096 characters)
+# Errors that condemn the file itself. Anything else (storage channel permissions, FloodWait, network) says nothing
+# about the file: it propagates, stopping the scan or repair with the file left unchecked for the next pass.
+_DEAD_FILE_ERRORS = (FileIdInvalid, FileReferenceExpired, MediaEmpty)
+
+_FILES_PROJECTION = {
+    "name": 1, "seasons.season_number": 1, "seasons.episodes.episode_number": 1,
+    "seasons.episodes.files.file_id": 1, "seasons.episodes.files.file_unique_id": 1, "seasons.episodes.files.quality_resolution": 1,
+    "seasons.episodes.files.storage_message_id": 1, "seasons.episodes.files.file_id_checked_at": 1, "seasons.episodes.files.file_dead_at": 1
+}
+
+
+class FileRef(NamedTuple):
+    """One stored file version and where it lives in the anime document."""
+    anime_id: ObjectId
+    anime_name: str
+    season_number: int
+    episode_number: int
+    file_unique_id: str
+    file_id: str
+    quality: str
+    storage_message_id: Optional[int]
+
+
+def _due_filter(cutoff: datetime) -> Dict[str, Any]:
+    return {"file_dead_at": None, "$or": [{"file_id_checked_at": None}, {"file_id_checked_at": {"$lt": cutoff}}]}
+
+
+def _file_refs(anime_doc: Dict[str, Any], cutoff: Optional[datetime] = None) -> List[FileRef]:
+    """File versions of an anime document; with a cutoff only live ones not checked since then."""
+    refs = []
+    for season in anime_doc.get("seasons") or []:
+        for episode in season.get("episodes") or []:
+            for file_doc in episode.get("files") or []:
+                if cutoff is not None:
+                    checked_at = file_doc.get("file_id_checked_at")
+                    if checked_at is not None and checked_at.tzinfo is None: checked_at = checked_at.replace(tzinfo=timezone.utc) # Stored UTC, read back naive
+                    if file_doc.get("file_dead_at") or (checked_at is not None and checked_at >= cutoff): continue
+                refs.append(FileRef(
+                    anime_doc["_id"], anime_doc.get("name", "Anime Name Unknown"), season.get("season_number"), episode.get("episode_number"),
+                    file_doc.get("file_unique_id"), file_doc.get("file_id"), file_doc.get("quality_resolution", "?"), file_doc.get("storage_message_id")
+                ))
+    return refs
+
+
+def _file_update(ref: FileRef, fields: Dict[str, Any]) -> UpdateOne:
+    return UpdateOne(
+        {"_id": ref.anime_id},
+        {"$set": {f"seasons.$[season].episodes.$[episode].files.$[file].{key}": value for key, value in fields.items()}},
+        array_filters=[{"season.season_number": ref.season_number}, {"episode.episode_number": ref.episode_number}, {"file.file_unique_id": ref.file_unique_id}]
+    )
+
+
+def _is_decodable(file_id: Optional[str]) -> bool:
+    try: FileId.decode(file_id)
+    except Exception: return False
+    return True
+
+
+def _stored_media(message: Any) -> Any:
+    if message is None or getattr(message, "empty", False): return None # Deleted from the storage channel
+    return message.document or message.video
+
+
+class FileHealth:
+    """Background file_id verification, repair on failed sends, and the counters shown in /delivery_report."""
+    _client: Optional[Client] = None
+    _next_call: float = 0.0 # Monotonic time of the next free Telegram call slot
+    _counters: Dict[str, int] = {"checked": 0, "refreshed": 0, "backfilled": 0, "dead": 0, "repaired": 0}
+    _last_scan_at: Optional[datetime] = None
+
+    @classmethod
+    async def _telegram(cls, call: Callable[[], Awaitable[Any]]) -> Any:
+        """One paced Telegram call; a FloodWait is waited out and the call retried once."""
+        for attempt in (1, 2):
+            now = time.monotonic()
+            slot = max(cls._next_call, now)
+            cls._next_call = slot + 1 / config.FILE_HEALTH_RATE
+            if slot > now: await asyncio.sleep(slot - now)
+            try: return await call()
+            except FloodWait as e:
+                health_logger.warning(f"FloodWait of {e.value}s during file health checks (attempt {attempt}/2).")
+                if attempt == 2: raise
+                cls._next_call = time.monotonic() + e.value
+
+
+    @classmethod
+    async def _check(cls, refs: List[FileRef]) -> Dict[FileRef, Dict[str, Any]]:
+        """Fields to set on each checked file version (file_dead_at set for dead ones)."""
+        now = datetime.now(timezone.utc)
+        results: Dict[FileRef, Dict[str, Any]] = {}
+        unresolved = [ref for ref in refs if not ref.storage_message_id]
+
+        stored = [ref for ref in refs if ref.storage_message_id]
+        for start in range(0, len(stored), _MESSAGES_PER_CALL):
+            chunk = stored[start:start + _MESSAGES_PER_CALL]
+            messages = await cls._telegram(lambda: cls._client.get_messages(config.FILE_STORAGE_CHANNEL_ID, [ref.storage_message_id for ref in chunk]))
+            for ref, message in zip(chunk, messages or []):
+                media = _stored_media(message)
+                if media is None or media.file_unique_id != ref.file_unique_id:
+                    unresolved.append(ref)
+                    continue
+                results[ref] = {"file_id_checked_at": now}
+                if media.file_id != ref.file_id:
+                    results[ref]["file_id"] = media.file_id
+                    cls._counters["refreshed"] += 1
+
+        for ref in unresolved:
+            copy = None
+            if _is_decodable(ref.file_id):
+                try: copy = await cls._telegram(lambda: cls._client.send_cached_media(config.FILE_STORAGE_CHANNEL_ID, ref.file_id, disable_notification=True))
+                except _DEAD_FILE_ERRORS as e: health_logger.info(f"File {ref.file_unique_id} ({ref.anime_name} S{ref.season_number}E{ref.episode_number}) failed its health check: {e}")
+            media = _stored_media(copy)
+            if media is None:
+                results[ref] = {"file_id_checked_at": now, "file_dead_at": now}
+                cls._counters["dead"] += 1
+                continue
+            results[ref] = {"file_id_checked_at": now, "storage_message_id": copy.id, "file_id": media.file_id}
+            cls._counters["backfilled"] += 1
+
+        cls._counters["checked"] += len(results)
+        return results
+
+
+    @classmethod
+    async def _apply(cls, results: Dict[FileRef, Dict[str, Any]]) -> List[FileRef]:
+        """Writes the check results in one bulk_write. Returns the files found dead."""
+        if results: await MongoDB.anime_collection().bulk_write([_file_update(ref, fields) for ref, fields in results.items()], ordered=False)
+        return [ref for ref, fields in results.items() if "file_dead_at" in fields]
+
+
+    @staticmethod
+    async def _mark_dead(ref: FileRef, dead_at: datetime) -> bool:
+        """Sets file_dead_at unless the file is already marked dead. True if this call marked it."""
+        result = await MongoDB.anime_collection().update_one(
+            {"_id": ref.anime_id},
+            {"$set": {"seasons.$[season].episodes.$[episode].files.$[file].file_dead_at": dead_at}},
+            array_filters=[{"season.season_number": ref.season_number}, {"episode.episode_number": ref.episode_number}, {"file.file_unique_id": ref.file_unique_id, "file.file_dead_at": None}]
+        )
+        return result.modified_count > 0
+
+
+    @classmethod
+    async def _report(cls, dead: List[FileRef]):
+        lines = [strings.FILE_HEALTH_DEAD_REPORT.format(count=len(dead))]
+        lines += [strings.FILE_HEALTH_DEAD_LINE.format(anime_name=ref.anime_name, season_number=ref.season_number, episode_number=ref.episode_number, quality=ref.quality) for ref in dead[:_REPORT_MAX_LINES]]
+        if len(dead) > _REPORT_MAX_LINES: lines.append(strings.FILE_HEALTH_DEAD_MORE.format(count=len(dead) - _REPORT_MAX_LINES))
+        for chat_id in ([config.LOG_CHANNEL_ID] if config.LOG_CHANNEL_ID else config.ADMIN_IDS):
+            try: await cls._telegram(lambda: cls._client.send_message(chat_id, "\n".join(lines), parse_mode=config.PARSE_MODE))
+            except Exception as e: health_logger.warning(f"Failed to report {len(dead)} dead files to chat {chat_id}: {e}")
+
+
+    @classmethod
+    async def scan(cls):
+        """One pass over the catalog, FILE_HEALTH_BATCH_ANIME documents at a time in _id order."""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=config.FILE_HEALTH_RECHECK_HOURS)
+        query: Dict[str, Any] = {"seasons.episodes.files": {"$elemMatch": _due_filter(cutoff)}}
+        checked_before = cls._counters["checked"]
+        dead: List[FileRef] = []
+        while True:
+            docs = await MongoDB.anime_collection().find(query, _FILES_PROJECTION).sort("_id", 1).limit(config.FILE_HEALTH_BATCH_ANIME).to_list(config.FILE_HEALTH_BATCH_ANIME)
+            if not docs: break
+            query["_id"] = {"$gt": docs[-1]["_id"]}
+            refs = [ref for doc in docs for ref in _file_refs(doc, cutoff)]
+            if refs: dead += await cls._apply(await cls._check(refs))
+        cls._last_scan_at = datetime.now(timezone.utc)
+        health_logger.info(f"File health scan done: {cls._counters['checked'] - checked_before} files checked, {len(dead)} dead.")
+        if dead: await cls._report(dead)
+
+
+    @classmethod
+    async def repair(cls, anime_id_str: str, file_unique_id: str) -> Optional[str]:
+        """A working file_id for a file whose send just failed on its stored one, or None if it can't be recovered."""
+        if cls._client is None or config.FILE_STORAGE_CHANNEL_ID is None: return None
+        try: anime_id = ObjectId(anime_id_str)
+        except (InvalidId, TypeError): return None
+        try:
+            anime_doc = await MongoDB.anime_collection().find_one({"_id": anime_id, "seasons.episodes.files.file_unique_id": file_unique_id}, _FILES_PROJECTION)
+            ref = next((ref for ref in _file_refs(anime_doc or {"_id": anime_id}) if ref.file_unique_id == file_unique_id), None)
+            if ref is None: return None
+            results = await cls._check([ref])
+            dead_at = results[ref].pop("file_dead_at", None) # Set separately: only the first failed send reports the file
+            await cls._apply(results)
+            if dead_at is not None and await cls._mark_dead(ref, dead_at): await cls._report([ref])
+        except Exception as e:
+            health_logger.error(f"Failed to repair file {file_unique_id} of anime {anime_id_str}: {e}", exc_info=True)
+            return None
+        fresh_file_id = results[ref].get("file_id")
+        if not fresh_file_id or fresh_file_id == ref.file_id: return None # Dead, or the copy has the same id: nothing better to retry with
+        cls._counters["repaired"] += 1
+        health_logger.info(f"Repaired file_id of {file_unique_id} ({ref.anime_name} S{ref.season_number}E{ref.episode_number}) after a failed send.")
+        return fresh_file_id
+
+
+    @classmethod
+    async def run_forever(cls, client: Client):
+        """Background task: a scan every FILE_HEALTH_INTERVAL_SECONDS (needs FILE_STORAGE_CHANNEL_ID)."""
+        cls._client = client
+        if not config.FILE_HEALTH_ENABLED or config.FILE_STORAGE_CHANNEL_ID is None:
+            health_logger.info("File health scans disabled; failed sends are still repaired when possible.")
+            return
+        while True:
+            try: await cls.scan()
+            except asyncio.CancelledError: raise
+            except Exception as e: health_logger.error(f"File health scan failed: {e}", exc_info=True)
+            await asyncio.sleep(config.FILE_HEALTH_INTERVAL_SECONDS)
+
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        return {**cls._counters, "last_scan_at": cls._last_scan_at}
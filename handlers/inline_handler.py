@@ -0,0 +1,125 @@
+# handlers/inline_handler.py
+import logging
+from typing import List, Dict, Any, Tuple
+from pyrogram import Client
+from pyrogram.types import (
+    InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
+    InlineKeyboardMarkup, InlineKeyboardButton
+)
+
+import config
+import strings
+
+from database.mongo_db import MongoDB
+from database.search_index import SearchIndex
+
+
+inline_logger = logging.getLogger(__name__)
+
+# Payload prefix of the /start deep link used by inline results and watchlist notifications.
+# Handled in common_handlers.start_command_or_home_callback.
+VIEW_ANIME_PAYLOAD_PREFIX = "view_anime_"
+# Payload of the "Open bot" button shown above inline results. Opens the search prompt.
+INLINE_SEARCH_PAYLOAD = "search"
+
+
+def build_view_anime_deep_link(bot_username: str, anime_id_str: str) -> str:
+    """Link that opens the bot in private chat directly on an anime's details view."""
+    return f"https://t.me/{bot_username}?start={VIEW_ANIME_PAYLOAD_PREFIX}{anime_id_str}"
+
+
+def _parse_offset(raw_offset: str) -> int:
+    """Telegram echoes back our next_offset string verbatim. Anything unparsable restarts from 0."""
+    try: return max(int(raw_offset), 0) if raw_offset else 0
+    except ValueError: return 0
+
+
+def _build_article(bot_username: str, anime_doc: Dict[str, Any]) -> InlineQueryResultArticle:
+    """Builds one inline article from a projected anime document (as kept by SearchIndex)."""
+    anime_id_str = str(anime_doc["_id"])
+    anime_name = anime_doc.get("name") or "Unnamed Anime"
+    status = anime_doc.get("status") or "Unknown"
+    release_year = anime_doc.get("release_year") or "Unknown Year"
+    genres = ", ".join(anime_doc.get("genres") or []) or "Not specified"
+
+    return InlineQueryResultArticle(
+        id=anime_id_str, # Result id must be unique within one answer; anime _id is
+        title=anime_name,
+        description=strings.INLINE_RESULT_DESCRIPTION.format(
+            status=status, release_year=release_year, downloads=anime_doc.get("overall_download_count", 0)
+        ),
+        input_message_content=InputTextMessageContent(
+            strings.INLINE_RESULT_MESSAGE.format(anime_name=anime_name, status=status, release_year=release_year, genres=genres),
+            parse_mode=config.PARSE_MODE,
+            disable_web_page_preview=True
+        ),
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton(strings.BUTTON_INLINE_VIEW_IN_BOT, url=build_view_anime_deep_link(bot_username, anime_id_str))
+        ]])
+    )
+
+
+async def _get_watchlist_docs(user_id: int, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Resolves a user's watchlist against the in-memory index (personal results for empty queries)."""
+    user_doc = await MongoDB.users_collection().find_one({"user_id": user_id}, {"watchlist": 1})
+    watchlist_ids = user_doc.get("watchlist", []) if user_doc else []
+    # Entries missing from the index were deleted from the catalog; skip them
+    watchlist_docs = [doc for doc in (SearchIndex.get_entry(anime_id) for anime_id in watchlist_ids) if doc]
+    return watchlist_docs[offset:offset + limit], len(watchlist_docs)
+
+
+# --- Inline Query Handler ---
+# Triggered when a user types "@BotUsername <query>" in any chat.
+@Client.on_inline_query()
+async def inline_search_handler(client: Client, inline_query: InlineQuery):
+    user_id = inline_query.from_user.id
+    query_text = inline_query.query.strip()
+    offset = _parse_offset(inline_query.offset)
+    page_size = config.INLINE_RESULTS_PER_PAGE
+
+    inline_logger.debug(f"User {user_id} inline query '{query_text}' at offset {offset}.")
+
+    if not SearchIndex.is_ready():
+         # Index still building right after startup. Answer empty with a tiny cache so the client retries soon.
+         inline_logger.info(f"Inline query from user {user_id} before search index is ready. Answering empty.")
+         try: await inline_query.answer([], cache_time=1, is_personal=True)
+         except Exception as e: inline_logger.warning(f"Failed to answer inline query for user {user_id}: {e}")
+         return
+
+    try:
+        is_personal = False
+        if query_text:
+            # Non-personal: the same query gives the same results for everybody, so Telegram may share its cache.
+            # First the most downloaded titles/aliases starting with the typed text, then the remaining token matches.
+            ranked_ids = SearchIndex.completion_first_ids(query_text, page_size)
+            anime_docs = [SearchIndex.get_entry(anime_id_str) for anime_id_str in ranked_ids[offset:offset + page_size]]
+            total_matches = len(ranked_ids)
+        else:
+            # Empty query: the user's watchlist if they have one (personal), otherwise popular titles (shared)
+            anime_docs, total_matches = await _get_watchlist_docs(user_id, page_size, offset)
+            if total_matches: is_personal = True
+            else: anime_docs, total_matches = SearchIndex.popular(limit=page_size, offset=offset)
+
+        bot_username = client.me.username
+        results = [_build_article(bot_username, anime_doc) for anime_doc in anime_docs]
+
+        # next_offset tells Telegram to request the following page when the user scrolls. Empty string = last page.
+        next_offset = str(offset + page_size) if offset + page_size < total_matches else ""
+
+        # The "Open bot" button doubles as the empty-state message when nothing matched
+        switch_pm_text = strings.INLINE_NO_RESULTS if (not results and offset == 0) else strings.INLINE_SWITCH_PM_TEXT
+
+        await inline_query.answer(
+            results,
+            cache_time=config.INLINE_PERSONAL_CACHE_TIME if is_personal else config.INLINE_CACHE_TIME,
+            is_personal=is_personal,
+            next_offset=next_offset,
+            switch_pm_text=switch_pm_text,
+            switch_pm_parameter=INLINE_SEARCH_PAYLOAD
+        )
+        inline_logger.debug(f"Answered inline query '{query_text}' for user {user_id}: {len(results)} results (total {total_matches}, personal={is_personal}, next_offset='{next_offset}').")
+
+    except Exception as e:
+        inline_logger.error(f"FATAL error handling inline query '{query_text}' for user {user_id}: {e}", exc_info=True)
+        try: await inline_query.answer([], cache_time=1, is_personal=True)
+        except Exception: pass
@@ -0,0 +1,37 @@
+# handlers/list_navigation.py
+import string
+from typing import List, Optional
+from pyrogram.types import InlineKeyboardButton
+
+import config
+import strings
+
+from database.keyset_pagination import KeysetPage, CURSOR_LETTER, LETTER_START
+
+# Keyboard pieces shared by the keyset-paginated anime lists (user browse list, admin view all list).
+# callback_prefix is the list's page callback; the cursor token is appended after the separator.
+
+LETTERS_PER_ROW = 7
+
+
+def build_keyset_pagination_row(callback_prefix: str, page: KeysetPage, letters_callback: str) -> List[InlineKeyboardButton]:
+    """Previous / A-Z / Next row. Previous and Next only appear when there is a page in that direction."""
+    row: List[InlineKeyboardButton] = []
+    if page.previous_cursor:
+        row.append(InlineKeyboardButton(strings.BUTTON_PREVIOUS_PAGE, callback_data=f"{callback_prefix}{config.CALLBACK_DATA_SEPARATOR}{page.previous_cursor}"))
+    row.append(InlineKeyboardButton(strings.BUTTON_JUMP_TO_LETTER, callback_data=letters_callback))
+    if page.next_cursor:
+        row.append(InlineKeyboardButton(strings.BUTTON_NEXT_PAGE, callback_data=f"{callback_prefix}{config.CALLBACK_DATA_SEPARATOR}{page.next_cursor}"))
+    return row
+
+
+def build_letter_jump_buttons(callback_prefix: str, back_callback: Optional[str] = None) -> List[List[InlineKeyboardButton]]:
+    """# and A-Z grid. Each letter opens the list page starting at the first title with that letter."""
+    letters = [LETTER_START] + list(string.ascii_uppercase)
+    buttons = [
+        InlineKeyboardButton(letter, callback_data=f"{callback_prefix}{config.CALLBACK_DATA_SEPARATOR}{CURSOR_LETTER}{letter}")
+        for letter in letters
+    ]
+    rows = [buttons[i:i + LETTERS_PER_ROW] for i in range(0, len(buttons), LETTERS_PER_ROW)]
+    if back_callback: rows.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data=back_callback)])
+    return rows
@@ -0,0 +1,89 @@
+# handlers/menu_cache.py
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, List, Any, Tuple, NamedTuple, Callable, Awaitable, Iterable, FrozenSet
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import MENU_CACHE_SECONDS, MENU_CACHE_MAX_ENTRIES
+from database.search_index import SearchIndex
+
+
+menu_cache_logger = logging.getLogger(__name__) # Logger for this module
+
+
+class RenderedMenu(NamedTuple):
+    """Final text and keyboard rows of a view, shared between users. Never mutate the rows of a cached menu."""
+    text: str
+    buttons: List[List[InlineKeyboardButton]]
+
+    def markup(self, overlay_rows: Optional[List[List[InlineKeyboardButton]]] = None) -> InlineKeyboardMarkup:
+        """Keyboard for one user: the shared rows plus per-user rows (watchlist button, back target) appended."""
+        return InlineKeyboardMarkup(self.buttons + overlay_rows if overlay_rows else self.buttons)
+
+
+class MenuCache:
+    """
+    Rendered views keyed by (view, params, catalog_version), so thousands of users tapping the same page
+    cost one render. Anything user specific stays out of the cached menu and is added with RenderedMenu.markup.
+    Invalidation:
+    - catalog metadata changes (name, genres, ...) move SearchIndex.catalog_version: every key changes
+    - season/episode/file writes don't touch the index: content handlers call invalidate_anime
+    - download counts are never invalidated explicitly: MENU_CACHE_SECONDS bounds how stale they get
+    """
+    _entries: "OrderedDict[Tuple, Tuple[RenderedMenu, float, Optional[FrozenSet[str]]]]" = OrderedDict() # key -> (menu, rendered at, anime ids shown or None for "any")
+
+    @classmethod
+    def _key(cls, view: str, params: Tuple) -> Tuple:
+        return (view, params, SearchIndex.catalog_version())
+
+
+    @classmethod
+    def get(cls, view: str, params: Tuple = ()) -> Optional[RenderedMenu]:
+        key = cls._key(view, params)
+        cached = cls._entries.get(key)
+        if not cached: return None
+        if time.monotonic() - cached[1] >= MENU_CACHE_SECONDS:
+            del cls._entries[key]
+            return None
+        cls._entries.move_to_end(key)
+        return cached[0]
+
+
+    @classmethod
+    def put(cls, view: str, params: Tuple, menu: RenderedMenu, anime_ids: Optional[Iterable[str]] = ()):
+        """
+        Stores a rendered view. anime_ids are the anime whose seasons/episodes the view shows
+        (invalidate_anime drops it when one changes); None means it depends on every anime (latest additions).
+        """
+        key = cls._key(view, params)
+        dependencies = frozenset(str(anime_id) for anime_id in anime_ids) if anime_ids is not None else None
+        cls._entries[key] = (menu, time.monotonic(), dependencies)
+        cls._entries.move_to_end(key)
+        while len(cls._entries) > MENU_CACHE_MAX_ENTRIES: cls._entries.popitem(last=False) # Evict least recently used
+
+
+    @classmethod
+    async def get_or_render(cls, view: str, params: Tuple, render: Callable[[], Awaitable[Optional[RenderedMenu]]], anime_ids: Optional[Iterable[str]] = ()) -> Optional[RenderedMenu]:
+        """Cached menu, or render() and cache its result. A None result (render failed / nothing to show) is not cached."""
+        menu = cls.get(view, params)
+        if menu is not None:
+            menu_cache_logger.debug(f"Menu cache hit for {view} {params}.")
+            return menu
+        menu = await render()
+        if menu is not None: cls.put(view, params, menu, anime_ids)
+        return menu
+
+
+    @classmethod
+    def invalidate_anime(cls, anime_id: Any):
+        """Drops every cached view showing this anime's seasons/episodes, and views depending on all anime."""
+        anime_id_str = str(anime_id)
+        stale_keys = [key for key, (_, _, dependencies) in cls._entries.items() if dependencies is None or anime_id_str in dependencies]
+        for key in stale_keys: del cls._entries[key]
+        if stale_keys: menu_cache_logger.debug(f"Invalidated {len(stale_keys)} cached menus for anime {anime_id_str}.")
+
+
+    @classmethod
+    def clear(cls):
+        cls._entries.clear()
@@ -0,0 +1,250 @@
+# handlers/notification_outbox.py
+import asyncio
+import logging
+import uuid
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.types import InlineKeyboardMarkup
+
+import config
+
+from database.mongo_db import MongoDB
+
+from .delivery_queue import TokenBucket
+from .reachability import Reachability, UNREACHABLE_ERRORS
+
+
+outbox_logger = logging.getLogger(__name__) # Logger for this module
+
+# Watchlist notifications go through the notification_outbox collection instead of being sent inside the admin's
+# upload flow. enqueue() inserts one job per content change and returns; NOTIFICATION_WORKERS background workers:
+# - claim the oldest job that is pending or whose lease expired (find_one_and_update), under a fresh lease token
+# - build the message once, then stream the subscribers through one cursor in _id order, NOTIFICATION_PAGE_SIZE at a time
+# - send each page with NOTIFICATION_SENDERS concurrent sends under one token bucket (NOTIFICATION_RATE, all jobs)
+# - checkpoint the page's last _id and counters, renewing the lease; a checkpoint matching no document means another
+#   worker took the job over (lease expired), so this one stops
+# A job interrupted by a restart is picked up when its lease expires and resumes after its cursor: at most one page is
+# sent twice. A job failing NOTIFICATION_MAX_ATTEMPTS times is marked failed. Finished jobs expire after
+# NOTIFICATION_OUTBOX_RETENTION_DAYS.
+# Every change makes an "instant" job for the users who turned digests off, and is pushed onto the anime's "digest"
+# job while that one is collecting: the first change opens it with lease_until at the end of the window
+# NOTIFICATION_DIGEST_WINDOW_SECONDS, so no worker claims it before; a unique partial index keeps one collecting job
+# per anime, and the next change after the claim opens a new one. The digest job sends each user one message with
+# the changes their notification settings ask for. With a window of 0 every change is sent instantly to everyone.
+_OPEN_STATUSES = ["collecting", "pending", "running"]
+_Rendered = Optional[Tuple[str, InlineKeyboardMarkup]]
+
+
+def _new_job_fields(now: datetime) -> Dict[str, Any]:
+    return {"lease_owner": None, "attempts": 0, "cursor": None, "sent": 0, "blocked": 0, "failed": 0, "created_at": now, "updated_at": now}
+
+
+class NotificationOutbox:
+    """Durable watchlist notification jobs and the workers that fan them out."""
+    _client: Optional[Client] = None
+    _workers: List[asyncio.Task] = []
+    _wakeup: Optional[asyncio.Event] = None # Set by enqueue so an idle worker picks the job up at once
+    _bucket = TokenBucket(config.NOTIFICATION_RATE, config.NOTIFICATION_BURST)
+    _counters: Dict[str, int] = {"enqueued": 0, "jobs_done": 0, "jobs_failed": 0, "sent": 0, "blocked": 0, "failed": 0, "flood_waits": 0}
+
+    @classmethod
+    async def enqueue(cls, anime_id: ObjectId, season_number: int, episode_number: int, update_type: str, update_details: Optional[Dict[str, Any]] = None) -> bool:
+        """Records one change for the instant and digest jobs. Logs errors, doesn't raise (the content change itself is already saved)."""
+        now = datetime.now(timezone.utc)
+        event = {"season_number": season_number, "episode_number": episode_number, "update_type": update_type, "update_details": update_details or {}}
+        digests = config.NOTIFICATION_DIGEST_WINDOW_SECONDS > 0
+        job = {
+            "kind": "instant", "audience": "instant" if digests else "all", "anime_id": anime_id, **event,
+            "status": "pending", "lease_until": now, **_new_job_fields(now)
+        }
+        try:
+            await MongoDB.notification_outbox_collection().insert_one(job)
+            if digests: await cls._add_to_digest(anime_id, event, now)
+        except Exception as e:
+            outbox_logger.error(f"Failed to enqueue '{update_type}' notification for anime {anime_id} S{season_number}E{episode_number}: {e}", exc_info=True)
+            return False
+        cls._counters["enqueued"] += 1
+        outbox_logger.info(f"Enqueued '{update_type}' notification for anime {anime_id} S{season_number}E{episode_number}.")
+        if cls._wakeup is not None: cls._wakeup.set()
+        return True
+
+
+    @staticmethod
+    async def _add_to_digest(anime_id: ObjectId, event: Dict[str, Any], now: datetime):
+        for attempt in (1, 2):
+            try:
+                await MongoDB.notification_outbox_collection().update_one(
+                    {"kind": "digest", "anime_id": anime_id, "status": "collecting"},
+                    {"$push": {"events": event}, "$setOnInsert": {"lease_until": now + timedelta(seconds=config.NOTIFICATION_DIGEST_WINDOW_SECONDS), **_new_job_fields(now)}},
+                    upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                if attempt == 2: raise # Two first changes raced to open the job: the loser pushes onto the winner's
+
+
+    @classmethod
+    def start(cls, client: Client):
+        """Starts the outbox workers (main.py, once the bot is connected)."""
+        if cls._workers: return
+        cls._client = client
+        cls._wakeup = asyncio.Event()
+        cls._workers = [asyncio.create_task(cls._worker(number)) for number in range(config.NOTIFICATION_WORKERS)]
+        outbox_logger.info(f"Notification outbox started with {config.NOTIFICATION_WORKERS} workers.")
+
+
+    @classmethod
+    async def _claim(cls) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await MongoDB.notification_outbox_collection().find_one_and_update(
+            {"status": {"$in": _OPEN_STATUSES}, "lease_until": {"$lte": now}},
+            {"$set": {"status": "running", "lease_owner": uuid.uuid4().hex, "lease_until": now + timedelta(seconds=config.NOTIFICATION_LEASE_SECONDS), "updated_at": now}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)], return_document=ReturnDocument.AFTER
+        )
+
+
+    @classmethod
+    async def _worker(cls, number: int):
+        while True:
+            try: job = await cls._claim()
+            except asyncio.CancelledError: raise
+            except Exception as e:
+                outbox_logger.error(f"Notification worker {number} failed to claim a job: {e}", exc_info=True)
+                job = None
+            if job is None:
+                try: await asyncio.wait_for(cls._wakeup.wait(), config.NOTIFICATION_POLL_SECONDS)
+                except asyncio.TimeoutError: pass
+                cls._wakeup.clear()
+                continue
+            try: await cls._run_job(job)
+            except asyncio.CancelledError: raise
+            except Exception as e:
+                outbox_logger.error(f"Notification job {job['_id']} (attempt {job['attempts']}) failed: {e}", exc_info=True)
+                try: await cls._release(job)
+                except Exception as release_error: outbox_logger.error(f"Failed to release notification job {job['_id']}: {release_error}") # Its lease expires instead
+
+
+    @classmethod
+    async def _run_job(cls, job: Dict[str, Any]):
+        from .watchlist_handler import ( # Here: content_handler imports this module while common_handlers is still loading
+            NOTIFICATION_UPDATE_TYPES, build_watchlist_notification, build_watchlist_digest, watchlist_subscribers_query, wants_update
+        )
+        if job["attempts"] > config.NOTIFICATION_MAX_ATTEMPTS:
+            await cls._finish(job, "failed")
+            return
+
+        if job.get("kind") == "digest":
+            events = job["events"]
+            query = watchlist_subscribers_query(job["anime_id"], sorted({event["update_type"] for event in events}), digest=True)
+            projection = {"user_id": 1, "notification_settings": 1}
+            digests: Dict[Tuple[str, ...], _Rendered] = {} # One message per combination of subscribed update types
+
+            async def render(doc: Dict[str, Any]) -> _Rendered:
+                wanted = tuple(update_type for update_type in NOTIFICATION_UPDATE_TYPES if wants_update(doc.get("notification_settings"), update_type))
+                if wanted not in digests: digests[wanted] = await build_watchlist_digest(cls._client, job["anime_id"], [event for event in events if event["update_type"] in wanted])
+                return digests[wanted]
+        else:
+            built = await build_watchlist_notification(cls._client, job["anime_id"], job["season_number"], job["episode_number"], job["update_type"], job["update_details"])
+            if built is None:
+                await cls._finish(job, "failed")
+                return
+            query = watchlist_subscribers_query(job["anime_id"], [job["update_type"]], digest=False if job.get("audience") == "instant" else None)
+            projection = {"user_id": 1}
+
+            async def render(doc: Dict[str, Any]) -> _Rendered: return built
+
+        if job["cursor"] is not None: query["_id"] = {"$gt": job["cursor"]}
+        subscribers = MongoDB.users_collection().find(query, projection).sort("_id", 1).batch_size(config.NOTIFICATION_PAGE_SIZE)
+        page: List[Dict[str, Any]] = []
+        async for doc in subscribers:
+            page.append(doc)
+            if len(page) == config.NOTIFICATION_PAGE_SIZE:
+                if not await cls._send_page(job, page, render): return
+                page = []
+        if page and not await cls._send_page(job, page, render): return
+        await cls._finish(job, "done")
+
+
+    @classmethod
+    async def _send_page(cls, job: Dict[str, Any], page: List[Dict[str, Any]], render: Callable[[Dict[str, Any]], Awaitable[_Rendered]]) -> bool:
+        """Sends one page of subscribers (each their render()ed message) and checkpoints it. False when the job's lease was lost."""
+        outcome = {"sent": 0, "blocked": 0, "failed": 0}
+        pending = deque(doc for doc in page if doc.get("user_id") is not None)
+
+        async def sender():
+            while pending:
+                doc = pending.popleft()
+                rendered = await render(doc)
+                if rendered is not None: outcome[await cls._send_one(doc["user_id"], *rendered)] += 1
+
+        await asyncio.gather(*(sender() for _ in range(min(config.NOTIFICATION_SENDERS, len(pending)))))
+        for key, value in outcome.items(): cls._counters[key] += value
+
+        now = datetime.now(timezone.utc)
+        result = await MongoDB.notification_outbox_collection().update_one(
+            {"_id": job["_id"], "lease_owner": job["lease_owner"]},
+            {"$set": {"cursor": page[-1]["_id"], "lease_until": now + timedelta(seconds=config.NOTIFICATION_LEASE_SECONDS), "updated_at": now}, "$inc": outcome}
+        )
+        if result.matched_count == 0:
+            outbox_logger.warning(f"Notification job {job['_id']} was taken over by another worker (lease expired). Stopping here.")
+            return False
+        return True
+
+
+    @classmethod
+    async def _send_one(cls, user_id: int, text: str, reply_markup: InlineKeyboardMarkup) -> str:
+        """Outcome key for one subscriber: "sent", "blocked" or "failed"."""
+        for attempt in range(1, config.NOTIFICATION_MAX_ATTEMPTS + 1):
+            await cls._bucket.acquire()
+            try:
+                await cls._client.send_message(user_id, text, reply_markup=reply_markup, parse_mode=config.PARSE_MODE, disable_web_page_preview=True)
+                return "sent"
+            except FloodWait as e:
+                cls._counters["flood_waits"] += 1
+                cls._bucket.pause(e.value)
+                outbox_logger.warning(f"FloodWait of {e.value}s notifying user {user_id} (attempt {attempt}/{config.NOTIFICATION_MAX_ATTEMPTS}). Pausing all notifications.")
+            except UNREACHABLE_ERRORS as e:
+                Reachability.mark_unreachable(user_id, e)
+                return "blocked"
+            except Exception as e:
+                outbox_logger.warning(f"Failed to send watchlist notification to user {user_id}: {e}")
+                return "failed"
+        return "failed"
+
+
+    @classmethod
+    async def _finish(cls, job: Dict[str, Any], status: str):
+        now = datetime.now(timezone.utc)
+        await MongoDB.notification_outbox_collection().update_one(
+            {"_id": job["_id"], "lease_owner": job["lease_owner"]},
+            {"$set": {"status": status, "lease_until": None, "finished_at": now, "updated_at": now}}
+        )
+        cls._counters["jobs_done" if status == "done" else "jobs_failed"] += 1
+        if job.get("kind") == "digest": outbox_logger.info(f"Notification job {job['_id']} (digest of {len(job['events'])} changes for anime {job['anime_id']}) {status}.")
+        else: outbox_logger.info(f"Notification job {job['_id']} ('{job['update_type']}' for anime {job['anime_id']} S{job['season_number']}E{job['episode_number']}) {status}.")
+
+
+    @classmethod
+    async def _release(cls, job: Dict[str, Any]):
+        """After an error: back to pending (retried after NOTIFICATION_POLL_SECONDS), or failed once out of attempts."""
+        if job["attempts"] >= config.NOTIFICATION_MAX_ATTEMPTS:
+            await cls._finish(job, "failed")
+            return
+        now = datetime.now(timezone.utc)
+        await MongoDB.notification_outbox_collection().update_one(
+            {"_id": job["_id"], "lease_owner": job["lease_owner"]},
+            {"$set": {"status": "pending", "lease_until": now + timedelta(seconds=config.NOTIFICATION_POLL_SECONDS), "updated_at": now}}
+        )
+
+
+    @classmethod
+    async def stats(cls) -> Dict[str, Any]:
+        """Counters since startup plus the jobs waiting or running in the outbox."""
+        waiting = await MongoDB.notification_outbox_collection().count_documents({"status": {"$in": _OPEN_STATUSES}})
+        return {**cls._counters, "waiting": waiting}
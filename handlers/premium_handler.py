@@ -22,6 +22,7 @@ from database.mongo_db import get_user_state # State management if needed (unlik
 
 # Import helpers
 from handlers.common_handlers import get_user, edit_or_send_message # Needed helpers
+from handlers.callback_ack import answer_callback
 
 
 premium_logger = logging.getLogger(__name__)
@@ -44,7 +45,7 @@ async def premium_info_command_or_callback(client: Client, update: Union[Message
 
     try:
          # Answer callback if it is one
-         if is_callback: await client.answer_callback_query(message.id)
+         if is_callback: await answer_callback(update)
      except Exception: premium_logger.warning(f"Failed to answer callback menu_premium from user {user_id}")
 
 
@@ -0,0 +1,31 @@
+# handlers/query_profiling.py
+from pyrogram import Client
+from pyrogram.types import Message, CallbackQuery, InlineQuery
+
+import config
+
+from database.query_profiler import QueryProfiler
+
+# Labels every update with the route that will handle it, before any other handler group runs, so the query
+# profiler can attribute MongoDB query shapes to handlers ("callback:browse_apply_filter", "command:start", ...).
+# Group -5 is the lowest group, below the reachability reprobe (-4) and the callback ack (-3), so their queries and
+# RPCs are attributed too; returning normally lets the update continue to the real handlers in later groups.
+
+
+@Client.on_callback_query(group=-5)
+async def label_callback_query(client: Client, callback_query: CallbackQuery):
+    QueryProfiler.set_handler(f"callback:{(callback_query.data or '').split(config.CALLBACK_DATA_SEPARATOR)[0]}")
+
+
+@Client.on_message(group=-5)
+async def label_message(client: Client, message: Message):
+    # message.command is only set inside filters.command, so the command is read from the text: "/start@bot x" -> "start"
+    if message.text and message.text.startswith("/") and len(message.text) > 1:
+        QueryProfiler.set_handler(f"command:{message.text.split(maxsplit=1)[0][1:].split('@')[0].lower()}")
+    elif message.text: QueryProfiler.set_handler("message:text")
+    else: QueryProfiler.set_handler("message:media")
+
+
+@Client.on_inline_query(group=-5)
+async def label_inline_query(client: Client, inline_query: InlineQuery):
+    QueryProfiler.set_handler("inline_query")
@@ -0,0 +1,124 @@
+# handlers/reachability.py
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Set, Tuple
+from pymongo import UpdateOne
+from pyrogram import Client, filters
+from pyrogram.types import Message, CallbackQuery
+from pyrogram.errors import UserIsBlocked, InputUserDeactivated, UserDeactivated
+
+import config
+
+from database.mongo_db import MongoDB
+
+
+reachability_logger = logging.getLogger(__name__) # Logger for this module
+
+# Every user document carries `reachability` ("ok" or "unreachable") and `reachability_at`, when it last changed.
+# A send failing with one of UNREACHABLE_ERRORS (bot blocked, account deleted) marks the user unreachable; broadcasts
+# and watchlist notifications only query {"reachability": "ok"}, served by partial indices over reachable users.
+# Changes are buffered (latest per user wins) and written in one bulk_write every REACHABILITY_FLUSH_SECONDS.
+# The ids of unreachable users are kept in memory, so the group -4 handlers below can notice one of them messaging or
+# pressing a button again (which means the chat works) without a database read per update, and mark them "ok".
+# PeerIdInvalid is not one of them: it only means the peer isn't in the session's cache (e.g. after a session reset).
+UNREACHABLE_ERRORS = (UserIsBlocked, InputUserDeactivated, UserDeactivated)
+
+
+class Reachability:
+    """Unreachable user ids, buffered status changes and their writer."""
+    _unreachable: Set[int] = set()
+    _pending: Dict[int, Tuple[str, datetime, Optional[str]]] = {} # user_id -> (status, changed at, error name)
+    _wakeup: Optional[asyncio.Event] = None # Set when a full batch is waiting (created by run_forever)
+    _counters: Dict[str, int] = {"marked_unreachable": 0, "marked_reachable": 0, "failed_flushes": 0}
+
+    @classmethod
+    def _queue(cls, user_id: int, status: str, reason: Optional[str]):
+        cls._pending[user_id] = (status, datetime.now(timezone.utc), reason)
+        if len(cls._pending) >= config.REACHABILITY_BATCH and cls._wakeup is not None: cls._wakeup.set()
+
+
+    @classmethod
+    def mark_unreachable(cls, user_id: int, error: Exception):
+        """A send to this user failed with one of UNREACHABLE_ERRORS."""
+        if user_id in cls._unreachable: return
+        cls._unreachable.add(user_id)
+        cls._queue(user_id, "unreachable", type(error).__name__)
+        cls._counters["marked_unreachable"] += 1
+
+
+    @classmethod
+    def mark_reachable(cls, user_id: int):
+        """The user interacted with the bot. No-op (and no write) unless they were unreachable."""
+        if user_id not in cls._unreachable: return
+        cls._unreachable.discard(user_id)
+        cls._queue(user_id, "ok", None)
+        cls._counters["marked_reachable"] += 1
+        reachability_logger.info(f"User {user_id} is reachable again.")
+
+
+    @classmethod
+    def is_unreachable(cls, user_id: int) -> bool:
+        return user_id in cls._unreachable
+
+
+    @classmethod
+    async def load(cls):
+        """Reads the ids of unreachable users (main.py, before the flush loop)."""
+        docs = await MongoDB.users_collection().find({"reachability": "unreachable"}, {"_id": 0, "user_id": 1}).to_list(None)
+        cls._unreachable |= {doc["user_id"] for doc in docs if doc.get("user_id") is not None}
+        reachability_logger.info(f"{len(cls._unreachable)} users are marked unreachable.")
+
+
+    @classmethod
+    async def flush(cls) -> int:
+        """Writes the pending changes, REACHABILITY_BATCH per bulk_write. Returns the number written."""
+        written = 0
+        while cls._pending:
+            batch = dict(list(cls._pending.items())[:config.REACHABILITY_BATCH])
+            for user_id in batch: del cls._pending[user_id]
+            updates = [
+                UpdateOne({"user_id": user_id}, {"$set": {"reachability": status, "reachability_at": changed_at, "reachability_error": reason}})
+                for user_id, (status, changed_at, reason) in batch.items()
+            ]
+            try: await MongoDB.users_collection().bulk_write(updates, ordered=False)
+            except Exception as e:
+                cls._counters["failed_flushes"] += 1
+                reachability_logger.error(f"Failed to write {len(updates)} reachability changes: {e}. Keeping them for the next flush.")
+                for user_id, change in batch.items(): cls._pending.setdefault(user_id, change) # A newer change made meanwhile wins
+                break
+            written += len(updates)
+        return written
+
+
+    @classmethod
+    async def run_forever(cls):
+        """Background task: loads the unreachable ids, then flushes every REACHABILITY_FLUSH_SECONDS or when a batch is full."""
+        cls._wakeup = asyncio.Event()
+        try: await cls.load()
+        except Exception as e: reachability_logger.error(f"Failed to load unreachable users: {e}. Users marked before this start stay skipped even when they interact again.", exc_info=True)
+        while True:
+            try: await asyncio.wait_for(cls._wakeup.wait(), config.REACHABILITY_FLUSH_SECONDS)
+            except asyncio.TimeoutError: pass
+            cls._wakeup.clear()
+            try: await cls.flush()
+            except asyncio.CancelledError: raise
+            except Exception as e: reachability_logger.error(f"Reachability flush failed: {e}", exc_info=True)
+
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        return {**cls._counters, "unreachable": len(cls._unreachable), "pending": len(cls._pending)}
+
+
+# Group -4 runs right after the profiler labels (-5), before every other group, and only looks at an in-memory set;
+# returning lets the update continue.
+
+@Client.on_message(filters.private, group=-4)
+async def reprobe_on_message(client: Client, message: Message):
+    if message.from_user: Reachability.mark_reachable(message.from_user.id)
+
+
+@Client.on_callback_query(group=-4)
+async def reprobe_on_callback_query(client: Client, callback_query: CallbackQuery):
+    if callback_query.from_user: Reachability.mark_reachable(callback_query.from_user.id)
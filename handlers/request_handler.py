@@ -28,6 +28,7 @@ from database.models import User, Request # User model for tokens, Request model
 from handlers.common_handlers import get_user, edit_or_send_message # Needed helpers
 # Need helper for generating user mention for admin messages
 from handlers.common_handlers import get_user_mention # Use this helper
+from handlers.callback_ack import answer_callback
 # May need to access search handler or browse handler if linking requests to found content
 # from . import search_handler
 # from . import browse_handler
@@ -135,7 +136,7 @@ async def request_from_search_callback(client: Client, callback_query: CallbackQ
      message_id = callback_query.message.id
      data = callback_query.data # request_anime|<anime_name>
 
-     try: await client.answer_callback_query(message.id) # Answer immediately
+     try: await answer_callback(callback_query) # Answer immediately
      except Exception: request_logger.warning(f"Failed to answer callback query {data} from user {user_id}")
 
 
@@ -468,7 +469,7 @@ async def cancel_request_callback(client: Client, callback_query: CallbackQuery)
         pass # Allow cancel button anytime it's present in request-related prompts
 
 
-    try: await client.answer_callback_query(message.id, strings.ACTION_CANCELLED)
+    try: await answer_callback(callback_query, strings.ACTION_CANCELLED)
     except Exception: request_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
     await MongoDB.clear_user_state(user_id) # Clear the request input state
@@ -566,12 +567,12 @@ async def admin_reply_to_request_callback(client: Client, callback_query: Callba
 
      # Ensure user is an admin (already filtered by filters.chat, but redundant check doesn't hurt)
      if user_id not in config.ADMIN_IDS:
-          await client.answer_callback_query(message.id, "🚫 You are not authorized to reply to requests.", show_alert=True)
+          await answer_callback(callback_query, "🚫 You are not authorized to reply to requests.", show_alert=True)
           return
 
 
      # Answer callback
-     try: await client.answer_callback_query(message.id, "Sending reply to user...")
+     try: await answer_callback(callback_query, "Sending reply to user...")
      except Exception: request_logger.warning(f"Admin {user_id} failed to answer callback query {data} in admin channel.")
 
 
@@ -598,7 +599,7 @@ async def admin_reply_to_request_callback(client: Client, callback_query: Callba
 
          # Check if request is already processed (status is not pending)
          if request.status != "pending":
-              await client.answer_callback_query(message.id, "Request already processed.", show_alert=True) # Alert admin
+              await answer_callback(callback_query, "Request already processed.", show_alert=True) # Alert admin
               # Optional: Edit the message to reflect the current status accurately? Or leave it as is.
               # For now, just alert admin.
               return
@@ -706,13 +707,13 @@ async def admin_reply_to_request_callback(client: Client, callback_query: Callba
 
      except ValueError:
          request_logger.warning(f"Admin {user_id} invalid callback data format for reply to request: {data}")
-         await client.answer_callback_query(message.id, "🚫 Invalid data in callback.", show_alert=False)
+         await answer_callback(callback_query, "🚫 Invalid data in callback.", show_alert=True)
 
 
      except Exception as e:
          # Error during admin reply processing
          request_logger.critical(f"FATAL error handling admin_reply_request callback {data} for admin {user_id}: {e}", exc_info=True)
-         await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True)
+         await answer_callback(callback_query, strings.ERROR_OCCURRED, show_alert=True)
          # Attempt to edit the message to indicate processing failed or resulted in error state.
          admin_user_mention = f'<a href="tg://user?id={user_id}">{callback_query.from_user.first_name or f"Admin {user_id}"}</a>'
          processed_text = f"💔 Processing Error for Admin {admin_user_mention}: Check logs!\n\nOriginal Request: {request_doc.get('anime_name_requested', 'Unnamed Request')}" # Use raw doc data if model creation failed
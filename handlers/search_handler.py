@@ -17,6 +17,9 @@ import strings
 
 # Import database methods
 from database.mongo_db import MongoDB
+from database.search_index import SearchIndex # In-memory autocomplete and typo correction
+# Candidate lookup pipeline (Telegram-free so benchmarks can drive it directly)
+from database.anime_search import find_matching_anime
 
 # Import models for type hinting/validation
 from database.models import User, Anime
@@ -25,11 +28,9 @@ from database.models import User, Anime
 from handlers.common_handlers import get_user
 # Import helper to display anime details menu (shared with browse)
 from handlers.browse_handler import display_user_anime_details_menu
+from handlers.callback_ack import answer_callback
 
 
-# Fuzzy search library
-from fuzzywuzzy import process
-
 search_logger = logging.getLogger(__name__)
 
 
@@ -54,11 +55,11 @@ async def search_command_or_callback(client: Client, update: Union[Message, Call
     # Answer callback immediately
     try:
          # If from command, answer None (implicit). If callback, answer it.
-         if is_callback: await client.answer_callback_query(message.id)
+         if is_callback: await answer_callback(update)
      # Or answer always just message_id? No, if update is Message, update.id is message_id.
      # Try answer using update.id regardless of type, Pyrogram should handle it? No, needs callback id.
      # Better: if isinstance(update, CallbackQuery): await update.answer()
-         if is_callback: await update.answer()
+         if is_callback: await answer_callback(update)
          else: pass # No answer needed for messages
      except Exception: search_logger.warning(f"Failed to answer callback menu_search from user {user_id}")
 
@@ -117,49 +118,7 @@ async def handle_search_query_text(client: Client, message: Message, query_text:
     # Then use fuzzywuzzy to find closest matches in this smaller set.
 
     try:
-        # Basic Text Search (if query > min length) as initial filter
-        db_query_filter: Dict[str, Any] = {}
-        if len(query_text) > 3: # Arbitrary length threshold for text index efficiency
-             db_query_filter = {"$text": {"$search": query_text}}
-
-        # Project relevant fields for search results list display (name, status, year, download count, _id)
-        projection = {"name": 1, "_id": 1, "status": 1, "release_year": 1, "overall_download_count": 1}
-
-        # Fetch a reasonable subset of anime docs, sorting by text score (if using text search) or alphabetically otherwise
-        sort_criteria: List[Tuple[str, Union[int, Dict[str, Any]]]] = [("name", 1)] # Default sort
-        if db_query_filter: # If text search filter is used, add text score sort priority
-            projection["score"] = {"$meta": "textScore"} # Project score to sort by it
-            sort_criteria.insert(0, ("score", {"$meta": "textScore"})) # Sort by score first
-
-        # Limit the initial database fetch for fuzzy matching candidates
-        anime_docs_subset = await MongoDB.anime_collection().find(db_query_filter, projection).sort(sort_criteria).limit(200).to_list(200) # Limit candidates
-
-        # Build a dictionary of name (string) -> full document dictionary from the subset for fuzzy matching
-        # This allows retrieving full projected data after fuzzy match.
-        anime_name_to_doc_dict = {doc['name']: doc for doc in anime_docs_subset}
-        anime_names_list = list(anime_name_to_doc_dict.keys())
-
-
-        # Perform fuzzy matching using fuzzywuzzy's process.extract on the subset of names
-        # Extract the top N matches based on score.
-        # Use a slightly higher limit than display PAGE_SIZE initially if needing robust result ordering later.
-        fuzzy_results_raw = process.extract(query_text, anime_names_list, limit=config.PAGE_SIZE * 2)
-
-        # Filter fuzzy results by the confidence score threshold
-        matching_anime_filtered = []
-        for name_match, score in fuzzy_results_raw:
-             if score >= config.FUZZYWUZZY_THRESHOLD:
-                 # Retrieve the original projected document from the dictionary
-                 original_doc = anime_name_to_doc_dict[name_match]
-                 matching_anime_filtered.append(original_doc) # Store the projected doc for display
-
-
-        # Sort final list of matching anime (e.g., by name for consistency)
-        # This sorting happens *after* fuzzy filtering, applies to the display list.
-        # Re-sorting by relevance based on fuzzy score isn't standard in display list buttons usually.
-        # Let's sort by name.
-        matching_anime_filtered.sort(key=lambda doc: doc.get("name", ""))
-
+        matching_anime_filtered = await find_matching_anime(query_text)
 
         search_logger.info(f"User {user_id} search for '{query_text}': {len(matching_anime_filtered)} results found after fuzzy score filter (threshold {config.FUZZYWUZZY_THRESHOLD}).")
 
@@ -309,11 +268,11 @@ async def search_results_page_callback(client: Client, callback_query: CallbackQ
 
     except ValueError:
          search_logger.warning(f"User {user_id} invalid page number in search list pagination callback: {data}")
-         await client.answer_callback_query(message.id, "🚫 Invalid page number.", show_alert=False) # Toast error
+         await answer_callback(callback_query, "🚫 Invalid page number.", show_alert=True) # Alert error
          return # Stop processing invalid callback
 
 
-    try: await client.answer_callback_query(message.id, f"Loading page {target_page}...")
+    try: await answer_callback(callback_query, f"Loading page {target_page}...")
     except Exception: search_logger.warning(f"Failed to answer callback {data} from user {user_id}")
 
     user_state = await MongoDB.get_user_state(user_id)
@@ -410,6 +369,25 @@ async def display_search_no_results(client: Client, message: Message, query: str
 
     buttons = []
 
+    # --- Did You Mean ---
+    # Spell-correct the query token by token and offer the best title for the corrected text.
+    # Selecting it reuses the normal result selection flow (state is RESULTS_LIST here).
+    did_you_mean_doc = SearchIndex.did_you_mean(query) if SearchIndex.is_ready() else None
+    if did_you_mean_doc:
+        menu_text += strings.SEARCH_DID_YOU_MEAN.format(suggestion=did_you_mean_doc.get("name", "Unnamed Anime")) + "\n\n"
+        buttons.append([InlineKeyboardButton(strings.BUTTON_DID_YOU_MEAN.format(anime_name=did_you_mean_doc.get("name", "Unnamed Anime")), callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{did_you_mean_doc['_id']}")])
+
+    # --- Prefix Suggestions ---
+    # Titles starting with the query (or the longest prefix of it that completes), most downloaded first.
+    if SearchIndex.is_ready():
+        matched_prefix, suggestions = SearchIndex.autocomplete_backoff(query, config.AUTOCOMPLETE_SUGGESTIONS_COUNT)
+        # Don't list the did-you-mean title twice
+        suggestions = [doc for doc in suggestions if not (did_you_mean_doc and doc["_id"] == did_you_mean_doc["_id"])]
+        if suggestions:
+            menu_text += strings.AUTOCOMPLETE_SUGGESTIONS_TITLE.format(prefix=matched_prefix) + "\n\n"
+            for suggestion_doc in suggestions:
+                buttons.append([InlineKeyboardButton(f"💡 {suggestion_doc.get('name', 'Unnamed Anime')}", callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{suggestion_doc['_id']}")])
+
     # Add Request this anime button based on user premium status and configured token cost
     request_button_text = None
     request_callback_data = None
@@ -21,6 +21,7 @@ from strings import (
 
 from database.mongo_db import MongoDB # Access the MongoDB class instance methods
 from database.models import User, GeneratedToken # Import models
+from handlers.callback_ack import answer_callback
 # get_user, save_user might be imported from common_handlers if used, but for tokens $inc is better
 # from handlers.common_handlers import get_user # If you need to fetch the user model after $inc
 
@@ -136,7 +137,7 @@ async def generate_token_link_handler(client: Client, update: Union[Message, Cal
     user = await MongoDB.users_collection().find_one({"user_id": user_id})
     if user is None:
          # This case should ideally not happen due to get_user on /start, but as a safeguard
-         if is_callback: await update.answer(ERROR_OCCURRED, show_alert=True)
+         if is_callback: await answer_callback(update, ERROR_OCCURRED, show_alert=True)
          else: await update.reply_text(ERROR_OCCURRED, parse_mode=config.PARSE_MODE);
          return # Cannot proceed without user data
 
@@ -159,7 +160,7 @@ async def generate_token_link_handler(client: Client, update: Union[Message, Cal
     except Exception as e:
         tokens_logger.error(f"Failed to get bot username to construct token link: {e}")
         error_msg = "💔 Sorry, cannot generate token link right now. Failed to get bot username."
-        if is_callback: await update.answer(error_msg, show_alert=True)
+        if is_callback: await answer_callback(update, error_msg, show_alert=True)
         else: await update.reply_text(error_msg, parse_mode=config.PARSE_MODE);
         return
 
@@ -175,7 +176,7 @@ async def generate_token_link_handler(client: Client, update: Union[Message, Cal
         # If shortening failed (API config missing or error), inform the user
         error_msg = "💔 Sorry, unable to generate the token link right now. The link shortening service is not available."
         tokens_logger.error(f"Failed to generate token link for user {user_id} - Shortener failed.")
-        if is_callback: await update.answer(error_msg, show_alert=True)
+        if is_callback: await answer_callback(update, error_msg, show_alert=True)
         else: await update.reply_text(error_msg, parse_mode=config.PARSE_MODE);
         return
 
@@ -196,7 +197,7 @@ async def generate_token_link_handler(client: Client, update: Union[Message, Cal
         # This could be a database error (e.g., connection issues, permission problems)
         tokens_logger.error(f"Failed to save generated token {unique_token} for user {user_id}: {e}", exc_info=True)
         error_msg = "💔 Failed to save token details in the database. Please try again later."
-        if is_callback: await update.answer(error_msg, show_alert=True)
+        if is_callback: await answer_callback(update, error_msg, show_alert=True)
         else: await update.reply_text(error_msg, parse_mode=config.PARSE_MODE);
         return # Do not proceed if saving token failed
 
@@ -235,7 +236,7 @@ async def generate_token_link_handler(client: Client, update: Union[Message, Cal
                 parse_mode=config.PARSE_MODE,
                 disable_web_page_preview=True # Important for URL buttons
             )
-            await update.answer() # Acknowledge the callback query
+            await answer_callback(update) # Acknowledge the callback query
         else:
              # If invoked via command, send a new reply
              await update.reply_text(
@@ -254,14 +255,14 @@ async def generate_token_link_handler(client: Client, update: Union[Message, Cal
               disable_web_page_preview=True
          )
          if is_callback:
-              try: await update.answer("Cannot edit message. Sending token link as a new message.", show_alert=False)
+              try: await answer_callback(update, "Cannot edit message. Sending token link as a new message.", show_alert=False)
               except Exception: pass # Ignore answer failures
 
 
     except Exception as e:
          # Generic error during message sending/editing
          tokens_logger.error(f"Failed to send/edit generate token message for user {user_id}: {e}", exc_info=True)
-         if is_callback: await update.answer(ERROR_OCCURRED, show_alert=True)
+         if is_callback: await answer_callback(update, ERROR_OCCURRED, show_alert=True)
          else: await update.reply_text(ERROR_OCCURRED, parse_mode=config.PARSE_MODE);
 
 
@@ -274,7 +275,7 @@ async def tokens_tutorial_callback(client: Client, callback_query: CallbackQuery
     message_id = callback_query.message.id # ID of the message to edit
 
     # Acknowledge the callback immediately
-    try: await callback_query.answer()
+    try: await answer_callback(callback_query)
     except Exception: tokens_logger.warning(f"Failed to answer callback query: tokens_tutorial from user {user_id}")
 
     tutorial_message_text = ""
@@ -311,7 +312,7 @@ async def tokens_tutorial_callback(client: Client, callback_query: CallbackQuery
               parse_mode=config.PARSE_MODE,
               disable_web_page_preview=True
          )
-         try: await callback_query.answer("Cannot edit message. Sending tutorial as a new message.", show_alert=False)
+         try: await answer_callback(callback_query, "Cannot edit message. Sending tutorial as a new message.", show_alert=False)
          except Exception: pass # Ignore answer failures
 
 
@@ -1,7 +1,7 @@
 # handlers/watchlist_handler.py
 import logging
 import asyncio # For potential delays or async database operations
-from typing import Union, List, Dict, Any # Import type hints
+from typing import Union, List, Dict, Any, Optional, Tuple # Import type hints
 from pyrogram import Client, filters # Import Pyrogram core and filters
 from pyrogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
@@ -16,7 +16,7 @@ import config # Import configuration constants
 import strings # Import string constants
 
 # Import database models and utilities
-from database.mongo_db import MongoDB # Access MongoDB class instance methods
+from database.mongo_db import MongoDB, ANIME_SUMMARY_PROJECTION # Access MongoDB class instance methods
 # Import necessary specific database helpers for user and anime
 # We'll use the standard users_collection method from MongoDB
 from database.mongo_db import get_user_state, set_user_state, clear_user_state # State management
@@ -26,6 +26,8 @@ from database.models import User, Anime # Import User and Anime models
 
 # Import helpers from common_handlers or search_handler
 from handlers.common_handlers import get_user, edit_or_send_message # Needed helpers
+from handlers.menu_cache import MenuCache, RenderedMenu # Shared rendered watchlist pages
+from handlers.callback_ack import answer_callback
 # May need to display anime details menu again, needs helper from search_handler
 # from handlers.search_handler import display_user_anime_details_menu # Import if directly called
 
@@ -67,7 +69,7 @@ async def handle_watchlist_add_remove_callback(client: Client, callback_query: C
 
     except ValueError as e:
         watchlist_logger.warning(f"User {user_id} invalid watchlist callback data: {data}: {e}")
-        await client.answer_callback_query(message.id, "🚫 Invalid watchlist data.", show_alert=False)
+        await answer_callback(callback_query, "🚫 Invalid watchlist data.", show_alert=True)
         return
 
 
@@ -76,7 +78,7 @@ async def handle_watchlist_add_remove_callback(client: Client, callback_query: C
     if user is None:
          # User not found in DB. Should not happen normally if /start works.
         watchlist_logger.error(f"User {user_id} not found in DB during watchlist {action_type} action for anime {anime_id_str}.")
-        await client.answer_callback_query(message.id, strings.DB_ERROR, show_alert=True)
+        await answer_callback(callback_query, strings.DB_ERROR, show_alert=True)
         return
 
 
@@ -154,7 +156,7 @@ async def handle_watchlist_add_remove_callback(client: Client, callback_query: C
 
                  # --- Redisplay Anime Details Menu with Updated Watchlist Button ---
                  # Fetch the full anime document again
-                 anime = await MongoDB.get_anime_by_id(anime_id_str)
+                 anime = await MongoDB.get_anime_by_id(anime_id_str, ANIME_SUMMARY_PROJECTION)
                  if anime:
                      # Message contains old button state. Re-render it.
                      # Keep the same state (viewing_anime_details)
@@ -184,11 +186,11 @@ async def handle_watchlist_add_remove_callback(client: Client, callback_query: C
                   # Fallback feedback
                   if action_type == 'add': feedback_message_text = "⚠️ Failed to add anime to watchlist."
                   elif action_type == 'remove': feedback_message_text = "⚠️ Failed to remove anime from watchlist."
-                  await client.answer_callback_query(message.id, feedback_message_text, show_alert=True) # Alert user
+                  await answer_callback(callback_query, feedback_message_text, show_alert=True) # Alert user
 
         else:
              # No DB update attempted (already in watchlist, etc). Just acknowledge callback.
-             await client.answer_callback_query(message.id, feedback_message_text, show_alert=False) # Toast (success) or Alert (failure)
+             await answer_callback(callback_query, feedback_message_text, show_alert=False) # Toast (success) or Alert (failure)
 
              # If it was add/remove on already in list, re-display menu might be confusing, as buttons are same.
              # Best is just answer callback, leave menu as is.
@@ -200,94 +202,146 @@ async def handle_watchlist_add_remove_callback(client: Client, callback_query: C
         watchlist_logger.error(f"FATAL error handling watchlist {action_type} callback {data} for user {user_id}: {e}", exc_info=True)
         # Clear state? User is probably not in a state *specific* to watchlist action itself.
         # User might be in browse/search list state. Clearing state is disruptive. Just log error.
-        try: await client.answer_callback_query(message.id, strings.ERROR_OCCURRED, show_alert=True)
+        try: await answer_callback(callback_query, strings.ERROR_OCCURRED, show_alert=True)
         except Exception: pass
         await edit_or_send_message(client, chat_id, message_id, strings.ERROR_OCCURRED, disable_web_page_preview=True)
 
 
 # --- Watchlist Viewing Handler (Callback from Profile) ---
-# Catches callbacks: profile_watchlist_menu
-@Client.on_callback_query(filters.regex("^profile_watchlist_menu$") & filters.private)
+# Catches callbacks: profile_watchlist_menu (first page)
+# Catches callbacks: watchlist_page|<page> (Previous/Next)
+@Client.on_callback_query(filters.regex(f"^(profile_watchlist_menu$|watchlist_page{config.CALLBACK_DATA_SEPARATOR})") & filters.private)
 async def view_watchlist_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     chat_id = callback_query.message.chat.id
     message_id = callback_query.message.id # The profile message
     data = callback_query.data
 
-    try: await client.answer_callback_query(message.id, "Loading watchlist...")
+    try: await answer_callback(callback_query, "Loading watchlist...")
     except Exception: watchlist_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
-    user = await MongoDB.users_collection().find_one({"user_id": user_id}, {"watchlist": 1}) # Fetch only watchlist for efficiency
-    if user is None:
+    page = 0
+    if data.startswith("watchlist_page"):
+        try: page = max(int(data.split(config.CALLBACK_DATA_SEPARATOR)[1]), 0)
+        except (IndexError, ValueError): watchlist_logger.warning(f"User {user_id} invalid watchlist page data in callback: {data}")
+
+    # Only this page's ids leave the users collection, newest additions first
+    watchlist_page = await _fetch_watchlist_page_ids(user_id, page)
+    if watchlist_page is None:
         watchlist_logger.error(f"User {user_id} not found in DB during view watchlist.")
         await edit_or_send_message(client, chat_id, message_id, strings.DB_ERROR, disable_web_page_preview=True)
         return
+    page, total, page_anime_ids = watchlist_page
 
 
     user_state = await MongoDB.get_user_state(user_id)
     # Ensure state is updated/correct when entering this view.
     # Coming from profile, state was potentially 'browse', etc., or 'profile_menu'.
-    await MongoDB.set_user_state(user_id, "watchlist", WatchlistState.VIEWING_LIST, data={})
+    if not (user_state and user_state.handler == "watchlist" and user_state.step == WatchlistState.VIEWING_LIST):
+        await MongoDB.set_user_state(user_id, "watchlist", WatchlistState.VIEWING_LIST, data={})
+
+    # The page is keyed by its content (anime ids, position, total): adding/removing anime changes the key,
+    # and users whose pages hold the same anime share the render. Episode/file writes drop it via invalidate_anime.
+    try:
+        rendered_menu = await MenuCache.get_or_render(
+            "watchlist", (page, total, tuple(str(anime_id) for anime_id in page_anime_ids)),
+            lambda: _render_watchlist_page(user_id, page, total, page_anime_ids),
+            anime_ids=page_anime_ids
+        )
+    except Exception as e:
+        watchlist_logger.error(f"Failed to fetch anime documents for user {user_id} watchlist: {e}", exc_info=True)
+        rendered_menu = RenderedMenu(strings.WATCHLIST_TITLE + "\n\n💔 Error loading watchlist content.", [])
 
+    # Edit the profile message to display the watchlist menu
+    await edit_or_send_message(client, chat_id, message_id, rendered_menu.text, rendered_menu.markup(_watchlist_navigation_rows()), disable_web_page_preview=True)
 
-    # Get the list of Anime ObjectIds from the user's watchlist
-    watchlist_anime_ids_obj = user.get("watchlist", []) # This is already a list of ObjectIds/PyObjectIds due to schema/validation
+    # State is WatchlistState.VIEWING_LIST, stays until user selects anime, changes settings, or navigates back/home.
 
 
+async def _fetch_watchlist_page_ids(user_id: int, page: int) -> Optional[Tuple[int, int, List[ObjectId]]]:
+    """
+    (page, watchlist size, anime ids on the page) sliced server-side from the user's watchlist array, newest first.
+    A page past the end (entries removed meanwhile) falls back to the last page. None if the user doesn't exist.
+    """
+    page_size = config.PAGE_SIZE
+    for _ in range(2):
+        docs = await MongoDB.users_collection().aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$project": {
+                "_id": 0,
+                "total": {"$size": {"$ifNull": ["$watchlist", []]}},
+                "anime_ids": {"$slice": [{"$reverseArray": {"$ifNull": ["$watchlist", []]}}, page * page_size, page_size]}
+            }}
+        ]).to_list(1)
+        if not docs: return None
+        total = docs[0]["total"]
+        if docs[0]["anime_ids"] or page == 0: return page, total, docs[0]["anime_ids"]
+        page = max((total - 1) // page_size, 0)
+    return page, total, []
+
+
+async def _render_watchlist_page(user_id: int, page: int, total: int, page_anime_ids: List[ObjectId]) -> RenderedMenu:
+    """One watchlist page: name, status and latest available episode per anime, fetched in one $in query."""
     menu_text = strings.WATCHLIST_TITLE + "\n\n"
     buttons = []
 
-    if not watchlist_anime_ids_obj:
-         menu_text += strings.WATCHLIST_EMPTY
-         # No buttons for specific anime if list is empty
-
+    if not page_anime_ids:
+        menu_text += strings.WATCHLIST_EMPTY
+        return RenderedMenu(menu_text, buttons)
+
+    # Latest episode = highest (season, episode) with at least one file. Computed on the server: seasons, episodes
+    # and files arrays never leave it. $max over {season_number, episode_number} documents compares them field by field.
+    season_latest = {"$map": {"input": {"$ifNull": ["$seasons", []]}, "as": "season", "in": {
+        "season_number": "$$season.season_number",
+        "episode_number": {"$max": {"$map": {
+            "input": {"$filter": {"input": {"$ifNull": ["$$season.episodes", []]}, "as": "episode", "cond": {"$gt": [{"$size": {"$ifNull": ["$$episode.files", []]}}, 0]}}},
+            "as": "episode", "in": "$$episode.episode_number"
+        }}}
+    }}}
+    anime_docs = await MongoDB.anime_collection().aggregate([
+        {"$match": {"_id": {"$in": page_anime_ids}}},
+        {"$project": {"name": 1, "status": 1, "latest": {"$max": {"$filter": {"input": season_latest, "as": "latest", "cond": {"$ne": ["$$latest.episode_number", None]}}}}}}
+    ]).to_list(len(page_anime_ids))
+    anime_by_id = {anime_doc["_id"]: anime_doc for anime_doc in anime_docs}
+
+    if not anime_by_id:
+        # Watchlist had IDs, but no matching anime documents found? Data inconsistency.
+        menu_text += "⚠️ Your watchlist seems to contain entries for anime that no longer exist."
+        watchlist_logger.warning(f"User {user_id} watchlist page {page} contains IDs ({page_anime_ids}) but no matching anime docs found.")
     else:
-         # Fetch details for the anime in the watchlist (just name for the list)
-         # Use $in operator to fetch multiple documents by _id.
-         try:
-             # Need to fetch projection needed for list display. Sort?
-             # Default sort by name A-Z.
-             watchlist_anime_docs = await MongoDB.anime_collection().find(
-                 {"_id": {"$in": watchlist_anime_ids_obj}},
-                 {"name": 1, "_id": 1} # Project name and ID
-              ).sort("name", 1).to_list(None) # Get all in list (assume watchlist isn't massive)
-
-             if not watchlist_anime_docs:
-                 # Watchlist had IDs, but no matching anime documents found? Data inconsistency.
-                 menu_text += "⚠️ Your watchlist seems to contain entries for anime that no longer exist."
-                 watchlist_logger.warning(f"User {user_id} watchlist contains IDs ({watchlist_anime_ids_obj}) but no matching anime docs found.")
-             else:
-                 # Display watchlist anime list with buttons
-                 for anime_doc in watchlist_anime_docs:
-                      anime_name = anime_doc.get("name", "Unnamed Anime")
-                      anime_id_str = str(anime_doc["_id"])
+        first = page * config.PAGE_SIZE + 1
+        menu_text += strings.WATCHLIST_PAGE_INFO.format(first=first, last=first + len(page_anime_ids) - 1, total=total)
 
-                      # Button label: "Anime Name"
-                      button_label = f"🎬 {anime_name}"
+    # Display watchlist anime list with buttons, in watchlist order (newest additions first)
+    for anime_id in page_anime_ids:
+        anime_doc = anime_by_id.get(anime_id)
+        if anime_doc is None: continue # Deleted anime still referenced by the watchlist
 
-                      # Callback: browse_select_anime|<anime_id> (Clicking leads to Anime Details - reusing browse logic)
-                      # State transition: watchlist_handler:VIEWING_LIST -> browse_handler:viewing_anime_details (with source_handler='watchlist' in data?)
-                      buttons.append([InlineKeyboardButton(button_label, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id_str}")]) # Re-use logic to view details
+        button_label = strings.WATCHLIST_ITEM_BUTTON.format(anime_name=anime_doc.get("name", "Unnamed Anime"), status=anime_doc.get("status") or "N/A")
+        latest = anime_doc.get("latest")
+        if latest: button_label += strings.WATCHLIST_ITEM_LATEST_EPISODE.format(season_number=latest["season_number"], episode_number=latest["episode_number"])
 
+        # Callback: browse_select_anime|<anime_id> (Clicking leads to Anime Details - reusing browse logic)
+        buttons.append([InlineKeyboardButton(button_label, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{anime_id}")]) # Re-use logic to view details
 
-         except Exception as e:
-             watchlist_logger.error(f"Failed to fetch anime documents for user {user_id} watchlist: {e}", exc_info=True)
-             menu_text += "💔 Error loading watchlist content."
-             # Buttons remain empty
+    # Previous/Next page
+    navigation_row = []
+    if page > 0:
+        navigation_row.append(InlineKeyboardButton(strings.BUTTON_PREVIOUS_PAGE, callback_data=f"watchlist_page{config.CALLBACK_DATA_SEPARATOR}{page - 1}"))
+    if (page + 1) * config.PAGE_SIZE < total:
+        navigation_row.append(InlineKeyboardButton(strings.BUTTON_NEXT_PAGE, callback_data=f"watchlist_page{config.CALLBACK_DATA_SEPARATOR}{page + 1}"))
+    if navigation_row: buttons.append(navigation_row)
 
+    return RenderedMenu(menu_text, buttons)
 
-    # Add Navigation buttons: Notification Settings, Back to Profile, Back to Main Menu
-    buttons.append([InlineKeyboardButton(strings.BUTTON_NOTIFICATION_SETTINGS.format(status="View/Edit"), callback_data="profile_notification_settings_menu")]) # Link to settings
-    buttons.append([InlineKeyboardButton(strings.BUTTON_BACK, callback_data="menu_profile")]) # Back to Profile
-    buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-
-
-    reply_markup = InlineKeyboardMarkup(buttons)
 
-    # Edit the profile message to display the watchlist menu
-    await edit_or_send_message(client, chat_id, message_id, menu_text, reply_markup, disable_web_page_preview=True)
-
-    # State is WatchlistState.VIEWING_LIST, stays until user selects anime, changes settings, or navigates back/home.
+def _watchlist_navigation_rows() -> List[List[InlineKeyboardButton]]:
+    # Add Navigation buttons: Notification Settings, Back to Profile, Back to Main Menu
+    return [
+        [InlineKeyboardButton(strings.BUTTON_NOTIFICATION_SETTINGS.format(status="View/Edit"), callback_data="profile_notification_settings_menu")], # Link to settings
+        [InlineKeyboardButton(strings.BUTTON_BACK, callback_data="menu_profile")], # Back to Profile
+        [InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]
+    ]
 
 # --- Notification Settings Handler (Callback from Profile and Watchlist Menu) ---
 # Catches callbacks: profile_notification_settings_menu
@@ -299,7 +353,7 @@ async def notification_settings_callback(client: Client, callback_query: Callbac
      message_id = callback_query.message.id
      data = callback_query.data
 
-     try: await client.answer_callback_query(message.id, "Loading notification settings...")
+     try: await answer_callback(callback_query, "Loading notification settings...")
      except Exception: watchlist_logger.warning(f"Failed to answer callback query {data} from user {user_id}")
 
      user = await MongoDB.users_collection().find_one({"user_id": user_id})
@@ -366,7 +420,7 @@ async def toggle_notification_setting_callback(client: Client, callback_query: C
      data = callback_query.data
 
      # Acknowledge immediately
-     try: await client.answer_callback_query(message.id)
+     try: await answer_callback(callback_query)
      except Exception: watchlist_logger.warning(f"Failed to answer callback query {data} from user {user_id}.")
 
 
@@ -396,7 +450,7 @@ async def toggle_notification_setting_callback(client: Client, callback_query: C
         # Validate setting key against allowed defaults
         if setting_key not in config.DEFAULT_NOTIFICATION_SETTINGS:
              watchlist_logger.warning(f"User {user_id} attempted to toggle non-preset notification setting: {setting_key}.")
-             await client.answer_callback_query(message.id, "🚫 Invalid setting option.", show_alert=False)
+             await answer_callback(callback_query, "🚫 Invalid setting option.", show_alert=True)
              # State remains Viewing Settings.
              return
 
@@ -439,7 +493,7 @@ async def toggle_notification_setting_callback(client: Client, callback_query: C
 
      except ValueError as e:
          watchlist_logger.warning(f"User {user_id} invalid setting key in toggle notification callback: {data}: {e}")
-         await client.answer_callback_query(message.id, "🚫 Invalid setting key.", show_alert=False)
+         await answer_callback(callback_query, "🚫 Invalid setting key.", show_alert=True)
          # State remains Viewing Settings.
 
      except Exception as e:
@@ -453,183 +507,152 @@ async def toggle_notification_setting_callback(client: Client, callback_query: C
 
 
 # --- Notification Logic (Triggered by Admin Content Updates) ---
+# Content changes enqueue jobs in the notification outbox (handlers/notification_outbox.py); its workers stream the
+# subscribers matching watchlist_subscribers_query. Users with instant notifications get build_watchlist_notification
+# per change; the others (notification_settings "digest", on by default) get one build_watchlist_digest per anime
+# for all the changes of a NOTIFICATION_DIGEST_WINDOW_SECONDS window.
 
-async def notify_watchlist_users_about_update(client: Client, anime_id: ObjectId, season_number: int, episode_number: int, update_type: str, update_details: Optional[Dict] = None):
-    """
-    Finds users who have the specified anime in their watchlist and are
-    subscribed to notifications for the given update type, and sends them a message.
-    This function should be called by content_handler.py when a relevant update occurs
-    (e.g., after adding a new episode, adding a file version).
-    """
-    notification_logger = logging.getLogger("NotificationLogic")
-    notification_logger.info(f"Initiating watchlist notification for anime ID {anime_id}, S{season_number}E{episode_number}, update type: {update_type}. Details: {update_details}")
+NOTIFICATION_UPDATE_TYPES = ["new_episode", "new_version", "release_date_updated"]
 
 
-    # Validate update type
-    allowed_update_types = ["new_episode", "new_version", "release_date_updated"]
-    if update_type not in allowed_update_types:
-         notification_logger.error(f"Attempted to send watchlist notification with invalid update type: {update_type}. Aborting.")
-         return
-
-
-    try:
-        # Find all users whose watchlist contains the specified anime_id
-        # And whose notification_settings for the given update_type is True
-        filter_query = {
-            "watchlist": anime_id, # Find documents where watchlist array contains this ObjectId
-            # Need to also filter based on nested notification_settings
-            f"notification_settings.{update_type}": True # Example filter for nested key
-        }
-
-        # Project only user_id to send messages
-        projection = {"user_id": 1}
-
-        # Fetch users as a list of user_id documents
-        users_to_notify_docs = await MongoDB.users_collection().find(filter_query, projection).to_list(None)
-
-        if not users_to_notify_docs:
-            notification_logger.info(f"No users found on watchlist for anime {anime_id} with '{update_type}' notifications enabled.")
-            return # No one to notify
-
-        notification_logger.info(f"Found {len(users_to_notify_docs)} users to notify about update for anime {anime_id}, type '{update_type}'.")
-
-        # --- Construct the Notification Message ---
-        # Needs context about the anime and episode/update. Fetch anime name.
-        anime = await MongoDB.anime_collection().find_one({"_id": anime_id}, {"name": 1})
-        anime_name = anime.get("name", "An Anime") if anime else "An Anime"
-
-        message_text = ""
-        reply_markup = None # Can add button to episode/version
-
-
-        if update_type == "new_episode":
-             # Fetch the specific episode document to get release date or other info
-             filter_episode = {"_id": anime_id, "seasons.season_number": season_number, "seasons.0.episodes.episode_number": episode_number}
-             projection_episode = {"name":1, "seasons.$": 1} # Project matched season to get episode details
-             anime_doc_episode = await MongoDB.anime_collection().find_one(filter_episode, projection_episode)
-             episode_details_doc = None
-             if anime_doc_episode and anime_doc_episode.get("seasons") and anime_doc_episode["seasons"][0] and anime_doc_episode["seasons"][0].get("episodes"):
-                 episode_details_doc = anime_doc_episode["seasons"][0]["episodes"][0] # The episode doc itself
-
-
-             # Link should go to Anime Details menu. Needs anime ID in callback.
-             button_callback = f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}" # Link to view anime details menu
+def watchlist_subscribers_query(anime_id: ObjectId, update_types: List[str], digest: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Reachable users with the anime on their watchlist, subscribed to any of the update types.
+    digest=True keeps only users who want digests, digest=False only those who want instant messages.
+    """
+    query: Dict[str, Any] = {
+        "watchlist": anime_id, # Find documents where watchlist array contains this ObjectId
+        "$or": [{f"notification_settings.{update_type}": True} for update_type in update_types],
+        "reachability": "ok" # Users who blocked the bot are skipped (partial index on watchlist over reachable users)
+    }
+    if digest is True: query["notification_settings.digest"] = {"$ne": False} # Missing means the default: digest
+    elif digest is False: query["notification_settings.digest"] = False
+    return query
 
-             # Or link directly to the episode versions list? More complex. Requires new state/handler entry point.
-             # Callback: download_select_episode|<anime_id>|<season>|<ep>
-             button_callback_direct_episode = f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{episode_number}"
 
+def wants_update(notification_settings: Optional[Dict[str, bool]], update_type: str) -> bool:
+    return (notification_settings or {}).get(update_type, config.DEFAULT_NOTIFICATION_SETTINGS.get(update_type, False))
 
-             # Construct message using string format
-             message_text = strings.WATCHLIST_ADDED_NOTIFICATION.format(
-                 anime_title=anime_name,
-                 season_number=season_number,
-                 episode_number=episode_number,
-                 # Placeholder for anime_url needs to point to a place where they can click to see details in bot.
-                 # Use a Telegram Deep Link back to bot with /start payload encoding anime ID? Or use callback button.
-                 anime_url=f"https://t.me/{client.me.username}?start=view_anime_{str(anime_id)}" # Example deep link payload
-                 # OR pass nothing, add button instead. Use BUTTON_SEE_DETAILS_OR_EPISODE
-             )
 
-             # Add a button to jump to the episode's version list directly (recommended)
-             buttons = [[InlineKeyboardButton(f"🎬 View S{season_number}E{episode_number:02d}", callback_data=button_callback_direct_episode)]]
-             # Maybe also button to just see anime details: [InlineKeyboardButton("Info", callback_data=button_callback)]
-             buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]) # Main menu always
+def _format_episode_ranges(episode_numbers: List[int]) -> str:
+    """[5, 6, 7, 8, 9, 12] -> "E5–E9, E12"."""
+    ranges: List[List[int]] = []
+    for episode_number in sorted(set(episode_numbers)):
+        if ranges and episode_number == ranges[-1][1] + 1: ranges[-1][1] = episode_number
+        else: ranges.append([episode_number, episode_number])
+    return ", ".join(f"E{first}" if first == last else f"E{first}–E{last}" for first, last in ranges)
 
-             reply_markup = InlineKeyboardMarkup(buttons)
 
+async def build_watchlist_notification(client: Client, anime_id: ObjectId, season_number: int, episode_number: int, update_type: str, update_details: Optional[Dict] = None) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """
+    Text and buttons of a watchlist notification, or None when it can't be built
+    (unknown update type, missing details). Built once per outbox job, sent to every subscriber.
+    """
+    notification_logger = logging.getLogger("NotificationLogic")
+    update_details = update_details or {}
 
-        elif update_type == "new_version":
-             # Expecting update_details dict containing 'file_unique_id', maybe quality, audio, subs?
-             if update_details is None or not update_details.get("file_unique_id"):
-                 notification_logger.error(f"Missing file unique ID in details for new_version notification for {anime_id}/S{season_number}E{episode_number}. Details: {update_details}. Aborting notification.")
-                 return # Cannot send notification if missing crucial info
+    if update_type not in NOTIFICATION_UPDATE_TYPES:
+         notification_logger.error(f"Attempted to build watchlist notification with invalid update type: {update_type}.")
+         return None
 
+    # Needs context about the anime and episode/update. Fetch anime name.
+    anime = await MongoDB.anime_collection().find_one({"_id": anime_id}, {"name": 1})
+    anime_name = anime.get("name", "An Anime") if anime else "An Anime"
+    anime_url = f"https://t.me/{client.me.username}?start=view_anime_{str(anime_id)}" # Deep link back to the bot
 
-             # Fetch details for the specific file version to include info in message.
-             # Need to find the file version within the episode, or rely on details in update_details
-             # Rely on update_details containing summary info for the notification message.
-             version_summary = update_details.get("version_summary", "a new version") # e.g. "1080p (JP/EN Subs)"
+    # Every notification links straight to the episode's versions list. Callback: download_select_episode|<anime_id>|<season>|<ep>
+    button_callback_episode = f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{episode_number}"
 
-             # Link directly to episode version list is best. Callback: download_select_episode|<anime_id>|<season>|<ep>
-             button_callback_episode = f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{episode_number}"
 
-             message_text = strings.WATCHLIST_NEW_VERSION_NOTIFICATION.format(
-                  anime_title=anime_name,
-                  season_number=season_number,
-                  episode_number=episode_number,
-                  version_summary=version_summary,
-                 # Anime_url needs to be link to details/bot.
-                 anime_url=f"https://t.me/{client.me.username}?start=view_anime_{str(anime_id)}"
-             )
-             # Add a button to jump directly to episode versions list
-             buttons = [[InlineKeyboardButton(f"📥 View Download Options", callback_data=button_callback_episode)]]
-             buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-             reply_markup = InlineKeyboardMarkup(buttons)
+    if update_type == "new_episode":
+         message_text = strings.WATCHLIST_ADDED_NOTIFICATION.format(
+             anime_title=anime_name,
+             season_number=season_number,
+             episode_number=episode_number,
+             anime_url=anime_url
+         )
+         buttons = [[InlineKeyboardButton(f"🎬 View S{season_number}E{episode_number:02d}", callback_data=button_callback_episode)]]
 
 
-        elif update_type == "release_date_updated":
-            # Notification for date update. Requires details like the date string.
-            # Requires config DEFAULT_NOTIFICATION_SETTINGS.release_date_updated = True
-            # Get formatted date from update_details?
-             formatted_date = update_details.get("release_date", "An Updated Date")
+    elif update_type == "new_version":
+         # Expecting update_details with 'file_unique_id' and the version's quality/audio/subtitles
+         if not update_details.get("file_unique_id"):
+             notification_logger.error(f"Missing file unique ID in details for new_version notification for {anime_id}/S{season_number}E{episode_number}. Details: {update_details}.")
+             return None
 
-            # Link directly to episode details. Callback: download_select_episode|<anime_id>|<season>|<ep>
-             button_callback_episode = f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{episode_number}"
+         message_text = strings.WATCHLIST_NEW_VERSION_NOTIFICATION.format(
+              anime_title=anime_name,
+              season_number=season_number,
+              episode_number=episode_number,
+              quality=update_details.get("quality", "New"),
+              audio=update_details.get("audio", "N/A"),
+              subs=update_details.get("subs", "None"),
+              anime_url=anime_url
+         )
+         buttons = [[InlineKeyboardButton(f"📥 View Download Options", callback_data=button_callback_episode)]]
 
-             message_text = f"🔔 <b><u>Watchlist Update!</u></b> 🔔\n\nRelease date updated for <b>{anime_name}</b> - S<b>__{season_number}__</b>E<b>__{episode_number:02d}__</b>."
-             if formatted_date != "An Updated Date":
-                 message_text += f"\n\nNew Estimated Release: <b>{formatted_date}</b>." # Add date if available
 
-             message_text += f"\n\nCheck episode details: 👇"
+    else: # release_date_updated
+         formatted_date = update_details.get("release_date")
+         message_text = f"🔔 <b><u>Watchlist Update!</u></b> 🔔\n\nRelease date updated for <b>{anime_name}</b> - S<b>__{season_number}__</b>E<b>__{episode_number:02d}__</b>."
+         if formatted_date: message_text += f"\n\nNew Estimated Release: <b>{formatted_date}</b>." # Add date if available
+         message_text += f"\n\nCheck episode details: 👇"
+         buttons = [[InlineKeyboardButton(f"⏳ View Episode Details", callback_data=button_callback_episode)]]
 
-             # Add a button to jump directly to episode management view (user version)
-             buttons = [[InlineKeyboardButton(f"⏳ View Episode Details", callback_data=button_callback_episode)]]
-             buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")])
-             reply_markup = InlineKeyboardMarkup(buttons)
 
+    buttons.append([InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]) # Main menu always
+    return message_text, InlineKeyboardMarkup(buttons)
 
-        else:
-             notification_logger.error(f"Notification message creation not implemented for update type: {update_type}")
-             return # Cannot send message if type is not handled.
-
-
-        # --- Send the Message to Each User ---
-        # Iterate through the list of user document dictionaries and send the message to each user_id.
-        for user_doc in users_to_notify_docs:
-            user_id_to_notify = user_doc.get("user_id")
-            if user_id_to_notify is None: continue # Skip if user_id is missing
-
-
-            try:
-                # Use client.send_message. Catch FloodWait, UserNotParticipant (user blocked bot).
-                await client.send_message(
-                     chat_id=user_id_to_notify, # Send to the user's private chat
-                     text=message_text,
-                     reply_markup=reply_markup,
-                     parse_mode=config.PARSE_MODE,
-                     disable_web_page_preview=True # Good for URLs, preventing big previews.
-                 )
-                notification_logger.debug(f"Sent '{update_type}' notification to user {user_id_to_notify} for anime {anime_id}.")
-
-            except UserNotParticipant:
-                notification_logger.info(f"User {user_id_to_notify} not participating or blocked bot. Cannot send notification for anime {anime_id}.")
-                 # Consider removing user from watchlist automatically if this happens frequently? Optional.
-            except FloodWait as e:
-                 notification_logger.warning(f"FloodWait while sending notification to user {user_id_to_notify}. Retrying after {e.value}s for anime {anime_id}: {e}")
-                 await asyncio.sleep(e.value)
-                 # Retry sending to this user once? Or skip this user?
-                 try: await client.send_message(chat_id=user_id_to_notify, text=message_text, reply_markup=reply_markup, parse_mode=config.PARSE_MODE, disable_web_page_preview=True)
-                 except Exception as retry_e: notification_logger.error(f"Retry failed sending notification to {user_id_to_notify} for anime {anime_id}: {retry_e}", exc_info=True)
-                 pass # Continue to next user even if retry failed
-
-            except Exception as e:
-                # Catch any other error during message sending
-                notification_logger.error(f"Failed to send notification message to user {user_id_to_notify} for anime {anime_id}: {e}", exc_info=True)
-                # Continue to the next user even if one send fails
 
-
-    except Exception as e:
-         notification_logger.critical(f"FATAL error during watchlist notification processing for anime {anime_id}: {e}", exc_info=True)
-         # Don't raise exception here, notification is a background-like task.
-         # Ensure critical logging triggers alerts for admins.
+async def build_watchlist_digest(client: Client, anime_id: ObjectId, events: List[Dict[str, Any]]) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """
+    One message for several changes of an anime ({"season_number", "episode_number", "update_type", "update_details"}):
+    new episodes by season as ranges with their qualities, other new versions, release date changes.
+    A single change gets the regular notification.
+    """
+    if not events: return None
+    if len(events) == 1:
+        event = events[0]
+        return await build_watchlist_notification(client, anime_id, event["season_number"], event["episode_number"], event["update_type"], event.get("update_details"))
+
+    anime = await MongoDB.anime_collection().find_one({"_id": anime_id}, {"name": 1})
+    anime_name = anime.get("name", "An Anime") if anime else "An Anime"
+
+    new_episodes: Dict[int, set] = {} # season -> episode numbers
+    new_versions: Dict[int, set] = {}
+    qualities: Dict[Tuple[int, int], List[str]] = {} # (season, episode) -> qualities in upload order
+    release_dates: Dict[Tuple[int, int], str] = {} # Latest date per episode
+    for event in events:
+        key = (event["season_number"], event["episode_number"])
+        details = event.get("update_details") or {}
+        if event["update_type"] == "release_date_updated":
+            release_dates[key] = details.get("release_date", "updated")
+            continue
+        (new_episodes if event["update_type"] == "new_episode" else new_versions).setdefault(key[0], set()).add(key[1])
+        if details.get("quality") and details["quality"] not in qualities.setdefault(key, []): qualities[key].append(details["quality"])
+
+    def qualities_of(season_number: int, episode_numbers: set) -> str:
+        found: List[str] = []
+        for episode_number in sorted(episode_numbers):
+            found += [quality for quality in qualities.get((season_number, episode_number), []) if quality not in found]
+        return ", ".join(found) or "new"
+
+    lines = []
+    for season_number in sorted(new_episodes):
+        lines.append(strings.WATCHLIST_DIGEST_EPISODES_LINE.format(season_number=season_number, episodes=_format_episode_ranges(list(new_episodes[season_number])), qualities=qualities_of(season_number, new_episodes[season_number])))
+    for season_number in sorted(new_versions):
+        episodes = new_versions[season_number] - new_episodes.get(season_number, set()) # Versions of new episodes are in the line above
+        if episodes: lines.append(strings.WATCHLIST_DIGEST_VERSIONS_LINE.format(season_number=season_number, episodes=_format_episode_ranges(list(episodes)), qualities=qualities_of(season_number, episodes)))
+    for (season_number, episode_number), release_date in sorted(release_dates.items()):
+        lines.append(strings.WATCHLIST_DIGEST_RELEASE_DATE_LINE.format(season_number=season_number, episode_number=episode_number, release_date=release_date))
+
+    message_text = strings.WATCHLIST_DIGEST_NOTIFICATION.format(
+        anime_title=anime_name, anime_url=f"https://t.me/{client.me.username}?start=view_anime_{str(anime_id)}", lines="\n".join(lines)
+    )
+    episodes_touched = {(event["season_number"], event["episode_number"]) for event in events}
+    if len(episodes_touched) == 1: # Several versions of one episode: straight to its versions list
+        season_number, episode_number = episodes_touched.pop()
+        button = InlineKeyboardButton(f"📥 View S{season_number}E{episode_number:02d}", callback_data=f"download_select_episode{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}{config.CALLBACK_DATA_SEPARATOR}{season_number}{config.CALLBACK_DATA_SEPARATOR}{episode_number}")
+    else:
+        button = InlineKeyboardButton(strings.WATCHLIST_DIGEST_BUTTON, callback_data=f"browse_select_anime{config.CALLBACK_DATA_SEPARATOR}{str(anime_id)}")
+    return message_text, InlineKeyboardMarkup([[button], [InlineKeyboardButton(strings.BUTTON_HOME, callback_data="menu_home")]])
@@ -140,6 +140,14 @@ try:
     main_logger.info("Importing database functions and models.")
     from database.mongo_db import init_db, MongoDB
     from database.mongo_db import DB_NAME as DB_NAME_CONST # Access DB_NAME needed by init_database_async log
+    from database.search_index import SearchIndex # In-memory catalog index, built after DB init
+    from database.similarity_index import SimilarityIndex # Similar-anime lists, rebuilt in the background
+    from handlers.delivery_queue import DeliveryQueue # Worker pool sending downloaded files
+    from handlers.file_health import FileHealth # file_id checks against the storage channel
+    from database.download_events import DownloadEvents # Buffered writer of the download_events time series
+    from handlers.broadcast_engine import BroadcastEngine # Persisted broadcast jobs (resumed after a restart)
+    from handlers.reachability import Reachability # Buffered writer of users' reachability status
+    from handlers.notification_outbox import NotificationOutbox # Watchlist notification jobs (resumed after a restart)
     from database.models import User # Example model import if needed early (or import within handlers)
     main_logger.info("Database modules imported successfully.")
     print("DEBUG: --- Step 3.2: DB modules imported successfully. ---")
@@ -355,6 +363,30 @@ async def run_app_async():
     main_logger.info("Health check server: Running and listening on configured port/path.")
 
 
+    # Build the in-memory search index used by inline mode (and search). Needs the DB connection.
+    # Failure is not fatal: inline queries answer empty until a later rebuild succeeds.
+    main_logger.info("Building in-memory search index.")
+    try:
+        await SearchIndex.build()
+        main_logger.info(f"Search index ready with {SearchIndex.size()} anime.")
+        print("DEBUG: --- Step 7.2.1: Search index built. ---")
+    except Exception as e:
+        main_logger.error(f"Failed to build search index at startup: {e}. Inline search unavailable.", exc_info=True)
+
+
+    # File delivery workers send queued downloads under the Telegram rate limits
+    DeliveryQueue.start(bot)
+    asyncio.create_task(FileHealth.run_forever(bot))
+    asyncio.create_task(DownloadEvents.run_forever())
+    asyncio.create_task(Reachability.run_forever())
+    asyncio.create_task(BroadcastEngine.resume_after_restart(bot))
+    NotificationOutbox.start(bot)
+
+    # Similar-anime lists: loaded from the DB now, then rebuilt on a schedule (skips runs while the search index isn't ready)
+    asyncio.create_task(SimilarityIndex.run_forever())
+    main_logger.info("Similarity index task scheduled.")
+
+
     # Report bot startup to the log channel (if configured and bot is connected)
     if LOG_CHANNEL_ID is not None and bot.is_connected:
          main_logger.info(f"Configured LOG_CHANNEL_ID is {LOG_CHANNEL_ID}. Scheduling startup notification task.")
@@ -64,6 +64,9 @@ BUTTON_HOME = "🏠 Main Menu" # For navigation back
 BUTTON_BACK = "↩️ Back"
 BUTTON_NEXT_PAGE = "➡️ Next ▶️"
 BUTTON_PREVIOUS_PAGE = "◀️ Previous ⬅️"
+BUTTON_JUMP_TO_LETTER = "🔤 A-Z" # Opens the jump-to-letter grid on alphabetical lists
+JUMP_TO_LETTER_PROMPT = "🔤 <b>Jump to titles starting with:</b>"
+LIST_PAGE_RANGE = "<b>{total}</b> titles • <b>{first}</b> … <b>{last}</b>" # Header of keyset-paginated lists (no page numbers)
 
 # --- Browse Handlers ---
 BROWSE_MAIN_MENU = "📚 <b><u>Browse Options</u></b> 📚\n\nHow would you like to explore our anime library?"
@@ -80,11 +83,17 @@ BUTTON_APPLY_FILTER = "✅ Apply Filter" # After selecting multiple options
 BUTTON_CLEAR_FILTERS = "🔄 Clear Filters"
 
 BROWSE_LIST_TITLE = "📚 <b><u>Anime Library</u></b> 📚\n\n" # Add {filter_info} placeholder
+BROWSE_LIST_SEARCH_HINT = "<i>💡 Send a name to search within this list.</i>" # Shown under the browse list
+BROWSE_LIST_SEARCH_INFO = "Search: <code>{query}</code>" # Added to the active filters line while searching within filters
+BUTTON_CLEAR_BROWSE_SEARCH = "✖️ Clear Search" # Drops the text query, keeps the filters
 
 # --- Search Handlers ---
 SEARCH_PROMPT = "🔍 <b><u>Search</u></b>\n\nSend me the name of the anime you want to find:"
 SEARCH_RESULTS_TITLE = "🔍 <b><u>Search Results for</u></b> <code>{query}</code> 👇"
 SEARCH_NO_MATCHES_REQUEST_BUTTON_FREE = "👇 Request \"{query}\" ({cost} Tokens)" # For the "Request this anime" button on no search results (Free User)
+SEARCH_DID_YOU_MEAN = "🤔 Did you mean <b>{suggestion}</b>?" # Typo-corrected suggestion on the no results view
+BUTTON_DID_YOU_MEAN = "🤔 {anime_name}" # Button opening the did-you-mean anime
+AUTOCOMPLETE_SUGGESTIONS_TITLE = "💡 <b>Titles starting with</b> <code>{prefix}</code>:" # Shown above prefix suggestions on the no results view
 SEARCH_NO_MATCHES_REQUEST_BUTTON_PREMIUM = "👇 Request \"{query}\" (FREE)" # For the "Request this anime" button on no search results (Premium User)
 
 
@@ -104,6 +113,7 @@ ANIME_DETAILS_FORMAT = """
 """ # Season list follows, Add to Watchlist button below
 BUTTON_ADD_TO_WATCHLIST = "❤️ Add to Watchlist"
 BUTTON_REMOVE_FROM_WATCHLIST = "💔 Remove from Watchlist"
+SIMILAR_ANIME_BUTTON = "💡 Similar: {anime_name}" # "More like this" buttons under the season list
 
 SEASON_LIST_TITLE_USER = "👇 <b><u>Select a Season for</u></b> <b>{anime_title}</b> 👇"
 EPISODE_LIST_TITLE_USER = "🎞️ <b><u>Episodes for</u></b> <b>{anime_title}</b> - Season {season_number} 👇"
@@ -111,6 +121,12 @@ EPISODE_LIST_TITLE_USER = "🎞️ <b><u>Episodes for</u></b> <b>{anime_title}</
 EPISODE_FORMAT_AVAILABLE_USER = "🎬 EP{episode_number:02d}" # Format like EP01, EP02
 EPISODE_FORMAT_RELEASE_DATE_USER = "⏳ EP{episode_number:02d} - Release: {release_date}" # Example format
 EPISODE_FORMAT_NOT_ANNOUNCED_USER = "🚫 EP{episode_number:02d} - Release Date Not Announced"
+# Compact labels for the paginated episode grid (several buttons per row)
+EPISODE_GRID_AVAILABLE_USER = "✅ {episode_number}"
+EPISODE_GRID_RELEASE_DATE_USER = "⏳ {episode_number}"
+EPISODE_GRID_NOT_ANNOUNCED_USER = "🚫 {episode_number}"
+EPISODE_GRID_PAGE_INFO = "Episodes <b>{first}</b>–<b>{last}</b> of <b>{total}</b>\n✅ Available • ⏳ Release date set • 🚫 Not announced"
+EPISODE_RANGE_BUTTON = "{first}–{last}" # Range jump button, e.g. "1–40"
 
 VERSION_LIST_TITLE_USER = "📥 <b><u>Download Options for</u></b> <b>{anime_title}</b> - EP{episode_number:02d} 👇"
 VERSION_DETAILS_FORMAT_USER = """
@@ -131,6 +147,28 @@ PREMIUM_REQUIRED = "This feature is exclusive to Premium users. ✨ Unlock unlim
 FILE_BEING_SENT = "Sending your file now... 💪 Please be patient, this may take a few moments."
 FILE_SENT_SUCCESS = "✅ File sent successfully! Enjoy! 🎉"
 FILE_SEND_ERROR = "😞 Sorry, failed to send the file. Please try again." # Should be handled in download logic
+FILE_QUEUED = "📦 Your file is queued (position <b>{position}</b>) and will arrive in this chat shortly."
+DELIVERY_QUEUE_FULL = "🚦 Too many downloads are waiting right now. Please try again in a minute. (No tokens were used.)"
+DOWNLOAD_ALREADY_QUEUED = "⏳ This download is already on its way."
+
+# Batch downloads (whole season / episode range)
+BUTTON_BATCH_SEASON = "📦 Whole Season"
+BUTTON_BATCH_RANGE = "📦 Episodes {first}–{last}"
+BUTTON_BATCH_CONFIRM = "✅ Send {count} Files"
+BATCH_CONFIRM = "📦 <b><u>Batch Download</u></b>\n\n<b>{anime_title}</b> - Season {season_number}, episodes {first}–{last}\n\n{count} file(s), {total_size} in total, one per episode (preferred quality: {preference}).\nCost: <b>{cost}</b> token(s)."
+BATCH_MISSING_EPISODES = "\n⏳ Not available yet: episodes {episodes}."
+BATCH_TRUNCATED = "\nℹ️ Only the first {count} episodes are included. Download the rest as another batch."
+BATCH_NOTHING_AVAILABLE = "😕 None of these episodes has a file yet."
+BATCH_TITLE = "{anime_title} - Season {season_number}"
+BATCH_QUEUED = "📦 <b>{title}</b>: {count} files queued (position <b>{position}</b>). This message shows the progress."
+BATCH_PROGRESS = "📤 <b>{title}</b>: sending... {done}/{total} files"
+BATCH_DONE = "✅ <b>{title}</b>: all {total} files sent! Enjoy! 🎉"
+BATCH_DONE_WITH_FAILURES = "⚠️ <b>{title}</b>: {delivered}/{total} files sent. Episodes {failed_episodes} could not be sent; their tokens were refunded."
+
+# File ID health checks (sent to the log channel, or to the admins)
+FILE_HEALTH_DEAD_REPORT = "🩺 <b><u>File Health Check</u></b>\n\n{count} file(s) can no longer be sent and have no usable copy in the storage channel. Please re-upload them:"
+FILE_HEALTH_DEAD_LINE = "• {anime_name} S{season_number}E{episode_number:02d} ({quality})"
+FILE_HEALTH_DEAD_MORE = "...and {count} more."
 
 # --- Profile & Watchlist Handlers ---
 PROFILE_TITLE = "👤 <b><u>Your Profile</u></b> 👤"
@@ -149,12 +187,16 @@ BUTTON_NOTIFICATION_SETTINGS = "🔔 Notification Settings: {status}" # Status w
 
 WATCHLIST_TITLE = "🎬 <b><u>Your Watchlist</u></b> 🎬"
 WATCHLIST_EMPTY = "Your watchlist is empty! 😥 Add anime you love by viewing their details and clicking the '❤️ Add to Watchlist' button."
+WATCHLIST_PAGE_INFO = "<b>{first}</b>–<b>{last}</b> of <b>{total}</b> • newest additions first"
+WATCHLIST_ITEM_BUTTON = "🎬 {anime_name} • {status}"
+WATCHLIST_ITEM_LATEST_EPISODE = " • S{season_number}E{episode_number:02d}" # Latest episode with files, appended to the item button
 
 NOTIFICATION_SETTINGS_TITLE = "🔔 <b><u>Notification Settings</u></b> 🔔"
 NOTIFICATION_SETTINGS_PROMPT = "Select the types of notifications you want to receive for your watchlist:"
 BUTTON_NOTIFY_NEW_EPISODE_STATE = "➕ New Episodes: {state}" # State is ✅ On or ❌ Off
 BUTTON_NOTIFY_NEW_VERSION_STATE = "✨ New Versions: {state}" # State is ✅ On or ❌ Off
 BUTTON_NOTIFY_RELEASE_DATE_STATE = "⏳ Date Changes: {state}" # State is ✅ On or ❌ Off
+BUTTON_NOTIFY_DIGEST_STATE = "🗂 Group Updates Into Digests: {state}" # Off: one message per change, right away
 
 BUTTON_SAVE_NOTIFICATION_SETTINGS = "💾 Save Settings" # Optional if toggle updates instantly
 NOTIFICATION_SETTINGS_SAVED = "🔔 Your notification settings have been saved!"
@@ -175,6 +217,19 @@ New version ({quality}, {audio}/{subs}) available for <a href="{anime_url}"><b>{
 Download it now! 👇
 """
 
+WATCHLIST_DIGEST_NOTIFICATION = """
+🔔 <b><u>Watchlist Update!</u></b> 🔔
+
+<a href="{anime_url}"><b>{anime_title}</b></a>
+{lines}
+
+Check it out! 👇
+"""
+WATCHLIST_DIGEST_EPISODES_LINE = "🎬 S{season_number} {episodes} added ({qualities})"
+WATCHLIST_DIGEST_VERSIONS_LINE = "✨ S{season_number} {episodes}: new versions ({qualities})"
+WATCHLIST_DIGEST_RELEASE_DATE_LINE = "⏳ S{season_number}E{episode_number:02d} release date: {release_date}"
+WATCHLIST_DIGEST_BUTTON = "📺 View Anime"
+
 # --- Token Handlers ---
 GEN_TOKEN_TITLE = "🪙 <b><u>Earn Download Tokens</u></b> 🪙"
 GEN_TOKEN_INSTRUCTIONS = """
@@ -371,12 +426,22 @@ ADMIN_TOKENS_REMOVED_SUCCESS = "✅ Successfully removed <b>{amount}</b> tokens
 ADMIN_TOKENS_ERROR = "💔 Error updating tokens for user ID <code>{user_id}</code>."
 
 BROADCAST_PROMPT = "📢 Send the <b><u>message</u></b> you want to broadcast to all users:"
+BROADCAST_USAGE = "ℹ️ Usage: <code>/broadcast Your message text here.</code>\nOr reply <code>/broadcast</code> to any message (photo, video, document...) to send a copy of it to all users."
+BROADCAST_NO_SOURCE_CHANNEL = "⚠️ Broadcasting a message needs FILE_STORAGE_CHANNEL_ID or LOG_CHANNEL_ID: it is copied there first and sent to users from that copy."
+BROADCAST_SOURCE_COPY_FAILED = "💔 Could not copy your message to the storage/log channel, so the broadcast was not started. Check the bot can post there and try again."
 BROADCAST_CONFIRMATION = "Are you sure you want to send this message to all {user_count} users?\n\n<b>Message Preview:</b>\n\n<blockquote>{message_preview}</blockquote>"
 BUTTON_CONFIRM_BROADCAST = "✅ Send Broadcast Now"
 BUTTON_CANCEL_BROADCAST = "❌ Cancel Broadcast"
 BROADCAST_STARTED = "✅ Broadcast started. It may take some time."
 BROADCAST_CANCELLED = "❌ Broadcast cancelled."
 BROADCAST_MESSAGE_SENT = "📢 **Broadcast Message**\n\n{message_text}" # Format of the broadcast message itself
+BROADCAST_PROGRESS = "📢 <b><u>Broadcast {status}</u></b>\n\n{processed}/{total} users processed\n✅ Sent: {sent} • 🚫 Blocked/unreachable: {blocked} • ⚠️ Failed: {failed}\n⚡ Throughput: {rate} • ⏳ ETA: {eta}\n\n<code>/broadcast_pause</code> • <code>/broadcast_resume</code> • <code>/broadcast_cancel</code>"
+BROADCAST_ALREADY_ACTIVE = "⏳ Another broadcast is still {status}. Cancel it with <code>/broadcast_cancel</code> or wait for it to finish."
+BROADCAST_NONE_ACTIVE = "ℹ️ There is no running or paused broadcast."
+BROADCAST_NOTHING_TO_CHANGE = "ℹ️ No broadcast to {action} right now. See <code>/broadcast_status</code>."
+BROADCAST_PAUSED = "⏸ Broadcast paused after the current batch of users. Continue with <code>/broadcast_resume</code>."
+BROADCAST_RESUMED = "▶️ Broadcast resumed."
+BROADCAST_CANCEL_REQUESTED = "❌ Broadcast cancelled. Messages already sent can't be recalled."
 
 DATA_DELETION_PROMPT = "💀 <b><u>DANGER: PERMANENT DATA LOSS</u></b> 💀\n\nAre you absolutely sure you want to delete <b>ALL</b> bot data (users, anime, requests, tokens, states)?\n\n<b>THIS CANNOT BE UNDONE.</b>\n\nType `YES I AM SURE DELETE EVERYTHING` to confirm."
 DATA_DELETION_CONFIRMATION_PHRASE = "YES I AM SURE DELETE EVERYTHING" # Phrase the admin must type
@@ -404,6 +469,14 @@ POPULAR_ENTRY_FORMAT = "<b><u>{anime_title}</u></b> ({download_count} Downloads)
 INLINE_SEARCH_PLACEHOLDER = "Type anime name to search..."
 # Message for empty inline results
 INLINE_NO_RESULTS = "😔 No anime found matching your query."
+# Description line under each inline result title
+INLINE_RESULT_DESCRIPTION = "{status} • {release_year} • {downloads} Downloads"
+# Message sent into the chat when an inline result is picked
+INLINE_RESULT_MESSAGE = "🎬 <b><u>{anime_name}</u></b>\n<b>Status:</b> {status}\n<b>Year:</b> {release_year}\n<b>Genres:</b> {genres}"
+# Button under a sent inline result, deep-links into the bot's anime details view
+BUTTON_INLINE_VIEW_IN_BOT = "📥 View & Download"
+# Button above inline results that opens the bot in private chat
+INLINE_SWITCH_PM_TEXT = "🤖 Open AnimeRealm Bot"
 
 
 # --- Utility Texts ---